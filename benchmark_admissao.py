@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+🚦 BENCHMARK DO CONTROLE DE ADMISSÃO (ENXURRADA NA ETAPA 1)
+Contra o Supabase em memória (--latencia-ms por consulta, bloqueando o worker como o
+cliente síncrono), dispara ao mesmo tempo:
+- --legitimos conversas de telefones diferentes (/agendamento-inteligente)
+- --robos telefones em laço, cada um com --rajada requisições (corpo variando, fora da janela de reenvio)
+enquanto uma sonda chama /health/live a cada --intervalo-sonda-ms.
+
+Compara sem controle e com controle (--max-concorrentes vagas, fila de até --fila-maxima
+dimensionada pela espera de --espera-ms, baldes por telefone): latência da sonda, status
+por origem, latência das recusas e das respostas 200.
+Sai com código 1 se, com controle, o p99 da sonda não cair, se houver 5xx além do 503
+da admissão, se os robôs não receberem 429, se alguma conversa legítima for recusada
+(429 ou 503) ou se as recusas não saírem antes da espera máxima (+ margem).
+
+Uso:
+    python benchmark_admissao.py
+    python benchmark_admissao.py --legitimos 60 --robos 4 --rajada 40 --json admissao.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmark_agendamento import preparar_ambiente_offline
+from controle_admissao import BaldesFichas, ControleAdmissao
+from metricas import percentil
+from supabase_memoria import ENDERECOS_EXEMPLO
+
+import middleware
+
+
+def dados(nome: str, telefone: str, i: int) -> Dict[str, Any]:
+    return {
+        "nome": nome,
+        "telefone": telefone,
+        "cpf": f"{80000000000 + int(telefone[-7:])}",
+        "endereco": ENDERECOS_EXEMPLO["A"][i % len(ENDERECOS_EXEMPLO["A"])],
+        "equipamento": "Fogão",
+        "problema": f"Não acende ({i})",
+        "tipo_atendimento_1": "em_domicilio",
+        "urgente": "não",
+    }
+
+
+def controle(args: argparse.Namespace, ligado: bool) -> ControleAdmissao:
+    return ControleAdmissao(
+        middleware.ROTAS_CARAS if ligado else (),
+        maximo_concorrentes=args.max_concorrentes,
+        fila_maxima=args.fila_maxima,
+        espera_maxima=args.espera_ms / 1000,
+        telefone=BaldesFichas("telefone_benchmark", args.rajada_telefone, args.telefone_por_minuto),
+    )
+
+
+async def medir_modo(args: argparse.Namespace, ligado: bool, rodada: int) -> Dict[str, Any]:
+    preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao, args.latencia_ms)
+    middleware.quadro_disponibilidade.limpar()
+    middleware.cache_horarios.clear()
+    middleware.controle_admissao = controle(args, ligado)
+
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware.app), base_url="http://benchmark", timeout=120)
+    resultados: List[Dict[str, Any]] = []
+    sonda: List[float] = []
+    terminou = asyncio.Event()
+
+    async def enviar(origem: str, corpo: Dict[str, Any]) -> None:
+        inicio = time.perf_counter()
+        resposta = await http.post("/agendamento-inteligente", json=corpo)
+        resultados.append({"origem": origem, "status": resposta.status_code, "ms": (time.perf_counter() - inicio) * 1000})
+
+    async def sondar() -> None:
+        while not terminou.is_set():
+            inicio = time.perf_counter()
+            await http.get("/health/live")
+            sonda.append((time.perf_counter() - inicio) * 1000)
+            await asyncio.sleep(args.intervalo_sonda_ms / 1000)
+
+    envios = [
+        enviar("legitimo", dados(f"Cliente {rodada}-{i}", f"4896{rodada}{i:06d}", i)) for i in range(args.legitimos)
+    ] + [
+        enviar("robo", dados(f"Robo {rodada}-{r}", f"4897{rodada}{r:06d}", i))
+        for i in range(args.rajada) for r in range(args.robos)
+    ]
+    tarefa_sonda = asyncio.create_task(sondar())
+    inicio = time.perf_counter()
+    try:
+        await asyncio.gather(*envios)
+    finally:
+        duracao = time.perf_counter() - inicio
+        terminou.set()
+        await tarefa_sonda
+        await http.aclose()
+
+    def status(origem: str) -> Dict[int, int]:
+        contagem: Dict[int, int] = {}
+        for r in resultados:
+            if r["origem"] == origem:
+                contagem[r["status"]] = contagem.get(r["status"], 0) + 1
+        return dict(sorted(contagem.items()))
+
+    recusas = [r["ms"] for r in resultados if r["status"] in (429, 503)]
+    sucessos = [r["ms"] for r in resultados if r["status"] == 200]
+    return {
+        "modo": "com controle" if ligado else "sem controle",
+        "duracao_s": round(duracao, 2),
+        "sonda_p50_ms": round(percentil(sonda, 50), 1),
+        "sonda_p99_ms": round(percentil(sonda, 99), 1),
+        "sonda_max_ms": round(max(sonda, default=0.0), 1),
+        "sucesso_p50_ms": round(percentil(sucessos, 50), 1),
+        "sucesso_p99_ms": round(percentil(sucessos, 99), 1),
+        "recusa_p50_ms": round(percentil(recusas, 50), 1),
+        "recusa_max_ms": round(max(recusas, default=0.0), 1),
+        "legitimos": status("legitimo"),
+        "robos": status("robo"),
+        "admissao": middleware.controle_admissao.resumo(),
+    }
+
+
+async def executar(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    return [await medir_modo(args, False, 1), await medir_modo(args, True, 2)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Enxurrada na ETAPA 1: com e sem controle de admissão")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-ms", type=float, default=2.0, help="Latência por consulta (bloqueante)")
+    parser.add_argument("--legitimos", type=int, default=30, help="Conversas de telefones diferentes")
+    parser.add_argument("--robos", type=int, default=2, help="Telefones em laço")
+    parser.add_argument("--rajada", type=int, default=30, help="Requisições de cada robô")
+    parser.add_argument("--max-concorrentes", type=int, default=4)
+    parser.add_argument("--fila-maxima", type=int, default=256)
+    parser.add_argument("--espera-ms", type=float, default=2000.0)
+    parser.add_argument("--rajada-telefone", type=int, default=6)
+    parser.add_argument("--telefone-por-minuto", type=float, default=12.0)
+    parser.add_argument("--intervalo-sonda-ms", type=float, default=20.0)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    resultados = asyncio.run(executar(args))
+
+    print(f"\n🚦 Enxurrada: {args.legitimos} conversas + {args.robos} robôs x {args.rajada}, "
+          f"{args.latencia_ms}ms por consulta; controle: {args.max_concorrentes} vagas, fila {args.fila_maxima}, "
+          f"espera {args.espera_ms:.0f}ms")
+    print(f"{'modo':<13} {'dur s':>6} {'sonda p50':>10} {'sonda p99':>10} {'200 p50':>8} {'200 p99':>8} "
+          f"{'recusa p50':>11} {'recusa max':>11}  legítimos / robôs")
+    for r in resultados:
+        print(f"{r['modo']:<13} {r['duracao_s']:>6} {r['sonda_p50_ms']:>10} {r['sonda_p99_ms']:>10} "
+              f"{r['sucesso_p50_ms']:>8} {r['sucesso_p99_ms']:>8} {r['recusa_p50_ms']:>11} {r['recusa_max_ms']:>11}  "
+              f"{r['legitimos']} / {r['robos']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    sem, com = resultados
+    falhas = []
+    if com["sonda_p99_ms"] >= sem["sonda_p99_ms"]:
+        falhas.append(f"p99 do /health/live não caiu ({com['sonda_p99_ms']} vs {sem['sonda_p99_ms']}ms)")
+    erros = {s for r in resultados for origem in ("legitimos", "robos") for s in r[origem] if s >= 500 and s != 503}
+    if erros or 503 in sem["legitimos"] or 503 in sem["robos"]:
+        falhas.append(f"respostas 5xx inesperadas: {sem['legitimos']} {sem['robos']} {com['legitimos']} {com['robos']}")
+    if not com["robos"].get(429):
+        falhas.append(f"robôs não foram limitados por telefone: {com['robos']}")
+    if com["legitimos"].get(429) or com["legitimos"].get(503):
+        falhas.append(f"conversas legítimas recusadas: {com['legitimos']}")
+    if com["recusa_max_ms"] > args.espera_ms + 500:
+        falhas.append(f"recusa demorou {com['recusa_max_ms']}ms (espera máxima {args.espera_ms:.0f}ms)")
+    for falha in falhas:
+        print(f"❌ {falha}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+⏱️ BENCHMARK OFFLINE DO AGENDAMENTO
+Executa os fluxos do middleware contra o Supabase em memória (supabase_memoria.py),
+sem rede: mede latência (p50/p95) e número de consultas por cenário.
+
+Cenários:
+- etapa1: /agendamento-inteligente (consulta de horários + pré-agendamento), Grupo A
+- etapa2: confirmação da opção 1 (processar_etapa_2_confirmacao → criação da OS) após uma ETAPA 1.
+  Chamada direta: via HTTP o reenvio com o mesmo telefone é respondido antes pela proteção anti-duplicata
+- status: /api/consultar-status-os por número da OS
+- grupo_c: ETAPA 1 para endereço do Grupo C (Balneário Camboriú / Itajaí)
+
+Uso:
+    python benchmark_agendamento.py --iteracoes 30 --tecnicos 4 --dias 14 --ocupacao 0.6 --latencia-ms 5
+    python benchmark_agendamento.py --cenarios etapa1,grupo_c --quente --json resultado.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# O benchmark nunca fala com o Supabase real nem inicia o feed de alterações
+os.environ.setdefault("SUPABASE_URL", "http://supabase-memoria.invalid")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ["FEED_ALTERACOES_MODO"] = "desligado"
+
+import httpx
+
+import middleware
+from metricas import percentil
+from orcamento_consultas import instrumentar_cliente
+from supabase_memoria import ClienteSupabaseMemoria, ENDERECOS_EXEMPLO, popular_calendario
+
+CENARIOS = ("etapa1", "etapa2", "status", "grupo_c")
+
+# Coordenadas fixas (lon, lat) no lugar do Nominatim
+COORDENADAS_OFFLINE = {
+    "florianópolis": (-48.5480, -27.5954),
+    "são josé": (-48.6270, -27.6136),
+    "palhoça": (-48.6700, -27.6455),
+    "balneário camboriú": (-48.6350, -26.9906),
+    "itajaí": (-48.6616, -26.9078),
+    "tijucas": (-48.6336, -27.2413),
+    "itapema": (-48.6113, -27.0903),
+    "navegantes": (-48.6547, -26.8989),
+}
+
+
+async def geocodificar_offline(endereco: str) -> Optional[Tuple[float, float]]:
+    endereco_lower = endereco.lower()
+    for cidade, coordenadas in COORDENADAS_OFFLINE.items():
+        if cidade in endereco_lower:
+            return coordenadas
+    return None
+
+
+def preparar_ambiente_offline(tecnicos: int = 3, dias: int = 14, ocupacao: float = 0.5,
+                              latencia_ms: float = 0.0, seed: int = 42) -> Tuple[ClienteSupabaseMemoria, Dict[str, Any]]:
+    """Troca o cliente Supabase e o geocodificador do middleware pelas versões offline"""
+    banco = ClienteSupabaseMemoria(latencia_ms=latencia_ms)
+    resumo = popular_calendario(banco, tecnicos=tecnicos, dias=dias, ocupacao=ocupacao, seed=seed)
+    middleware._supabase_client = instrumentar_cliente(banco)
+    middleware.geocodificar_endereco = geocodificar_offline
+    return banco, resumo
+
+
+class Benchmark:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.banco, self.resumo_dados = preparar_ambiente_offline(
+            args.tecnicos, args.dias, args.ocupacao, args.latencia_ms, args.seed
+        )
+        self.http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=middleware.app),
+            base_url="http://benchmark",
+            timeout=120
+        )
+        self._sequencia = 0
+
+    def limpar_caches(self) -> None:
+        """Modo frio: cada iteração recalcula técnicos, horários e quadro"""
+        middleware.quadro_disponibilidade.limpar()
+        middleware.cache_horarios.clear()
+        middleware._technicians_cache = {}
+        middleware._cache_timestamp = None
+
+    def dados_cliente(self, grupo: str) -> Dict[str, Any]:
+        # Telefone/CPF únicos por iteração: a proteção anti-duplicata não deve encurtar o fluxo
+        self._sequencia += 1
+        return {
+            "nome": f"Cliente Benchmark {self._sequencia}",
+            "telefone": f"4897{self._sequencia:07d}",
+            "cpf": f"{90000000000 + self._sequencia}",
+            "email": f"benchmark{self._sequencia}@exemplo.com",
+            "endereco": ENDERECOS_EXEMPLO[grupo][self._sequencia % len(ENDERECOS_EXEMPLO[grupo])],
+            "equipamento": "Fogão",
+            "problema": "Não acende",
+            "tipo_atendimento_1": "em_domicilio",
+            "urgente": "não",
+        }
+
+    async def medir(self, chamada: Callable[[], Awaitable[Any]]) -> Tuple[Any, float, int]:
+        consultas_antes = self.banco.consultas
+        inicio = time.perf_counter()
+        resposta = await chamada()
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        return resposta, duracao_ms, self.banco.consultas - consultas_antes
+
+    async def post(self, rota: str, corpo: Dict[str, Any]) -> Tuple[httpx.Response, float, int]:
+        return await self.medir(lambda: self.http.post(rota, json=corpo))
+
+    # --- cenários: (preparação fora da medição) + requisição medida -------------
+    async def cenario_etapa1(self) -> Tuple[httpx.Response, float, int]:
+        return await self.post("/agendamento-inteligente", self.dados_cliente("A"))
+
+    async def cenario_grupo_c(self) -> Tuple[httpx.Response, float, int]:
+        return await self.post("/agendamento-inteligente", self.dados_cliente("C"))
+
+    async def cenario_etapa2(self) -> Tuple[Any, float, int]:
+        dados = self.dados_cliente("A")
+        await self.http.post("/agendamento-inteligente", json=dados)
+        return await self.medir(lambda: middleware.processar_etapa_2_confirmacao("1", dados["telefone"]))
+
+    async def cenario_status(self) -> Tuple[httpx.Response, float, int]:
+        exemplo = self.resumo_dados["exemplo_os"] or {}
+        return await self.post("/api/consultar-status-os", {
+            "numero_os": exemplo.get("order_number", "#001"),
+            "telefone_cliente": exemplo.get("client_phone", ""),
+        })
+
+    async def executar_cenario(self, nome: str) -> Dict[str, Any]:
+        funcao: Callable = getattr(self, f"cenario_{nome}")
+        duracoes, consultas, status = [], [], {}
+
+        for iteracao in range(self.args.aquecimento + self.args.iteracoes):
+            if not self.args.quente:
+                self.limpar_caches()
+            resposta, duracao_ms, total_consultas = await funcao()
+            if iteracao < self.args.aquecimento:
+                continue
+            duracoes.append(duracao_ms)
+            consultas.append(total_consultas)
+            status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+
+        return {
+            "cenario": nome,
+            "iteracoes": len(duracoes),
+            "p50_ms": round(percentil(duracoes, 50), 1),
+            "p95_ms": round(percentil(duracoes, 95), 1),
+            "max_ms": round(max(duracoes), 1) if duracoes else 0.0,
+            "consultas_p50": percentil(consultas, 50),
+            "consultas_p95": percentil(consultas, 95),
+            "status": status,
+        }
+
+    async def executar(self, cenarios: List[str]) -> List[Dict[str, Any]]:
+        try:
+            return [await self.executar_cenario(nome) for nome in cenarios]
+        finally:
+            await self.http.aclose()
+
+
+def imprimir_tabela(resultados: List[Dict[str, Any]], resumo_dados: Dict[str, Any], args: argparse.Namespace) -> None:
+    print(f"\n⏱️ Benchmark offline - {len(resumo_dados['tecnicos'])} técnicos, {resumo_dados['eventos']} eventos, "
+          f"latência simulada {args.latencia_ms}ms, modo {'quente' if args.quente else 'frio'}")
+    print(f"{'cenário':<10} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'consultas p50':>14} {'p95':>5}  status")
+    for r in resultados:
+        print(f"{r['cenario']:<10} {r['iteracoes']:>4} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['max_ms']:>9} "
+              f"{r['consultas_p50']:>14} {r['consultas_p95']:>5}  {r['status']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do middleware de agendamento")
+    parser.add_argument("--cenarios", default=",".join(CENARIOS), help=f"Lista separada por vírgula ({', '.join(CENARIOS)})")
+    parser.add_argument("--iteracoes", type=int, default=20)
+    parser.add_argument("--aquecimento", type=int, default=2, help="Iterações descartadas por cenário")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14, help="Dias úteis de agenda semeada")
+    parser.add_argument("--ocupacao", type=float, default=0.5, help="Fração dos horários já ocupados (0-1)")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latência simulada por consulta ao banco")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quente", action="store_true", help="Manter caches/quadro entre iterações")
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    parser.add_argument("--log", default="WARNING", help="Nível de log do middleware durante a medição")
+    args = parser.parse_args()
+
+    cenarios = [c.strip() for c in args.cenarios.split(",") if c.strip()]
+    desconhecidos = [c for c in cenarios if c not in CENARIOS]
+    if desconhecidos:
+        parser.error(f"Cenários desconhecidos: {', '.join(desconhecidos)}")
+
+    logging.getLogger().setLevel(args.log.upper())
+    for nome in ("middleware", "quadro_disponibilidade", "orcamento_consultas", "idempotencia"):
+        logging.getLogger(nome).setLevel(args.log.upper())
+
+    benchmark = Benchmark(args)
+    resultados = asyncio.run(benchmark.executar(cenarios))
+    imprimir_tabela(resultados, benchmark.resumo_dados, args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
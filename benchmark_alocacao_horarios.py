@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+🧮 BENCHMARK DE ALOCAÇÃO DOS HORÁRIOS CANDIDATOS
+Contra o Supabase em memória (sem rede), compara a busca de horários livres de
+obter_horarios_disponiveis_otimizados:
+- legado: um dict com 8 strings formatadas por horário livre (strftime a cada faixa,
+  agendamentos convertidos de novo a cada faixa), depois corta os 3 primeiros
+- compacto: listar_horarios_livres (Candidato com __slots__, rótulos por tabela) e
+  formatação só dos 3 apresentados ao ClienteChat
+
+Mede, com tracemalloc: pico de memória da busca, memória retida pela lista de
+candidatos, blocos vivos e bytes por horário; e o tempo por chamada sem tracemalloc.
+Sai com código 1 se os 3 horários apresentados forem diferentes.
+
+Uso:
+    python benchmark_alocacao_horarios.py --dias 30
+    python benchmark_alocacao_horarios.py --dias 60 --ocupacao 0.3 --json alocacao.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from benchmark_agendamento import preparar_ambiente_offline
+from calendario_comercial import calendario, horas_da_mascara
+
+import middleware
+
+
+async def listar_legado(data_inicio: datetime, dias: int) -> List[Dict[str, Any]]:
+    """Laço anterior de obter_horarios_disponiveis (dict formatado para cada horário livre)"""
+    data_inicio = middleware.validar_data_pesquisa(data_inicio, "pesquisa de horários")
+    supabase = middleware.get_supabase_client()
+    cal = calendario()
+    horarios_disponiveis = []
+    for i in range(dias):
+        data_atual = data_inicio + timedelta(days=i)
+        # Mesmos dias e faixas do calendário comercial (domingos e feriados fora): só a alocação muda
+        horas = horas_da_mascara(cal.horas(data_atual, sabado=True))
+        if not horas:
+            continue
+        data_str = data_atual.strftime('%Y-%m-%d')
+        agendamentos_ai = supabase.table("agendamentos_ai").select("*").or_(
+            f"data_agendada.gte.{data_str}T00:00:00,data_agendada.lt.{data_str}T23:59:59"
+        ).execute().data or []
+        ordens_servico = supabase.table("service_orders").select("*").eq("scheduled_date", data_str).in_(
+            "status", ["scheduled", "in_progress", "on_the_way", "scheduled"]
+        ).execute().data or []
+        agendamentos_tecnicos = supabase.table("service_orders").select("*").eq("scheduled_date", data_str).not_.is_(
+            "technician_name", "null"
+        ).execute().data or []
+        ordens_servico.extend([os for os in agendamentos_tecnicos if os not in ordens_servico])
+
+        for hora in horas:
+            horario_inicio = data_atual.replace(hour=hora, minute=0, second=0, microsecond=0)
+            horario_fim = horario_inicio + timedelta(hours=2)
+            conflito = False
+            motivo_conflito = ""
+            for ag in agendamentos_ai:
+                if ag.get('data_agendada'):
+                    try:
+                        data_ag_str = ag['data_agendada']
+                        if 'T' in data_ag_str:
+                            data_ag = datetime.fromisoformat(data_ag_str.replace('Z', '+00:00'))
+                        else:
+                            data_ag = datetime.strptime(data_ag_str, '%Y-%m-%d %H:%M:%S')
+                        margem = timedelta(minutes=30)
+                        if (horario_inicio - margem) <= data_ag < (horario_fim + margem):
+                            conflito = True
+                            motivo_conflito = f"Agendamento AI às {data_ag.strftime('%H:%M')}"
+                            break
+                    except Exception:
+                        continue
+            if not conflito:
+                for os in ordens_servico:
+                    if os.get('scheduled_time'):
+                        try:
+                            hora_os_str = os['scheduled_time']
+                            if ':' in hora_os_str:
+                                hora_os, min_os = map(int, hora_os_str.split(':')[:2])
+                                horario_os = data_atual.replace(hour=hora_os, minute=min_os, second=0, microsecond=0)
+                                duracao_os = timedelta(hours=2)
+                                margem = timedelta(minutes=30)
+                                if (horario_inicio - margem) <= horario_os < (horario_fim + margem) or \
+                                   (horario_os - margem) <= horario_inicio < (horario_os + duracao_os + margem):
+                                    conflito = True
+                                    motivo_conflito = f"OS às {hora_os_str} - {os.get('client_name', 'Cliente')}"
+                                    break
+                        except Exception:
+                            continue
+            if conflito:
+                logging.getLogger("middleware").debug(f"⚠️ Conflito em {data_str} {hora:02d}:00 - {motivo_conflito}")
+            else:
+                horarios_disponiveis.append({
+                    "data": data_atual.strftime('%Y-%m-%d'),
+                    "hora_agendamento": f"{hora:02d}:00",
+                    "hora_inicio": f"{hora:02d}:00",
+                    "hora_fim": f"{hora + 1:02d}:00",
+                    "datetime": horario_inicio.isoformat(),
+                    "datetime_agendamento": horario_inicio.isoformat(),
+                    "data_formatada": data_atual.strftime('%d/%m/%Y'),
+                    "dia_semana": ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado"][data_atual.weekday()]
+                })
+    return horarios_disponiveis
+
+
+async def buscar_legado(data_inicio: datetime, dias: int) -> Tuple[list, List[Dict[str, Any]]]:
+    horarios = await listar_legado(data_inicio, dias)
+    return horarios, horarios[:3]
+
+
+async def buscar_compacto(data_inicio: datetime, dias: int) -> Tuple[list, List[Dict[str, Any]]]:
+    candidatos = await middleware.listar_horarios_livres(data_inicio, dias)
+    return candidatos, [middleware.formatar_horario_livre(candidato) for candidato in candidatos[:3]]
+
+
+async def medir(nome: str, buscar: Callable[..., Awaitable], data_inicio: datetime, dias: int, repeticoes: int) -> Dict[str, Any]:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        await buscar(data_inicio, dias)
+    duracao_ms = (time.perf_counter() - inicio) * 1000 / repeticoes
+
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    atual_antes, _ = tracemalloc.get_traced_memory()
+    candidatos, apresentados = await buscar(data_inicio, dias)
+    atual, pico = tracemalloc.get_traced_memory()
+    retidos = tracemalloc.take_snapshot().compare_to(base, "filename")
+    tracemalloc.stop()
+
+    blocos = sum(estatistica.count_diff for estatistica in retidos)
+    return {
+        "busca": nome,
+        "horarios": len(candidatos),
+        "ms": round(duracao_ms, 2),
+        "pico_kb": round((pico - atual_antes) / 1024, 1),
+        "retido_kb": round((atual - atual_antes) / 1024, 1),
+        "blocos_vivos": blocos,
+        "bytes_por_horario": round((atual - atual_antes) / max(len(candidatos), 1)),
+        "apresentados": apresentados,
+    }
+
+
+async def executar(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao)
+    data_inicio = datetime.now() + timedelta(days=1)
+    # Aquecimento: conexões, rótulos e caches de import fora da medição
+    await buscar_legado(data_inicio, args.dias)
+    await buscar_compacto(data_inicio, args.dias)
+    return [
+        await medir("legado", buscar_legado, data_inicio, args.dias, args.repeticoes),
+        await medir("compacto", buscar_compacto, data_inicio, args.dias, args.repeticoes),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Alocação dos horários candidatos (dicts vs. candidatos compactos)")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=30)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    resultados = asyncio.run(executar(args))
+
+    print(f"\n🧮 Horários livres em {args.dias} dias (formatação só dos 3 apresentados no compacto)")
+    print(f"{'busca':<9} {'horários':>8} {'ms':>8} {'pico KB':>9} {'retido KB':>10} {'blocos':>8} {'B/horário':>10}")
+    for r in resultados:
+        print(f"{r['busca']:<9} {r['horarios']:>8} {r['ms']:>8} {r['pico_kb']:>9} {r['retido_kb']:>10} "
+              f"{r['blocos_vivos']:>8} {r['bytes_por_horario']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    legado, compacto = resultados
+    if legado["apresentados"] != compacto["apresentados"] or legado["horarios"] != compacto["horarios"]:
+        print("❌ Horários apresentados diferentes entre legado e compacto")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+🔌 BENCHMARK DOS DISJUNTORES (SUPABASE FORA DO AR)
+Contra o Supabase em memória, simula uma pane do banco (cada consulta espera
+--latencia-pane-ms e falha) e mede, com e sem o disjuntor do Supabase:
+- ETAPA 1 (/agendamento-inteligente) com o quadro de disponibilidade já vencido
+- ETAPA 2 (confirmação da opção 1)
+
+Sem disjuntor, cada consulta paga a pane inteira. Com disjuntor, depois das primeiras
+falhas as chamadas falham na hora: a ETAPA 1 serve o último quadro (vencido) e a ETAPA 2
+grava a confirmação na fila de saída. No fim a pane acaba, a sonda de prontidão fecha o
+disjuntor e a fila é reprocessada (OS criadas).
+As conversas até o disjuntor abrir pagam a pane como sem disjuntor e ficam fora da medida.
+Sai com código 1 se, com o disjuntor aberto, alguma resposta não for 200, se o p50 não ficar
+abaixo do p50 sem disjuntor, ou se a fila não esvaziar depois da volta do banco.
+
+Uso:
+    python benchmark_disjuntores.py
+    python benchmark_disjuntores.py --latencia-pane-ms 500 --requisicoes 20 --json disjuntores.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmark_agendamento import preparar_ambiente_offline
+from fila_saida import FilaSaida
+from metricas import percentil
+from orcamento_consultas import instrumentar_cliente
+from supabase_memoria import ENDERECOS_EXEMPLO
+
+import middleware
+
+
+class Pane:
+    """Liga/desliga a pane do banco em memória: cada consulta espera e falha"""
+
+    def __init__(self, banco, latencia_ms: float):
+        self.banco = banco
+        self.latencia_ms = latencia_ms
+        self.ativa = False
+        registrar = banco._registrar_consulta
+
+        def registrar_com_pane(tabela: str, operacao: str) -> None:
+            registrar(tabela, operacao)
+            if self.ativa:
+                time.sleep(self.latencia_ms / 1000)
+                raise ConnectionError(f"Supabase indisponível ({tabela})")
+
+        banco._registrar_consulta = registrar_com_pane
+
+
+class Cliente:
+    # Compartilhado entre os modos: a janela de idempotência não pode ver o mesmo telefone duas vezes
+    sequencia = 0
+
+    def __init__(self):
+        self.http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=middleware.app), base_url="http://benchmark", timeout=120
+        )
+
+    def dados(self) -> Dict[str, Any]:
+        # O mesmo endereço/grupo para todos: a chave do quadro aquecida antes da pane
+        Cliente.sequencia += 1
+        return {
+            "nome": f"Cliente Pane {Cliente.sequencia}",
+            "telefone": f"4895{Cliente.sequencia:07d}",
+            "cpf": f"{70000000000 + Cliente.sequencia}",
+            "endereco": ENDERECOS_EXEMPLO["A"][0],
+            "equipamento": "Fogão",
+            "problema": "Não acende",
+            "tipo_atendimento_1": "em_domicilio",
+            "urgente": "não",
+        }
+
+
+async def medir_modo(args: argparse.Namespace, com_disjuntor: bool) -> Dict[str, Any]:
+    banco, _ = preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao)
+    pane = Pane(banco, args.latencia_pane_ms)
+    disjuntor = middleware.disjuntor_supabase
+    disjuntor.reiniciar()
+    disjuntor.lenta_ms = args.latencia_pane_ms / 2
+    disjuntor.tempo_aberto = args.tempo_aberto
+    middleware._supabase_client = instrumentar_cliente(banco, disjuntor if com_disjuntor else None)
+    middleware.quadro_disponibilidade.limpar()
+    middleware.cache_horarios.clear()
+    middleware.cache_rotas.limpar()
+    middleware.fila_saida = FilaSaida(caminho=os.path.join(args.diretorio, f"fila-{int(com_disjuntor)}.db"))
+
+    cliente = Cliente()
+    try:
+        # Antes da pane: quadro e técnicos aquecidos
+        await cliente.http.post("/agendamento-inteligente", json=cliente.dados())
+        validade = middleware.quadro_disponibilidade.validade
+        middleware.quadro_disponibilidade.validade = 0  # o quadro aquecido já está vencido na pane
+
+        # Conversas até o disjuntor abrir pagam a pane como sem disjuntor; as medidas são as seguintes
+        pane.ativa = True
+        etapa1, etapa2, status, acoes, antes_de_abrir = [], [], {}, {}, 0
+        try:
+            for _ in range(args.requisicoes):
+                if com_disjuntor and not disjuntor.degradado:
+                    antes_de_abrir += 1
+                    medir = False
+                else:
+                    medir = True
+                dados = cliente.dados()
+                inicio = time.perf_counter()
+                resposta = await cliente.http.post("/agendamento-inteligente", json=dados)
+                duracao1 = (time.perf_counter() - inicio) * 1000
+                respostas = [(resposta.status_code, resposta.json().get("action") or "horarios")]
+
+                # Sem horários oferecidos (quadro vencido esgotado) não há escolha a confirmar
+                if respostas[0][1] != "contact_later":
+                    inicio = time.perf_counter()
+                    confirmacao = await middleware.processar_etapa_2_confirmacao("1", dados["telefone"])
+                    if medir:
+                        etapa2.append((time.perf_counter() - inicio) * 1000)
+                    respostas.append((confirmacao.status_code, json.loads(confirmacao.body).get("action") or "confirmado"))
+                if not medir:
+                    continue
+                etapa1.append(duracao1)
+                for codigo, acao in respostas:
+                    status[codigo] = status.get(codigo, 0) + 1
+                    acoes[acao] = acoes.get(acao, 0) + 1
+        finally:
+            pane.ativa = False
+            middleware.quadro_disponibilidade.validade = validade
+
+        # Volta do banco: a sonda fecha o disjuntor e a fila é reprocessada
+        await asyncio.sleep(args.tempo_aberto)
+        await middleware.verificar_dependencias()
+        await middleware.fila_saida.processar(middleware.processar_item_fila_saida, lambda: not disjuntor.degradado)
+        return {
+            "modo": "com disjuntor" if com_disjuntor else "sem disjuntor",
+            "antes_de_abrir": antes_de_abrir,
+            "medidas": len(etapa1),
+            "etapa1_p50_ms": round(percentil(etapa1, 50), 1),
+            "etapa1_max_ms": round(max(etapa1), 1),
+            "etapa2_p50_ms": round(percentil(etapa2, 50), 1),
+            "etapa2_max_ms": round(max(etapa2, default=0.0), 1),
+            "status": status,
+            "acoes": acoes,
+            "disjuntor": disjuntor.resumo() if com_disjuntor else None,
+            "fila_saida": middleware.fila_saida.resumo(),
+        }
+    finally:
+        await cliente.http.aclose()
+
+
+async def executar(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    return [await medir_modo(args, False), await medir_modo(args, True)]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Supabase fora do ar: com e sem disjuntor")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-pane-ms", type=float, default=200.0, help="Espera de cada consulta antes de falhar")
+    parser.add_argument("--tempo-aberto", type=float, default=0.5, help="Segundos do disjuntor aberto antes do teste")
+    parser.add_argument("--requisicoes", type=int, default=20, help="Conversas (ETAPA 1 + ETAPA 2) durante a pane")
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as diretorio:
+        args.diretorio = diretorio
+        resultados = asyncio.run(executar(args))
+    del args.diretorio
+
+    print(f"\n🔌 Pane do Supabase: {args.latencia_pane_ms:.0f}ms por consulta e falha, {args.requisicoes} conversas")
+    print(f"{'modo':<14} {'n':>3} {'E1 p50':>8} {'E1 max':>8} {'E2 p50':>8} {'E2 max':>8}  status / ações")
+    for r in resultados:
+        print(f"{r['modo']:<14} {r['medidas']:>3} {r['etapa1_p50_ms']:>8} {r['etapa1_max_ms']:>8} {r['etapa2_p50_ms']:>8} "
+              f"{r['etapa2_max_ms']:>8}  {r['status']} {r['acoes']}")
+    com = resultados[1]
+    print(f"\nDisjuntor: aberto após {com['antes_de_abrir']} conversa(s), {com['disjuntor']['aberturas']} abertura(s), "
+          f"{com['disjuntor']['recusadas']} chamadas recusadas, estado final {com['disjuntor']['estado']}")
+    print(f"Fila de saída depois da volta do banco: {com['fila_saida']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    sem = resultados[0]
+    falhas = []
+    if set(com["status"]) != {200}:
+        falhas.append(f"respostas diferentes de 200 com o disjuntor aberto: {com['status']}")
+    if com["etapa1_p50_ms"] >= sem["etapa1_p50_ms"] or com["etapa2_p50_ms"] >= sem["etapa2_p50_ms"]:
+        falhas.append("p50 com disjuntor não ficou abaixo do p50 sem disjuntor")
+    if com["fila_saida"]["pendentes"] or not com["fila_saida"]["enfileirados"]:
+        falhas.append(f"fila de saída não esvaziou: {com['fila_saida']}")
+    for falha in falhas:
+        print(f"❌ {falha}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+🔁 BENCHMARK DAS LEITURAS RESILIENTES (NOVAS TENTATIVAS E HEDGE)
+Contra o Supabase em memória com latência de cauda simulada (a maioria das consultas
+leva --latencia-ms, uma fração --prob-cauda leva --cauda-ms) e falhas passageiras
+(--prob-falha), compara três clientes:
+- sem: cliente instrumentado sem política (comportamento anterior)
+- tentativas: novas tentativas (no event loop, como nos endpoints: imediata e única)
+- hedge: novas tentativas + cópia das leituras que passam do p95 da tabela
+
+Mede leituras de disponibilidade (calendar_events por técnico e período, como a busca de
+horários faz) e a ETAPA 1 completa (/agendamento-inteligente, caches limpos): p50/p95/p99,
+erros e a carga extra (consultas enviadas ao banco por leitura).
+Sai com código 1 se o hedge não reduzir o p99 das leituras, se a carga extra passar do
+orçamento (+ margem) ou se as novas tentativas não reduzirem os erros.
+
+Uso:
+    python benchmark_hedge_leituras.py
+    python benchmark_hedge_leituras.py --leituras 2000 --prob-cauda 0.05 --json hedge.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmark_agendamento import preparar_ambiente_offline
+from leituras_resilientes import LeiturasResilientes
+from metricas import percentil
+from orcamento_consultas import instrumentar_cliente
+from supabase_memoria import ENDERECOS_EXEMPLO
+
+import middleware
+
+
+class LatenciaDeCauda:
+    """Latência do banco em memória: base + cauda ocasional + falha ocasional"""
+
+    def __init__(self, banco, args: argparse.Namespace):
+        self.args = args
+        self.aleatorio = random.Random(args.seed)
+        registrar = banco._registrar_consulta
+
+        def registrar_com_cauda(tabela: str, operacao: str) -> None:
+            registrar(tabela, operacao)
+            sorteio = self.aleatorio.random()
+            lenta = sorteio < args.prob_cauda
+            time.sleep((args.cauda_ms if lenta else args.latencia_ms) / 1000)
+            if args.prob_cauda <= sorteio < args.prob_cauda + args.prob_falha:
+                raise ConnectionError(f"conexão reiniciada ({tabela})")
+
+        banco._registrar_consulta = registrar_com_cauda
+
+
+def politica(modo: str, args: argparse.Namespace) -> LeiturasResilientes:
+    if modo == "sem":
+        return None
+    return LeiturasResilientes(
+        tentativas=3, espera_base=0.005, espera_maxima=0.05,
+        hedge=modo == "hedge", hedge_minimo_ms=args.hedge_minimo_ms, fracao_hedge=args.fracao_hedge,
+        amostras_minimas=50,
+    )
+
+
+def ler_disponibilidade(cliente, tecnico_id: str, dia: datetime):
+    return cliente.table("calendar_events").select("*").eq("technician_id", tecnico_id).gte(
+        "start_time", dia.strftime("%Y-%m-%dT00:00:00")
+    ).lt("start_time", (dia + timedelta(days=1)).strftime("%Y-%m-%dT00:00:00")).execute()
+
+
+def medir_leituras(banco, modo: str, args: argparse.Namespace) -> Dict[str, Any]:
+    leituras = politica(modo, args)
+    cliente = instrumentar_cliente(banco, leituras=leituras)
+    tecnicos = [t["id"] for t in banco.tabelas["technicians"]]
+    hoje = datetime.now()
+
+    def uma(i: int) -> None:
+        ler_disponibilidade(cliente, tecnicos[i % len(tecnicos)], hoje + timedelta(days=i % 14))
+
+    # Aquecimento: o hedge precisa de amostras para conhecer o p95 da tabela
+    for i in range(100):
+        try:
+            uma(i)
+        except ConnectionError:
+            pass
+
+    duracoes, erros = [], 0
+    antes = banco.consultas
+    for i in range(args.leituras):
+        inicio = time.perf_counter()
+        try:
+            uma(i)
+        except ConnectionError:
+            erros += 1
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "modo": modo,
+        "p50_ms": round(percentil(duracoes, 50), 2),
+        "p95_ms": round(percentil(duracoes, 95), 2),
+        "p99_ms": round(percentil(duracoes, 99), 2),
+        "max_ms": round(max(duracoes), 2),
+        "erros": erros,
+        "consultas_por_leitura": round((banco.consultas - antes) / args.leituras, 3),
+        "politica": leituras.resumo() if leituras else None,
+    }
+
+
+async def medir_etapa1(banco, modo: str, args: argparse.Namespace) -> Dict[str, Any]:
+    leituras = politica(modo, args)
+    middleware._supabase_client = instrumentar_cliente(banco, leituras=leituras)
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware.app), base_url="http://benchmark", timeout=120)
+    duracoes, status = [], {}
+    try:
+        for i in range(args.aquecimento + args.etapas1):
+            middleware.quadro_disponibilidade.limpar()
+            middleware.cache_horarios.clear()
+            middleware.cache_rotas.limpar()
+            sequencia = f"{modo[0]}{i}"
+            dados = {
+                "nome": f"Cliente Hedge {sequencia}",
+                "telefone": f"4894{abs(hash(sequencia)) % 10 ** 7:07d}",
+                "cpf": f"{60000000000 + abs(hash(sequencia)) % 10 ** 9}",
+                "endereco": ENDERECOS_EXEMPLO["A"][i % len(ENDERECOS_EXEMPLO["A"])],
+                "equipamento": "Fogão", "problema": "Não acende",
+                "tipo_atendimento_1": "em_domicilio", "urgente": "não",
+            }
+            inicio = time.perf_counter()
+            resposta = await http.post("/agendamento-inteligente", json=dados)
+            if i < args.aquecimento:
+                continue
+            duracoes.append((time.perf_counter() - inicio) * 1000)
+            status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+    finally:
+        await http.aclose()
+    return {
+        "modo": modo,
+        "p50_ms": round(percentil(duracoes, 50), 1),
+        "p95_ms": round(percentil(duracoes, 95), 1),
+        "p99_ms": round(percentil(duracoes, 99), 1),
+        "status": status,
+    }
+
+
+async def executar(args: argparse.Namespace) -> Dict[str, List[Dict[str, Any]]]:
+    banco, _ = preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao)
+    LatenciaDeCauda(banco, args)
+    modos = ("sem", "tentativas", "hedge")
+    resultado = {"leituras": [medir_leituras(banco, modo, args) for modo in modos], "etapa1": []}
+    if args.etapas1:
+        for modo in modos:
+            resultado["etapa1"].append(await medir_etapa1(banco, modo, args))
+    return resultado
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Leituras do Supabase com novas tentativas e hedge")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-ms", type=float, default=2.0, help="Latência normal por consulta")
+    parser.add_argument("--cauda-ms", type=float, default=60.0, help="Latência das consultas lentas")
+    parser.add_argument("--prob-cauda", type=float, default=0.03, help="Fração de consultas lentas")
+    parser.add_argument("--prob-falha", type=float, default=0.01, help="Fração de consultas com falha passageira")
+    parser.add_argument("--hedge-minimo-ms", type=float, default=5.0)
+    parser.add_argument("--fracao-hedge", type=float, default=0.05)
+    parser.add_argument("--leituras", type=int, default=1000)
+    parser.add_argument("--etapas1", type=int, default=30, help="ETAPA 1 completas por modo (0 = pular)")
+    parser.add_argument("--aquecimento", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    resultado = asyncio.run(executar(args))
+
+    print(f"\n🔁 Leituras de disponibilidade: {args.latencia_ms}ms, {args.prob_cauda:.0%} em {args.cauda_ms}ms, "
+          f"{args.prob_falha:.0%} com falha ({args.leituras} leituras)")
+    print(f"{'modo':<11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'erros':>6} {'consultas/leitura':>18}")
+    for r in resultado["leituras"]:
+        print(f"{r['modo']:<11} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8} "
+              f"{r['erros']:>6} {r['consultas_por_leitura']:>18}")
+    if resultado["etapa1"]:
+        print(f"\nETAPA 1 completa ({args.etapas1} por modo, caches limpos)")
+        print(f"{'modo':<11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  status")
+        for r in resultado["etapa1"]:
+            print(f"{r['modo']:<11} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}  {r['status']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), **resultado}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    sem, tentativas, hedge = resultado["leituras"]
+    falhas = []
+    if hedge["p99_ms"] >= sem["p99_ms"]:
+        falhas.append(f"hedge não reduziu o p99 das leituras ({hedge['p99_ms']} vs {sem['p99_ms']}ms)")
+    # Carga extra: novas tentativas (falhas) + cópias (orçamento)
+    limite_carga = tentativas["consultas_por_leitura"] + args.fracao_hedge + 0.02
+    if hedge["consultas_por_leitura"] > limite_carga:
+        falhas.append(f"carga extra do hedge acima do orçamento ({hedge['consultas_por_leitura']} > {limite_carga:.3f})")
+    if sem["erros"] and tentativas["erros"] >= sem["erros"]:
+        falhas.append(f"novas tentativas não reduziram os erros ({tentativas['erros']} vs {sem['erros']})")
+    for falha in falhas:
+        print(f"❌ {falha}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+🚀 BENCHMARK DE INICIALIZAÇÃO
+Mede, em processos novos (importação fria a cada rodada), contra o Supabase em memória:
+- importação do middleware
+- duração do startup do lifespan (aquecimento) e de cada fase
+- latência da primeira ETAPA 1 e de uma consulta de status, comparadas à segunda requisição
+
+Roda com o aquecimento ligado e desligado (AQUECIMENTO=desligado) para mostrar
+quanto da primeira requisição era custo de processo frio.
+
+Uso:
+    python benchmark_inicializacao.py --rodadas 5 --latencia-ms 5
+    python benchmark_inicializacao.py --modos ligado --tecnicos 6 --json inicializacao.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+MODOS = ("ligado", "desligado")
+MARCADOR = "RESULTADO "  # a saída do filho também recebe logs
+
+
+async def medir_processo(args: argparse.Namespace) -> Dict[str, Any]:
+    """Executado no processo filho: uma inicialização completa"""
+    os.environ.setdefault("SUPABASE_URL", "http://supabase-memoria.invalid")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    os.environ["FEED_ALTERACOES_MODO"] = "desligado"
+    os.environ["MEMORIA_INTERVALO"] = "0"
+    os.environ["LOG_LEVEL"] = "WARNING"
+
+    inicio = time.perf_counter()
+    import middleware
+    importacao_ms = (time.perf_counter() - inicio) * 1000
+
+    import httpx
+    from benchmark_agendamento import preparar_ambiente_offline
+    from supabase_memoria import ENDERECOS_EXEMPLO
+
+    _, resumo = preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao, args.latencia_ms)
+
+    resultado: Dict[str, Any] = {"importacao_ms": round(importacao_ms, 1)}
+    inicio = time.perf_counter()
+    async with middleware.app.router.lifespan_context(middleware.app):
+        resultado["startup_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        resultado["fases"] = middleware.sonda_prontidao.aquecimento["fases"]
+
+        transporte = httpx.ASGITransport(app=middleware.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://inicializacao", timeout=120) as cliente:
+            for ordem in ("primeira", "segunda"):
+                corpo = {
+                    "nome": f"Cliente Inicialização {ordem}",
+                    "telefone": "4899000000" + ("1" if ordem == "primeira" else "2"),
+                    "endereco": ENDERECOS_EXEMPLO["A"][0],
+                    "equipamento": "Fogão",
+                    "problema": "Não acende",
+                    "tipo_atendimento_1": "em_domicilio",
+                }
+                inicio = time.perf_counter()
+                resposta = await cliente.post("/agendamento-inteligente", json=corpo)
+                resultado[f"etapa1_{ordem}_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+                resultado[f"etapa1_{ordem}_status"] = resposta.status_code
+
+                exemplo = resumo["exemplo_os"] or {}
+                inicio = time.perf_counter()
+                await cliente.post("/api/consultar-status-os", json={
+                    "numero_os": exemplo.get("order_number", "#001"),
+                    "telefone_cliente": exemplo.get("client_phone", ""),
+                })
+                resultado[f"status_{ordem}_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+def executar_rodada(modo: str, args: argparse.Namespace) -> Dict[str, Any]:
+    ambiente = {**os.environ, "AQUECIMENTO": modo}
+    comando = [sys.executable, __file__, "--filho",
+               "--tecnicos", str(args.tecnicos), "--dias", str(args.dias),
+               "--ocupacao", str(args.ocupacao), "--latencia-ms", str(args.latencia_ms)]
+    inicio = time.perf_counter()
+    processo = subprocess.run(comando, env=ambiente, capture_output=True, text=True, timeout=args.timeout)
+    if processo.returncode != 0:
+        raise SystemExit(f"❌ Rodada falhou ({modo}):\n{processo.stderr[-2000:]}")
+    linha = next(l for l in processo.stdout.splitlines() if l.startswith(MARCADOR))
+    resultado = json.loads(linha[len(MARCADOR):])
+    resultado["processo_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+def resumir(rodadas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    campos = ["importacao_ms", "startup_ms", "etapa1_primeira_ms", "etapa1_segunda_ms",
+              "status_primeira_ms", "status_segunda_ms", "processo_ms"]
+    return {campo: round(statistics.median(r[campo] for r in rodadas), 1) for campo in campos}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização e aquecimento do middleware")
+    parser.add_argument("--modos", default=",".join(MODOS), help="ligado,desligado (AQUECIMENTO)")
+    parser.add_argument("--rodadas", type=int, default=3, help="Processos por modo")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-ms", type=float, default=2.0, help="Latência simulada por consulta ao banco")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    parser.add_argument("--filho", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.filho:
+        print(MARCADOR + json.dumps(asyncio.run(medir_processo(args)), ensure_ascii=False, default=str), flush=True)
+        return 0
+
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+    if any(m not in MODOS for m in modos):
+        parser.error(f"Modos válidos: {', '.join(MODOS)}")
+
+    resultados = {}
+    for modo in modos:
+        rodadas = [executar_rodada(modo, args) for _ in range(args.rodadas)]
+        resultados[modo] = {"mediana": resumir(rodadas), "rodadas": rodadas}
+
+    print(f"\n🚀 Inicialização - {args.rodadas} processos por modo, {args.tecnicos} técnicos, latência simulada {args.latencia_ms}ms")
+    print(f"{'aquecimento':<12} {'import ms':>10} {'startup ms':>11} {'etapa1 1ª':>10} {'etapa1 2ª':>10} {'status 1ª':>10} {'status 2ª':>10}")
+    for modo, dados in resultados.items():
+        m = dados["mediana"]
+        print(f"{modo:<12} {m['importacao_ms']:>10} {m['startup_ms']:>11} {m['etapa1_primeira_ms']:>10} "
+              f"{m['etapa1_segunda_ms']:>10} {m['status_primeira_ms']:>10} {m['status_segunda_ms']:>10}")
+    if "ligado" in resultados:
+        print("   fases (última rodada):", {
+            nome: fase.get("ms") for nome, fase in resultados["ligado"]["rodadas"][-1]["fases"].items()
+        })
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
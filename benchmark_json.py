@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+⚡ BENCHMARK DE SERIALIZAÇÃO JSON
+Captura, contra o Supabase em memória (sem rede), as maiores respostas da API e mede
+só a serialização de cada uma:
+- starlette: JSONResponse.render (json padrão; respostas montadas nos endpoints)
+- fastapi_dict: jsonable_encoder + JSONResponse.render (endpoint que devolve dict)
+- padrao: respostas_json.serializar_padrao (fallback sem orjson)
+- orjson: respostas_json.serializar com orjson
+
+Também confere se a saída do orjson é idêntica, byte a byte, à do JSONResponse.
+
+Respostas:
+- etapa1: mensagem do ClienteChat com as opções de horário (/agendamento-inteligente)
+- status: consulta de status com histórico (/api/consultar-status-os)
+- os_tecnico: OS agendadas de um técnico (/os-tecnico/{tecnico_id})
+- agendamentos: listagem completa (/api/agendamentos) com --linhas pré-agendamentos
+
+Uso:
+    python benchmark_json.py --dias 30 --linhas 1000
+    python benchmark_json.py --repeticoes 500 --json resultado_json.json
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from benchmark_agendamento import preparar_ambiente_offline
+from supabase_memoria import ENDERECOS_EXEMPLO
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+import middleware
+import respostas_json
+
+
+def inserir_pre_agendamentos(banco, quantidade: int) -> None:
+    agora = datetime.now()
+    banco.tabelas["agendamentos_ai"].extend({
+        "id": f"00000000-0000-0000-0000-{indice:012d}",
+        "nome": f"Cliente Listagem {indice}",
+        "telefone": f"4896{indice:07d}",
+        "endereco": ENDERECOS_EXEMPLO["A"][indice % len(ENDERECOS_EXEMPLO["A"])],
+        "equipamento": "Fogão",
+        "problema": "Não acende, faísca fraca e cheiro de gás ao ligar o forno",
+        "status": "pendente",
+        "urgente": False,
+        "valor_servico": 150.0,
+        "tipo_atendimento_1": "em_domicilio",
+        "horarios_oferecidos": [
+            {"numero": n, "datetime_agendamento": (agora + timedelta(days=n, hours=9)).isoformat(), "texto": f"Opção {n}"}
+            for n in (1, 2, 3)
+        ],
+        "created_at": (agora - timedelta(minutes=indice)).isoformat(),
+    } for indice in range(quantidade))
+
+
+async def capturar_respostas(args: argparse.Namespace) -> Dict[str, Any]:
+    banco, resumo = preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao)
+    transporte = httpx.ASGITransport(app=middleware.app)
+    respostas = {}
+    async with httpx.AsyncClient(transport=transporte, base_url="http://json", timeout=120) as cliente:
+        resposta = await cliente.post("/agendamento-inteligente", json={
+            "nome": "Cliente Serialização", "telefone": "48970000099", "endereco": ENDERECOS_EXEMPLO["A"][0],
+            "equipamento": "Fogão", "problema": "Não acende", "tipo_atendimento_1": "em_domicilio",
+        })
+        respostas["etapa1"] = resposta.json()
+
+        exemplo = resumo["exemplo_os"] or {}
+        resposta = await cliente.post("/api/consultar-status-os", json={
+            "numero_os": exemplo.get("order_number", "#001"),
+            "telefone_cliente": exemplo.get("client_phone", ""),
+        })
+        respostas["status"] = resposta.json()
+
+        resposta = await cliente.get(f"/os-tecnico/{resumo['tecnicos'][0]}")
+        respostas["os_tecnico"] = resposta.json()
+
+        inserir_pre_agendamentos(banco, args.linhas)
+        resposta = await cliente.get("/api/agendamentos")
+        respostas["agendamentos"] = resposta.json()
+    return respostas
+
+
+def medir(funcao: Callable[[], Any], repeticoes: int, rodadas: int = 5) -> float:
+    """Mediana (µs por chamada) entre rodadas de `repeticoes` chamadas"""
+    tempos = []
+    for _ in range(rodadas):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        tempos.append((time.perf_counter() - inicio) / repeticoes * 1_000_000)
+    return statistics.median(tempos)
+
+
+def comparar(respostas: Dict[str, Any], repeticoes: int) -> List[Dict[str, Any]]:
+    starlette = JSONResponse(None).render
+    resultados = []
+    for nome, conteudo in respostas.items():
+        referencia = starlette(conteudo)
+        resultado = {
+            "resposta": nome,
+            "kb": round(len(referencia) / 1024, 1),
+            "starlette_us": round(medir(lambda: starlette(conteudo), repeticoes), 1),
+            "fastapi_dict_us": round(medir(lambda: starlette(jsonable_encoder(conteudo)), repeticoes), 1),
+            "padrao_us": round(medir(lambda: respostas_json.serializar_padrao(conteudo), repeticoes), 1),
+            "orjson_us": None,
+            "identico": respostas_json.serializar_padrao(conteudo) == referencia,
+        }
+        if respostas_json.orjson is not None:
+            opcoes = respostas_json.OPCOES_ORJSON
+            orjson_dumps = lambda: respostas_json.orjson.dumps(conteudo, default=respostas_json.converter, option=opcoes)
+            resultado["orjson_us"] = round(medir(orjson_dumps, repeticoes), 1)
+            resultado["identico"] = resultado["identico"] and orjson_dumps() == referencia
+        resultados.append(resultado)
+    return resultados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de serialização JSON das maiores respostas")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=30)
+    parser.add_argument("--ocupacao", type=float, default=0.6)
+    parser.add_argument("--linhas", type=int, default=500, help="Pré-agendamentos na listagem /api/agendamentos")
+    parser.add_argument("--repeticoes", type=int, default=200, help="Chamadas por rodada de medição")
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    respostas = asyncio.run(capturar_respostas(args))
+    resultados = comparar(respostas, args.repeticoes)
+
+    print(f"\n⚡ Serialização JSON (µs por resposta, mediana) - serializador ativo: {respostas_json.SERIALIZADOR}")
+    print(f"{'resposta':<13} {'KB':>7} {'starlette':>10} {'fastapi_dict':>13} {'padrao':>8} {'orjson':>8} {'ganho':>7} {'idêntico':>9}")
+    for r in resultados:
+        ganho = f"{r['starlette_us'] / r['orjson_us']:.1f}x" if r["orjson_us"] else "-"
+        print(f"{r['resposta']:<13} {r['kb']:>7} {r['starlette_us']:>10} {r['fastapi_dict_us']:>13} "
+              f"{r['padrao_us']:>8} {str(r['orjson_us'] or '-'):>8} {ganho:>7} {'sim' if r['identico'] else 'NÃO':>9}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+    return 0 if all(r["identico"] for r in resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
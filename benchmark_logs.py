@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+🪵 BENCHMARK DE VOLUME DE LOGS
+Executa os cenários do benchmark offline (benchmark_agendamento.py) com diferentes
+configurações de logging e mede, por requisição: linhas e bytes escritos,
+mensagens suprimidas pela amostragem e latência p50/p95.
+
+Configurações comparadas:
+- sincrono: StreamHandler direto no logger raiz (escrita no event loop, como antes)
+- fila_texto: pipeline de logs_estruturados.py (QueueHandler + QueueListener), formato texto
+- fila_json: mesmo pipeline, uma linha JSON por registro
+- fila_debug: pipeline em DEBUG, para ver o volume rebaixado dos laços por horário/linha
+
+Uso:
+    python benchmark_logs.py --iteracoes 30 --cenarios etapa1,grupo_c
+    python benchmark_logs.py --saida /tmp/logs.txt --latencia-ms 2 --json resultado_logs.json
+    python benchmark_logs.py --atraso-escrita-us 200   (stdout lento: onde a fila faz diferença)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmark_agendamento import Benchmark, CENARIOS
+import logs_estruturados
+
+CONFIGURACOES = ("sincrono", "fila_texto", "fila_json", "fila_debug")
+
+
+class SaidaContada:
+    """Stream que conta linhas e bytes antes de repassar ao destino"""
+
+    def __init__(self, destino, atraso_us: float = 0.0):
+        self.destino = destino
+        self.atraso = atraso_us / 1_000_000
+        self.linhas = 0
+        self.bytes = 0
+
+    def write(self, texto: str) -> int:
+        self.linhas += texto.count("\n")
+        self.bytes += len(texto.encode("utf-8"))
+        if self.atraso:
+            # Simula stdout lento (pipe cheio do coletor de logs da plataforma)
+            time.sleep(self.atraso)
+        return self.destino.write(texto)
+
+    def flush(self) -> None:
+        self.destino.flush()
+
+
+def configurar(nome: str, saida: SaidaContada, args: argparse.Namespace) -> None:
+    logs_estruturados.parar_logs()
+    if nome == "sincrono":
+        raiz = logging.getLogger()
+        for handler in list(raiz.handlers):
+            raiz.removeHandler(handler)
+        handler = logging.StreamHandler(saida)
+        handler.setFormatter(logging.Formatter(logs_estruturados.FORMATO_TEXTO.replace(" [%(request_id)s]", "")))
+        raiz.addHandler(handler)
+        raiz.setLevel(logging.INFO)
+        return
+    logs_estruturados.configurar_logs(
+        nivel="DEBUG" if nome == "fila_debug" else "INFO",
+        formato="json" if nome == "fila_json" else "texto",
+        limite_repeticoes=args.limite_repeticoes,
+        janela_repeticoes=args.janela_repeticoes,
+        saida=saida,
+    )
+
+
+async def executar(args: argparse.Namespace, cenarios: List[str], configuracoes: List[str]) -> List[Dict[str, Any]]:
+    benchmark = Benchmark(args)
+    resultados = []
+    with open(args.saida, "a", encoding="utf-8") as destino:
+        try:
+            for nome in configuracoes:
+                for cenario in cenarios:
+                    saida = SaidaContada(destino, args.atraso_escrita_us)
+                    configurar(nome, saida, args)
+                    resultado = await benchmark.executar_cenario(cenario)
+                    filtro = logs_estruturados.filtro_repeticao if nome != "sincrono" else None
+                    logs_estruturados.parar_logs()  # esvazia a fila antes de contar
+                    requisicoes = args.aquecimento + args.iteracoes
+                    resultados.append({
+                        "configuracao": nome,
+                        "cenario": cenario,
+                        "p50_ms": resultado["p50_ms"],
+                        "p95_ms": resultado["p95_ms"],
+                        "linhas_por_requisicao": round(saida.linhas / requisicoes, 1),
+                        "bytes_por_requisicao": round(saida.bytes / requisicoes),
+                        "suprimidas": filtro.suprimidas if filtro else 0,
+                    })
+        finally:
+            await benchmark.http.aclose()
+            logs_estruturados.configurar_logs(saida=sys.stderr)
+    return resultados
+
+
+def imprimir_tabela(resultados: List[Dict[str, Any]]) -> None:
+    print("\n🪵 Volume de logs por requisição")
+    print(f"{'configuração':<12} {'cenário':<9} {'p50 ms':>8} {'p95 ms':>8} {'linhas':>8} {'bytes':>8} {'suprimidas':>11}")
+    for r in resultados:
+        print(f"{r['configuracao']:<12} {r['cenario']:<9} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['linhas_por_requisicao']:>8} {r['bytes_por_requisicao']:>8} {r['suprimidas']:>11}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de volume e custo dos logs do middleware")
+    parser.add_argument("--cenarios", default="etapa1,grupo_c,status", help=f"Lista separada por vírgula ({', '.join(CENARIOS)})")
+    parser.add_argument("--configuracoes", default=",".join(CONFIGURACOES), help=f"({', '.join(CONFIGURACOES)})")
+    parser.add_argument("--iteracoes", type=int, default=20)
+    parser.add_argument("--aquecimento", type=int, default=2)
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quente", action="store_true", help="Manter caches/quadro entre iterações")
+    parser.add_argument("--limite-repeticoes", type=int, default=20)
+    parser.add_argument("--janela-repeticoes", type=float, default=10.0)
+    parser.add_argument("--atraso-escrita-us", type=float, default=0.0, help="Atraso simulado por escrita no stdout (µs)")
+    parser.add_argument("--saida", default=os.devnull, help="Destino das linhas de log (padrão: descartar)")
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    cenarios = [c.strip() for c in args.cenarios.split(",") if c.strip()]
+    configuracoes = [c.strip() for c in args.configuracoes.split(",") if c.strip()]
+    desconhecidos = [c for c in cenarios if c not in CENARIOS] + [c for c in configuracoes if c not in CONFIGURACOES]
+    if desconhecidos:
+        parser.error(f"Valores desconhecidos: {', '.join(desconhecidos)}")
+
+    resultados = asyncio.run(executar(args, cenarios, configuracoes))
+    imprimir_tabela(resultados)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
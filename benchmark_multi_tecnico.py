@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+👥 BENCHMARK DA BUSCA EM VÁRIOS TÉCNICOS
+Contra o Supabase em memória (sem rede, com latência simulada por consulta), compara a
+busca de horários da ETAPA 1:
+- unico: determinar_tecnico_otimizado + obter_horarios_do_quadro (só o técnico de maior score)
+- multi: determinar_tecnicos_qualificados + obter_horarios_multi_tecnico (todos os técnicos
+  qualificados em paralelo, um retrato do calendário para os que faltam no quadro)
+
+Cada busca roda com o quadro frio (limpo antes de cada chamada) e quente. Com --lotar-melhor
+a agenda do técnico de maior score fica cheia nos próximos dias: mostra a data oferecida por
+cada busca quando o melhor técnico está ocupado.
+Sai com código 1 se a busca multi for mais lenta que a única com o quadro frio ou quente.
+
+Uso:
+    python benchmark_multi_tecnico.py --tecnicos 4 --latencia-ms 2
+    python benchmark_multi_tecnico.py --tecnicos 6 --lotar-melhor 5 --json multi.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from benchmark_agendamento import preparar_ambiente_offline
+
+import middleware
+
+EQUIPAMENTOS = ["Fogão"]
+GRUPO = "A"
+TIPO = "em_domicilio"
+
+
+def lotar_agenda(banco, tecnico: Dict[str, Any], dias: int) -> None:
+    """Eventos em todas as faixas comerciais do técnico nos próximos dias úteis"""
+    dia = middleware.calcular_data_inicio_otimizada(False).replace(tzinfo=None)
+    for _ in range(dias):
+        for hora in (9, 10, 13, 14, 15, 16):
+            inicio = dia.replace(hour=hora, minute=0, second=0, microsecond=0)
+            banco.tabelas["calendar_events"].append({
+                "id": str(uuid.uuid4()), "technician_id": tecnico["tecnico_id"], "technician_name": tecnico["nome"],
+                "client_name": "Agenda Cheia", "address": "Rua Felipe Schmidt, 100, Centro, Florianópolis, SC",
+                "start_time": middleware.pytz.timezone('America/Sao_Paulo').localize(inicio).isoformat(),
+                "status": "confirmed", "event_type": "service",
+            })
+        dia = middleware.calendario().proximo_dia_util(dia + timedelta(days=1))
+        dia = datetime.combine(dia, datetime.min.time())
+
+
+async def buscar_unico() -> List[Dict]:
+    tecnico = await middleware.determinar_tecnico_otimizado(EQUIPAMENTOS, GRUPO, False)
+    return await middleware.obter_horarios_do_quadro(tecnico["tecnico_id"], GRUPO, TIPO, False)
+
+
+async def buscar_multi() -> List[Dict]:
+    tecnicos = await middleware.determinar_tecnicos_qualificados(EQUIPAMENTOS, GRUPO, False)
+    return await middleware.obter_horarios_multi_tecnico(tecnicos, GRUPO, TIPO, False)
+
+
+async def medir(nome: str, buscar, banco, quadro: str, repeticoes: int) -> Dict[str, Any]:
+    if quadro == "quente":
+        middleware.quadro_disponibilidade.limpar()
+        await buscar()
+    duracoes, consultas = [], []
+    for _ in range(repeticoes):
+        if quadro == "frio":
+            middleware.quadro_disponibilidade.limpar()
+        consultas_antes = banco.consultas
+        inicio = time.perf_counter()
+        horarios = await buscar()
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(banco.consultas - consultas_antes)
+
+    hoje = datetime.now().date()
+    primeiro = datetime.fromisoformat(horarios[0]["datetime_agendamento"]).date() if horarios else None
+    return {
+        "busca": nome,
+        "quadro": quadro,
+        "ms": round(sum(duracoes) / len(duracoes), 2),
+        "consultas": max(consultas),
+        "horarios": len(horarios),
+        "primeiro_dia": (primeiro - hoje).days if primeiro else None,
+        "tecnicos": sorted({h.get("tecnico_nome", "único") for h in horarios}),
+    }
+
+
+async def executar(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    banco, _ = preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao, args.latencia_ms)
+    middleware.BUSCA_MULTI_TECNICO_MAX = args.tecnicos
+    middleware.BUSCA_MULTI_TECNICO_SCORE_MINIMO = 0.0
+    if args.lotar_melhor:
+        lotar_agenda(banco, await middleware.determinar_tecnico_otimizado(EQUIPAMENTOS, GRUPO, False), args.lotar_melhor)
+
+    resultados = []
+    for quadro in ("frio", "quente"):
+        resultados.append(await medir("unico", buscar_unico, banco, quadro, args.repeticoes))
+        resultados.append(await medir("multi", buscar_multi, banco, quadro, args.repeticoes))
+    return resultados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Busca de horários em um técnico vs. em todos os qualificados")
+    parser.add_argument("--tecnicos", type=int, default=4)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-ms", type=float, default=2.0)
+    parser.add_argument("--lotar-melhor", type=int, default=5, help="Dias úteis com a agenda do melhor técnico cheia (0 = não lotar)")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    resultados = asyncio.run(executar(args))
+
+    print(f"\n👥 Busca de horários com {args.tecnicos} técnicos (latência {args.latencia_ms}ms/consulta)")
+    print(f"{'busca':<6} {'quadro':<7} {'ms':>9} {'consultas':>10} {'horários':>9} {'1º dia':>7}  técnicos")
+    for r in resultados:
+        print(f"{r['busca']:<6} {r['quadro']:<7} {r['ms']:>9} {r['consultas']:>10} {r['horarios']:>9} "
+              f"{str(r['primeiro_dia']):>7}  {', '.join(r['tecnicos'])}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    por_busca = {(r["busca"], r["quadro"]): r for r in resultados}
+    regressao = [
+        quadro for quadro in ("frio", "quente")
+        if por_busca[("multi", quadro)]["ms"] > por_busca[("unico", quadro)]["ms"] * 1.1 + 1
+    ]
+    if regressao:
+        print(f"❌ Busca multi mais lenta que a única com o quadro: {', '.join(regressao)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+⏱️ BENCHMARK DO PRAZO DA BUSCA DE HORÁRIOS
+Contra o Supabase em memória com latência simulada (um dia lento do banco), mede a
+ETAPA 1 (/agendamento-inteligente, caches limpos a cada chamada) com prazos de
+requisição diferentes (PRAZO_REQUISICAO_MS):
+- tempo de resposta, horários devolvidos e se a resposta saiu parcial
+- etapas interrompidas (header X-Deadline-Partial)
+
+Com agenda bem ocupada a busca percorre muitos dias; com prazo curto ela tem de parar
+e responder com os horários achados até ali.
+Sai com código 1 se alguma resposta não for 200 ou se, com prazo, passar do prazo mais
+a margem (uma etapa em andamento quando o prazo esgota).
+
+Uso:
+    python benchmark_prazo_busca.py --latencia-ms 15 --prazos 0,1000,300,100
+    python benchmark_prazo_busca.py --ocupacao 0.9 --json prazo.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmark_agendamento import preparar_ambiente_offline
+from metricas import percentil
+from supabase_memoria import ENDERECOS_EXEMPLO
+
+import middleware
+
+
+class Cliente:
+    def __init__(self):
+        self.sequencia = 0
+        self.http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=middleware.app), base_url="http://benchmark", timeout=120
+        )
+
+    def dados(self, grupo: str) -> Dict[str, Any]:
+        # Telefone/CPF únicos: a janela de idempotência não deve repetir respostas
+        self.sequencia += 1
+        return {
+            "nome": f"Cliente Prazo {self.sequencia}",
+            "telefone": f"4896{self.sequencia:07d}",
+            "cpf": f"{80000000000 + self.sequencia}",
+            "endereco": ENDERECOS_EXEMPLO[grupo][self.sequencia % len(ENDERECOS_EXEMPLO[grupo])],
+            "equipamento": "Fogão",
+            "problema": "Não acende",
+            "tipo_atendimento_1": "em_domicilio",
+            "urgente": "não",
+        }
+
+
+def limpar_caches() -> None:
+    middleware.quadro_disponibilidade.limpar()
+    middleware.cache_horarios.clear()
+    middleware.cache_rotas.limpar()
+    middleware._technicians_cache = {}
+    middleware._cache_timestamp = None
+
+
+async def medir(cliente: Cliente, prazo_ms: float, grupo: str, repeticoes: int) -> Dict[str, Any]:
+    middleware.PRAZO_REQUISICAO_MS = prazo_ms
+    duracoes, horarios, status, parciais, etapas = [], [], {}, 0, set()
+    for _ in range(repeticoes):
+        limpar_caches()
+        inicio = time.perf_counter()
+        resposta = await cliente.http.post("/agendamento-inteligente", json=cliente.dados(grupo))
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+        status[resposta.status_code] = status.get(resposta.status_code, 0) + 1
+        corpo = resposta.json()
+        horarios.append(len(corpo.get("horarios_disponiveis") or []))
+        if corpo.get("parcial"):
+            parciais += 1
+        if resposta.headers.get("X-Deadline-Partial"):
+            etapas.update(resposta.headers["X-Deadline-Partial"].split(","))
+    return {
+        "prazo_ms": prazo_ms,
+        "grupo": grupo,
+        "p50_ms": round(percentil(duracoes, 50), 1),
+        "max_ms": round(max(duracoes), 1),
+        "horarios_min": min(horarios),
+        "parciais": parciais,
+        "repeticoes": repeticoes,
+        "etapas": sorted(etapas),
+        "status": status,
+    }
+
+
+async def executar(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao, args.latencia_ms)
+    cliente = Cliente()
+    try:
+        resultados = []
+        for prazo_ms in args.prazos:
+            for grupo in ("A", "C"):
+                resultados.append(await medir(cliente, prazo_ms, grupo, args.repeticoes))
+        return resultados
+    finally:
+        await cliente.http.aclose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Busca de horários com prazo por requisição")
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=20)
+    parser.add_argument("--ocupacao", type=float, default=0.8)
+    parser.add_argument("--latencia-ms", type=float, default=15.0)
+    parser.add_argument("--prazos", type=lambda texto: [float(p) for p in texto.split(",")], default=[0, 1000, 300, 100],
+                        help="Prazos em ms separados por vírgula (0 = sem prazo)")
+    parser.add_argument("--margem-ms", type=float, default=None,
+                        help="Tolerância acima do prazo (padrão: 10 consultas de latência + 50ms)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    resultados = asyncio.run(executar(args))
+    margem = args.margem_ms if args.margem_ms is not None else 10 * args.latencia_ms + 50
+
+    print(f"\n⏱️ ETAPA 1 com latência de {args.latencia_ms}ms/consulta, ocupação {args.ocupacao:.0%} (margem {margem:.0f}ms)")
+    print(f"{'prazo ms':>8} {'grupo':>5} {'p50 ms':>9} {'max ms':>9} {'horários':>9} {'parciais':>9}  etapas interrompidas")
+    for r in resultados:
+        prazo = "sem" if not r["prazo_ms"] else f"{r['prazo_ms']:.0f}"
+        print(f"{prazo:>8} {r['grupo']:>5} {r['p50_ms']:>9} {r['max_ms']:>9} {r['horarios_min']:>9} "
+              f"{r['parciais']:>4}/{r['repeticoes']:<4}  {', '.join(r['etapas']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    falhas = [r for r in resultados if set(r["status"]) != {200}]
+    estouros = [r for r in resultados if r["prazo_ms"] and r["max_ms"] > r["prazo_ms"] + margem]
+    if falhas:
+        print(f"❌ Respostas diferentes de 200: {[(r['prazo_ms'], r['grupo'], r['status']) for r in falhas]}")
+    if estouros:
+        print(f"❌ Respostas acima do prazo + margem: {[(r['prazo_ms'], r['grupo'], r['max_ms']) for r in estouros]}")
+    return 1 if falhas or estouros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
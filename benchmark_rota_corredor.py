@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+🗺️ BENCHMARK DO CORREDOR DA ROTA SEQUENCIAL (GRUPO C)
+Regressão do buscar_agendamentos_rota_sequencial com um corredor movimentado, contra o
+Supabase em memória (sem rede). Para cada quantidade de pré-agendamentos pendentes no
+corredor da tarde (BC / Itajaí / Navegantes) compara:
+- legado: uma consulta ilike por cidade + extend dentro do laço (N² linhas) + agrupamento
+- or_ilike: uma consulta para o corredor inteiro, sem repetições, já agrupada por data
+- coluna: mesma busca pela coluna periodo_rota (sql/rota_corredor_agendamentos_ai.sql)
+
+Também mede a estratégia completa do Grupo C (estrategia_grupo_c: busca do corredor +
+processar_horarios_rota_sequencial) para um endereço de Balneário Camboriú, com a busca
+legada e com a nova.
+Sai com código 1 se a busca nova devolver linhas repetidas ou faltando.
+
+Uso:
+    python benchmark_rota_corredor.py --quantidades 10,50,200
+    python benchmark_rota_corredor.py --quantidades 500 --latencia-ms 5 --json corredor.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from benchmark_agendamento import preparar_ambiente_offline
+
+import middleware
+
+CIDADES_TARDE = [
+    ("Avenida Brasil, {n}, Centro, Balneário Camboriú, SC", "Balneário Camboriú"),
+    ("Rua Hercílio Luz, {n}, Centro, Itajaí, SC", "Itajaí"),
+    ("Rua João Sacavém, {n}, Centro, Navegantes, SC", "Navegantes"),
+]
+
+
+def popular_corredor(banco, quantidade: int, agora: datetime) -> None:
+    """Pré-agendamentos pendentes no corredor da tarde, espalhados pelos próximos 10 dias"""
+    banco.tabelas["agendamentos_ai"] = [
+        row for row in banco.tabelas.get("agendamentos_ai", []) if not str(row.get("id", "")).startswith("corredor-")
+    ]
+    for indice in range(quantidade):
+        endereco, cidade = CIDADES_TARDE[indice % len(CIDADES_TARDE)]
+        banco.tabelas["agendamentos_ai"].append({
+            "id": f"corredor-{indice}",
+            "nome": f"Cliente Corredor {indice}",
+            "telefone": f"4795{indice:07d}",
+            "endereco": endereco.format(n=100 + indice),
+            "status": "pendente",
+            "grupo_logistico": "C",
+            "data_agendada": (agora + timedelta(days=1 + indice % 10, hours=14)).isoformat(),
+            # Preenchidas pelo trigger da migração no banco real
+            "cidade_rota": cidade,
+            "periodo_rota": "tarde",
+            "created_at": agora.isoformat(),
+        })
+
+
+async def buscar_legado(periodo_ideal: str, agora: datetime, supabase) -> Dict[str, List[Dict]]:
+    """Implementação anterior (uma consulta por cidade, extend dentro do laço) + agrupamento"""
+    data_inicio = agora.strftime('%Y-%m-%d')
+    data_fim = (agora + timedelta(days=15)).strftime('%Y-%m-%d')
+    agendamentos_periodo = []
+    for cidade in middleware.CIDADES_CORREDOR_ROTA[periodo_ideal]:
+        response = supabase.table("agendamentos_ai").select("*").ilike(
+            "endereco", f"%{cidade}%"
+        ).gte("data_agendada", data_inicio).lte("data_agendada", data_fim).eq("status", "pendente").execute()
+        if response.data:
+            for ag in response.data:
+                ag['cidade_detectada'] = cidade
+                agendamentos_periodo.extend(response.data)
+    agendamentos_por_data: Dict[str, List[Dict]] = {}
+    for ag in agendamentos_periodo:
+        agendamentos_por_data.setdefault(ag['data_agendada'][:10], []).append(ag)
+    return agendamentos_por_data
+
+
+async def medir_busca(nome: str, banco, agora: datetime, repeticoes: int) -> Dict[str, Any]:
+    supabase = middleware.get_supabase_client()
+    middleware.ROTA_CORREDOR_COLUNA = nome == "coluna"
+    buscar = buscar_legado if nome == "legado" else middleware.buscar_agendamentos_rota_sequencial
+
+    consultas_antes = banco.consultas
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        por_data = await buscar("tarde", agora, supabase)
+    duracao_ms = (time.perf_counter() - inicio) * 1000 / repeticoes
+    linhas = [ag for ags in por_data.values() for ag in ags]
+    return {
+        "busca": nome,
+        "ms": round(duracao_ms, 2),
+        "consultas": (banco.consultas - consultas_antes) // repeticoes,
+        "linhas": len(linhas),
+        "ids_unicos": len({ag["id"] for ag in linhas}),
+        "datas": len(por_data),
+    }
+
+
+async def medir_estrategia_grupo_c(nome: str, agora: datetime, repeticoes: int) -> float:
+    """estrategia_grupo_c de ponta a ponta usando a busca legada ou a nova"""
+    original = middleware.buscar_agendamentos_rota_sequencial
+    if nome == "legado":
+        middleware.buscar_agendamentos_rota_sequencial = buscar_legado
+    try:
+        tecnico_id = next(iter(middleware.get_supabase_client().table("technicians").select("*").execute().data))["id"]
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            await middleware.estrategia_grupo_c(
+                tecnico_id, "Técnico Corredor", None, "Avenida Atlântica, 2000, Centro, Balneário Camboriú, SC",
+                False, agora, middleware.get_supabase_client()
+            )
+        return (time.perf_counter() - inicio) * 1000 / repeticoes
+    finally:
+        middleware.buscar_agendamentos_rota_sequencial = original
+
+
+async def executar(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    banco, _ = preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao, args.latencia_ms)
+    agora = datetime.now()
+    resultados = []
+    for quantidade in args.quantidades:
+        popular_corredor(banco, quantidade, agora)
+        for nome in ("legado", "or_ilike", "coluna"):
+            resultado = await medir_busca(nome, banco, agora, args.repeticoes)
+            resultado["pendentes"] = quantidade
+            resultado["estrategia_grupo_c_ms"] = round(await medir_estrategia_grupo_c(nome, agora, args.repeticoes), 2)
+            resultados.append(resultado)
+    middleware.ROTA_CORREDOR_COLUNA = False
+    return resultados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Regressão da busca do corredor da rota sequencial (Grupo C)")
+    parser.add_argument("--quantidades", default="10,50,200", help="Pré-agendamentos pendentes no corredor")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--tecnicos", type=int, default=3)
+    parser.add_argument("--dias", type=int, default=14)
+    parser.add_argument("--ocupacao", type=float, default=0.5)
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+    args.quantidades = [int(q) for q in args.quantidades.split(",") if q.strip()]
+
+    resultados = asyncio.run(executar(args))
+
+    print("\n🗺️ Corredor da tarde (BC → Itajaí → Navegantes)")
+    print(f"{'pendentes':>9} {'busca':<9} {'ms':>9} {'consultas':>10} {'linhas':>8} {'ids únicos':>11} {'datas':>6} {'estratégia C ms':>16}")
+    for r in resultados:
+        print(f"{r['pendentes']:>9} {r['busca']:<9} {r['ms']:>9} {r['consultas']:>10} {r['linhas']:>8} "
+              f"{r['ids_unicos']:>11} {r['datas']:>6} {r['estrategia_grupo_c_ms']:>16}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    regressao = [r for r in resultados if r["busca"] != "legado" and not (r["linhas"] == r["ids_unicos"] == r["pendentes"])]
+    if regressao:
+        print("❌ Busca do corredor com linhas repetidas ou faltando:", regressao)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+🛣️ BENCHMARK DO BONUS DE ROTA POR CUSTO DE INSERÇÃO
+Contra o Supabase em memória (sem rede), monta um dia de corredor do Grupo C para um
+técnico (Tijucas 9h → Itapema 10h → Itajaí 14h → Navegantes 16h) e pontua candidatos
+nesse dia com:
+- aneis: bonus legado de calcular_bonus_rota (agendamentos a 2/5/10 km, sem ordem do dia)
+- insercao: calcular_bonus_rota atual (desvio na rota do dia, posição pelo horário)
+
+Mostra, por candidato, os dois bonus e o desvio (km / min). Mede também o tempo por
+chamada (legado, inserção com o cache de rotas frio e quente) e o custo de uma nova
+parada: atualização incremental da matriz vs. remontar a rota do dia.
+Sai com código 1 se o candidato no caminho do corredor (BC 13h) não tiver o maior bonus
+de inserção, ou se a inserção com cache quente for mais lenta que o legado.
+
+Uso:
+    python benchmark_rota_insercao.py
+    python benchmark_rota_insercao.py --paradas 40 --latencia-ms 2 --json insercao.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from benchmark_agendamento import COORDENADAS_OFFLINE, geocodificar_offline, preparar_ambiente_offline
+from calendario_comercial import calendario
+from rota_insercao import RotaDia
+
+import middleware
+
+CORREDOR = [
+    (9, "Rua Coronel Büchele, 200, Centro, Tijucas, SC"),
+    (10, "Avenida Nereu Ramos, 1500, Meia Praia, Itapema, SC"),
+    (14, "Rua Hercílio Luz, 300, Centro, Itajaí, SC"),
+    (16, "Rua João Sacavém, 90, Centro, Navegantes, SC"),
+]
+
+CANDIDATOS = [
+    ("BC 13h (no caminho)", "balneário camboriú", 13),
+    ("BC 9h (antes de Tijucas)", "balneário camboriú", 9),
+    ("Itapema 15h (volta)", "itapema", 15),
+    ("Florianópolis 13h", "florianópolis", 13),
+    ("Palhoça 10h", "palhoça", 10),
+]
+
+
+async def bonus_aneis(data_str: str, coordenadas, grupo_logistico: str) -> float:
+    """Regra anterior de calcular_bonus_rota (contagem por anéis de distância)"""
+    supabase = middleware.get_supabase_client()
+    bonus = 0.0
+    eventos = supabase.table("calendar_events").select("*").gte(
+        "start_time", f"{data_str}T00:00:00"
+    ).lt("start_time", f"{data_str}T23:59:59").execute().data or []
+    agendamentos_ai = supabase.table("agendamentos_ai").select("*").gte(
+        "data_agendada", f"{data_str}T00:00:00"
+    ).lt("data_agendada", f"{data_str}T23:59:59").in_("status", ["pendente", "confirmado"]).execute().data or []
+    for evento in eventos:
+        if evento.get('address'):
+            coords_evento = await geocodificar_offline(evento['address'])
+            if coords_evento:
+                distancia = middleware.calculate_distance(coordenadas, coords_evento)
+                if distancia <= 2:
+                    bonus += 5
+                elif distancia <= 5:
+                    bonus += 3
+                elif distancia <= 10:
+                    bonus += 1
+    if sum(1 for ag in agendamentos_ai if ag.get('grupo_logistico') == grupo_logistico) >= 2:
+        bonus += 2
+    return min(bonus, 10)
+
+
+def dia_do_corredor() -> datetime:
+    """Próximo dia útil permitido ao Grupo C, daqui a uma semana"""
+    cal = calendario()
+    dia = cal.proximo_dia_util(datetime.now() + timedelta(days=7))
+    while not cal.grupo_permitido(dia, "C"):
+        dia = cal.proximo_dia_util(dia + timedelta(days=1))
+    return datetime.combine(dia, datetime.min.time())
+
+
+def popular_corredor(banco, tecnico_id: str, dia: datetime) -> None:
+    fuso = middleware.pytz.timezone('America/Sao_Paulo')
+    for hora, endereco in CORREDOR:
+        banco.tabelas["calendar_events"].append({
+            "id": str(uuid.uuid4()), "technician_id": tecnico_id, "technician_name": "Técnico Corredor",
+            "client_name": "Cliente Corredor", "address": endereco,
+            "start_time": fuso.localize(dia.replace(hour=hora)).isoformat(),
+            "status": "confirmed", "event_type": "service",
+        })
+
+
+async def medir_chamadas(chamada, banco, repeticoes: int, frio: bool) -> Dict[str, float]:
+    duracoes, consultas = [], []
+    for _ in range(repeticoes):
+        if frio:
+            middleware.cache_rotas.limpar()
+        antes = banco.consultas
+        inicio = time.perf_counter()
+        await chamada()
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(banco.consultas - antes)
+    return {"ms": round(sum(duracoes) / len(duracoes), 3), "consultas": max(consultas)}
+
+
+def medir_parada(paradas: int, repeticoes: int) -> Dict[str, float]:
+    """Nova parada numa rota de N paradas: incremental (O(n)) vs. remontar a matriz (O(n²))"""
+    aleatorio = random.Random(42)
+    pontos = [((-48.7 + aleatorio.random() * 0.2), (-27.6 + aleatorio.random() * 0.7), 8 + aleatorio.random() * 9)
+              for _ in range(paradas)]
+    base = tuple(middleware.FLORIANOPOLIS_CENTER)
+    nova = ((-48.63, -26.99), 13.0)
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        rota = RotaDia(base, (((lon, lat), hora) for lon, lat, hora in pontos))
+        rota.adicionar(*nova)
+    remontar = (time.perf_counter() - inicio) * 1000 / repeticoes
+
+    rota = RotaDia(base, (((lon, lat), hora) for lon, lat, hora in pontos))
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        copia = RotaDia.__new__(RotaDia)
+        copia.pontos, copia.horas, copia.matriz = list(rota.pontos), list(rota.horas), [list(linha) for linha in rota.matriz]
+        copia.adicionar(*nova)
+    incremental_com_copia = (time.perf_counter() - inicio) * 1000 / repeticoes
+    return {"paradas": paradas, "remontar_ms": round(remontar, 3), "incremental_ms": round(incremental_com_copia, 3)}
+
+
+async def executar(args: argparse.Namespace) -> Dict[str, Any]:
+    banco, _ = preparar_ambiente_offline(tecnicos=1, dias=0, latencia_ms=args.latencia_ms)
+    tecnico_id = banco.tabelas["technicians"][0]["id"]
+    dia = dia_do_corredor()
+    data_str = dia.strftime('%Y-%m-%d')
+    popular_corredor(banco, tecnico_id, dia)
+
+    candidatos = []
+    for nome, cidade, hora in CANDIDATOS:
+        coordenadas = COORDENADAS_OFFLINE[cidade]
+        grupo = middleware.determine_logistics_group_by_coordinates(coordenadas)
+        insercao = await middleware.avaliar_insercao_rota(data_str, coordenadas, hora)
+        candidatos.append({
+            "candidato": nome,
+            "grupo": grupo,
+            "aneis": await bonus_aneis(data_str, coordenadas, grupo),
+            "insercao": await middleware.calcular_bonus_rota(data_str, hora, coordenadas, grupo),
+            "km_extra": insercao.km_extra if insercao else None,
+            "min_extra": insercao.minutos_extra if insercao else None,
+        })
+
+    coordenadas_bc = COORDENADAS_OFFLINE["balneário camboriú"]
+    tempos = {
+        "aneis": await medir_chamadas(lambda: bonus_aneis(data_str, coordenadas_bc, "C"), banco, args.repeticoes, False),
+        "insercao_frio": await medir_chamadas(
+            lambda: middleware.calcular_bonus_rota(data_str, 13, coordenadas_bc, "C"), banco, args.repeticoes, True),
+        "insercao_quente": await medir_chamadas(
+            lambda: middleware.calcular_bonus_rota(data_str, 13, coordenadas_bc, "C"), banco, args.repeticoes, False),
+    }
+    return {"dia": data_str, "candidatos": candidatos, "tempos": tempos,
+            "nova_parada": medir_parada(args.paradas, args.repeticoes)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bonus de rota: anéis de distância vs. custo de inserção")
+    parser.add_argument("--paradas", type=int, default=20, help="Paradas na rota da medição de nova parada")
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--json", help="Salvar resultados neste arquivo")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    resultado = asyncio.run(executar(args))
+
+    print(f"\n🛣️ Corredor do Grupo C em {resultado['dia']}: " + " → ".join(f"{h}h" for h, _ in CORREDOR))
+    print(f"{'candidato':<26} {'grupo':>5} {'anéis':>6} {'inserção':>9} {'+km':>7} {'+min':>7}")
+    for c in resultado["candidatos"]:
+        print(f"{c['candidato']:<26} {c['grupo']:>5} {c['aneis']:>6} {c['insercao']:>9} "
+              f"{str(c['km_extra']):>7} {str(c['min_extra']):>7}")
+    print(f"\n{'bonus':<16} {'ms/chamada':>11} {'consultas':>10}")
+    for nome, tempo in resultado["tempos"].items():
+        print(f"{nome:<16} {tempo['ms']:>11} {tempo['consultas']:>10}")
+    parada = resultado["nova_parada"]
+    print(f"\nNova parada em rota de {parada['paradas']}: remontar {parada['remontar_ms']}ms, "
+          f"incremental {parada['incremental_ms']}ms (com cópia da matriz)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), **resultado}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados salvos em {args.json}")
+
+    candidatos = resultado["candidatos"]
+    if max(candidatos, key=lambda c: c["insercao"]) is not candidatos[0]:
+        print("❌ O candidato no caminho do corredor não tem o maior bonus de inserção")
+        return 1
+    if resultado["tempos"]["insercao_quente"]["ms"] > resultado["tempos"]["aneis"]["ms"]:
+        print("❌ Bonus por inserção (cache quente) mais lento que o de anéis")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
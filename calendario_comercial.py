@@ -0,0 +1,294 @@
+"""
+📅 Calendário comercial pré-calculado
+
+Para uma janela móvel de um ano (de uma semana atrás até ~12 meses à frente) guarda,
+por dia, em tabelas indexadas pelo número do dia:
+- tipo do dia: útil, sábado, domingo ou feriado
+- máscara de horas de trabalho (bit h ligado = faixa das h horas atendida)
+- grupos logísticos permitidos (Grupo C: nunca segunda nem sábado)
+- índice do próximo dia útil
+
+Os geradores de horários consultam estas tabelas (O(1)) em vez de refazer por
+candidato weekday(), listas de faixas comerciais e a regra do Grupo C.
+
+Feriados:
+- nacionais fixos (Lei 662/1949, 6.802/1980, 14.759/2023) e Sexta-feira Santa
+- pontos facultativos: Carnaval (segunda e terça), Quarta-feira de Cinzas até as 14h e
+  Corpus Christi. Não são feriados: atendimento normal por padrão;
+  CALENDARIO_PONTOS_FACULTATIVOS=folga fecha a agenda nesses dias
+- Santa Catarina: Data Magna (11/08) e Santa Catarina de Alexandria (25/11). A lei
+  estadual transfere a comemoração para o domingo seguinte quando caem em dia útil,
+  então só aparecem na tabela como informação (não fecham agenda)
+- FERIADOS_EXTRAS=2026-03-23:Aniversário de Florianópolis,2026-12-24: municipais,
+  recessos e emendas (nome opcional)
+"""
+
+import functools
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+UTIL, SABADO, DOMINGO, FERIADO = range(4)
+
+# Faixas comerciais: manhã 9h-11h e tarde 13h-17h (faixa = hora de chegada prevista)
+HORAS_COMERCIAIS = (9, 10, 13, 14, 15, 16)
+MASCARA_COMERCIAL = sum(1 << hora for hora in HORAS_COMERCIAIS)
+# Quarta-feira de Cinzas: ponto facultativo até as 14h
+MASCARA_APOS_14H = sum(1 << hora for hora in HORAS_COMERCIAIS if hora >= 14)
+
+GRUPOS = {"A": 1, "B": 2, "C": 4}
+TODOS_GRUPOS = 1 | 2 | 4
+
+FERIADOS_NACIONAIS = {
+    (1, 1): "Confraternização Universal",
+    (4, 21): "Tiradentes",
+    (5, 1): "Dia do Trabalho",
+    (9, 7): "Independência do Brasil",
+    (10, 12): "Nossa Senhora Aparecida",
+    (11, 2): "Finados",
+    (11, 15): "Proclamação da República",
+    (11, 20): "Dia Nacional de Zumbi e da Consciência Negra",
+    (12, 25): "Natal",
+}
+
+# Comemorados no domingo seguinte quando caem em dia útil (não fecham agenda)
+DATAS_SANTA_CATARINA = {
+    (8, 11): "Data Magna de Santa Catarina",
+    (11, 25): "Santa Catarina de Alexandria",
+}
+
+JANELA_DIAS = 380
+DIAS_ANTES = 7
+HORAS_POR_MASCARA: Dict[int, Tuple[int, ...]] = {}
+
+
+def pascoa(ano: int) -> date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher, calendário gregoriano)"""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(ano, mes, dia + 1)
+
+
+@functools.lru_cache(maxsize=8)
+def feriados_do_ano(ano: int, pontos_facultativos: bool = False) -> Dict[date, Tuple[str, int]]:
+    """{data: (nome, máscara de horas que continuam atendidas)} do ano"""
+    feriados = {date(ano, mes, dia): (nome, 0) for (mes, dia), nome in FERIADOS_NACIONAIS.items()}
+    domingo_pascoa = pascoa(ano)
+    feriados[domingo_pascoa - timedelta(days=2)] = ("Sexta-feira Santa", 0)
+    if pontos_facultativos:
+        feriados[domingo_pascoa - timedelta(days=48)] = ("Carnaval (segunda-feira)", 0)
+        feriados[domingo_pascoa - timedelta(days=47)] = ("Carnaval (terça-feira)", 0)
+        feriados[domingo_pascoa - timedelta(days=46)] = ("Quarta-feira de Cinzas (até 14h)", MASCARA_APOS_14H)
+        feriados[domingo_pascoa + timedelta(days=60)] = ("Corpus Christi", 0)
+    return feriados
+
+
+def ler_feriados_extras(valor: Optional[str] = None) -> Dict[date, str]:
+    """FERIADOS_EXTRAS: datas ISO separadas por vírgula, com nome opcional depois de ':'"""
+    valor = os.getenv("FERIADOS_EXTRAS", "") if valor is None else valor
+    extras = {}
+    for item in valor.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        data_texto, _, nome = item.partition(":")
+        try:
+            extras[date.fromisoformat(data_texto.strip())] = nome.strip() or "Feriado local"
+        except ValueError:
+            logger.warning(f"⚠️ FERIADOS_EXTRAS: data inválida ignorada: {item}")
+    return extras
+
+
+def horas_da_mascara(mascara: int) -> Tuple[int, ...]:
+    """Horas (em ordem) com bit ligado na máscara"""
+    horas = HORAS_POR_MASCARA.get(mascara)
+    if horas is None:
+        horas = HORAS_POR_MASCARA[mascara] = tuple(hora for hora in range(24) if mascara >> hora & 1)
+    return horas
+
+
+def hora_comercial(hora: int) -> bool:
+    return 0 <= hora < 24 and bool(MASCARA_COMERCIAL >> hora & 1)
+
+
+class CalendarioComercial:
+    """
+    📅 Tabelas por dia de uma janela de datas (tipo, horas, grupos, próximo dia útil).
+    Datas fora da janela são classificadas na hora pelas mesmas regras.
+    """
+
+    def __init__(
+        self,
+        inicio: date,
+        dias: int = JANELA_DIAS,
+        feriados_extras: Optional[Dict[date, str]] = None,
+        pontos_facultativos: bool = False,
+    ):
+        self.inicio = inicio
+        self.dias = dias
+        self.feriados_extras = dict(feriados_extras or {})
+        self.pontos_facultativos = pontos_facultativos
+        self._ordinal_inicio = inicio.toordinal()
+
+        self._tipo = bytearray(dias)
+        self._grupos = bytearray(dias)
+        self._horas: List[int] = [0] * dias
+        self._nomes: Dict[int, str] = {}
+        for indice in range(dias):
+            tipo, horas, grupos, nome = self._classificar(inicio + timedelta(days=indice))
+            self._tipo[indice] = tipo
+            self._horas[indice] = horas
+            self._grupos[indice] = grupos
+            if nome:
+                self._nomes[indice] = nome
+
+        # Próximo dia útil (índice >= i); `dias` quando não há nenhum dentro da janela
+        self._proximo_util = [dias] * (dias + 1)
+        for indice in range(dias - 1, -1, -1):
+            self._proximo_util[indice] = indice if self._tipo[indice] == UTIL else self._proximo_util[indice + 1]
+
+    def _classificar(self, dia: date) -> Tuple[int, int, int, Optional[str]]:
+        """(tipo, máscara de horas, grupos permitidos, nome do feriado) pelas regras"""
+        dia = date(dia.year, dia.month, dia.day)
+        semana = dia.weekday()
+        nome = self.feriados_extras.get(dia)
+        horas_feriado = 0
+        if nome is None:
+            nome, horas_feriado = feriados_do_ano(dia.year, self.pontos_facultativos).get(dia, (None, 0))
+        if nome is None:
+            nome = DATAS_SANTA_CATARINA.get((dia.month, dia.day))
+            if nome is not None and semana < 5:
+                nome = f"{nome} (comemorada no domingo seguinte)"
+            if semana == 6:
+                return DOMINGO, 0, 0, nome
+            if semana == 5:
+                return SABADO, MASCARA_COMERCIAL, 0, nome
+            # 🚫 REGRA GRUPO C: Nunca às segundas-feiras
+            return UTIL, MASCARA_COMERCIAL, TODOS_GRUPOS & ~GRUPOS["C"] if semana == 0 else TODOS_GRUPOS, nome
+        if horas_feriado and semana < 5:
+            # Meio expediente (Quarta-feira de Cinzas): dia útil só com as faixas restantes
+            return UTIL, horas_feriado, TODOS_GRUPOS, nome
+        return FERIADO, 0, 0, nome
+
+    def _indice(self, dia: date) -> Optional[int]:
+        indice = dia.toordinal() - self._ordinal_inicio
+        return indice if 0 <= indice < self.dias else None
+
+    def tipo(self, dia: date) -> int:
+        indice = self._indice(dia)
+        return self._tipo[indice] if indice is not None else self._classificar(dia)[0]
+
+    def dia_util(self, dia: date) -> bool:
+        return self.tipo(dia) == UTIL
+
+    def feriado(self, dia: date) -> Optional[str]:
+        """Nome do feriado/data comemorativa, se houver"""
+        indice = self._indice(dia)
+        if indice is not None:
+            return self._nomes.get(indice)
+        return self._classificar(dia)[3]
+
+    def horas(self, dia: date, sabado: bool = False) -> int:
+        """Máscara das horas atendidas no dia (0 = sem atendimento); sábado só com sabado=True"""
+        indice = self._indice(dia)
+        if indice is None:
+            tipo, horas, _, _ = self._classificar(dia)
+        else:
+            tipo, horas = self._tipo[indice], self._horas[indice]
+        if tipo == UTIL or (tipo == SABADO and sabado):
+            return horas
+        return 0
+
+    def hora_de_trabalho(self, dia: date, hora: int, sabado: bool = False) -> bool:
+        return 0 <= hora < 24 and bool(self.horas(dia, sabado) >> hora & 1)
+
+    def grupo_permitido(self, dia: date, grupo: str) -> bool:
+        indice = self._indice(dia)
+        grupos = self._grupos[indice] if indice is not None else self._classificar(dia)[2]
+        return bool(grupos & GRUPOS.get(grupo, 0))
+
+    def proximo_dia_util(self, dia: date) -> date:
+        """O próprio dia, se útil, ou o próximo dia útil"""
+        indice = self._indice(dia)
+        if indice is not None:
+            proximo = self._proximo_util[indice]
+            if proximo < self.dias:
+                return self.inicio + timedelta(days=proximo)
+            dia = self.inicio + timedelta(days=self.dias)
+        dia = date(dia.year, dia.month, dia.day)
+        while self._classificar(dia)[0] != UTIL:
+            dia += timedelta(days=1)
+        return dia
+
+    def dias_uteis(self, inicio: date, quantidade: int) -> List[date]:
+        """Os `quantidade` próximos dias úteis a partir de `inicio` (inclusive)"""
+        dias = []
+        dia = self.proximo_dia_util(inicio)
+        while len(dias) < quantidade:
+            dias.append(dia)
+            dia = self.proximo_dia_util(dia + timedelta(days=1))
+        return dias
+
+    def feriados_entre(self, inicio: date, fim: date) -> List[Tuple[date, str]]:
+        dias = []
+        dia = date(inicio.year, inicio.month, inicio.day)
+        while dia <= fim:
+            nome = self.feriado(dia)
+            if nome:
+                dias.append((dia, nome))
+            dia += timedelta(days=1)
+        return dias
+
+
+_calendario: Optional[CalendarioComercial] = None
+
+
+def hoje_brasil() -> date:
+    return datetime.now(pytz.timezone('America/Sao_Paulo')).date()
+
+
+def calendario(hoje: Optional[date] = None) -> CalendarioComercial:
+    """Calendário da janela atual; refeito quando a janela fica mais de 30 dias para trás"""
+    global _calendario
+    hoje = hoje or hoje_brasil()
+    if _calendario is None or (hoje - _calendario.inicio).days > DIAS_ANTES + 30:
+        _calendario = CalendarioComercial(
+            hoje - timedelta(days=DIAS_ANTES),
+            feriados_extras=ler_feriados_extras(),
+            pontos_facultativos=os.getenv("CALENDARIO_PONTOS_FACULTATIVOS", "trabalho") == "folga",
+        )
+        logger.info(
+            f"📅 Calendário comercial: {_calendario.inicio.isoformat()} a "
+            f"{(_calendario.inicio + timedelta(days=_calendario.dias - 1)).isoformat()}, "
+            f"{len(_calendario._nomes)} feriados/datas"
+        )
+    return _calendario
+
+
+def recarregar() -> CalendarioComercial:
+    """Refaz o calendário (após mudar FERIADOS_EXTRAS ou CALENDARIO_PONTOS_FACULTATIVOS)"""
+    global _calendario
+    _calendario = None
+    return calendario()
+
+
+if __name__ == "__main__":
+    cal = calendario()
+    fim = cal.inicio + timedelta(days=cal.dias - 1)
+    print(f"📅 Calendário comercial de {cal.inicio:%d/%m/%Y} a {fim:%d/%m/%Y}")
+    for dia, nome in cal.feriados_entre(cal.inicio, fim):
+        tipo = ("útil", "sábado", "domingo", "feriado")[cal.tipo(dia)]
+        print(f"  {dia:%d/%m/%Y} ({tipo:<7}) {nome}")
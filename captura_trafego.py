@@ -0,0 +1,189 @@
+"""
+🎥 Captura de tráfego real para replay
+
+Grava em JSONL cada requisição (corpo já anonimizado), com instante de chegada,
+status e duração. O arquivo alimenta replay_trafego.py.
+
+Anonimização: telefones, CPFs, nomes e e-mails viram pseudônimos determinísticos
+(o mesmo telefone na ETAPA 1 e na ETAPA 2 gera o mesmo pseudônimo, mantendo a
+forma da conversa); números de endereço são trocados, mas CEP e cidade ficam,
+pois definem o grupo logístico. Textos livres têm e-mails e sequências longas de
+dígitos mascarados.
+
+Ativação por ambiente:
+    CAPTURA_TRAFEGO_ARQUIVO=captura.jsonl
+    CAPTURA_TRAFEGO_AMOSTRAGEM=1.0   (fração das requisições gravadas)
+    CAPTURA_TRAFEGO_SAL=...          (sal dos pseudônimos; padrão aleatório por processo)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_TELEFONE = {"telefone", "telefone_contato", "telefone_cliente", "phone", "client_phone", "from"}
+CAMPOS_DOCUMENTO = {"cpf", "cnpj", "cpf_cnpj", "client_cpf_cnpj", "documento"}
+CAMPOS_NOME = {"nome", "nome_cliente", "name", "client_name", "cliente"}
+CAMPOS_EMAIL = {"email", "client_email"}
+CAMPOS_ENDERECO = {"endereco", "complemento", "address", "pickup_address"}
+HEADERS_GRAVADOS = ("content-type", "idempotency-key", "user-agent")
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_CEP = re.compile(r"\d{5}-?\d{3}")
+_DIGITOS_LONGOS = re.compile(r"\d[\d.\-/ ]{6,}\d")
+_NUMERO = re.compile(r"\b\d{1,5}\b")
+
+
+class Anonimizador:
+    """Substitui dados pessoais por pseudônimos estáveis (mesma entrada + mesmo sal = mesma saída)"""
+
+    def __init__(self, sal: Optional[str] = None):
+        self.sal = sal if sal is not None else os.getenv("CAPTURA_TRAFEGO_SAL") or os.urandom(8).hex()
+
+    def _hash(self, valor: str) -> str:
+        return hashlib.sha1(f"{self.sal}:{valor}".encode("utf-8")).hexdigest()
+
+    def _digitos(self, valor: str, quantidade: int) -> str:
+        return str(int(self._hash(valor), 16))[:quantidade].zfill(quantidade)
+
+    def telefone(self, valor: str) -> str:
+        digitos = re.sub(r"\D", "", valor)
+        if not digitos:
+            return valor
+        # Mantém DDD e tamanho: o formato continua válido para a normalização do middleware
+        return (digitos[:2] + self._digitos(digitos, max(len(digitos) - 2, 1)))[:len(digitos)]
+
+    def documento(self, valor: str) -> str:
+        digitos = re.sub(r"\D", "", valor)
+        return self._digitos(digitos, len(digitos)) if digitos else valor
+
+    def nome(self, valor: str) -> str:
+        return f"Cliente {self._hash(valor.strip().lower())[:6]}" if valor.strip() else valor
+
+    def email(self, valor: str) -> str:
+        return f"{self._hash(valor.strip().lower())[:10]}@exemplo.com" if valor.strip() else valor
+
+    def endereco(self, valor: str) -> str:
+        ceps = _CEP.findall(valor)
+        texto = _CEP.sub("\0", valor)
+        texto = _NUMERO.sub(lambda m: str(100 + int(self._digitos(m.group(0), 3)) % 900), texto)
+        for cep in ceps:
+            texto = texto.replace("\0", cep, 1)
+        return texto
+
+    def texto_livre(self, valor: str) -> str:
+        valor = _EMAIL.sub(lambda m: self.email(m.group(0)), valor)
+        return _DIGITOS_LONGOS.sub(lambda m: self._digitos(m.group(0), len(re.sub(r"\D", "", m.group(0)))), valor)
+
+    def anonimizar(self, dados: Any, campo: str = "") -> Any:
+        if isinstance(dados, dict):
+            return {chave: self.anonimizar(valor, chave.lower()) for chave, valor in dados.items()}
+        if isinstance(dados, list):
+            return [self.anonimizar(item, campo) for item in dados]
+        if not isinstance(dados, str):
+            return dados
+        if campo in CAMPOS_TELEFONE:
+            return self.telefone(dados)
+        if campo in CAMPOS_DOCUMENTO:
+            return self.documento(dados)
+        if campo in CAMPOS_NOME:
+            return self.nome(dados)
+        if campo in CAMPOS_EMAIL:
+            return self.email(dados)
+        if campo in CAMPOS_ENDERECO:
+            return self.endereco(dados)
+        return self.texto_livre(dados)
+
+
+class CapturaTrafego:
+    """
+    🎥 Gravador de requisições em JSONL.
+
+    A escrita em disco acontece em uma thread própria (fila em memória),
+    fora do event loop.
+    """
+
+    def __init__(self, arquivo: Optional[str] = None, amostragem: Optional[float] = None,
+                 rotas: Optional[Iterable[str]] = None, anonimizador: Optional[Anonimizador] = None):
+        self.arquivo = arquivo if arquivo is not None else os.getenv("CAPTURA_TRAFEGO_ARQUIVO", "")
+        self.amostragem = amostragem if amostragem is not None else float(os.getenv("CAPTURA_TRAFEGO_AMOSTRAGEM", "1.0"))
+        # Por padrão só interessam as rotas chamadas pelo ClienteChat (POST)
+        self.rotas = set(rotas) if rotas is not None else None
+        self.anonimizador = anonimizador or Anonimizador()
+        self._fila: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self.estatisticas = {"gravadas": 0, "descartadas": 0, "erros": 0}
+
+    @property
+    def ativa(self) -> bool:
+        return bool(self.arquivo)
+
+    def deve_capturar(self, metodo: str, caminho: str) -> bool:
+        if not self.ativa or metodo != "POST":
+            return False
+        if self.rotas is not None and caminho not in self.rotas:
+            return False
+        if self.amostragem >= 1.0 or random.random() < self.amostragem:
+            return True
+        self.estatisticas["descartadas"] += 1
+        return False
+
+    def registrar(self, metodo: str, caminho: str, query: str, headers: Dict[str, str], corpo: bytes,
+                  status: int, duracao_ms: float, chegada: float) -> None:
+        """Anonimiza e enfileira uma requisição para gravação"""
+        try:
+            try:
+                conteudo = self.anonimizador.anonimizar(json.loads(corpo)) if corpo else None
+                corpo_texto = None
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                conteudo = None
+                corpo_texto = self.anonimizador.texto_livre(corpo.decode("utf-8", errors="replace"))
+
+            registro = {
+                "ts": round(chegada, 3),
+                "method": metodo,
+                "path": caminho,
+                "query": query,
+                "headers": {nome: headers[nome] for nome in HEADERS_GRAVADOS if nome in headers},
+                "json": conteudo,
+                "body": corpo_texto,
+                "status": status,
+                "duracao_ms": round(duracao_ms, 1),
+            }
+            self._garantir_escritor()
+            self._fila.put(json.dumps(registro, ensure_ascii=False))
+        except Exception as e:
+            self.estatisticas["erros"] += 1
+            logger.warning(f"⚠️ Falha ao capturar requisição {caminho}: {e}")
+
+    def _garantir_escritor(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._escrever, name="captura-trafego", daemon=True)
+            self._thread.start()
+
+    def _escrever(self) -> None:
+        with open(self.arquivo, "a", encoding="utf-8") as saida:
+            while True:
+                linha = self._fila.get()
+                if linha is None:
+                    return
+                saida.write(linha + "\n")
+                saida.flush()
+                self.estatisticas["gravadas"] += 1
+
+    def parar(self, timeout: float = 5.0) -> None:
+        """Grava o que estiver na fila e encerra a thread de escrita"""
+        if self._thread is not None and self._thread.is_alive():
+            self._fila.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+
+captura_trafego = CapturaTrafego()
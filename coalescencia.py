@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class _LiderCancelado(Exception):
+    """A chamada que executava a computação foi cancelada (cliente desconectou, desligamento)"""
+
+
+class SingleFlight:
+    """
+    🔀 Coalescência de requisições idênticas em andamento.
+
+    Enquanto uma computação para a chave estiver em execução, as demais
+    chamadas com a mesma chave aguardam e recebem o mesmo resultado
+    (ou a mesma exceção) em vez de repetir o trabalho. Se a chamada que executa
+    for cancelada, o primeiro seguidor assume a computação e os demais passam a
+    aguardá-lo: o cancelamento de uma requisição não derruba as outras.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._em_andamento: Dict[str, asyncio.Future] = {}
+        self.estatisticas = {
+            "execucoes": 0,
+            "coalescidas": 0,  # computações economizadas
+            "retomadas": 0,  # seguidores que assumiram após o cancelamento do líder
+            "em_andamento": 0,
+        }
+
+    async def executar(self, chave: str, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executa a computação ou aguarda a que já está em andamento para a chave.
+
+        Args:
+            chave: Fingerprint normalizado da requisição
+            fabrica: Função que cria a corrotina da computação
+
+        Returns:
+            Any: Resultado compartilhado entre todas as chamadas coalescidas
+        """
+        while (futuro := self._em_andamento.get(chave)) is not None:
+            self.estatisticas["coalescidas"] += 1
+            logger.info(f"🔀 [{self.nome}] Requisição idêntica em andamento - aguardando resultado compartilhado")
+            try:
+                # shield: o cancelamento de um seguidor não cancela a computação do líder
+                return await asyncio.shield(futuro)
+            except _LiderCancelado:
+                # O primeiro a voltar aqui encontra a chave livre e executa; os outros o aguardam
+                self.estatisticas["coalescidas"] -= 1
+                self.estatisticas["retomadas"] += 1
+                logger.info(f"🔀 [{self.nome}] Execução compartilhada cancelada - retomando")
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._em_andamento[chave] = futuro
+        self.estatisticas["execucoes"] += 1
+        self.estatisticas["em_andamento"] = len(self._em_andamento)
+        try:
+            resultado = await fabrica()
+        except asyncio.CancelledError:
+            futuro.set_exception(_LiderCancelado())
+            futuro.exception()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            # Evita o aviso "exception was never retrieved" quando não há seguidores
+            futuro.exception()
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            self._em_andamento.pop(chave, None)
+            self.estatisticas["em_andamento"] = len(self._em_andamento)
@@ -0,0 +1,318 @@
+"""
+🚦 Controle de admissão das rotas caras
+
+/agendamento-inteligente, /agendamento-inteligente-completo e /consultar-disponibilidade
+fazem dezenas de consultas cada. Um robô em laço ou uma enxurrada de reenvios ocupa o
+worker inteiro e todo mundo espera. Antes de chegar ao endpoint, cada requisição passa por:
+- baldes de fichas por telefone e por IP: `capacidade` requisições de uma vez, repostas a
+  `por_minuto`; sem ficha, 429 na hora com Retry-After
+- limite de concorrência por rota (por worker): até `maximo` em andamento; as demais
+  esperam em ordem de chegada por no máximo `espera_maxima` segundos (nunca além do prazo
+  da requisição). A fila cabe o que as vagas atendem dentro da espera, pelo tempo médio de
+  atendimento da rota (maximo · espera / tempo médio, até `fila_maxima`): quem ainda seria
+  atendido a tempo espera; quem não seria recebe 503 na hora, sem esperar para nada
+
+Os baldes ficam no armazenamento do estado compartilhado (memória do processo por padrão).
+Com vários workers, ler e gravar o balde não é atômico: duas requisições simultâneas do
+mesmo telefone em workers diferentes podem gastar a mesma ficha. Para conter robôs isso basta.
+As demais rotas (/health, tracking, ETAPA 2) não passam por aqui.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from estado_compartilhado import criar_armazenamento
+from metricas import gauge, registro
+from prazos import prazo_atual
+
+logger = logging.getLogger(__name__)
+
+requisicoes_recusadas = registro.contador(
+    "admission_rejected_total", "Requisições recusadas pelo controle de admissão", ("route", "reason")
+)
+espera_admissao = registro.histograma(
+    "admission_queue_wait_seconds", "Espera na fila de admissão das requisições admitidas", ("route",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+)
+
+
+class AdmissaoRecusada(Exception):
+    """Requisição recusada antes do endpoint (motivo: telefone, ip, fila_cheia ou espera)"""
+
+    def __init__(self, rota: str, motivo: str, tentar_em: float):
+        super().__init__(f"{rota} recusada ({motivo})")
+        self.rota = rota
+        self.motivo = motivo
+        self.tentar_em = tentar_em
+
+    @property
+    def status_code(self) -> int:
+        return 429 if self.motivo in ("telefone", "ip") else 503
+
+    @property
+    def retry_after(self) -> str:
+        return str(max(1, math.ceil(self.tentar_em)))
+
+
+class BaldesFichas:
+    """
+    🪣 Um balde de fichas por chave (telefone ou IP), guardado no armazenamento
+    """
+
+    def __init__(self, nome: str, capacidade: int, por_minuto: float, armazenamento=None):
+        """
+        Args:
+            nome: Nome dos baldes (namespace do armazenamento e logs)
+            capacidade: Requisições seguidas permitidas com o balde cheio (0 = desligado)
+            por_minuto: Fichas repostas por minuto (0 = desligado)
+            armazenamento: Sobrescreve criar_armazenamento(f"limite_{nome}")
+        """
+        self.nome = nome
+        self.capacidade = capacidade
+        self.taxa = por_minuto / 60
+        self.armazenamento = armazenamento if armazenamento is not None else criar_armazenamento(f"limite_{nome}")
+        # Balde esquecido depois de tempo suficiente para encher de novo
+        self.ttl = math.ceil(capacidade / self.taxa) + 1 if self.ativo else 0
+        self._trava = threading.Lock()
+        self.estatisticas = {"permitidas": 0, "recusadas": 0}
+
+    @property
+    def ativo(self) -> bool:
+        return self.capacidade > 0 and self.taxa > 0
+
+    def consumir(self, chave: str) -> float:
+        """0 se a requisição pode seguir; senão, segundos até a próxima ficha"""
+        if not self.ativo or not chave:
+            return 0.0
+        with self._trava:
+            agora = time.time()
+            estado = self.armazenamento.get(chave)
+            if estado is None:
+                fichas = float(self.capacidade)
+            else:
+                fichas, instante = estado
+                fichas = min(self.capacidade, fichas + max(0.0, agora - instante) * self.taxa)
+            if fichas < 1:
+                self.armazenamento.set(chave, (fichas, agora), ttl=self.ttl)
+                self.estatisticas["recusadas"] += 1
+                return (1 - fichas) / self.taxa
+            self.armazenamento.set(chave, (fichas - 1, agora), ttl=self.ttl)
+            self.estatisticas["permitidas"] += 1
+            return 0.0
+
+    def limpar(self) -> None:
+        self.armazenamento.clear()
+
+
+class LimiteConcorrencia:
+    """
+    🚧 Vagas de uma rota no worker; quem não tem vaga espera em ordem de chegada
+    """
+
+    def __init__(self, rota: str, maximo: int, fila_maxima: int, peso_media: float = 0.2):
+        self.rota = rota
+        self.maximo = maximo
+        self.fila_maxima = fila_maxima
+        self.peso_media = peso_media
+        self.em_andamento = 0
+        # Média móvel exponencial do tempo de atendimento (s); None até o primeiro
+        self.atendimento_medio: Optional[float] = None
+        # Futuros de quem espera; a vaga é repassada diretamente ao primeiro da fila
+        self._fila: Deque[asyncio.Future] = deque()
+        self.estatisticas = {"admitidas": 0, "esperaram": 0, "fila_cheia": 0, "espera": 0}
+
+    @property
+    def na_fila(self) -> int:
+        return len(self._fila)
+
+    def fila_permitida(self, espera_maxima: float) -> int:
+        """Quantos cabem na fila e ainda seriam atendidos dentro da espera"""
+        if not self.atendimento_medio:
+            return self.fila_maxima
+        cabem = int(self.maximo * espera_maxima / self.atendimento_medio)
+        return max(self.maximo, min(self.fila_maxima, cabem))
+
+    def espera_estimada(self) -> float:
+        """Segundos até esvaziar a fila atual (Retry-After da fila cheia)"""
+        return (self.na_fila + 1) / max(1, self.maximo) * (self.atendimento_medio or 1.0)
+
+    async def entrar(self, espera_maxima: float) -> None:
+        if self.em_andamento < self.maximo and not self._fila:
+            self.em_andamento += 1
+            self.estatisticas["admitidas"] += 1
+            return
+        if espera_maxima <= 0 or len(self._fila) >= self.fila_permitida(espera_maxima):
+            self.estatisticas["fila_cheia"] += 1
+            raise AdmissaoRecusada(self.rota, "fila_cheia", self.espera_estimada())
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._fila.append(futuro)
+        try:
+            await asyncio.wait_for(futuro, espera_maxima)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if futuro.done() and not futuro.cancelled():
+                self.sair()  # a vaga chegou junto com o timeout: devolve ao próximo
+            elif futuro in self._fila:
+                self._fila.remove(futuro)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.estatisticas["espera"] += 1
+            raise AdmissaoRecusada(self.rota, "espera", espera_maxima) from None
+        self.estatisticas["admitidas"] += 1
+        self.estatisticas["esperaram"] += 1
+
+    def sair(self, duracao: Optional[float] = None) -> None:
+        """Libera a vaga (repassada ao primeiro da fila); duracao alimenta o tempo médio"""
+        if duracao is not None:
+            anterior = self.atendimento_medio
+            self.atendimento_medio = duracao if anterior is None else anterior + self.peso_media * (duracao - anterior)
+        while self._fila:
+            futuro = self._fila.popleft()
+            if not futuro.done():
+                futuro.set_result(None)
+                return
+        self.em_andamento -= 1
+
+    def resumo(self) -> Dict:
+        return {
+            "maximo": self.maximo,
+            "em_andamento": self.em_andamento,
+            "na_fila": self.na_fila,
+            "atendimento_medio_ms": round(self.atendimento_medio * 1000, 1) if self.atendimento_medio else None,
+            **self.estatisticas,
+        }
+
+
+class ControleAdmissao:
+    """
+    🚦 Baldes por telefone/IP + limite de concorrência das rotas caras
+    """
+
+    def __init__(
+        self,
+        rotas: Iterable[str],
+        maximo_concorrentes: int = 4,
+        fila_maxima: int = 256,
+        espera_maxima: float = 2.0,
+        telefone: Optional[BaldesFichas] = None,
+        ip: Optional[BaldesFichas] = None,
+        ips_isentos: Iterable[str] = (),
+        reserva_prazo: float = 1.0,
+    ):
+        """
+        Args:
+            rotas: Caminhos controlados (apenas POST)
+            maximo_concorrentes: Requisições em andamento por rota (0 = sem limite)
+            fila_maxima: Teto da fila por rota (o tamanho efetivo vem da espera e do tempo médio)
+            espera_maxima: Segundos de espera por uma vaga
+            telefone: Baldes por telefone (None = sem limite)
+            ip: Baldes por IP (None = sem limite)
+            ips_isentos: IPs fora do balde por IP (ex.: saída do ClienteChat)
+            reserva_prazo: Segundos do prazo da requisição guardados para o endpoint
+        """
+        self.rotas = set(rotas)
+        self.maximo_concorrentes = maximo_concorrentes
+        self.espera_maxima = espera_maxima
+        self.telefone = telefone
+        self.ip = ip
+        self.ips_isentos = set(ips_isentos)
+        self.reserva_prazo = reserva_prazo
+        self.limites: Dict[str, LimiteConcorrencia] = {
+            rota: LimiteConcorrencia(rota, maximo_concorrentes, fila_maxima) for rota in self.rotas
+        }
+
+    def controla(self, metodo: str, caminho: str) -> bool:
+        return metodo == "POST" and caminho in self.rotas
+
+    def _espera_permitida(self) -> float:
+        prazo = prazo_atual()
+        if prazo is None:
+            return self.espera_maxima
+        return max(0.0, min(self.espera_maxima, prazo.restante() - self.reserva_prazo))
+
+    def _recusar(self, recusa: AdmissaoRecusada) -> AdmissaoRecusada:
+        requisicoes_recusadas.inc(recusa.rota, recusa.motivo)
+        logger.warning(f"🚦 {recusa.rota} recusada ({recusa.motivo}); tentar de novo em {recusa.retry_after}s")
+        return recusa
+
+    def verificar_taxa(self, rota: str, telefone: Optional[str], ip: Optional[str]) -> None:
+        """Gasta uma ficha do telefone e do IP ou levanta AdmissaoRecusada"""
+        if self.telefone is not None and telefone:
+            tentar_em = self.telefone.consumir("".join(c for c in str(telefone) if c.isdigit()))
+            if tentar_em:
+                raise self._recusar(AdmissaoRecusada(rota, "telefone", tentar_em))
+        if self.ip is not None and ip and ip not in self.ips_isentos:
+            tentar_em = self.ip.consumir(ip)
+            if tentar_em:
+                raise self._recusar(AdmissaoRecusada(rota, "ip", tentar_em))
+
+    @asynccontextmanager
+    async def admitir(self, rota: str, telefone: Optional[str] = None, ip: Optional[str] = None):
+        """
+        async with controle.admitir(rota, telefone, ip): endpoint
+        Levanta AdmissaoRecusada sem executar o bloco.
+        """
+        self.verificar_taxa(rota, telefone, ip)
+        limite = self.limites.get(rota)
+        if limite is None or self.maximo_concorrentes <= 0:
+            yield
+            return
+
+        inicio = time.perf_counter()
+        try:
+            await limite.entrar(self._espera_permitida())
+        except AdmissaoRecusada as recusa:
+            raise self._recusar(recusa)
+        espera_admissao.observar(time.perf_counter() - inicio, rota)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            limite.sair(time.perf_counter() - inicio)
+
+    def resumo(self) -> Dict:
+        return {
+            "rotas": {rota: limite.resumo() for rota, limite in sorted(self.limites.items())},
+            "espera_maxima_s": self.espera_maxima,
+            "telefone": self.telefone.estatisticas if self.telefone is not None and self.telefone.ativo else None,
+            "ip": self.ip.estatisticas if self.ip is not None and self.ip.ativo else None,
+        }
+
+    def reiniciar(self) -> None:
+        """Esvazia os baldes e as estatísticas (testes e benchmarks)"""
+        for baldes in (self.telefone, self.ip):
+            if baldes is not None:
+                baldes.limpar()
+                baldes.estatisticas = {"permitidas": 0, "recusadas": 0}
+        for limite in self.limites.values():
+            limite.estatisticas = {chave: 0 for chave in limite.estatisticas}
+
+
+_controles: List[ControleAdmissao] = []
+
+
+def criar_controle_admissao(rotas: Iterable[str], **configuracao) -> ControleAdmissao:
+    controle = ControleAdmissao(rotas, **configuracao)
+    _controles.append(controle)
+    return controle
+
+
+def coletar_metricas_admissao() -> List[str]:
+    valores: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {"em_andamento": {}, "na_fila": {}}
+    for controle in _controles:
+        for rota, limite in controle.limites.items():
+            valores["em_andamento"][(("route", rota),)] = limite.em_andamento
+            valores["na_fila"][(("route", rota),)] = limite.na_fila
+    return (
+        gauge("admission_in_flight", "Requisições admitidas em andamento por rota", valores["em_andamento"])
+        + gauge("admission_queued", "Requisições esperando vaga por rota", valores["na_fila"])
+    )
+
+
+registro.registrar_coletor(coletar_metricas_admissao)
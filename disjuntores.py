@@ -0,0 +1,231 @@
+"""
+🔌 Disjuntores (circuit breakers) das dependências externas
+
+Com o Supabase ou o Nominatim lentos, cada requisição esperava o timeout inteiro da
+dependência. Um disjuntor por dependência acompanha as chamadas numa janela deslizante:
+- fechado: chamadas passam; abre quando, com pelo menos `minimo_chamadas` na janela,
+  a taxa de erros passa de `taxa_erros` ou a de chamadas lentas (> `lenta_ms`) passa
+  de `taxa_lentas`
+- aberto: chamadas falham na hora (DisjuntorAberto), sem I/O, por `tempo_aberto` segundos
+- meio aberto: deixa passar `sondas` chamadas de teste; sucesso fecha, falha reabre
+
+Quem chama decide o modo degradado enquanto o disjuntor não está fechado (quadro de
+disponibilidade vencido, sem bonus de rota, escrita na fila de saída).
+Thread-safe: o quadro de disponibilidade consulta o Supabase a partir de outra thread.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterable, List, Tuple
+
+from metricas import gauge, registro
+
+logger = logging.getLogger(__name__)
+
+FECHADO, MEIO_ABERTO, ABERTO = "fechado", "meio_aberto", "aberto"
+VALOR_ESTADO = {FECHADO: 0, MEIO_ABERTO: 1, ABERTO: 2}
+
+transicoes_disjuntor = registro.contador(
+    "circuit_breaker_transitions_total", "Mudanças de estado dos disjuntores", ("dependency", "state")
+)
+chamadas_recusadas = registro.contador(
+    "circuit_breaker_rejected_total", "Chamadas recusadas sem I/O com o disjuntor aberto", ("dependency",)
+)
+
+
+class DisjuntorAberto(Exception):
+    """Chamada recusada: a dependência está com o disjuntor aberto"""
+
+    def __init__(self, nome: str):
+        super().__init__(f"Disjuntor de {nome} aberto")
+        self.nome = nome
+
+
+class Disjuntor:
+    """
+    🔌 Estado de uma dependência a partir das últimas chamadas
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        taxa_erros: float = 0.5,
+        lenta_ms: float = 3000,
+        taxa_lentas: float = 0.8,
+        minimo_chamadas: int = 10,
+        janela: float = 30.0,
+        tempo_aberto: float = 30.0,
+        sondas: int = 1,
+    ):
+        """
+        Args:
+            nome: Nome da dependência (métricas e logs)
+            taxa_erros: Fração de erros na janela que abre o disjuntor
+            lenta_ms: Acima disso a chamada conta como lenta
+            taxa_lentas: Fração de chamadas lentas na janela que abre o disjuntor
+            minimo_chamadas: Chamadas na janela antes de avaliar as taxas
+            janela: Segundos de histórico considerados
+            tempo_aberto: Segundos aberto antes da chamada de teste (meio aberto)
+            sondas: Chamadas de teste simultâneas no meio aberto
+        """
+        self.nome = nome
+        self.taxa_erros = taxa_erros
+        self.lenta_ms = lenta_ms
+        self.taxa_lentas = taxa_lentas
+        self.minimo_chamadas = minimo_chamadas
+        self.janela = janela
+        self.tempo_aberto = tempo_aberto
+        self.sondas = sondas
+
+        self._trava = threading.Lock()
+        self._estado = FECHADO
+        self._aberto_em = 0.0
+        self._sondas_em_andamento = 0
+        # (instante, erro, lenta)
+        self._chamadas: Deque[Tuple[float, bool, bool]] = deque()
+        self.estatisticas = {"aberturas": 0, "recusadas": 0, "ultimo_erro": None}
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+    def _mudar(self, estado: str) -> None:
+        if estado == self._estado:
+            return
+        logger.warning(f"🔌 Disjuntor {self.nome}: {self._estado} → {estado}")
+        self._estado = estado
+        transicoes_disjuntor.inc(self.nome, estado)
+        if estado == ABERTO:
+            self._aberto_em = time.monotonic()
+            self.estatisticas["aberturas"] += 1
+        elif estado == FECHADO:
+            self._chamadas.clear()
+
+    def _atualizar(self) -> None:
+        if self._estado == ABERTO and time.monotonic() - self._aberto_em >= self.tempo_aberto:
+            self._mudar(MEIO_ABERTO)
+            self._sondas_em_andamento = 0
+
+    @property
+    def estado(self) -> str:
+        with self._trava:
+            self._atualizar()
+            return self._estado
+
+    @property
+    def degradado(self) -> bool:
+        """Aberto ou testando a volta: quem chama usa o modo degradado"""
+        return self.estado != FECHADO
+
+    # ------------------------------------------------------------------
+    # Chamadas
+    # ------------------------------------------------------------------
+    def permitir(self) -> bool:
+        """True se a chamada pode seguir; no meio aberto, só as chamadas de teste"""
+        with self._trava:
+            self._atualizar()
+            if self._estado == FECHADO:
+                return True
+            if self._estado == MEIO_ABERTO and self._sondas_em_andamento < self.sondas:
+                self._sondas_em_andamento += 1
+                return True
+            self.estatisticas["recusadas"] += 1
+        chamadas_recusadas.inc(self.nome)
+        return False
+
+    def registrar(self, ms: float, erro: bool = False, detalhe: str = "") -> None:
+        with self._trava:
+            agora = time.monotonic()
+            lenta = ms > self.lenta_ms
+            if erro:
+                self.estatisticas["ultimo_erro"] = detalhe or "erro"
+
+            if self._estado == MEIO_ABERTO:
+                self._sondas_em_andamento = max(0, self._sondas_em_andamento - 1)
+                self._mudar(ABERTO if erro or lenta else FECHADO)
+                return
+            if self._estado == ABERTO:
+                return  # chamada iniciada antes de abrir
+
+            self._chamadas.append((agora, erro, lenta))
+            while self._chamadas and agora - self._chamadas[0][0] > self.janela:
+                self._chamadas.popleft()
+            total = len(self._chamadas)
+            if total < self.minimo_chamadas:
+                return
+            erros = sum(1 for _, e, _ in self._chamadas if e)
+            lentas = sum(1 for _, _, l in self._chamadas if l)
+            if erros / total >= self.taxa_erros or lentas / total >= self.taxa_lentas:
+                logger.error(f"🔌 Disjuntor {self.nome} abrindo: {erros}/{total} erros, {lentas}/{total} lentas em {self.janela:.0f}s")
+                self._mudar(ABERTO)
+
+    def liberar(self) -> None:
+        """Chamada abandonada sem resultado (cancelada): só devolve a vaga de teste do meio aberto"""
+        with self._trava:
+            if self._estado == MEIO_ABERTO:
+                self._sondas_em_andamento = max(0, self._sondas_em_andamento - 1)
+
+    @contextmanager
+    def protegido(self):
+        """
+        with disjuntor.protegido(): chamada síncrona ou await
+        Levanta DisjuntorAberto sem executar o bloco se o disjuntor não deixar passar.
+        """
+        if not self.permitir():
+            raise DisjuntorAberto(self.nome)
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.registrar((time.perf_counter() - inicio) * 1000, erro=True, detalhe=str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            # CancelledError/KeyboardInterrupt: sem resultado, mas a vaga de teste não pode ficar presa
+            self.liberar()
+            raise
+        self.registrar((time.perf_counter() - inicio) * 1000)
+
+    def resumo(self) -> Dict:
+        with self._trava:
+            self._atualizar()
+            total = len(self._chamadas)
+            return {
+                "estado": self._estado,
+                "chamadas_janela": total,
+                "erros_janela": sum(1 for _, e, _ in self._chamadas if e),
+                "lentas_janela": sum(1 for _, _, l in self._chamadas if l),
+                "aberto_ha_segundos": round(time.monotonic() - self._aberto_em, 1) if self._estado != FECHADO else None,
+                **self.estatisticas,
+            }
+
+    def reiniciar(self) -> None:
+        """Volta ao estado fechado e esquece o histórico (testes e benchmarks)"""
+        with self._trava:
+            self._mudar(FECHADO)
+            self._chamadas.clear()
+            self._sondas_em_andamento = 0
+
+
+_disjuntores: Dict[str, Disjuntor] = {}
+
+
+def criar_disjuntor(nome: str, **configuracao) -> Disjuntor:
+    disjuntor = Disjuntor(nome, **configuracao)
+    _disjuntores[nome] = disjuntor
+    return disjuntor
+
+
+def disjuntores() -> Iterable[Disjuntor]:
+    return list(_disjuntores.values())
+
+
+def coletar_metricas_disjuntores() -> List[str]:
+    return gauge(
+        "circuit_breaker_state", "Estado do disjuntor (0 fechado, 1 meio aberto, 2 aberto)",
+        {(("dependency", d.nome),): VALOR_ESTADO[d.estado] for d in disjuntores()}
+    )
+
+
+registro.registrar_coletor(coletar_metricas_disjuntores)
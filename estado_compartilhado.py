@@ -0,0 +1,296 @@
+"""
+🗄️ Estado compartilhado entre workers
+
+Com mais de um worker (WEB_CONCURRENCY > 1) a ETAPA 1 e a ETAPA 2 podem cair em
+processos diferentes: os horários oferecidos, o quadro de disponibilidade, a janela
+de idempotência e a geocodificação precisam ficar fora da memória do processo.
+
+ESTADO_COMPARTILHADO_URL escolhe o armazenamento (mesma interface get/set/delete e
+conjuntos adicionar/membros/retirar do ArmazenamentoMemoria de idempotencia.py):
+    (vazio) ou memoria          memória do processo (um worker, comportamento anterior)
+    sqlite:///caminho/estado.db arquivo SQLite em WAL, compartilhado pelos workers do host
+    redis://host:6379/0         Redis (requer o pacote redis), compartilhado entre hosts
+
+As tarefas em segundo plano (quadro de disponibilidade e feed de alterações) rodam
+uma vez por host: o worker que obtém a trava de arquivo (ESTADO_COMPARTILHADO_TRAVA)
+é o líder; os demais tentam assumir a cada ESTADO_COMPARTILHADO_INTERVALO_LIDER
+segundos, o que cobre a queda do líder (o sistema operacional libera a trava).
+"""
+
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+from idempotencia import ArmazenamentoMemoria, MAX_ENTRADAS
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava de arquivo, cada processo é líder
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ESTADO_COMPARTILHADO_URL = os.getenv("ESTADO_COMPARTILHADO_URL", "")
+ESTADO_COMPARTILHADO_TRAVA = os.getenv(
+    "ESTADO_COMPARTILHADO_TRAVA", os.path.join(tempfile.gettempdir(), "fix-agendamento-lider.lock")
+)
+INTERVALO_LIDER = float(os.getenv("ESTADO_COMPARTILHADO_INTERVALO_LIDER", "15"))
+
+
+def estado_compartilhado_ativo(url: Optional[str] = None) -> bool:
+    url = ESTADO_COMPARTILHADO_URL if url is None else url
+    return url not in ("", "memoria")
+
+
+class ArmazenamentoSQLite:
+    """
+    🗄️ Chave/valor com TTL em um arquivo SQLite (um namespace por cache).
+
+    Uma conexão por thread e por processo; WAL permite leituras concorrentes
+    dos workers enquanto um deles escreve. Valores serializados com pickle
+    (o arquivo é local e só a própria API escreve nele).
+    """
+
+    def __init__(self, caminho: str, namespace: str, max_entradas: int = MAX_ENTRADAS):
+        self.caminho = caminho
+        self.namespace = namespace
+        self._max_entradas = max_entradas
+        self._local = threading.local()
+        self._escritas = 0
+        self._conexao().execute(
+            "CREATE TABLE IF NOT EXISTS estado ("
+            " namespace TEXT NOT NULL, chave TEXT NOT NULL, expira_em REAL NOT NULL, valor BLOB NOT NULL,"
+            " PRIMARY KEY (namespace, chave)) WITHOUT ROWID"
+        )
+        self._conexao().execute(
+            "CREATE TABLE IF NOT EXISTS conjuntos ("
+            " namespace TEXT NOT NULL, conjunto TEXT NOT NULL, membro TEXT NOT NULL, expira_em REAL NOT NULL,"
+            " PRIMARY KEY (namespace, conjunto, membro)) WITHOUT ROWID"
+        )
+
+    def _conexao(self) -> sqlite3.Connection:
+        # Conexões não atravessam fork nem threads
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+            self._local.pid = os.getpid()
+        return conexao
+
+    def get(self, chave: str) -> Optional[Any]:
+        linha = self._conexao().execute(
+            "SELECT valor FROM estado WHERE namespace = ? AND chave = ? AND expira_em >= ?",
+            (self.namespace, chave, time.time()),
+        ).fetchone()
+        return pickle.loads(linha[0]) if linha else None
+
+    def set(self, chave: str, valor: Any, ttl: int) -> None:
+        conexao = self._conexao()
+        conexao.execute(
+            "INSERT OR REPLACE INTO estado (namespace, chave, expira_em, valor) VALUES (?, ?, ?, ?)",
+            (self.namespace, chave, time.time() + ttl, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)),
+        )
+        self._escritas += 1
+        if self._escritas % 500 == 0:
+            self._compactar(conexao)
+
+    def delete(self, chave: str) -> None:
+        self._conexao().execute("DELETE FROM estado WHERE namespace = ? AND chave = ?", (self.namespace, chave))
+
+    def clear(self) -> None:
+        conexao = self._conexao()
+        conexao.execute("DELETE FROM estado WHERE namespace = ?", (self.namespace,))
+        conexao.execute("DELETE FROM conjuntos WHERE namespace = ?", (self.namespace,))
+
+    def adicionar(self, conjunto: str, membro: str, ttl: float) -> None:
+        self._conexao().execute(
+            "INSERT OR REPLACE INTO conjuntos (namespace, conjunto, membro, expira_em) VALUES (?, ?, ?, ?)",
+            (self.namespace, conjunto, membro, time.time() + ttl),
+        )
+
+    def membros(self, conjunto: str) -> List[str]:
+        return [linha[0] for linha in self._conexao().execute(
+            "SELECT membro FROM conjuntos WHERE namespace = ? AND conjunto = ? AND expira_em >= ?",
+            (self.namespace, conjunto, time.time()),
+        ).fetchall()]
+
+    def retirar(self, conjunto: str) -> List[str]:
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            membros = self.membros(conjunto)
+            conexao.execute("DELETE FROM conjuntos WHERE namespace = ? AND conjunto = ?", (self.namespace, conjunto))
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        conexao.execute("COMMIT")
+        return membros
+
+    def _compactar(self, conexao: sqlite3.Connection) -> None:
+        """Remove expirados e, acima do limite, as entradas que expiram primeiro"""
+        conexao.execute("DELETE FROM estado WHERE namespace = ? AND expira_em < ?", (self.namespace, time.time()))
+        conexao.execute("DELETE FROM conjuntos WHERE namespace = ? AND expira_em < ?", (self.namespace, time.time()))
+        conexao.execute(
+            "DELETE FROM estado WHERE namespace = ? AND chave IN ("
+            " SELECT chave FROM estado WHERE namespace = ? ORDER BY expira_em DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self._max_entradas),
+        )
+
+    def __len__(self) -> int:
+        return self._conexao().execute(
+            "SELECT COUNT(*) FROM estado WHERE namespace = ? AND expira_em >= ?", (self.namespace, time.time())
+        ).fetchone()[0]
+
+
+class ArmazenamentoRedis:
+    """🗄️ Chave/valor com TTL no Redis (chaves prefixadas pelo namespace)"""
+
+    def __init__(self, url: str, namespace: str):
+        import redis  # dependência opcional, apenas com ESTADO_COMPARTILHADO_URL=redis://...
+
+        self._redis = redis.Redis.from_url(url)
+        self._prefixo = f"fix-agendamento:{namespace}:"
+
+    def get(self, chave: str) -> Optional[Any]:
+        bruto = self._redis.get(self._prefixo + chave)
+        return pickle.loads(bruto) if bruto is not None else None
+
+    def set(self, chave: str, valor: Any, ttl: int) -> None:
+        self._redis.set(self._prefixo + chave, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), px=max(1, int(ttl * 1000)))
+
+    def delete(self, chave: str) -> None:
+        self._redis.delete(self._prefixo + chave)
+
+    def clear(self) -> None:
+        chaves = list(self._redis.scan_iter(match=self._prefixo + "*", count=1000))
+        if chaves:
+            self._redis.delete(*chaves)
+
+    # Conjuntos: sorted set com a validade de cada membro como score
+    def adicionar(self, conjunto: str, membro: str, ttl: float) -> None:
+        chave = f"{self._prefixo}conjunto:{conjunto}"
+        pipeline = self._redis.pipeline()
+        pipeline.zadd(chave, {membro: time.time() + ttl})
+        pipeline.pexpire(chave, max(1, int(ttl * 1000)))
+        pipeline.execute()
+
+    def membros(self, conjunto: str) -> List[str]:
+        chave = f"{self._prefixo}conjunto:{conjunto}"
+        return [m.decode() for m in self._redis.zrangebyscore(chave, time.time(), "+inf")]
+
+    def retirar(self, conjunto: str) -> List[str]:
+        chave = f"{self._prefixo}conjunto:{conjunto}"
+        pipeline = self._redis.pipeline(transaction=True)
+        pipeline.zrangebyscore(chave, time.time(), "+inf")
+        pipeline.delete(chave)
+        membros, _ = pipeline.execute()
+        return [m.decode() for m in membros]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._redis.scan_iter(match=self._prefixo + "*", count=1000))
+
+
+def criar_armazenamento(namespace: str, url: Optional[str] = None, max_entradas: int = MAX_ENTRADAS):
+    """
+    Armazenamento do namespace conforme ESTADO_COMPARTILHADO_URL.
+
+    Args:
+        namespace: Nome do cache (horarios, geocodificacao, idempotencia, quadro...)
+        url: Sobrescreve ESTADO_COMPARTILHADO_URL
+        max_entradas: Limite de entradas (memória e SQLite)
+    """
+    url = ESTADO_COMPARTILHADO_URL if url is None else url
+    if not estado_compartilhado_ativo(url):
+        return ArmazenamentoMemoria(max_entradas)
+    if url.startswith("sqlite://"):
+        return ArmazenamentoSQLite(url[len("sqlite://"):], namespace, max_entradas)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return ArmazenamentoRedis(url, namespace)
+    raise ValueError(f"ESTADO_COMPARTILHADO_URL não suportada: {url}")
+
+
+class TravaLider:
+    """
+    👑 Eleição de líder por host com flock em um arquivo.
+
+    O líder executa as tarefas em segundo plano; os seguidores tentam a trava
+    periodicamente e assumem se o líder encerrar.
+    """
+
+    def __init__(self, caminho: str = ESTADO_COMPARTILHADO_TRAVA, intervalo: float = INTERVALO_LIDER):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.lider = False
+        self._arquivo = None
+        self._tarefa: Optional[asyncio.Task] = None
+
+    def tentar(self) -> bool:
+        """Tenta obter a trava sem bloquear"""
+        if self.lider:
+            return True
+        if fcntl is None:
+            self.lider = True
+            return True
+        arquivo = open(self.caminho, "a+")
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        arquivo.seek(0)
+        arquivo.truncate()
+        arquivo.write(str(os.getpid()))
+        arquivo.flush()
+        self._arquivo = arquivo
+        self.lider = True
+        return True
+
+    def liberar(self) -> None:
+        if self._arquivo is not None:
+            fcntl.flock(self._arquivo.fileno(), fcntl.LOCK_UN)
+            self._arquivo.close()
+            self._arquivo = None
+        self.lider = False
+
+    async def iniciar(self, ao_assumir: Callable[[], Awaitable[None]]) -> bool:
+        """
+        Assume a liderança agora ou passa a tentar em segundo plano.
+
+        Args:
+            ao_assumir: Corrotina que inicia as tarefas do líder
+
+        Returns:
+            bool: True se este worker já é o líder
+        """
+        if self.tentar():
+            logger.info("👑 Worker %s é o líder das tarefas em segundo plano", os.getpid())
+            await ao_assumir()
+            return True
+
+        async def aguardar():
+            while not self.tentar():
+                await asyncio.sleep(self.intervalo)
+            logger.info("👑 Worker %s assumiu a liderança das tarefas em segundo plano", os.getpid())
+            await ao_assumir()
+
+        logger.info("👥 Worker %s seguidor: tarefas em segundo plano ficam com o líder", os.getpid())
+        self._tarefa = asyncio.create_task(aguardar())
+        return False
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        self.liberar()
@@ -0,0 +1,262 @@
+"""
+🔔 Feed de alterações do calendário para invalidação de caches
+
+Escuta gravações feitas fora deste processo (dashboard React, app do técnico,
+edições em scheduled_services) nas tabelas calendar_events, service_orders e
+agendamentos_ai e entrega eventos tipados de invalidação aos caches do middleware.
+
+Fontes disponíveis (FEED_ALTERACOES_MODO):
+- realtime: Supabase Realtime (replicação lógica do Postgres), com fallback para polling
+- polling: consulta periódica por updated_at
+- postgres: LISTEN/NOTIFY em um Postgres local (requer asyncpg e sql/notify_agendamento_alteracoes.sql)
+- desligado: não inicia o feed
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+TABELAS_MONITORADAS = ("calendar_events", "service_orders", "agendamentos_ai")
+
+# Coluna usada como cursor pelo polling (tabelas sem updated_at podem usar created_at)
+COLUNAS_CURSOR = {
+    "calendar_events": os.getenv("FEED_CURSOR_CALENDAR_EVENTS", "updated_at"),
+    "service_orders": os.getenv("FEED_CURSOR_SERVICE_ORDERS", "updated_at"),
+    "agendamentos_ai": os.getenv("FEED_CURSOR_AGENDAMENTOS_AI", "updated_at"),
+}
+
+CANAL_NOTIFY = "agendamento_alteracoes"
+
+
+@dataclass
+class EventoInvalidacao:
+    """Alteração em uma tabela monitorada, já normalizada para os caches"""
+    tabela: str
+    operacao: str  # INSERT, UPDATE, DELETE ou UPSERT (polling não distingue)
+    registro_id: Optional[str] = None
+    technician_id: Optional[str] = None
+    telefone: Optional[str] = None
+    cpf: Optional[str] = None
+    inicio: Optional[str] = None  # horário ocupado/liberado (start_time, scheduled_date ou data_agendada)
+    status: Optional[str] = None
+    origem: str = "realtime"
+    registro: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def de_registro(cls, tabela: str, operacao: str, registro: Optional[Dict[str, Any]], origem: str) -> "EventoInvalidacao":
+        registro = registro or {}
+        if tabela == "calendar_events":
+            telefone = registro.get("client_phone")
+            inicio = registro.get("start_time")
+        elif tabela == "service_orders":
+            telefone = registro.get("client_phone")
+            inicio = registro.get("scheduled_date")
+        else:
+            telefone = registro.get("telefone")
+            inicio = registro.get("data_agendada")
+
+        technician_id = registro.get("technician_id") or registro.get("tecnico_id")
+        return cls(
+            tabela=tabela,
+            operacao=(operacao or "UPSERT").upper(),
+            registro_id=str(registro["id"]) if registro.get("id") is not None else None,
+            technician_id=str(technician_id) if technician_id else None,
+            telefone=telefone,
+            cpf=registro.get("client_cpf_cnpj") or registro.get("cpf"),
+            inicio=inicio,
+            status=registro.get("status"),
+            origem=origem,
+            registro=registro,
+        )
+
+
+Assinante = Callable[[EventoInvalidacao], Union[None, Awaitable[None]]]
+
+
+class ConsumidorAlteracoes:
+    """
+    🔔 Consumidor do feed de alterações.
+
+    As fontes chamam publicar() e cada assinante recebe o EventoInvalidacao;
+    um assinante com erro não impede a entrega aos demais.
+    """
+
+    def __init__(self, modo: Optional[str] = None, intervalo_polling: int = 15):
+        self.modo = (modo or os.getenv("FEED_ALTERACOES_MODO", "realtime")).lower()
+        self.intervalo_polling = intervalo_polling
+        self._assinantes: List[Assinante] = []
+        self._tarefa: Optional[asyncio.Task] = None
+        self._canal_realtime = None
+        self._cliente_realtime = None
+        self._conexao_postgres = None
+        self._cursores: Dict[str, str] = {}
+        self.estatisticas = {
+            "fonte_ativa": None,
+            "eventos": 0,
+            "eventos_por_tabela": {tabela: 0 for tabela in TABELAS_MONITORADAS},
+            "erros": 0,
+            "ultimo_evento": None,
+            "ultimo_erro": None,
+        }
+
+    def assinar(self, assinante: Assinante) -> None:
+        self._assinantes.append(assinante)
+
+    async def publicar(self, evento: EventoInvalidacao) -> None:
+        """Entrega o evento a todos os assinantes"""
+        self.estatisticas["eventos"] += 1
+        self.estatisticas["eventos_por_tabela"][evento.tabela] = self.estatisticas["eventos_por_tabela"].get(evento.tabela, 0) + 1
+        self.estatisticas["ultimo_evento"] = time.time()
+        logger.debug(f"🔔 Alteração recebida: {evento.tabela} {evento.operacao} id={evento.registro_id} ({evento.origem})")
+
+        for assinante in self._assinantes:
+            try:
+                resultado = assinante(evento)
+                if asyncio.iscoroutine(resultado):
+                    await resultado
+            except Exception as e:
+                self._registrar_erro(f"assinante {getattr(assinante, '__name__', assinante)}: {e}")
+
+    def _registrar_erro(self, mensagem: str) -> None:
+        self.estatisticas["erros"] += 1
+        self.estatisticas["ultimo_erro"] = mensagem
+        logger.error(f"❌ Feed de alterações: {mensagem}")
+
+    # ------------------------------------------------------------------
+    # Supabase Realtime
+    # ------------------------------------------------------------------
+    async def _iniciar_realtime(self) -> bool:
+        url = os.environ.get("SUPABASE_URL")
+        key = os.environ.get("SUPABASE_KEY")
+        if not url or not key:
+            return False
+
+        try:
+            from supabase import acreate_client
+
+            self._cliente_realtime = await acreate_client(url, key)
+            loop = asyncio.get_running_loop()
+
+            def ao_receber(payload: Dict[str, Any]) -> None:
+                dados = payload.get("data", payload)
+                operacao = dados.get("type") or dados.get("eventType")
+                registro = dados.get("record") or dados.get("new") or dados.get("old_record") or dados.get("old")
+                evento = EventoInvalidacao.de_registro(dados.get("table"), str(operacao), registro, "realtime")
+                loop.create_task(self.publicar(evento))
+
+            canal = self._cliente_realtime.channel("agendamento-alteracoes")
+            for tabela in TABELAS_MONITORADAS:
+                canal.on_postgres_changes("*", schema="public", table=tabela, callback=ao_receber)
+            await canal.subscribe()
+            self._canal_realtime = canal
+            logger.info("🔔 Feed de alterações conectado via Supabase Realtime")
+            return True
+        except Exception as e:
+            self._registrar_erro(f"Realtime indisponível, usando polling: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Polling por updated_at
+    # ------------------------------------------------------------------
+    async def _executar_polling(self, obter_cliente: Callable[[], Any]) -> None:
+        agora = datetime.now(timezone.utc).isoformat()
+        for tabela in TABELAS_MONITORADAS:
+            self._cursores.setdefault(tabela, agora)
+
+        logger.info(f"🔔 Feed de alterações em modo polling (a cada {self.intervalo_polling}s)")
+        while True:
+            for tabela in TABELAS_MONITORADAS:
+                try:
+                    await self._consultar_tabela(obter_cliente(), tabela)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._registrar_erro(f"polling {tabela}: {e}")
+            await asyncio.sleep(self.intervalo_polling)
+
+    async def _consultar_tabela(self, supabase, tabela: str) -> None:
+        coluna = COLUNAS_CURSOR[tabela]
+        cursor = self._cursores[tabela]
+
+        # O cliente Supabase é síncrono: executar fora do event loop
+        response = await asyncio.to_thread(
+            lambda: supabase.table(tabela).select("*").gt(coluna, cursor).order(coluna).limit(500).execute()
+        )
+
+        for registro in response.data or []:
+            await self.publicar(EventoInvalidacao.de_registro(tabela, "UPSERT", registro, "polling"))
+            if registro.get(coluna):
+                self._cursores[tabela] = registro[coluna]
+
+    # ------------------------------------------------------------------
+    # LISTEN/NOTIFY (Postgres local)
+    # ------------------------------------------------------------------
+    async def _iniciar_postgres(self, dsn: str) -> None:
+        import asyncpg  # dependência opcional, apenas para testes/ambiente local
+
+        loop = asyncio.get_running_loop()
+
+        def ao_notificar(conexao, pid, canal, payload: str) -> None:
+            try:
+                dados = json.loads(payload)
+            except json.JSONDecodeError as e:
+                self._registrar_erro(f"payload NOTIFY inválido: {e}")
+                return
+            evento = EventoInvalidacao.de_registro(dados.get("table"), dados.get("type"), dados.get("record"), "postgres")
+            loop.create_task(self.publicar(evento))
+
+        self._conexao_postgres = await asyncpg.connect(dsn)
+        await self._conexao_postgres.add_listener(CANAL_NOTIFY, ao_notificar)
+        logger.info(f"🔔 Feed de alterações escutando NOTIFY '{CANAL_NOTIFY}' no Postgres local")
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    async def iniciar(self, obter_cliente: Callable[[], Any]) -> None:
+        """
+        Inicia a fonte configurada.
+
+        Args:
+            obter_cliente: Função que retorna o cliente Supabase (usado pelo polling)
+        """
+        if self.modo == "desligado":
+            logger.info("🔔 Feed de alterações desligado")
+            return
+
+        if self.modo == "postgres":
+            await self._iniciar_postgres(os.environ["FEED_ALTERACOES_DSN"])
+            self.estatisticas["fonte_ativa"] = "postgres"
+            return
+
+        if self.modo == "realtime" and await self._iniciar_realtime():
+            self.estatisticas["fonte_ativa"] = "realtime"
+            return
+
+        self.estatisticas["fonte_ativa"] = "polling"
+        self._tarefa = asyncio.create_task(self._executar_polling(obter_cliente))
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        try:
+            if self._canal_realtime is not None:
+                await self._cliente_realtime.remove_channel(self._canal_realtime)
+                self._canal_realtime = None
+            if self._conexao_postgres is not None:
+                await self._conexao_postgres.close()
+                self._conexao_postgres = None
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao encerrar feed de alterações: {e}")
+        self.estatisticas["fonte_ativa"] = None
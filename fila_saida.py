@@ -0,0 +1,166 @@
+"""
+📮 Fila de saída (outbox) das escritas de agendamento
+
+Com o Supabase fora do ar (disjuntor aberto), a ETAPA 2 não consegue criar a OS. Em vez
+de perder a conversa, a confirmação é gravada aqui (SQLite local, sobrevive a reinícios)
+e o cliente recebe "agendamento recebido". Uma tarefa em segundo plano, no worker líder,
+reprocessa a fila quando o disjuntor volta a fechar.
+
+Cada item tem uma chave (telefone + horário): o mesmo pedido reenviado pelo ClienteChat
+não entra duas vezes. Estados: pendente → concluido, ou conflito (o horário foi ocupado
+enquanto o banco estava fora; fica para contato manual).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FILA_SAIDA_ARQUIVO = os.getenv(
+    "FILA_SAIDA_ARQUIVO", os.path.join(tempfile.gettempdir(), "fix-agendamento-fila-saida.db")
+)
+
+PENDENTE, CONCLUIDO, CONFLITO = "pendente", "concluido", "conflito"
+
+# Resultado do processamento de um item
+Processar = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+
+class FilaSaida:
+    """
+    📮 Escritas adiadas, reprocessadas em ordem de chegada
+    """
+
+    def __init__(self, caminho: str = FILA_SAIDA_ARQUIVO, intervalo: float = 15.0, espera_maxima: float = 300.0):
+        """
+        Args:
+            caminho: Arquivo SQLite da fila
+            intervalo: Segundos entre tentativas de esvaziar a fila
+            espera_maxima: Teto do intervalo entre tentativas de um mesmo item (dobra a cada falha)
+        """
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.espera_maxima = espera_maxima
+        self._local = threading.local()
+        self._tarefa: Optional[asyncio.Task] = None
+        self.estatisticas = {"enfileirados": 0, "concluidos": 0, "conflitos": 0, "falhas": 0}
+        self._conexao().execute(
+            "CREATE TABLE IF NOT EXISTS fila_saida ("
+            " id TEXT PRIMARY KEY, chave TEXT UNIQUE, operacao TEXT NOT NULL, dados TEXT NOT NULL,"
+            " estado TEXT NOT NULL, tentativas INTEGER NOT NULL DEFAULT 0, criado_em REAL NOT NULL,"
+            " proxima_tentativa REAL NOT NULL, ultimo_erro TEXT)"
+        )
+
+    def _conexao(self) -> sqlite3.Connection:
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None or self._local.pid != os.getpid():
+            conexao = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            self._local.conexao = conexao
+            self._local.pid = os.getpid()
+        return conexao
+
+    def enfileirar(self, operacao: str, dados: Dict[str, Any], chave: Optional[str] = None) -> Optional[str]:
+        """Id do item, ou None se a chave já está na fila"""
+        item_id = str(uuid.uuid4())
+        agora = time.time()
+        cursor = self._conexao().execute(
+            "INSERT OR IGNORE INTO fila_saida (id, chave, operacao, dados, estado, criado_em, proxima_tentativa)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (item_id, chave, operacao, json.dumps(dados, ensure_ascii=False, default=str), PENDENTE, agora, agora),
+        )
+        if not cursor.rowcount:
+            logger.info(f"📮 Fila de saída: {operacao} {chave} já enfileirado")
+            return None
+        self.estatisticas["enfileirados"] += 1
+        logger.warning(f"📮 Fila de saída: {operacao} enfileirado ({chave})")
+        return item_id
+
+    def pendentes(self, limite: int = 20) -> List[Dict[str, Any]]:
+        linhas = self._conexao().execute(
+            "SELECT id, operacao, dados, tentativas FROM fila_saida"
+            " WHERE estado = ? AND proxima_tentativa <= ? ORDER BY criado_em LIMIT ?",
+            (PENDENTE, time.time(), limite),
+        ).fetchall()
+        return [{"id": i, "operacao": o, "dados": json.loads(d), "tentativas": t} for i, o, d, t in linhas]
+
+    def _finalizar(self, item_id: str, estado: str, erro: Optional[str] = None) -> None:
+        self._conexao().execute(
+            "UPDATE fila_saida SET estado = ?, ultimo_erro = ? WHERE id = ?", (estado, erro, item_id)
+        )
+
+    def _adiar(self, item: Dict[str, Any], erro: str) -> None:
+        espera = min(self.espera_maxima, self.intervalo * 2 ** item["tentativas"])
+        self._conexao().execute(
+            "UPDATE fila_saida SET tentativas = tentativas + 1, proxima_tentativa = ?, ultimo_erro = ? WHERE id = ?",
+            (time.time() + espera, erro, item["id"]),
+        )
+
+    async def processar(self, executar: Processar, pode_executar: Callable[[], bool]) -> int:
+        """
+        Reprocessa os itens vencidos enquanto pode_executar() (disjuntor fechado).
+        executar devolve CONCLUIDO, CONFLITO ou levanta exceção (tenta de novo depois).
+        """
+        processados = 0
+        for item in self.pendentes():
+            if not pode_executar():
+                break
+            try:
+                resultado = await executar(item["operacao"], item["dados"])
+            except Exception as e:
+                self.estatisticas["falhas"] += 1
+                self._adiar(item, str(e) or type(e).__name__)
+                logger.error(f"❌ Fila de saída: {item['operacao']} {item['id']} falhou (tentativa {item['tentativas'] + 1}): {e}")
+                continue
+            self._finalizar(item["id"], resultado)
+            self.estatisticas["concluidos" if resultado == CONCLUIDO else "conflitos"] += 1
+            processados += 1
+            logger.info(f"📮 Fila de saída: {item['operacao']} {item['id']} → {resultado}")
+        return processados
+
+    def resumo(self) -> Dict[str, Any]:
+        contagem = dict(self._conexao().execute(
+            "SELECT estado, COUNT(*) FROM fila_saida GROUP BY estado"
+        ).fetchall())
+        return {
+            "pendentes": contagem.get(PENDENTE, 0),
+            "conflitos": contagem.get(CONFLITO, 0),
+            "concluidos": contagem.get(CONCLUIDO, 0),
+            **self.estatisticas,
+        }
+
+    # ------------------------------------------------------------------
+    # Tarefa em segundo plano
+    # ------------------------------------------------------------------
+    async def executar(self, executar: Processar, pode_executar: Callable[[], bool]) -> None:
+        while True:
+            try:
+                if pode_executar():
+                    await self.processar(executar, pode_executar)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no laço da fila de saída: {e}")
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self, executar: Processar, pode_executar: Callable[[], bool]) -> asyncio.Task:
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self.executar(executar, pode_executar))
+        return self._tarefa
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Janelas de tempo (em segundos) espelhando as verificações feitas no banco
+# por verificar_duplicata_agendamento: OS nas últimas 4 horas e
+# pré-agendamentos nos últimos 15 minutos
+JANELA_OS = int(os.getenv("IDEMPOTENCIA_JANELA_OS", str(4 * 60 * 60)))
+JANELA_PRE_AGENDAMENTO = int(os.getenv("IDEMPOTENCIA_JANELA_PRE_AGENDAMENTO", str(15 * 60)))
+# Reenvio sem Idempotency-Key: mesmo corpo dentro desta janela repete a resposta
+JANELA_REENVIO = int(os.getenv("IDEMPOTENCIA_JANELA_REENVIO", "120"))
+# Tempo de vida das respostas guardadas por Idempotency-Key
+TTL_RESPOSTA = int(os.getenv("IDEMPOTENCIA_TTL_RESPOSTA", str(24 * 60 * 60)))
+# Limite de entradas mantidas em memória (as mais antigas saem primeiro)
+MAX_ENTRADAS = int(os.getenv("IDEMPOTENCIA_MAX_ENTRADAS", "5000"))
+
+HEADER_IDEMPOTENCIA = "Idempotency-Key"
+
+
+def normalizar_documento(valor: Optional[str]) -> str:
+    """Mantém apenas os dígitos de telefone/CPF para comparar formatos diferentes"""
+    if not valor:
+        return ""
+    return re.sub(r"\D", "", str(valor))
+
+
+def gerar_fingerprint(data: Dict[str, Any], campos: Optional[List[str]] = None) -> str:
+    """
+    Gera uma impressão digital estável do payload.
+
+    Args:
+        data: Corpo da requisição
+        campos: Campos considerados (todos se não informado)
+
+    Returns:
+        str: Hash SHA-1 dos campos normalizados
+    """
+    campos = campos or sorted(data.keys())
+    normalizado = {}
+    for campo in campos:
+        valor = data.get(campo)
+        if isinstance(valor, str):
+            valor = " ".join(valor.lower().split())
+        normalizado[campo] = valor
+    bruto = json.dumps(normalizado, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(bruto.encode("utf-8")).hexdigest()
+
+
+class ArmazenamentoMemoria:
+    """
+    🧠 Armazenamento chave/valor com TTL em memória do processo.
+
+    Qualquer objeto com os métodos get/set/delete pode substituí-lo
+    (ex.: um armazenamento compartilhado entre workers). Os conjuntos
+    (adicionar/membros/retirar) atualizam membros sem ler e regravar o todo.
+    """
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS):
+        self._dados: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # conjunto -> membro -> expira_em
+        self._conjuntos: Dict[str, Dict[str, float]] = {}
+        self._max_entradas = max_entradas
+        self._lock = threading.Lock()
+
+    def get(self, chave: str) -> Optional[Any]:
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.time():
+                del self._dados[chave]
+                return None
+            return valor
+
+    def set(self, chave: str, valor: Any, ttl: int) -> None:
+        with self._lock:
+            self._dados[chave] = (time.time() + ttl, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self._max_entradas:
+                self._dados.popitem(last=False)
+
+    def delete(self, chave: str) -> None:
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._dados.clear()
+            self._conjuntos.clear()
+
+    def adicionar(self, conjunto: str, membro: str, ttl: float) -> None:
+        """Inclui (ou renova) um membro com validade própria"""
+        with self._lock:
+            self._conjuntos.setdefault(conjunto, {})[membro] = time.time() + ttl
+
+    def _vivos(self, conjunto: str) -> Dict[str, float]:
+        agora = time.time()
+        membros = {m: e for m, e in self._conjuntos.get(conjunto, {}).items() if e >= agora}
+        self._conjuntos[conjunto] = membros
+        return membros
+
+    def membros(self, conjunto: str) -> List[str]:
+        with self._lock:
+            return list(self._vivos(conjunto))
+
+    def retirar(self, conjunto: str) -> List[str]:
+        """Membros vivos, removidos de uma vez (quem consome não perde inclusões concorrentes)"""
+        with self._lock:
+            membros = list(self._vivos(conjunto))
+            self._conjuntos.pop(conjunto, None)
+            return membros
+
+    def __len__(self) -> int:
+        return len(self._dados)
+
+
+class JanelaIdempotencia:
+    """
+    🛡️ Janela de idempotência para os endpoints de agendamento.
+
+    Guarda, por telefone/CPF, os registros recentes (OS criadas e
+    pré-agendamentos) e as respostas já enviadas por Idempotency-Key,
+    permitindo responder reenvios do ClienteChat sem consultar o banco.
+    """
+
+    def __init__(self, armazenamento=None):
+        self.armazenamento = armazenamento or ArmazenamentoMemoria()
+        self.estatisticas = {
+            "hits_janela": 0,
+            "misses_janela": 0,
+            "respostas_repetidas": 0,
+            "respostas_salvas": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Idempotency-Key
+    # ------------------------------------------------------------------
+    def obter_resposta(self, escopo: str, chave: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca a resposta já enviada para uma Idempotency-Key.
+
+        Returns:
+            Optional[Dict]: {"status_code", "body", "media_type"} ou None
+        """
+        if not chave:
+            return None
+        resposta = self.armazenamento.get(f"resp:{escopo}:{chave}")
+        if resposta is not None:
+            self.estatisticas["respostas_repetidas"] += 1
+        return resposta
+
+    def salvar_resposta(self, escopo: str, chave: str, status_code: int, body: bytes,
+                        media_type: str = "application/json", ttl: int = TTL_RESPOSTA) -> None:
+        """Guarda a resposta de uma Idempotency-Key para reenvios futuros"""
+        if not chave:
+            return
+        self.armazenamento.set(
+            f"resp:{escopo}:{chave}",
+            {"status_code": status_code, "body": body, "media_type": media_type},
+            ttl,
+        )
+        self.estatisticas["respostas_salvas"] += 1
+
+    # ------------------------------------------------------------------
+    # Registros por telefone/CPF
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _chaves(tipo: str, telefone: Optional[str], cpf: Optional[str]) -> List[str]:
+        chaves = []
+        cpf = normalizar_documento(cpf)
+        telefone = normalizar_documento(telefone)
+        if cpf:
+            chaves.append(f"{tipo}:cpf:{cpf}")
+        if telefone:
+            chaves.append(f"{tipo}:tel:{telefone}")
+        return chaves
+
+    def registrar(self, tipo: str, telefone: Optional[str], cpf: Optional[str],
+                  registro: Dict[str, Any], ttl: int, criado_em: Optional[float] = None) -> None:
+        """
+        Registra um fato recente (ex.: OS criada) para telefone e CPF.
+
+        Args:
+            tipo: "os" ou "pre_agendamento"
+            telefone: Telefone do cliente
+            cpf: CPF/CNPJ do cliente
+            registro: Linha gravada no banco
+            ttl: Tempo de permanência na janela (segundos)
+            criado_em: Timestamp da criação (agora se não informado)
+        """
+        agora = time.time()
+        momento = criado_em or agora
+        for chave in self._chaves(tipo, telefone, cpf):
+            existentes = [
+                (ts, reg) for ts, reg in (self.armazenamento.get(chave) or [])
+                if agora - ts < ttl and (registro.get("id") is None or reg.get("id") != registro.get("id"))
+            ]
+            existentes.append((momento, registro))
+            existentes.sort(key=lambda item: item[0], reverse=True)
+            self.armazenamento.set(chave, existentes[:10], ttl)
+
+    def buscar(self, tipo: str, telefone: Optional[str], cpf: Optional[str],
+               janela: int) -> List[Tuple[Dict[str, Any], int]]:
+        """
+        Lista os registros ainda dentro da janela, do mais recente ao mais antigo.
+
+        Returns:
+            List[Tuple[Dict, int]]: (registro, minutos desde o registro)
+        """
+        agora = time.time()
+        vistos = set()
+        encontrados = []
+        for chave in self._chaves(tipo, telefone, cpf):
+            for ts, registro in self.armazenamento.get(chave) or []:
+                if agora - ts > janela:
+                    continue
+                identificador = registro.get("id") or id(registro)
+                if identificador in vistos:
+                    continue
+                vistos.add(identificador)
+                encontrados.append((ts, registro))
+        encontrados.sort(key=lambda item: item[0], reverse=True)
+        return [(registro, max(0, int((agora - ts) / 60))) for ts, registro in encontrados]
+
+    def esquecer(self, tipo: str, telefone: Optional[str], cpf: Optional[str]) -> None:
+        """Remove os registros de telefone/CPF (ex.: OS cancelada fora deste processo)"""
+        for chave in self._chaves(tipo, telefone, cpf):
+            self.armazenamento.delete(chave)
+
+    def contabilizar(self, hit: bool) -> None:
+        self.estatisticas["hits_janela" if hit else "misses_janela"] += 1
+
+
+janela_idempotencia = JanelaIdempotencia()
+
+
+def configurar_armazenamento(armazenamento) -> None:
+    """Troca o armazenamento da janela (ex.: por um compartilhado entre workers)"""
+    janela_idempotencia.armazenamento = armazenamento
+    logger.info(f"🛡️ Armazenamento de idempotência: {type(armazenamento).__name__}")
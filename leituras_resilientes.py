@@ -0,0 +1,254 @@
+"""
+🔁 Leituras resilientes do PostgREST: novas tentativas e hedge
+
+A ETAPA 1 faz as leituras em sequência; uma leitura lenta ou com falha passageira segura
+a busca inteira. Para leituras (select, idempotentes) o cliente instrumentado pode:
+- tentar de novo em falhas de transporte (conexão, timeout) e 5xx do gateway, com espera
+  exponencial e jitter completo (uniforme entre 0 e min(teto, base·2^tentativa)), só se
+  o prazo da requisição ainda comporta a espera mais uma tentativa (a duração da que
+  falhou ou o p95 da tabela, o que for maior)
+- no event loop (leituras síncronas dentro dos endpoints) não há espera: dormir ali
+  travaria todas as requisições, inclusive /health. A nova tentativa é imediata e única;
+  a espera com jitter vale fora do loop (quadro de disponibilidade, threads)
+- hedge: se a leitura passa do p95 recente da tabela, manda uma cópia e fica com a
+  primeira que responder. Um orçamento global (fração das leituras) limita as cópias,
+  para que uma lentidão geral não dobre a carga no banco.
+
+Não há nova tentativa para DisjuntorAberto (falhar na hora é o objetivo), para APIError
+do PostgREST (consulta inválida, statement timeout: repetir dá o mesmo erro) nem para
+erros de programação. Escritas nunca passam por aqui.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+from metricas import registro
+from prazos import prazo_atual
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+novas_tentativas = registro.contador(
+    "supabase_read_retries_total", "Novas tentativas de leituras do Supabase após falha passageira", ("table",)
+)
+hedges_enviados = registro.contador(
+    "supabase_read_hedges_total", "Cópias (hedge) de leituras lentas do Supabase, por quem respondeu primeiro", ("table", "winner")
+)
+hedges_sem_orcamento = registro.contador(
+    "supabase_read_hedge_budget_exhausted_total", "Leituras lentas sem hedge por falta de orçamento", ("table",)
+)
+
+
+def espera_com_jitter(tentativa: int, base: float, teto: float, aleatorio: random.Random = random) -> float:
+    """Segundos antes da tentativa seguinte (jitter completo; tentativa começa em 0)"""
+    return aleatorio.uniform(0, min(teto, base * 2 ** tentativa))
+
+
+def retentavel(erro: Exception) -> bool:
+    """Falha passageira da dependência: transporte (rede, timeout) ou 5xx do gateway"""
+    if type(erro).__name__ == "APIError":
+        # Resposta não-JSON do gateway: o código é o status HTTP
+        codigo = str(getattr(erro, "code", "") or "")
+        return codigo.isdigit() and 500 <= int(codigo) < 600
+    return isinstance(erro, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def no_event_loop() -> bool:
+    """True na thread do event loop principal (onde dormir trava todas as requisições)"""
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class LatenciasRecentes:
+    """Últimas latências por tabela e o percentil usado como gatilho do hedge"""
+
+    def __init__(self, janela: int = 256, percentil: float = 95, recalcular_a_cada: int = 32):
+        self.janela = janela
+        self.percentil = percentil
+        self.recalcular_a_cada = recalcular_a_cada
+        self._amostras: Dict[str, Deque[float]] = {}
+        self._novas: Dict[str, int] = {}
+        self._limites: Dict[str, float] = {}
+        self._trava = threading.Lock()
+
+    def registrar(self, tabela: str, ms: float) -> None:
+        with self._trava:
+            amostras = self._amostras.get(tabela)
+            if amostras is None:
+                amostras = self._amostras[tabela] = deque(maxlen=self.janela)
+            amostras.append(ms)
+            self._novas[tabela] = self._novas.get(tabela, 0) + 1
+            if self._novas[tabela] >= self.recalcular_a_cada:
+                self._novas[tabela] = 0
+                ordenadas = sorted(amostras)
+                self._limites[tabela] = ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * self.percentil / 100))]
+
+    def limite(self, tabela: str, amostras_minimas: int) -> Optional[float]:
+        """Percentil em ms, ou None enquanto a tabela tem poucas amostras"""
+        with self._trava:
+            if len(self._amostras.get(tabela, ())) < amostras_minimas:
+                return None
+            return self._limites.get(tabela)
+
+    def resumo(self) -> Dict[str, Dict[str, float]]:
+        with self._trava:
+            return {tabela: {"amostras": len(self._amostras[tabela]), f"p{self.percentil:g}_ms": round(limite, 2)}
+                    for tabela, limite in self._limites.items()}
+
+
+class OrcamentoHedge:
+    """Balde de fichas: cada leitura deposita `fracao` de ficha, cada hedge gasta uma"""
+
+    def __init__(self, fracao: float = 0.05, maximo: float = 10.0):
+        self.fracao = fracao
+        self.maximo = maximo
+        self._fichas = maximo
+        self._trava = threading.Lock()
+
+    def depositar(self) -> None:
+        with self._trava:
+            self._fichas = min(self.maximo, self._fichas + self.fracao)
+
+    def gastar(self) -> bool:
+        with self._trava:
+            if self._fichas < 1:
+                return False
+            self._fichas -= 1
+            return True
+
+    @property
+    def fichas(self) -> float:
+        return self._fichas
+
+
+class LeiturasResilientes:
+    """
+    🔁 Política de novas tentativas e hedge aplicada às leituras do cliente instrumentado
+    """
+
+    def __init__(
+        self,
+        tentativas: int = 3,
+        espera_base: float = 0.05,
+        espera_maxima: float = 0.5,
+        hedge: bool = False,
+        percentil_hedge: float = 95,
+        hedge_minimo_ms: float = 20.0,
+        fracao_hedge: float = 0.05,
+        amostras_minimas: int = 50,
+        max_threads: int = 16,
+    ):
+        """
+        Args:
+            tentativas: Total de tentativas por leitura (1 = sem novas tentativas)
+            espera_base: Espera base (s) da primeira nova tentativa, dobrando a cada uma
+            espera_maxima: Teto (s) da espera entre tentativas
+            hedge: Enviar cópia das leituras que passam do percentil recente
+            percentil_hedge: Percentil da tabela que dispara a cópia
+            hedge_minimo_ms: Nunca disparar a cópia antes disso (tabelas muito rápidas)
+            fracao_hedge: Cópias permitidas por leitura (0.05 = no máximo ~5% a mais de carga)
+            amostras_minimas: Leituras da tabela antes de confiar no percentil
+            max_threads: Threads para a leitura original e a cópia em paralelo
+        """
+        self.tentativas = max(1, tentativas)
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.hedge = hedge
+        self.hedge_minimo_ms = hedge_minimo_ms
+        self.amostras_minimas = amostras_minimas
+        self.latencias = LatenciasRecentes(percentil=percentil_hedge)
+        self.orcamento = OrcamentoHedge(fracao_hedge)
+        self.max_threads = max_threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.estatisticas = {"leituras": 0, "novas_tentativas": 0, "hedges": 0, "hedges_vencedores": 0, "sem_orcamento": 0}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="hedge-leitura")
+        return self._executor
+
+    def executar(self, tabela: str, chamar: Callable[[], T]) -> T:
+        """Executa a leitura com novas tentativas (e hedge, se ligado)"""
+        self.estatisticas["leituras"] += 1
+        no_loop = no_event_loop()
+        tentativas = min(self.tentativas, 2) if no_loop else self.tentativas
+        for tentativa in range(tentativas):
+            inicio = time.perf_counter()
+            try:
+                return self._executar_uma(tabela, chamar)
+            except Exception as e:
+                if not retentavel(e) or tentativa == tentativas - 1:
+                    raise
+                espera = 0.0 if no_loop else espera_com_jitter(tentativa, self.espera_base, self.espera_maxima)
+                # Tentativa esperada: a que falhou (um timeout se repete inteiro) ou o p95 da tabela
+                esperada = max(time.perf_counter() - inicio, (self.latencias.limite(tabela, self.amostras_minimas) or 0) / 1000)
+                atual = prazo_atual()
+                if atual is not None and atual.restante() <= espera + esperada:
+                    raise
+                novas_tentativas.inc(tabela)
+                self.estatisticas["novas_tentativas"] += 1
+                logger.warning(f"🔁 Leitura de {tabela} falhou ({e}); nova tentativa em {espera * 1000:.0f}ms")
+                if espera:
+                    time.sleep(espera)
+        raise AssertionError("inalcançável")
+
+    def _medida(self, tabela: str, chamar: Callable[[], T]) -> Callable[[], T]:
+        def executar() -> T:
+            inicio = time.perf_counter()
+            try:
+                return chamar()
+            finally:
+                self.latencias.registrar(tabela, (time.perf_counter() - inicio) * 1000)
+        return executar
+
+    def _executar_uma(self, tabela: str, chamar: Callable[[], T]) -> T:
+        limite = self.latencias.limite(tabela, self.amostras_minimas) if self.hedge else None
+        if limite is None:
+            return self._medida(tabela, chamar)()
+
+        self.orcamento.depositar()
+        original = self._pool().submit(self._medida(tabela, chamar))
+        feitas, _ = wait([original], timeout=max(limite, self.hedge_minimo_ms) / 1000)
+        if feitas or not self.orcamento.gastar():
+            if not feitas:
+                hedges_sem_orcamento.inc(tabela)
+                self.estatisticas["sem_orcamento"] += 1
+            return original.result()
+
+        self.estatisticas["hedges"] += 1
+        copia = self._pool().submit(chamar)
+        pendentes = {original, copia}
+        erro: Optional[BaseException] = None
+        while pendentes:
+            feitas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in feitas:
+                if futuro.exception() is None:
+                    vencedora = "hedge" if futuro is copia else "original"
+                    hedges_enviados.inc(tabela, vencedora)
+                    if futuro is copia:
+                        self.estatisticas["hedges_vencedores"] += 1
+                    return futuro.result()
+                erro = futuro.exception()
+        raise erro
+
+    def resumo(self) -> Dict:
+        return {
+            **self.estatisticas,
+            "hedge": self.hedge,
+            "fichas_hedge": round(self.orcamento.fichas, 2),
+            "gatilhos": self.latencias.resumo(),
+        }
@@ -0,0 +1,163 @@
+"""
+🪵 Pipeline de logs da API
+
+- QueueHandler no processo: o event loop só enfileira o registro; formatação final
+  (texto ou JSON) e escrita no stdout acontecem na thread do QueueListener.
+- id da requisição (contextvar definido pelo middleware) anexado a cada registro.
+- Amostragem com limite de taxa para mensagens repetitivas: cada template
+  (mensagem antes da formatação %, por isso os logs em `%s` e não f-string)
+  passa no máximo LOG_LIMITE_REPETICOES vezes por janela de LOG_JANELA_REPETICOES
+  segundos; o excedente é descartado e contabilizado. WARNING ou acima nunca é descartado.
+
+Ambiente:
+    LOG_LEVEL=INFO
+    LOG_FORMATO=texto | json
+    LOG_LIMITE_REPETICOES=20   (0 = sem limite)
+    LOG_JANELA_REPETICOES=10
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+id_requisicao: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("id_requisicao", default=None)
+
+FORMATO_TEXTO = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Atributos padrão de LogRecord (o restante vem de extra=... e vai para o JSON)
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class FiltroContexto(logging.Filter):
+    """Anexa o id da requisição corrente (roda na thread que gerou o log)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = id_requisicao.get() or "-"
+        return True
+
+
+class FiltroRepeticao(logging.Filter):
+    """Limita por janela de tempo quantas vezes o mesmo template de mensagem é emitido"""
+
+    def __init__(self, limite: int = 20, janela: float = 10.0):
+        super().__init__()
+        self.limite = limite
+        self.janela = janela
+        self._contagens: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._trava = threading.Lock()
+        self.suprimidas = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limite <= 0 or record.levelno >= logging.WARNING:
+            return True
+        chave = (record.name, str(record.msg))
+        agora = time.monotonic()
+        with self._trava:
+            inicio, quantidade = self._contagens.get(chave, (agora, 0))
+            if agora - inicio >= self.janela:
+                if quantidade > self.limite:
+                    # Resumo do que foi descartado na janela anterior, junto da próxima ocorrência
+                    record.msg = f"{record.msg} [+{quantidade - self.limite} repetições suprimidas]"
+                inicio, quantidade = agora, 0
+            self._contagens[chave] = (inicio, quantidade + 1)
+            if len(self._contagens) > 10000:
+                self._contagens.clear()
+        if quantidade < self.limite:
+            return True
+        self.suprimidas += 1
+        return False
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO:
+                dados[chave] = valor
+        if record.exc_info:
+            dados["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            dados["exc"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class _QueueHandlerLogs(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Mensagem resolvida aqui (os argumentos podem mudar depois); a formatação
+        # final fica para a thread do listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+filtro_repeticao: Optional[FiltroRepeticao] = None
+
+
+def configurar_logs(nivel: Optional[str] = None, formato: Optional[str] = None,
+                    limite_repeticoes: Optional[int] = None, janela_repeticoes: Optional[float] = None,
+                    saida=None) -> logging.handlers.QueueListener:
+    """
+    Instala o pipeline no logger raiz (substitui os handlers existentes).
+    Pode ser chamada de novo para trocar nível/formato; o listener anterior é encerrado.
+    """
+    global _listener, filtro_repeticao
+
+    nivel = (nivel or os.getenv("LOG_LEVEL", "INFO")).upper()
+    formato = (formato or os.getenv("LOG_FORMATO", "texto")).lower()
+    limite = limite_repeticoes if limite_repeticoes is not None else int(os.getenv("LOG_LIMITE_REPETICOES", "20"))
+    janela = janela_repeticoes if janela_repeticoes is not None else float(os.getenv("LOG_JANELA_REPETICOES", "10"))
+
+    parar_logs()
+
+    destino = logging.StreamHandler(saida or sys.stdout)
+    destino.setFormatter(FormatadorJSON() if formato == "json" else logging.Formatter(FORMATO_TEXTO))
+
+    fila: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    manipulador = _QueueHandlerLogs(fila)
+    filtro_repeticao = FiltroRepeticao(limite, janela)
+    manipulador.addFilter(filtro_repeticao)
+    manipulador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.addHandler(manipulador)
+    raiz.setLevel(nivel)
+
+    _listener = logging.handlers.QueueListener(fila, destino, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def parar_logs() -> None:
+    """Esvazia a fila e encerra a thread de escrita"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(parar_logs)
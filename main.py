@@ -1,26 +1,37 @@
 # main.py - Arquivo de entrada otimizado para o Railway
 # Importa e executa o middleware.py com configurações de performance
+#
+# WEB_CONCURRENCY=N sobe N workers (padrão 1). Com mais de um worker o estado
+# compartilhado (horários da ETAPA 1, quadro, idempotência, geocodificação) vai para
+# ESTADO_COMPARTILHADO_URL - por padrão um SQLite no diretório temporário do host.
+# Com gunicorn: ESTADO_COMPARTILHADO_URL=sqlite:///tmp/estado.db gunicorn -k uvicorn.workers.UvicornWorker -w 4 middleware:app
+
+import os
+import tempfile
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+if WORKERS > 1:
+    # Definido antes de importar o middleware: os workers herdam o ambiente
+    os.environ.setdefault(
+        "ESTADO_COMPARTILHADO_URL",
+        "sqlite://" + os.path.join(tempfile.gettempdir(), "fix-agendamento-estado.db")
+    )
 
 from middleware import app
 import uvicorn
-import os
-import logging
 
-# Configurar logging para produção
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging já configurado pelo middleware (logs_estruturados.configurar_logs: LOG_LEVEL / LOG_FORMATO)
 
 if __name__ == "__main__":
     # Executar o servidor FastAPI com configurações otimizadas
     port = int(os.getenv("PORT", 8000))
 
     uvicorn.run(
-        app,
+        # uvicorn só sobe vários workers a partir do caminho de importação
+        "middleware:app" if WORKERS > 1 else app,
         host="0.0.0.0",
         port=port,
-        workers=1,  # Railway funciona melhor com 1 worker
+        workers=WORKERS,
         timeout_keep_alive=300,  # 5 minutos
         timeout_graceful_shutdown=30,  # 30 segundos
         access_log=True,
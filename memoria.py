@@ -0,0 +1,222 @@
+import asyncio
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Limite de objetos visitados ao medir um cache (protege o endpoint de caches enormes)
+MAX_OBJETOS_MEDIDOS = 500_000
+
+
+def rss_bytes() -> Optional[int]:
+    """Memória residente atual do processo (Linux: /proc; demais: pico via getrusage)"""
+    try:
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if sys.platform == "darwin" else pico * 1024
+    except Exception:
+        return None
+
+
+def tamanho_profundo(objeto: Any, limite: int = MAX_OBJETOS_MEDIDOS) -> int:
+    """Soma de sys.getsizeof do objeto e de tudo que ele referencia (contêineres e __dict__)"""
+    vistos = set()
+    pendentes = [objeto]
+    total = 0
+    while pendentes and len(vistos) < limite:
+        atual = pendentes.pop()
+        if id(atual) in vistos:
+            continue
+        vistos.add(id(atual))
+        total += sys.getsizeof(atual, 0)
+        if isinstance(atual, dict):
+            pendentes.extend(atual.keys())
+            pendentes.extend(atual.values())
+        elif isinstance(atual, (list, tuple, set, frozenset, deque)):
+            pendentes.extend(atual)
+        elif hasattr(atual, "__dict__") and not isinstance(atual, type):
+            pendentes.append(vars(atual))
+    return total
+
+
+def tipos_mais_frequentes(quantidade: int = 15) -> List[Dict[str, Any]]:
+    contagem = Counter(type(objeto).__name__ for objeto in gc.get_objects())
+    return [{"tipo": tipo, "objetos": total} for tipo, total in contagem.most_common(quantidade)]
+
+
+class MonitorMemoria:
+    """
+    🧠 Contabilidade de memória do processo.
+
+    - Amostrador periódico barato (RSS + número de entradas de cada cache registrado)
+      que registra a tendência de crescimento em MB/hora e avisa quando passa do limite.
+    - Relatório sob demanda com bytes de cada cache, contagem de objetos por tipo e
+      diferença entre snapshots do tracemalloc (desligado até o primeiro snapshot).
+    """
+
+    def __init__(self, intervalo: Optional[int] = None, historico: int = 288,
+                 alerta_mb_hora: Optional[float] = None):
+        """
+        Args:
+            intervalo: Segundos entre amostras (MEMORIA_INTERVALO; 0 desliga o amostrador)
+            historico: Quantidade de amostras guardadas
+            alerta_mb_hora: Crescimento de RSS que gera aviso no log (MEMORIA_ALERTA_MB_HORA)
+        """
+        self.intervalo = intervalo if intervalo is not None else int(os.getenv("MEMORIA_INTERVALO", "300"))
+        self.alerta_mb_hora = alerta_mb_hora if alerta_mb_hora is not None else float(os.getenv("MEMORIA_ALERTA_MB_HORA", "20"))
+        self.amostras: Deque[Dict[str, Any]] = deque(maxlen=historico)
+        self._caches: Dict[str, Callable[[], Any]] = {}
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._tarefa: Optional[asyncio.Task] = None
+
+    def registrar_cache(self, nome: str, obter: Callable[[], Any]) -> None:
+        """Registra uma função que devolve a estrutura do cache (lida a cada amostra)"""
+        self._caches[nome] = obter
+
+    def _entradas(self) -> Dict[str, Optional[int]]:
+        entradas = {}
+        for nome, obter in self._caches.items():
+            try:
+                entradas[nome] = len(obter())
+            except Exception:
+                entradas[nome] = None
+        return entradas
+
+    # ------------------------------------------------------------------
+    # Amostragem periódica
+    # ------------------------------------------------------------------
+    def amostrar(self) -> Dict[str, Any]:
+        amostra = {"ts": time.time(), "rss_bytes": rss_bytes(), "caches": self._entradas()}
+        self.amostras.append(amostra)
+        return amostra
+
+    @staticmethod
+    def _inclinacao_por_hora(pontos: List[tuple]) -> Optional[float]:
+        """Inclinação da regressão linear (unidade/hora) de pontos (ts, valor)"""
+        pontos = [(ts, valor) for ts, valor in pontos if valor is not None]
+        if len(pontos) < 3:
+            return None
+        media_t = sum(ts for ts, _ in pontos) / len(pontos)
+        media_v = sum(valor for _, valor in pontos) / len(pontos)
+        variancia = sum((ts - media_t) ** 2 for ts, _ in pontos)
+        if not variancia:
+            return None
+        return sum((ts - media_t) * (valor - media_v) for ts, valor in pontos) / variancia * 3600
+
+    def tendencia(self) -> Dict[str, Any]:
+        rss = self._inclinacao_por_hora([(a["ts"], a["rss_bytes"]) for a in self.amostras])
+        return {
+            "amostras": len(self.amostras),
+            "janela_horas": round((self.amostras[-1]["ts"] - self.amostras[0]["ts"]) / 3600, 2) if self.amostras else 0,
+            "rss_mb_por_hora": round(rss / 1024 / 1024, 2) if rss is not None else None,
+            "entradas_por_hora": {
+                nome: round(inclinacao, 1) if inclinacao is not None else None
+                for nome in self._caches
+                for inclinacao in [self._inclinacao_por_hora([(a["ts"], a["caches"].get(nome)) for a in self.amostras])]
+            },
+        }
+
+    async def _executar(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                amostra = self.amostrar()
+                tendencia = self.tendencia()
+                rss_mb = (amostra["rss_bytes"] or 0) / 1024 / 1024
+                crescimento = tendencia["rss_mb_por_hora"]
+                logger.info("🧠 Memória: RSS %.1f MB, tendência %s MB/h, caches %s", rss_mb, crescimento, amostra["caches"])
+                if crescimento is not None and tendencia["amostras"] >= 6 and crescimento > self.alerta_mb_hora:
+                    logger.warning("⚠️ RSS crescendo %.1f MB/h nas últimas %s amostras (caches: %s)",
+                                   crescimento, tendencia["amostras"], tendencia["entradas_por_hora"])
+            except Exception as e:
+                logger.error(f"❌ Erro no amostrador de memória: {e}")
+
+    def iniciar(self) -> Optional[asyncio.Task]:
+        if self.intervalo <= 0:
+            return None
+        self.amostrar()
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._executar())
+        return self._tarefa
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    # ------------------------------------------------------------------
+    # Relatório sob demanda
+    # ------------------------------------------------------------------
+    def relatorio(self, tipos: int = 15) -> Dict[str, Any]:
+        """Relatório completo (percorre os caches e o heap do gc: uso administrativo)"""
+        caches = {}
+        for nome, obter in self._caches.items():
+            try:
+                estrutura = obter()
+                caches[nome] = {"entradas": len(estrutura), "bytes": tamanho_profundo(estrutura)}
+            except Exception as e:
+                caches[nome] = {"erro": str(e)}
+        return {
+            "rss_bytes": rss_bytes(),
+            "caches": caches,
+            "gc": {"objetos": len(gc.get_objects()), "contagem_geracoes": gc.get_count()},
+            "tipos_mais_frequentes": tipos_mais_frequentes(tipos),
+            "tendencia": self.tendencia(),
+            "tracemalloc": {
+                "ativo": tracemalloc.is_tracing(),
+                "memoria_rastreada_bytes": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+            },
+        }
+
+    def snapshot(self, top: int = 20, frames: int = 5) -> Dict[str, Any]:
+        """
+        Primeira chamada liga o tracemalloc e guarda a base; as seguintes devolvem
+        os locais de alocação que mais cresceram desde o snapshot anterior.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._snapshot = tracemalloc.take_snapshot()
+            return {"tracemalloc": "iniciado", "frames": frames, "diferenca": []}
+
+        atual = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        anterior, self._snapshot = self._snapshot, atual
+        if anterior is None:
+            return {"tracemalloc": "base registrada", "diferenca": []}
+
+        diferenca = atual.compare_to(anterior, "lineno")
+        return {
+            "tracemalloc": "ativo",
+            "memoria_rastreada_bytes": tracemalloc.get_traced_memory()[0],
+            "diferenca": [
+                {
+                    "local": str(estatistica.traceback[0]),
+                    "bytes": estatistica.size,
+                    "bytes_diferenca": estatistica.size_diff,
+                    "blocos": estatistica.count,
+                    "blocos_diferenca": estatistica.count_diff,
+                }
+                for estatistica in diferenca[:top]
+            ],
+        }
+
+    def parar_rastreamento(self) -> None:
+        tracemalloc.stop()
+        self._snapshot = None
@@ -0,0 +1,180 @@
+"""
+📈 Métricas no formato de exposição do Prometheus
+
+Contadores e histogramas em memória (inteiros e listas, sem dependências externas),
+servidos em texto pelo endpoint /metrics do middleware.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Buckets (segundos) pensados para a faixa de latência da API: de poucos ms até o timeout do ClienteChat
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _formatar_labels(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    partes = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Contador:
+    def __init__(self, nome: str, descricao: str, labels: Sequence[str] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores_labels: str, valor: float = 1) -> None:
+        with self._lock:
+            self._valores[valores_labels] = self._valores.get(valores_labels, 0) + valor
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} counter"]
+        for valores_labels, valor in sorted(self._valores.items()):
+            linhas.append(f"{self.nome}{_formatar_labels(self.labels, valores_labels)} {valor}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, descricao: str, labels: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_PADRAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Por série: [contagens por bucket (não cumulativas) + overflow, soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *valores_labels: str) -> None:
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_labels)
+            if serie is None:
+                serie = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[valores_labels] = serie
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def cronometrar(self, *valores_labels: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, *valores_labels)
+
+    def exportar(self) -> List[str]:
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        for valores_labels, (contagens, soma, total) in sorted(self._series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                labels = _formatar_labels(self.labels, valores_labels, f'le="{limite}"')
+                linhas.append(f"{self.nome}_bucket{labels} {acumulado}")
+            labels_inf = _formatar_labels(self.labels, valores_labels, 'le="+Inf"')
+            linhas.append(f"{self.nome}_bucket{labels_inf} {total}")
+            labels = _formatar_labels(self.labels, valores_labels)
+            linhas.append(f"{self.nome}_sum{labels} {round(soma, 6)}")
+            linhas.append(f"{self.nome}_count{labels} {total}")
+        return linhas
+
+
+class Registro:
+    """Conjunto de métricas + coletores (funções chamadas apenas na exportação)"""
+
+    def __init__(self):
+        self._metricas: List = []
+        self._coletores: List[Callable[[], Iterable[str]]] = []
+
+    def contador(self, nome: str, descricao: str, labels: Sequence[str] = ()) -> Contador:
+        metrica = Contador(nome, descricao, labels)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome: str, descricao: str, labels: Sequence[str] = (),
+                   buckets: Sequence[float] = BUCKETS_PADRAO) -> Histograma:
+        metrica = Histograma(nome, descricao, labels, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def registrar_coletor(self, coletor: Callable[[], Iterable[str]]) -> None:
+        self._coletores.append(coletor)
+
+    def exportar(self) -> str:
+        linhas: List[str] = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        for coletor in self._coletores:
+            try:
+                linhas.extend(coletor())
+            except Exception as e:
+                linhas.append(f"# coletor com erro: {_escapar(e)}")
+        return "\n".join(linhas) + "\n"
+
+
+def gauge(nome: str, descricao: str, valores: Dict[Tuple[Tuple[str, str], ...], Optional[float]]) -> List[str]:
+    """Linhas de um gauge calculado na hora da exportação"""
+    linhas = [f"# HELP {nome} {descricao}", f"# TYPE {nome} gauge"]
+    for labels, valor in valores.items():
+        if valor is None:
+            continue
+        linhas.append(f"{nome}{_formatar_labels([l[0] for l in labels], [l[1] for l in labels])} {valor}")
+    return linhas
+
+
+registro = Registro()
+
+http_requisicoes = registro.histograma(
+    "http_request_duration_seconds", "Latência das requisições HTTP por rota", ("method", "route", "status")
+)
+etapas_pipeline = registro.histograma(
+    "pipeline_stage_duration_seconds", "Duração das etapas internas do agendamento", ("stage",)
+)
+consultas_banco = registro.histograma(
+    "db_query_duration_seconds", "Duração das consultas ao Supabase por tabela", ("table", "outcome")
+)
+requisicoes_http_cliente = registro.histograma(
+    "http_client_duration_seconds", "Duração das chamadas HTTP externas", ("host", "outcome")
+)
+consultas_cache = registro.contador(
+    "cache_lookups_total", "Consultas aos caches em memória", ("cache", "result")
+)
+
+
+def medir_etapa(etapa: str):
+    """Decorator que registra a duração de uma função assíncrona como etapa do pipeline"""
+    def decorator(funcao):
+        @functools.wraps(funcao)
+        async def wrapper(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await funcao(*args, **kwargs)
+            finally:
+                etapas_pipeline.observar(time.perf_counter() - inicio, etapa)
+        return wrapper
+    return decorator
+
+
+def registrar_cache(cache: str, hit: bool) -> None:
+    consultas_cache.inc(cache, "hit" if hit else "miss")
+
+
+def percentil(valores: Sequence[float], p: float) -> float:
+    """Percentil por posição mais próxima (nearest-rank), usado pelos benchmarks"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados) + 0.5)) - 1))
+    return ordenados[posicao]
@@ -6,7 +6,9 @@ Versão simplificada que funciona corretamente
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+# JSONResponse com serialização rápida (orjson, fallback para o json padrão), ver respostas_json.py
+from respostas_json import RespostaJSON as JSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List, Tuple
 from supabase import create_client, Client
@@ -18,13 +20,55 @@ import json
 import logging
 import os
 import math
+import time
 import asyncio
+import uuid
 import httpx
+from idempotencia import (
+    janela_idempotencia,
+    gerar_fingerprint,
+    HEADER_IDEMPOTENCIA,
+    JANELA_OS,
+    JANELA_PRE_AGENDAMENTO,
+    JANELA_REENVIO,
+    normalizar_documento,
+    configurar_armazenamento,
+)
+from coalescencia import SingleFlight
+from quadro_disponibilidade import QuadroDisponibilidade
+from retrato_calendario import RetratoCalendario
+from rota_insercao import CacheRotas, Insercao, RotaDia, dia_local, hora_local, melhor_insercao
+from feed_alteracoes import ConsumidorAlteracoes, EventoInvalidacao
+from saude import SondaProntidao, estado_processo
+from disjuntores import DisjuntorAberto, criar_disjuntor, disjuntores
+from fila_saida import CONCLUIDO, CONFLITO, FilaSaida
+from leituras_resilientes import LeiturasResilientes
+from orcamento_consultas import instrumentar_cliente, iniciar_requisicao, finalizar_requisicao, registrar_observador
+from prazos import finalizar_prazo, iniciar_prazo, prazo_atual, prazo_esgotado, resultado_parcial
+from controle_admissao import AdmissaoRecusada, BaldesFichas, criar_controle_admissao
+import metricas
+from metricas import medir_etapa, registrar_cache
+from captura_trafego import captura_trafego
+from perfilador import Perfilador, MiddlewarePerfilador
+from logs_estruturados import configurar_logs, id_requisicao
+from memoria import MonitorMemoria, rss_bytes
+from estado_compartilhado import TravaLider, criar_armazenamento, estado_compartilhado_ativo
+from calendario_comercial import HORAS_COMERCIAIS, SABADO, UTIL, calendario, hora_comercial, horas_da_mascara
+from motor_horarios import (
+    HORA_AGENDAMENTO, Candidato, EstrategiaBusca, buscar_melhores_horarios, candidatos_por_dia, chave_score,
+    formatar_horario, rotulos_dia
+)
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (fila + thread de escrita, ver logs_estruturados.py)
+configurar_logs()
 logger = logging.getLogger(__name__)
 
+# 🗄️ Estado compartilhado entre workers (ESTADO_COMPARTILHADO_URL, ver estado_compartilhado.py)
+ESTADO_COMPARTILHADO = estado_compartilhado_ativo()
+trava_lider = TravaLider()
+if ESTADO_COMPARTILHADO:
+    configurar_armazenamento(criar_armazenamento("idempotencia"))
+
 app = FastAPI(
     title="Fix Fogões API - Agendamento Inteligente",
     description="API para agendamento inteligente e orçamentos",
@@ -119,6 +163,25 @@ def generate_quote(equipment: str, brand: str = None, problem: str = None, urgen
         "observacoes": f"Orçamento para {equipment} - {brand or 'marca genérica'}"
     }
 
+def obter_valor_servico(tipo_atendimento: str, valor_clientechat: float = None) -> float:
+    """
+    Obtém o valor final do serviço: TODOS os tipos usam o valor do ClienteChat,
+    com fallback por tipo de atendimento quando ele não vier
+    """
+    if valor_clientechat and float(valor_clientechat) > 0:
+        valor_final = float(valor_clientechat)
+        logger.info(f"📱 VALOR DO CLIENTECHAT: R$ {valor_final} para {tipo_atendimento}")
+    else:
+        valores_fallback = {
+            "em_domicilio": 150.00,
+            "coleta_conserto": 120.00,
+            "coleta_diagnostico": 350.00
+        }
+        valor_final = valores_fallback.get(tipo_atendimento, 150.00)
+        logger.warning(f"⚠️ FALLBACK: Usando valor padrão R$ {valor_final}")
+
+    return valor_final
+
 def obter_valor_inicial(tipo_atendimento: str, valor_clientechat: float = None) -> float:
     """
     Obtém o valor inicial (sinal) baseado no tipo de atendimento
@@ -148,10 +211,86 @@ def obter_valor_inicial(tipo_atendimento: str, valor_clientechat: float = None)
 
 _technicians_cache = {}
 _cache_timestamp = None
+TECNICOS_CACHE_TTL = int(os.getenv("TECNICOS_CACHE_TTL", "300"))
 
 # Cache para geocodificação (evitar múltiplas consultas do mesmo endereço)
 _geocoding_cache = {}
 _geocoding_cache_timestamp = {}
+# Com vários workers: segundo nível compartilhado (o dicionário acima continua local)
+_geocoding_compartilhado = criar_armazenamento("geocodificacao") if ESTADO_COMPARTILHADO else None
+# Arquivo opcional para o cache sobreviver a reinícios (carregado no aquecimento, salvo no desligamento)
+GEOCODIFICACAO_ARQUIVO = os.getenv("GEOCODIFICACAO_ARQUIVO", "")
+
+# Cliente HTTP do Nominatim reaproveitado entre requisições (aberto no aquecimento)
+TIMEOUT_NOMINATIM = httpx.Timeout(10.0, connect=5.0)
+_cliente_nominatim: Optional[httpx.AsyncClient] = None
+
+# 🔌 Disjuntores: com a dependência lenta ou fora, falhar na hora e entrar em modo degradado
+disjuntor_supabase = criar_disjuntor(
+    "supabase",
+    lenta_ms=float(os.getenv("DISJUNTOR_SUPABASE_LENTA_MS", "2000")),
+    tempo_aberto=float(os.getenv("DISJUNTOR_SUPABASE_ABERTO_S", "30")),
+)
+disjuntor_nominatim = criar_disjuntor(
+    "nominatim",
+    lenta_ms=float(os.getenv("DISJUNTOR_NOMINATIM_LENTA_MS", "5000")),
+    minimo_chamadas=5,
+    tempo_aberto=float(os.getenv("DISJUNTOR_NOMINATIM_ABERTO_S", "60")),
+)
+
+# 🔁 Leituras do Supabase: novas tentativas com espera exponencial + jitter; hedge opcional
+# (cópia da leitura que passa do p95 recente da tabela, limitada a HEDGE_LEITURAS_FRACAO das leituras)
+leituras_supabase = LeiturasResilientes(
+    tentativas=int(os.getenv("LEITURAS_TENTATIVAS", "3")),
+    espera_base=float(os.getenv("LEITURAS_ESPERA_BASE_MS", "50")) / 1000,
+    espera_maxima=float(os.getenv("LEITURAS_ESPERA_MAXIMA_MS", "500")) / 1000,
+    hedge=os.getenv("HEDGE_LEITURAS", "desligado") == "ligado",
+    hedge_minimo_ms=float(os.getenv("HEDGE_LEITURAS_MINIMO_MS", "20")),
+    fracao_hedge=float(os.getenv("HEDGE_LEITURAS_FRACAO", "0.05")),
+)
+
+def modos_degradados() -> set:
+    """
+    Modos em uso enquanto um disjuntor não está fechado:
+    - quadro_vencido: ETAPA 1 serve o último quadro de disponibilidade, mesmo expirado
+    - sem_bonus_rota: horários sem bonus de inserção na rota do dia
+    - fila_saida: ETAPA 2 grava a confirmação na fila de saída em vez de criar a OS
+    """
+    modos = set()
+    if disjuntor_supabase.degradado:
+        modos.update({"quadro_vencido", "sem_bonus_rota", "fila_saida"})
+    if disjuntor_nominatim.degradado:
+        modos.add("sem_bonus_rota")
+    return modos
+
+def carregar_cache_geocodificacao(caminho: str = GEOCODIFICACAO_ARQUIVO) -> int:
+    """Carrega coordenadas salvas ({endereço normalizado: [lon, lat]})"""
+    if not caminho or not os.path.exists(caminho):
+        return 0
+    with open(caminho, encoding="utf-8") as arquivo:
+        dados = json.load(arquivo)
+    agora = datetime.now()
+    for endereco, coordenadas in dados.items():
+        _geocoding_cache[endereco] = tuple(coordenadas)
+        _geocoding_cache_timestamp[endereco] = agora
+    return len(dados)
+
+def salvar_cache_geocodificacao(caminho: str = GEOCODIFICACAO_ARQUIVO) -> int:
+    if not caminho:
+        return 0
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump({endereco: list(coordenadas) for endereco, coordenadas in _geocoding_cache.items() if coordenadas},
+                  arquivo, ensure_ascii=False)
+    return len(_geocoding_cache)
+
+@asynccontextmanager
+async def cliente_nominatim():
+    """Cliente compartilhado, se aberto; senão um temporário (scripts e testes)"""
+    if _cliente_nominatim is not None and not _cliente_nominatim.is_closed:
+        yield _cliente_nominatim
+        return
+    async with httpx.AsyncClient(timeout=TIMEOUT_NOMINATIM) as client:
+        yield client
 
 def verificar_horario_real_sistema() -> dict:
     """
@@ -174,12 +313,12 @@ def verificar_horario_real_sistema() -> dict:
         }
 
         # Log simplificado mas informativo
-        logger.info("🕐 ═══════════════════════════════════════════════════════════")
-        logger.info("🕐 VERIFICAÇÃO DE HORÁRIO REAL DO SISTEMA")
-        logger.info(f"🇧🇷 BRASIL: {info_horario['brasil']['formatted']}")
-        logger.info(f"📅 DATA:   {info_horario['brasil']['date']}")
-        logger.info(f"⏰ HORA:   {info_horario['brasil']['time']}")
-        logger.info("🕐 ═══════════════════════════════════════════════════════════")
+        logger.debug("🕐 ═══════════════════════════════════════════════════════════")
+        logger.debug("🕐 VERIFICAÇÃO DE HORÁRIO REAL DO SISTEMA")
+        logger.debug("🇧🇷 BRASIL: %s", info_horario['brasil']['formatted'])
+        logger.debug("📅 DATA:   %s", info_horario['brasil']['date'])
+        logger.debug("⏰ HORA:   %s", info_horario['brasil']['time'])
+        logger.debug("🕐 ═══════════════════════════════════════════════════════════")
 
         return info_horario
 
@@ -248,149 +387,124 @@ def calcular_data_inicio_otimizada(urgente: bool = False) -> datetime:
     # 🎯 SEMPRE COMEÇAR NO PRÓXIMO DIA ÚTIL DISPONÍVEL
     inicio = agora + timedelta(days=1)
 
-    # Pular para o próximo dia útil se necessário
-    while inicio.weekday() >= 5:  # 5=sábado, 6=domingo
-        inicio += timedelta(days=1)
+    # Pular para o próximo dia útil se necessário (fins de semana e feriados)
+    inicio += timedelta(days=(calendario().proximo_dia_util(inicio) - inicio.date()).days)
 
     logger.info(f"🎯 Data início otimizada: {inicio.strftime('%Y-%m-%d')} (Urgente: {urgente})")
     return inicio
 
-async def gerar_horarios_proximas_datas_disponiveis(technician_id: str, urgente: bool = False, tipo_atendimento: str = "em_domicilio", endereco: str = "") -> List[Dict]:
+@medir_etapa("calculo_horarios")
+async def gerar_horarios_proximas_datas_disponiveis(technician_id: str, urgente: bool = False, tipo_atendimento: str = "em_domicilio", endereco: str = "", quantidade: int = 3, grupo_logistico: Optional[str] = None, retrato: Optional[RetratoCalendario] = None) -> List[Dict]:
     """
     🎯 NOVA FUNÇÃO: Gera horários sempre priorizando as datas mais próximas disponíveis
 
-    Esta função substitui a lógica complexa por uma busca sequencial simples:
+    Busca sequencial pelo motor de horários (motor_horarios.py):
     1. Começa no próximo dia útil
     2. Verifica disponibilidade sequencialmente
-    3. Para assim que encontrar 3 horários
+    3. Para assim que encontrar a quantidade pedida de horários (3 por padrão)
+
+    O quadro de disponibilidade chama com quantidade maior e grupo_logistico já definido.
+    Com retrato (busca de vários técnicos), as verificações leem o retrato do calendário
+    em vez de consultar o Supabase a cada dia/horário.
     """
     try:
-        logger.info(f"🎯 Gerando horários próximas datas - Técnico: {technician_id}, Urgente: {urgente}, Tipo: {tipo_atendimento}")
+        logger.info("🎯 Gerando horários próximas datas - Técnico: %s, Urgente: %s, Tipo: %s", technician_id, urgente, tipo_atendimento)
 
         # 🎯 LÓGICA ESPECÍFICA POR TIPO DE ATENDIMENTO
         if tipo_atendimento in ["coleta_diagnostico", "coleta_conserto"]:
             # COLETA: Prazo até 7 dias úteis (mais flexível)
-            logger.info(f"📦 COLETA: Prazo estendido até 7 dias úteis")
-            inicio = calcular_data_inicio_otimizada(urgente)
+            logger.info("📦 COLETA: Prazo estendido até 7 dias úteis")
             max_dias = 10  # Buscar em até 10 dias para ter mais opções
         else:
             # EM DOMICÍLIO: Preferencialmente mesmo dia/próximo dia
-            logger.info(f"🏠 DOMICÍLIO: Prioridade para datas próximas")
-            inicio = calcular_data_inicio_otimizada(urgente)
+            logger.info("🏠 DOMICÍLIO: Prioridade para datas próximas")
             max_dias = 5  # Buscar em até 5 dias (mais restrito)
+        inicio = calcular_data_inicio_otimizada(urgente)
 
         # Determinar grupo logístico do endereço solicitado
-        grupo_solicitado = determine_logistics_group(endereco) if endereco else "A"
-        logger.info(f"🎯 Grupo logístico solicitado: {grupo_solicitado}")
+        if grupo_logistico:
+            grupo_solicitado = grupo_logistico
+        else:
+            grupo_solicitado = determine_logistics_group(endereco) if endereco else "A"
+        logger.info("🎯 Grupo logístico solicitado: %s", grupo_solicitado)
 
-        horarios_disponiveis = []
         supabase = get_supabase_client()
 
-        # Horários comerciais preferenciais
+        # Horários comerciais preferenciais (score: manhã preferencial)
         horarios_comerciais = [
-            {"hora": 9, "texto": "9h e 10h"},
-            {"hora": 10, "texto": "10h e 11h"},
-            {"hora": 14, "texto": "14h e 15h"},
-            {"hora": 15, "texto": "15h e 16h"},
-            {"hora": 16, "texto": "16h e 17h"}
+            {"hora": 9, "texto": "9h e 10h", "score": 15},
+            {"hora": 10, "texto": "10h e 11h", "score": 15},
+            {"hora": 14, "texto": "14h e 15h", "score": 10},
+            {"hora": 15, "texto": "15h e 16h", "score": 10},
+            {"hora": 16, "texto": "16h e 17h", "score": 10}
         ]
 
-        # Buscar sequencialmente até encontrar 3 horários
-        dia_offset = 0
-        while len(horarios_disponiveis) < 3 and dia_offset < max_dias:  # Limite baseado no tipo de atendimento
-            data_verificacao = inicio + timedelta(days=dia_offset)
-            dia_offset += 1
+        def horario_brasil(candidato: Candidato) -> datetime:
+            # ✅ PRESERVAR TIMEZONE BRASIL AO CRIAR HORÁRIO (sem timezone: assumir Brasil)
+            horario_dt = candidato.horario
+            if horario_dt.tzinfo is None:
+                horario_dt = pytz.timezone('America/Sao_Paulo').localize(horario_dt)
+            return horario_dt
 
-            # Pular fins de semana
-            if data_verificacao.weekday() >= 5:
-                continue
+        async def avaliar_dia(data_verificacao: datetime) -> Optional[float]:
+            data_str = data_verificacao.strftime('%d/%m/%Y')
 
-            # 🚫 REGRA GRUPO C: Nunca aos sábados e segundas-feiras
+            # 🚫 REGRA GRUPO C: Nunca aos sábados (fim de semana já pulado) e segundas-feiras
             if grupo_solicitado == 'C':
-                # Segunda-feira = 0, Sábado = 5
-                if data_verificacao.weekday() == 0:  # Segunda-feira
-                    data_str = data_verificacao.strftime('%d/%m/%Y')
-                    logger.warning(f"🚫 GRUPO C: Pulando segunda-feira {data_str}")
-                    continue
-                # Sábado já é pulado pelo fim de semana acima
+                if not calendario().grupo_permitido(data_verificacao, 'C'):
+                    logger.warning("🚫 GRUPO C: Pulando segunda-feira %s", data_str)
+                    return None
 
                 # 🚫 REGRA GRUPO C: Nunca no dia seguinte se já houver Grupo C hoje
-                if await verificar_grupo_c_consecutivo(data_verificacao, technician_id, supabase):
-                    data_str = data_verificacao.strftime('%d/%m/%Y')
-                    logger.warning(f"🚫 GRUPO C: Pulando {data_str} - já há Grupo C no dia anterior")
-                    continue
+                consecutivo = retrato.grupo_c_dia_anterior(technician_id, data_verificacao) if retrato else None
+                if consecutivo is None:
+                    consecutivo = await verificar_grupo_c_consecutivo(data_verificacao, technician_id, supabase)
+                if consecutivo:
+                    logger.warning("🚫 GRUPO C: Pulando %s - já há Grupo C no dia anterior", data_str)
+                    return None
 
             # 🚫 VERIFICAR CONFLITOS DE GRUPOS LOGÍSTICOS
-            conflito_info = await verificar_conflito_grupos_logisticos(
-                data_verificacao, grupo_solicitado, technician_id, supabase
-            )
-
-            if conflito_info["conflito"]:
-                logger.warning(f"🚫 BLOQUEANDO {data_verificacao.strftime('%d/%m/%Y')}: {conflito_info['motivo']}")
-                continue
-
-            # Verificar cada horário do dia
-            for horario_info in horarios_comerciais:
-                if len(horarios_disponiveis) >= 3:
-                    break
-
-                # ✅ PRESERVAR TIMEZONE BRASIL AO CRIAR HORÁRIO
-                if data_verificacao.tzinfo is not None:
-                    # Se tem timezone, usar replace preservando timezone
-                    horario_dt = data_verificacao.replace(
-                        hour=horario_info["hora"],
-                        minute=0,
-                        second=0,
-                        microsecond=0
-                    )
-                else:
-                    # Se não tem timezone, assumir Brasil e localizar
-                    horario_dt = data_verificacao.replace(
-                        hour=horario_info["hora"],
-                        minute=0,
-                        second=0,
-                        microsecond=0
-                    )
-                    horario_dt = pytz.timezone('America/Sao_Paulo').localize(horario_dt)
-
-                # Verificar disponibilidade
-                disponivel = await verificar_horario_disponivel_tecnico(technician_id, horario_dt)
-                logger.info(f"🔍 DEBUG: {data_verificacao.strftime('%d/%m/%Y')} {horario_info['hora']}h - Disponível: {disponivel}")
-
-                if disponivel:
-                    # 🚫 VERIFICAR CONFLITOS DE GRUPOS LOGÍSTICOS
-                    # Primeiro precisamos determinar o grupo do endereço atual
-                    # Como não temos o endereço aqui, vamos fazer a verificação na função que chama
-                    # Por enquanto, vamos continuar e fazer a verificação depois
-
-                    # Formatar data
-                    dias_semana = {
-                        'Monday': 'Segunda-feira', 'Tuesday': 'Terça-feira',
-                        'Wednesday': 'Quarta-feira', 'Thursday': 'Quinta-feira',
-                        'Friday': 'Sexta-feira', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-                    }
-
-                    dia_semana_pt = dias_semana.get(horario_dt.strftime('%A'), horario_dt.strftime('%A'))
-                    data_formatada = f"{dia_semana_pt}, {horario_dt.strftime('%d/%m/%Y')}"
-
-                    # Calcular score baseado na proximidade (mais próximo = maior score)
-                    score_proximidade = 50 - dia_offset  # Quanto mais próximo, maior o score
-                    score_horario = 15 if horario_info["hora"] <= 10 else 10  # Manhã preferencial
-                    score_total = score_proximidade + score_horario
-
-                    horarios_disponiveis.append({
-                        "numero": len(horarios_disponiveis) + 1,
-                        "texto": f"Previsão de chegada entre {horario_info['texto']} - {data_formatada}",
-                        "datetime_agendamento": horario_dt.isoformat(),
-                        "dia_semana": data_formatada,
-                        "hora_agendamento": f"{horario_info['hora']:02d}:00",
-                        "score_otimizacao": score_total,
-                        "grupo_logistico": "A"  # Será ajustado pela função principal
-                    })
-
-                    logger.info(f"✅ Horário próximo encontrado: {data_formatada} {horario_info['hora']}h (Score: {score_total})")
+            grupos_dia = retrato.grupos_do_dia(technician_id, data_verificacao) if retrato else None
+            if grupos_dia is not None:
+                motivo = motivo_conflito_grupos(grupo_solicitado, grupos_dia)
+            else:
+                conflito_info = await verificar_conflito_grupos_logisticos(
+                    data_verificacao, grupo_solicitado, technician_id, supabase
+                )
+                motivo = conflito_info["motivo"] if conflito_info["conflito"] else ""
+            if motivo:
+                logger.warning("🚫 BLOQUEANDO %s: %s", data_str, motivo)
+                return None
 
-        logger.info(f"🎯 Total de horários próximos encontrados: {len(horarios_disponiveis)}")
+            # Score de proximidade: quanto mais próximo, maior
+            return 50 - ((data_verificacao - inicio).days + 1)
+
+        async def pontuar(candidato: Candidato, score_dia: float) -> Optional[float]:
+            disponivel = retrato.horario_livre(technician_id, horario_brasil(candidato)) if retrato else None
+            if disponivel is None:
+                disponivel = await verificar_horario_disponivel_tecnico(technician_id, horario_brasil(candidato))
+            logger.debug("🔍 DEBUG: %s %sh - Disponível: %s", candidato.dia.strftime('%d/%m/%Y'), candidato.hora, disponivel)
+            return score_dia + candidato.score_base if disponivel else None
+
+        def formatar(candidato: Candidato) -> Dict:
+            horario = formatar_horario(
+                candidato, horario_brasil(candidato),
+                score_otimizacao=candidato.score,
+                grupo_logistico="A"  # Será ajustado pela função principal
+            )
+            logger.debug("✅ Horário próximo encontrado: %s %sh (Score: %s)", horario["dia_semana"], candidato.hora, candidato.score)
+            return horario
+
+        horarios_disponiveis = await buscar_melhores_horarios(EstrategiaBusca(
+            nome="proximas_datas",
+            candidatos=candidatos_por_dia(inicio, max_dias, horarios_comerciais),
+            avaliar_dia=avaliar_dia,
+            pontuar=pontuar,
+            formatar=formatar,
+            ordenar_por_score=False
+        ), quantidade)
+
+        logger.info("🎯 Total de horários próximos encontrados: %s", len(horarios_disponiveis))
         return horarios_disponiveis
 
     except Exception as e:
@@ -404,7 +518,7 @@ async def verificar_horario_disponivel_tecnico(technician_id: str, horario_dt: d
     try:
         supabase = get_supabase_client()
 
-        logger.info(f"🔍 DEBUG: Verificando técnico {technician_id} em {horario_dt.isoformat()}")
+        logger.debug("🔍 DEBUG: Verificando técnico %s em %s", technician_id, horario_dt.isoformat())
 
         # 🎯 VERIFICAR NA NOVA TABELA calendar_events (fonte única da verdade)
         response_calendar = supabase.table("calendar_events").select("*").eq(
@@ -412,7 +526,7 @@ async def verificar_horario_disponivel_tecnico(technician_id: str, horario_dt: d
         ).eq("start_time", horario_dt.isoformat()).execute()
 
         if response_calendar.data and len(response_calendar.data) > 0:
-            logger.info(f"❌ DEBUG: Conflito no calendário: {len(response_calendar.data)} eventos")
+            logger.debug("❌ DEBUG: Conflito no calendário: %s eventos", len(response_calendar.data))
             return False
 
         # 📋 VERIFICAR agendamentos_ai (pré-agendamentos pendentes)
@@ -430,10 +544,10 @@ async def verificar_horario_disponivel_tecnico(technician_id: str, horario_dt: d
                     conflitos_ai.append(ag)
 
         if conflitos_ai:
-            logger.info(f"❌ DEBUG: Conflito em pré-agendamentos: {len(conflitos_ai)} registros")
+            logger.debug("❌ DEBUG: Conflito em pré-agendamentos: %s registros", len(conflitos_ai))
             return False
 
-        logger.info(f"✅ DEBUG: Técnico {technician_id} disponível em {horario_dt.isoformat()}")
+        logger.debug("✅ DEBUG: Técnico %s disponível em %s", technician_id, horario_dt.isoformat())
         return True
         fim_range = (horario_dt + timedelta(hours=1)).isoformat()
 
@@ -442,25 +556,23 @@ async def verificar_horario_disponivel_tecnico(technician_id: str, horario_dt: d
         ).gte("data_agendada", inicio_range).lte("data_agendada", fim_range).execute()
 
         if response_ai.data:
-            logger.info(f"❌ DEBUG: Conflito em agendamentos_ai: {len(response_ai.data)} registros")
+            logger.debug("❌ DEBUG: Conflito em agendamentos_ai: %s registros", len(response_ai.data))
             return False
 
-        logger.info(f"✅ DEBUG: Horário disponível!")
+        logger.debug("✅ DEBUG: Horário disponível!")
         return True
 
     except Exception as e:
         logger.error(f"❌ Erro ao verificar disponibilidade do técnico: {e}")
         return False
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 # Carregar variáveis de ambiente
 load_dotenv()
 
 # Cache para horários disponíveis (para manter consistência entre ETAPA 1 e 2)
-cache_horarios = {}
+# Compartilhado entre workers: a ETAPA 2 pode cair em outro processo
+cache_horarios = criar_armazenamento("horarios")
+CACHE_HORARIOS_TTL = 1800  # 30 minutos
 
 async def criar_cliente_com_auth_supabase(dados: Dict) -> str:
     """
@@ -639,12 +751,12 @@ async def estrategia_grupo_a(technician_id: str, technician_name: str, coordenad
 
     # Horários otimizados para trânsito urbano - HORÁRIOS COMERCIAIS
     horarios_prioritarios = [
-        {"hora": 9, "texto": "9h e 10h", "score_base": 20},   # Manhã ideal
-        {"hora": 10, "texto": "10h e 11h", "score_base": 18}, # Manhã boa
-        {"hora": 14, "texto": "14h e 15h", "score_base": 15}, # Tarde boa
-        {"hora": 15, "texto": "15h e 16h", "score_base": 12}, # Tarde ok
-        {"hora": 13, "texto": "13h e 14h", "score_base": 10}, # Início tarde
-        {"hora": 16, "texto": "16h e 17h", "score_base": 8}   # Final tarde
+        {"hora": 9, "texto": "9h e 10h", "score": 20},   # Manhã ideal
+        {"hora": 10, "texto": "10h e 11h", "score": 18}, # Manhã boa
+        {"hora": 14, "texto": "14h e 15h", "score": 15}, # Tarde boa
+        {"hora": 15, "texto": "15h e 16h", "score": 12}, # Tarde ok
+        {"hora": 13, "texto": "13h e 14h", "score": 10}, # Início tarde
+        {"hora": 16, "texto": "16h e 17h", "score": 8}   # Final tarde
     ]
 
     return await processar_horarios_com_otimizacao(
@@ -664,12 +776,12 @@ async def estrategia_grupo_b(technician_id: str, technician_name: str, coordenad
 
     # Horários balanceados para região metropolitana - HORÁRIOS COMERCIAIS
     horarios_prioritarios = [
-        {"hora": 14, "texto": "14h e 15h", "score_base": 20}, # Tarde ideal
-        {"hora": 13, "texto": "13h e 14h", "score_base": 18}, # Pós-almoço
-        {"hora": 15, "texto": "15h e 16h", "score_base": 16}, # Tarde boa
-        {"hora": 10, "texto": "10h e 11h", "score_base": 14}, # Manhã boa
-        {"hora": 9, "texto": "9h e 10h", "score_base": 12},   # Manhã ok
-        {"hora": 16, "texto": "16h e 17h", "score_base": 10}  # Final tarde
+        {"hora": 14, "texto": "14h e 15h", "score": 20}, # Tarde ideal
+        {"hora": 13, "texto": "13h e 14h", "score": 18}, # Pós-almoço
+        {"hora": 15, "texto": "15h e 16h", "score": 16}, # Tarde boa
+        {"hora": 10, "texto": "10h e 11h", "score": 14}, # Manhã boa
+        {"hora": 9, "texto": "9h e 10h", "score": 12},   # Manhã ok
+        {"hora": 16, "texto": "16h e 17h", "score": 10}  # Final tarde
     ]
 
     return await processar_horarios_com_otimizacao(
@@ -701,7 +813,7 @@ async def estrategia_grupo_c(technician_id: str, technician_name: str, coordenad
 
     # 1. BUSCAR AGENDAMENTOS NA MESMA ROTA SEQUENCIAL
     agendamentos_rota = await buscar_agendamentos_rota_sequencial(periodo_ideal, agora, supabase)
-    logger.info(f"🗺️ Agendamentos na rota {periodo_ideal}: {len(agendamentos_rota)}")
+    logger.info(f"🗺️ Datas com agendamentos na rota {periodo_ideal}: {len(agendamentos_rota)}")
 
     # 2. ESTRATÉGIA BASEADA NO PERÍODO IDEAL
     if periodo_ideal == "manha":
@@ -727,101 +839,54 @@ async def processar_horarios_com_otimizacao(
 ) -> List[Dict]:
     """
     🎯 Processa horários com otimização inteligente
+
+    Datas mais próximas primeiro (15 dias úteis); no dia, as faixas de maior score.
+    Carga do dia e bonus de rota valem para o dia inteiro: calculados uma vez por dia.
     """
-    horarios_disponiveis = []
     inicio = calcular_data_inicio_otimizada(urgente)
+    bonus_urgencia = 15 if urgente else 0
 
-    # 🎯 BUSCAR SEMPRE AS DATAS MAIS PRÓXIMAS DISPONÍVEIS
-    # Verificar próximos 15 dias úteis para garantir opções
-    dias_verificados = 0
-    dia_offset = 0
-
-    while len(horarios_disponiveis) < 3 and dias_verificados < 15:
-        data_verificacao = inicio + timedelta(days=dia_offset)
-        dia_offset += 1
-
-        # Pular fins de semana
-        if data_verificacao.weekday() >= 5:
-            continue
+    async def avaliar_dia(data_verificacao: datetime) -> Optional[float]:
+        data_str = data_verificacao.strftime('%Y-%m-%d')
 
-        # 🚫 REGRA GRUPO C: Nunca aos sábados e segundas-feiras
+        # 🚫 REGRA GRUPO C: Nunca aos sábados (fim de semana já pulado) e segundas-feiras
         if grupo == 'C':
-            # Segunda-feira = 0, Sábado = 5
-            if data_verificacao.weekday() == 0:  # Segunda-feira
+            if not calendario().grupo_permitido(data_verificacao, 'C'):
                 logger.info(f"🚫 GRUPO C: Pulando segunda-feira {data_str}")
-                continue
-            # Sábado já é pulado pelo fim de semana acima
+                return None
 
             # 🚫 REGRA GRUPO C: Nunca no dia seguinte se já houver Grupo C hoje
             if await verificar_grupo_c_consecutivo(data_verificacao, technician_id, supabase):
                 logger.info(f"🚫 GRUPO C: Pulando {data_str} - já há Grupo C no dia anterior")
-                continue
-
-        dias_verificados += 1
-
-        data_str = data_verificacao.strftime('%Y-%m-%d')
+                return None
 
-        # Calcular score do dia baseado na carga de trabalho
+        # Score do dia baseado na carga de trabalho
         score_dia = await calcular_score_dia(data_str, grupo, supabase)
 
-        # Verificar cada horário prioritário
-        for horario_info in horarios_prioritarios:
-            if len(horarios_disponiveis) >= 3:
-                break
-
-            # Verificar disponibilidade do técnico
-            disponivel = await verificar_horario_tecnico_disponivel(
-                technician_id, data_str, horario_info["hora"]
-            )
-
-            if disponivel:
-                # Calcular score total
-                score_total = horario_info["score_base"] + score_dia
-
-                # Bonus por otimização de rota
-                if coordenadas:
-                    bonus_rota = await calcular_bonus_rota_inteligente(
-                        data_str, horario_info["hora"], coordenadas, grupo, supabase
-                    )
-                    score_total += bonus_rota
-
-                # Bonus por urgência
-                if urgente:
-                    score_total += 15
+        # Bonus por otimização de rota
+        if coordenadas:
+            score_dia += await calcular_bonus_rota_inteligente(data_str, coordenadas, grupo, supabase, technician_id)
+        return score_dia
 
-                # Criar horário otimizado
-                horario_dt = data_verificacao.replace(
-                    hour=horario_info["hora"], minute=0, second=0, microsecond=0
-                )
-
-                dias_semana = {
-                    'Monday': 'Segunda-feira', 'Tuesday': 'Terça-feira',
-                    'Wednesday': 'Quarta-feira', 'Thursday': 'Quinta-feira',
-                    'Friday': 'Sexta-feira'
-                }
-
-                dia_semana_pt = dias_semana.get(horario_dt.strftime('%A'), horario_dt.strftime('%A'))
-                data_formatada = f"{dia_semana_pt}, {horario_dt.strftime('%d/%m/%Y')}"
-
-                horarios_disponiveis.append({
-                    "numero": len(horarios_disponiveis) + 1,
-                    "texto": f"Previsão de chegada entre {horario_info['texto']} - {data_formatada}",
-                    "datetime_agendamento": horario_dt.isoformat(),
-                    "dia_semana": data_formatada,
-                    "hora_agendamento": f"{horario_info['hora']:02d}:00",
-                    "score_otimizacao": score_total,
-                    "grupo_logistico": grupo
-                })
-
-                logger.info(f"✅ Horário otimizado: {data_formatada} {horario_info['hora']}h (Score: {score_total})")
-
-        if len(horarios_disponiveis) >= 3:
-            break
-
-    # Ordenar por score (melhor otimização primeiro)
-    horarios_disponiveis.sort(key=lambda x: x.get("score_otimizacao", 0), reverse=True)
-
-    return horarios_disponiveis[:3]
+    async def pontuar(candidato: Candidato, score_dia: float) -> Optional[float]:
+        disponivel = await verificar_horario_tecnico_disponivel(
+            technician_id, candidato.data_str, candidato.hora
+        )
+        return candidato.score_base + score_dia + bonus_urgencia if disponivel else None
+
+    def formatar(candidato: Candidato) -> Dict:
+        horario = formatar_horario(candidato, score_otimizacao=candidato.score, grupo_logistico=grupo)
+        logger.info(f"✅ Horário otimizado: {horario['dia_semana']} {candidato.hora}h (Score: {candidato.score})")
+        return horario
+
+    # 🎯 BUSCAR SEMPRE AS DATAS MAIS PRÓXIMAS DISPONÍVEIS (15 dias úteis)
+    return await buscar_melhores_horarios(EstrategiaBusca(
+        nome=f"grupo_{grupo.lower()}",
+        candidatos=candidatos_por_dia(inicio, 15, horarios_prioritarios, teto_extra=bonus_urgencia, dias_uteis=True),
+        avaliar_dia=avaliar_dia,
+        pontuar=pontuar,
+        formatar=formatar
+    ))
 
 async def gerar_horarios_com_disponibilidade_tecnico(technician_id: str, technician_name: str, urgente: bool = False) -> List[Dict]:
     """
@@ -830,7 +895,6 @@ async def gerar_horarios_com_disponibilidade_tecnico(technician_id: str, technic
     try:
         logger.info(f"🔍 Verificando disponibilidade real do técnico {technician_name} (ID: {technician_id})")
 
-        agora = datetime.now(pytz.timezone('America/Sao_Paulo'))
         inicio = calcular_data_inicio_otimizada(urgente)
 
         # Horários preferenciais para verificar - HORÁRIOS COMERCIAIS
@@ -843,67 +907,20 @@ async def gerar_horarios_com_disponibilidade_tecnico(technician_id: str, technic
             {"hora": 16, "texto": "16h e 17h"}
         ]
 
-        horarios_disponiveis = []
-        supabase = get_supabase_client()
-
-        # 🎯 BUSCAR SEQUENCIALMENTE AS DATAS MAIS PRÓXIMAS
-        dias_verificados = 0
-        dia_offset = 0
-
-        while len(horarios_disponiveis) < 3 and dias_verificados < 10:
-            data_verificacao = inicio + timedelta(days=dia_offset)
-            dia_offset += 1
-
-            # Pular fins de semana
-            if data_verificacao.weekday() >= 5:
-                continue
-
-            dias_verificados += 1
-
-            data_str = data_verificacao.strftime('%Y-%m-%d')
-
-            # Verificar cada horário preferido
-            for horario_info in horarios_preferidos:
-                horario_dt = data_verificacao.replace(
-                    hour=horario_info["hora"],
-                    minute=0,
-                    second=0,
-                    microsecond=0
-                )
-
-                # Verificar se técnico está disponível neste horário
-                disponivel = await verificar_horario_tecnico_disponivel(
-                    technician_id,
-                    data_str,
-                    horario_info["hora"]
-                )
-
-                if disponivel:
-                    # Formatar data por extenso
-                    dias_semana = {
-                        'Monday': 'Segunda-feira', 'Tuesday': 'Terça-feira',
-                        'Wednesday': 'Quarta-feira', 'Thursday': 'Quinta-feira',
-                        'Friday': 'Sexta-feira'
-                    }
-
-                    dia_semana_pt = dias_semana.get(horario_dt.strftime('%A'), horario_dt.strftime('%A'))
-                    data_formatada = f"{dia_semana_pt}, {horario_dt.strftime('%d/%m/%Y')}"
-
-                    horarios_disponiveis.append({
-                        "numero": len(horarios_disponiveis) + 1,
-                        "texto": f"Previsão de chegada entre {horario_info['texto']} - {data_formatada}",
-                        "datetime_agendamento": horario_dt.isoformat(),
-                        "dia_semana": data_formatada,
-                        "hora_agendamento": f"{horario_info['hora']:02d}:00"
-                    })
+        async def pontuar(candidato: Candidato, score_dia: float) -> Optional[float]:
+            disponivel = await verificar_horario_tecnico_disponivel(
+                technician_id, candidato.data_str, candidato.hora
+            )
+            return 0 if disponivel else None
 
-                    # Parar quando tiver 3 horários
-                    if len(horarios_disponiveis) >= 3:
-                        break
-
-            # Parar quando tiver 3 horários
-            if len(horarios_disponiveis) >= 3:
-                break
+        # 🎯 BUSCAR SEQUENCIALMENTE AS DATAS MAIS PRÓXIMAS (10 dias úteis)
+        horarios_disponiveis = await buscar_melhores_horarios(EstrategiaBusca(
+            nome="disponibilidade_tecnico",
+            candidatos=candidatos_por_dia(inicio, 10, horarios_preferidos, dias_uteis=True),
+            pontuar=pontuar,
+            formatar=formatar_horario,
+            ordenar_por_score=False
+        ))
 
         # Se não encontrou horários suficientes, usar fallback
         if len(horarios_disponiveis) < 3:
@@ -938,10 +955,8 @@ def gerar_horarios_fixos_consistentes(urgente: bool = False) -> List[Dict]:
 
         horarios = []
 
-        # Encontrar o próximo dia útil
-        data_atual = inicio
-        while data_atual.weekday() >= 5:  # Pular fins de semana
-            data_atual += timedelta(days=1)
+        # Encontrar o próximo dia útil (fins de semana e feriados)
+        data_atual = inicio + timedelta(days=(calendario().proximo_dia_util(inicio) - inicio.date()).days)
 
         # Gerar os 3 horários fixos
         for i, horario_info in enumerate(horarios_fixos, 1):
@@ -991,28 +1006,24 @@ def gerar_chave_cache(dados: dict) -> str:
 def salvar_horarios_cache(dados: dict, horarios: List[Dict]) -> str:
     """Salva horários no cache e retorna a chave"""
     chave = gerar_chave_cache(dados)
-    cache_horarios[chave] = {
+    cache_horarios.set(chave, {
         "horarios": horarios,
         "timestamp": datetime.now().isoformat(),
         "dados_originais": dados
-    }
+    }, CACHE_HORARIOS_TTL)
     logger.info(f"💾 Horários salvos no cache: {chave}")
     return chave
 
 def recuperar_horarios_cache(dados: dict) -> Optional[List[Dict]]:
     """Recupera horários do cache"""
     chave = gerar_chave_cache(dados)
-    if chave in cache_horarios:
-        cache_entry = cache_horarios[chave]
-        # Verificar se não expirou (30 minutos)
-        timestamp = datetime.fromisoformat(cache_entry["timestamp"])
-        if (datetime.now() - timestamp).total_seconds() < 1800:  # 30 minutos
-            logger.info(f"📂 Horários recuperados do cache: {chave}")
-            return cache_entry["horarios"]
-        else:
-            # Remover entrada expirada
-            del cache_horarios[chave]
-            logger.info(f"🗑️ Cache expirado removido: {chave}")
+    # Entradas expiram no próprio armazenamento (CACHE_HORARIOS_TTL)
+    cache_entry = cache_horarios.get(chave)
+    if cache_entry is not None:
+        logger.info(f"📂 Horários recuperados do cache: {chave}")
+        registrar_cache("horarios", True)
+        return cache_entry["horarios"]
+    registrar_cache("horarios", False)
     return None
 
 # 🎯 FUNÇÕES PARA GOOGLE ADS TRACKING
@@ -1284,6 +1295,7 @@ async def register_smart_google_ads_conversion(
         logger.error(f"❌ Erro ao registrar conversões inteligentes: {e}")
         return False
 
+@medir_etapa("registro_conversao")
 async def register_google_ads_conversion(
     agendamento_id: str,
     conversion_type: str,
@@ -1350,7 +1362,100 @@ async def register_google_ads_conversion(
         logger.error(f"❌ Erro ao registrar conversão Google Ads: {e}")
         return False
 
-app = FastAPI()
+AQUECIMENTO_TIMEOUT = float(os.getenv("AQUECIMENTO_TIMEOUT", "45"))
+
+async def aquecer(fases: Dict[str, Any], quadro: bool = True) -> None:
+    """
+    🔥 Aquecimento antes de aceitar tráfego: pool do Supabase, cliente HTTP do
+    Nominatim, técnicos, cache de geocodificação e quadro de disponibilidade.
+    Uma fase com erro não impede as demais (a requisição calcula na hora).
+    Com estado compartilhado, só o worker líder calcula o quadro (quadro=False nos demais).
+    """
+    async def abrir_cliente_http():
+        global _cliente_nominatim
+        if _cliente_nominatim is None or _cliente_nominatim.is_closed:
+            _cliente_nominatim = httpx.AsyncClient(timeout=TIMEOUT_NOMINATIM)
+
+    etapas = [
+        ("supabase", verificar_dependencias),
+        ("cliente_http", abrir_cliente_http),
+        ("tecnicos", obter_tecnicos_do_banco),
+        ("geocodificacao", lambda: asyncio.to_thread(carregar_cache_geocodificacao)),
+        ("quadro_disponibilidade", quadro_disponibilidade.atualizar),
+    ]
+    if not quadro:
+        etapas = etapas[:-1]
+    for nome, executar in etapas:
+        inicio = time.perf_counter()
+        try:
+            resultado = await executar()
+            fases[nome] = {"ok": True}
+            if isinstance(resultado, (int, dict)):
+                fases[nome]["itens"] = resultado if isinstance(resultado, int) else len(resultado)
+        except Exception as e:
+            fases[nome] = {"ok": False, "erro": str(e) or type(e).__name__}
+            logger.warning("⚠️ Aquecimento: fase %s falhou: %s", nome, e)
+        fases[nome]["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    """
+    🔄 Inicia e encerra as tarefas em segundo plano da API.
+    O servidor só aceita conexões depois do aquecimento (AQUECIMENTO=desligado pula).
+    """
+    global _cliente_nominatim
+
+    sonda_prontidao.iniciar()
+    monitor_memoria.iniciar()
+
+    # Um worker por host fica com o quadro e o feed de alterações (sem estado compartilhado, todos)
+    lider = not ESTADO_COMPARTILHADO or trava_lider.tentar()
+
+    fases: Dict[str, Any] = {}
+    inicio = time.perf_counter()
+    if os.getenv("AQUECIMENTO", "ligado") != "desligado":
+        try:
+            await asyncio.wait_for(aquecer(fases, quadro=lider), timeout=AQUECIMENTO_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Aquecimento interrompido após %ss: %s", AQUECIMENTO_TIMEOUT, list(fases))
+    duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    sonda_prontidao.marcar_aquecido(fases, duracao_ms)
+    logger.info("🔥 Aquecimento concluído em %sms: %s", duracao_ms, fases)
+
+    async def iniciar_tarefas_lider():
+        # Quadro já calculado no aquecimento: o laço espera o intervalo antes da próxima atualização completa
+        quadro_disponibilidade.iniciar(atualizar_ao_iniciar=not (lider and fases.get("quadro_disponibilidade", {}).get("ok")))
+        logger.info("📋 Quadro de disponibilidade iniciado em segundo plano")
+        try:
+            await consumidor_alteracoes.iniciar(get_supabase_client)
+        except Exception as e:
+            logger.error(f"❌ Erro ao iniciar feed de alterações: {e}")
+        # Reprocessa a fila de saída com o Supabase de volta (a sonda de prontidão fecha o disjuntor)
+        fila_saida.iniciar(processar_item_fila_saida, lambda: not disjuntor_supabase.degradado)
+
+    if ESTADO_COMPARTILHADO:
+        await trava_lider.iniciar(iniciar_tarefas_lider)
+    else:
+        await iniciar_tarefas_lider()
+    try:
+        yield
+    finally:
+        await consumidor_alteracoes.parar()
+        await quadro_disponibilidade.parar()
+        await fila_saida.parar()
+        await trava_lider.parar()
+        await sonda_prontidao.parar()
+        await monitor_memoria.parar()
+        captura_trafego.parar()
+        if _cliente_nominatim is not None:
+            await _cliente_nominatim.aclose()
+            _cliente_nominatim = None
+        try:
+            salvar_cache_geocodificacao()
+        except Exception as e:
+            logger.warning(f"⚠️ Não foi possível salvar o cache de geocodificação: {e}")
+
+app = FastAPI(lifespan=ciclo_de_vida, default_response_class=JSONResponse)
 
 # Configurar CORS
 app.add_middleware(
@@ -1361,6 +1466,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 🔬 PERFILADOR SOB DEMANDA (adicionado antes dos @app.middleware: roda na mesma task do endpoint)
+perfilador = Perfilador(funcoes_atribuidas=(
+    "consultar_disponibilidade_interna",
+    "gerar_horarios_proximas_datas_disponiveis",
+    "criar_os_completa",
+))
+app.add_middleware(MiddlewarePerfilador, perfilador=perfilador)
+
 # 🎯 MIDDLEWARE PARA CAPTURAR PARÂMETROS DE TRACKING GOOGLE ADS
 @app.middleware("http")
 async def capture_google_ads_tracking(request: Request, call_next):
@@ -1412,6 +1525,286 @@ async def capture_google_ads_tracking(request: Request, call_next):
         response = await call_next(request)
         return response
 
+# 📊 ORÇAMENTO DE CONSULTAS POR REQUISIÇÃO
+QUERY_STATS_HEADER = os.getenv("QUERY_STATS_HEADER", "").lower() in ("1", "true", "sim")
+
+@app.middleware("http")
+async def medir_consultas_requisicao(request: Request, call_next):
+    """
+    Conta consultas, linhas e tempo no Supabase por requisição.
+    O resumo vai para o log e, se habilitado (QUERY_STATS_HEADER ou header X-Query-Stats na requisição),
+    para o header X-Query-Stats da resposta.
+    """
+    token = iniciar_requisicao()
+    try:
+        response = await call_next(request)
+    finally:
+        estatisticas = finalizar_requisicao(token)
+
+    if estatisticas.consultas:
+        resumo = estatisticas.resumo()
+        logger.info(f"📊 {request.method} {request.url.path}: {resumo['consultas']} consultas, {resumo['linhas']} linhas, {resumo['ms']}ms {resumo['por_tabela']}")
+        if resumo["n_mais_1"]:
+            logger.warning(f"⚠️ N+1 em {request.url.path}: {resumo['n_mais_1']}")
+
+    excedidos = estatisticas.orcamento_excedido()
+    if excedidos:
+        logger.error(f"❌ Orçamento de consultas excedido em {request.url.path}: {', '.join(excedidos)}")
+        if estatisticas.estrito:
+            response = JSONResponse(
+                status_code=500,
+                content={"success": False, "message": "Orçamento de consultas excedido", "query_stats": estatisticas.resumo()}
+            )
+
+    if QUERY_STATS_HEADER or request.headers.get("X-Query-Stats"):
+        response.headers["X-Query-Stats"] = estatisticas.cabecalho()
+    return response
+
+# 🚦 CONTROLE DE ADMISSÃO DAS ROTAS CARAS (registrado antes do prazo e da idempotência, fica dentro
+# deles: a espera na fila conta no prazo e reenvios repetidos pela janela não gastam ficha nem vaga)
+ROTAS_CARAS = {
+    "/agendamento-inteligente",
+    "/agendamento-inteligente-completo",
+    "/consultar-disponibilidade",
+}
+# Por IP desligado por padrão: todas as conversas chegam pelos poucos IPs do ClienteChat
+controle_admissao = criar_controle_admissao(
+    ROTAS_CARAS if os.getenv("CONTROLE_ADMISSAO", "ligado") == "ligado" else (),
+    maximo_concorrentes=int(os.getenv("ADMISSAO_MAX_CONCORRENTES", "4")),
+    fila_maxima=int(os.getenv("ADMISSAO_FILA_MAXIMA", "256")),
+    espera_maxima=float(os.getenv("ADMISSAO_ESPERA_MS", "2000")) / 1000,
+    telefone=BaldesFichas(
+        "telefone",
+        capacidade=int(os.getenv("LIMITE_TELEFONE_RAJADA", "6")),
+        por_minuto=float(os.getenv("LIMITE_TELEFONE_POR_MINUTO", "12")),
+    ),
+    ip=BaldesFichas(
+        "ip",
+        capacidade=int(os.getenv("LIMITE_IP_RAJADA", "60")),
+        por_minuto=float(os.getenv("LIMITE_IP_POR_MINUTO", "0")),
+    ),
+    ips_isentos=[ip.strip() for ip in os.getenv("LIMITE_IP_ISENTOS", "").split(",") if ip.strip()],
+)
+
+# Proxies na frente do worker (o do Railway = 1; 0 = ignorar X-Forwarded-For)
+PROXIES_CONFIAVEIS = int(os.getenv("PROXIES_CONFIAVEIS", "1"))
+
+def ip_requisicao(request: Request) -> Optional[str]:
+    """
+    IP do cliente para o balde por IP: a entrada do X-Forwarded-For acrescentada pelo proxy
+    confiável mais externo (a PROXIES_CONFIAVEIS-ésima a partir da direita). As entradas à
+    esquerda vêm do próprio cliente e não valem como identidade.
+    """
+    encaminhado = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+    if PROXIES_CONFIAVEIS > 0 and encaminhado:
+        return encaminhado[-min(PROXIES_CONFIAVEIS, len(encaminhado))]
+    return request.client.host if request.client else None
+
+@app.middleware("http")
+async def admitir_requisicao(request: Request, call_next):
+    """
+    Baldes por telefone/IP e limite de concorrência das rotas caras (controle_admissao.py).
+    Recusada: 429 (limite do telefone/IP) ou 503 (sem vaga), com Retry-After e a mensagem
+    para o ClienteChat repassar ao cliente.
+    """
+    if not controle_admissao.controla(request.method, request.url.path):
+        return await call_next(request)
+
+    telefone = None
+    try:
+        corpo = json.loads(await request.body() or b"{}")
+        if isinstance(corpo, dict):
+            telefone = corpo.get("telefone") or corpo.get("telefone_contato")
+    except Exception:
+        pass
+
+    try:
+        async with controle_admissao.admitir(request.url.path, telefone, ip_requisicao(request)):
+            return await call_next(request)
+    except AdmissaoRecusada as recusa:
+        return JSONResponse(
+            status_code=recusa.status_code,
+            content={
+                "success": False,
+                "message": "⏳ Estamos com muitas solicitações no momento. Por favor, tente novamente em alguns instantes.",
+                "action": "retry_later",
+                "retry_after": int(recusa.retry_after),
+            },
+            headers={"Retry-After": recusa.retry_after},
+        )
+
+# ⏱️ PRAZO POR REQUISIÇÃO (abaixo do timeout do webhook do ClienteChat; 0 = sem prazo)
+PRAZO_REQUISICAO_MS = float(os.getenv("PRAZO_REQUISICAO_MS", "8000"))
+
+@app.middleware("http")
+async def prazo_requisicao(request: Request, call_next):
+    """
+    Abre o prazo da requisição (prazos.py): as etapas da busca de horários param quando ele
+    esgota e a resposta sai com os horários encontrados até ali (header X-Deadline-Partial)
+    """
+    token = iniciar_prazo(PRAZO_REQUISICAO_MS / 1000)
+    try:
+        response = await call_next(request)
+    finally:
+        prazo = finalizar_prazo(token)
+
+    if prazo is not None and prazo.parcial:
+        logger.warning(f"⏱️ {request.method} {request.url.path}: prazo de {PRAZO_REQUISICAO_MS:.0f}ms esgotado em {prazo.etapas} - resposta parcial")
+        response.headers["X-Deadline-Partial"] = ",".join(prazo.etapas)
+    return response
+
+# 🛡️ IDEMPOTÊNCIA DOS ENDPOINTS DE AGENDAMENTO
+ROTAS_IDEMPOTENTES = {
+    "/agendamento-inteligente",
+    "/agendamento-inteligente-confirmacao",
+    "/agendamento-inteligente-completo",
+}
+
+@app.middleware("http")
+async def idempotencia_agendamento(request: Request, call_next):
+    """
+    Repete a resposta já enviada quando o ClienteChat reenvia a mesma requisição.
+    Usa o header Idempotency-Key ou, na falta dele, o fingerprint do corpo
+    dentro de uma janela curta de reenvio.
+    """
+    if request.method != "POST" or request.url.path not in ROTAS_IDEMPOTENTES:
+        return await call_next(request)
+
+    escopo = request.url.path
+    chave = request.headers.get(HEADER_IDEMPOTENCIA, "").strip()
+    ttl = None
+    if not chave:
+        try:
+            corpo = json.loads(await request.body() or b"{}")
+            if not isinstance(corpo, dict):
+                return await call_next(request)
+            chave = f"fp-{gerar_fingerprint(corpo)}"
+            ttl = JANELA_REENVIO
+        except Exception:
+            return await call_next(request)
+
+    resposta_anterior = janela_idempotencia.obter_resposta(escopo, chave)
+    registrar_cache("idempotencia_respostas", resposta_anterior is not None)
+    if resposta_anterior is not None:
+        logger.info(f"🛡️ Reenvio detectado em {escopo} - repetindo resposta sem processar novamente")
+        return Response(
+            content=resposta_anterior["body"],
+            status_code=resposta_anterior["status_code"],
+            media_type=resposta_anterior["media_type"],
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    response = await call_next(request)
+    # 5xx e 429 (controle de admissão) não são respostas definitivas: o reenvio deve processar
+    if response.status_code >= 500 or response.status_code == 429:
+        return response
+
+    corpo_resposta = b"".join([chunk async for chunk in response.body_iterator])
+    media_type = response.headers.get("content-type", "application/json")
+    # Por fingerprint só repetimos respostas de sucesso; com chave explícita, qualquer 2xx/4xx
+    if ttl is None:
+        janela_idempotencia.salvar_resposta(escopo, chave, response.status_code, corpo_resposta, media_type)
+    elif response.status_code < 300:
+        janela_idempotencia.salvar_resposta(escopo, chave, response.status_code, corpo_resposta, media_type, ttl=ttl)
+
+    return Response(
+        content=corpo_resposta,
+        status_code=response.status_code,
+        headers=dict(response.headers)
+    )
+
+# 🎥 CAPTURA DE TRÁFEGO PARA REPLAY (CAPTURA_TRAFEGO_ARQUIVO)
+@app.middleware("http")
+async def capturar_trafego(request: Request, call_next):
+    """
+    Grava corpo anonimizado, status e duração das requisições POST em JSONL (ver replay_trafego.py)
+    """
+    if not captura_trafego.deve_capturar(request.method, request.url.path):
+        return await call_next(request)
+
+    chegada = time.time()
+    corpo = await request.body()
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        captura_trafego.registrar(
+            request.method, request.url.path, request.url.query, dict(request.headers),
+            corpo, status, (time.perf_counter() - inicio) * 1000, chegada
+        )
+
+# 🪪 ID DA REQUISIÇÃO NOS LOGS (X-Request-ID do cliente ou gerado aqui)
+@app.middleware("http")
+async def atribuir_id_requisicao(request: Request, call_next):
+    """
+    Define o contextvar lido pelo pipeline de logs e devolve o id no header da resposta
+    """
+    identificador = request.headers.get("x-request-id") or uuid.uuid4().hex[:12]
+    token = id_requisicao.set(identificador)
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = identificador
+        return response
+    finally:
+        id_requisicao.reset(token)
+
+# 📈 LATÊNCIA POR ROTA (registrado por último = middleware mais externo, mede a requisição inteira)
+@app.middleware("http")
+async def medir_latencia_rota(request: Request, call_next):
+    """
+    Alimenta o histograma http_request_duration_seconds usando o template da rota
+    (ex.: /api/status/{id}) para não criar uma série por URL. Respostas dadas antes do
+    roteamento (reenvio repetido pela idempotência, 429/503 da admissão) ficam com o
+    caminho da URL quando ele é o de uma rota sem parâmetros.
+    """
+    inicio = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        rota = request.scope.get("route")
+        caminho = getattr(rota, "path", None)
+        if caminho is None:
+            caminho = request.url.path if request.url.path in caminhos_rotas() else "nao_mapeada"
+        metricas.http_requisicoes.observar(time.perf_counter() - inicio, request.method, caminho, status)
+
+_caminhos_rotas: Optional[set] = None
+
+def caminhos_rotas() -> set:
+    """Caminhos das rotas registradas (calculado na primeira requisição, com todas já declaradas)"""
+    global _caminhos_rotas
+    if _caminhos_rotas is None:
+        _caminhos_rotas = {rota.path for rota in app.routes if getattr(rota, "path", None)}
+    return _caminhos_rotas
+
+# 🔀 COALESCÊNCIA DE CONSULTAS DE DISPONIBILIDADE IDÊNTICAS
+coalescedor_disponibilidade = SingleFlight("disponibilidade")
+
+CAMPOS_FINGERPRINT_DISPONIBILIDADE = [
+    "telefone", "endereco", "nome",
+    "equipamento", "equipamento_2", "equipamento_3",
+    "tipo_atendimento_1", "tipo_atendimento_2", "tipo_atendimento_3",
+    "urgente", "data_preferida",
+]
+
+def gerar_chave_disponibilidade(data: dict, etapa: str) -> str:
+    """Fingerprint normalizado usado para coalescer consultas de disponibilidade"""
+    normalizado = dict(data)
+    normalizado["telefone"] = normalizar_documento(data.get("telefone"))
+    return f"{etapa}:{gerar_fingerprint(normalizado, CAMPOS_FINGERPRINT_DISPONIBILIDADE)}"
+
+def copiar_resposta(response):
+    """Cada requisição coalescida recebe sua própria instância da resposta compartilhada"""
+    if not isinstance(response, Response):
+        return response
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return Response(content=response.body, status_code=response.status_code, headers=headers)
+
 # URL da página do Google para avaliações
 GOOGLE_REVIEW_URL = "https://g.page/r/CfjiXeK7gOSLEAg/review"
 
@@ -1494,6 +1887,13 @@ CEPS_GRUPO_B = ['88100', '88110', '88115', '88130', '88135', '88140', '88160',
 CEPS_GRUPO_C = ['88200', '88210', '88220', '88300', '88330', '88340', '88345',
                 '88350', '88355', '88370', '88380', '88385', '88390']
 
+# Índice prefixo → grupo montado na importação (A tem prioridade sobre B e C, como na busca em listas)
+GRUPO_POR_PREFIXO_CEP = {
+    prefixo: grupo
+    for grupo, prefixos in (("C", CEPS_GRUPO_C), ("B", CEPS_GRUPO_B), ("A", CEPS_GRUPO_A))
+    for prefixo in prefixos
+}
+
 # Modelo para agendamento inteligente
 class AgendamentoInteligente(BaseModel):
     nome: str
@@ -1534,6 +1934,8 @@ def filtrar_placeholders(valor: str) -> str:
     return valor
 
 # Função para obter cliente Supabase com cache
+_supabase_client = None
+
 def get_supabase_client() -> Client:
     global _supabase_client
 
@@ -1545,7 +1947,7 @@ def get_supabase_client() -> Client:
             logger.error("Variáveis de ambiente SUPABASE_URL ou SUPABASE_KEY não definidas")
             raise ValueError("Variáveis de ambiente SUPABASE_URL ou SUPABASE_KEY não definidas")
 
-        _supabase_client = create_client(url, key)
+        _supabase_client = instrumentar_cliente(create_client(url, key), disjuntor_supabase, leituras_supabase)
         logger.info("🔧 Cliente Supabase inicializado com cache")
 
     return _supabase_client
@@ -1637,8 +2039,6 @@ async def gerar_horarios_disponiveis_v4(tecnico: str, grupo_logistico: str, urge
     IMPORTANTE: data_base permite fixar a data de referência para garantir consistência entre ETAPA 1 e 2
     """
     try:
-        horarios = []
-
         # Usar data_base se fornecida, senão usar agora
         if data_base:
             agora = data_base
@@ -1650,34 +2050,30 @@ async def gerar_horarios_disponiveis_v4(tecnico: str, grupo_logistico: str, urge
         # 🎯 NOVA LÓGICA: Sempre usar data mais próxima disponível
         inicio = calcular_data_inicio_otimizada(urgente)
 
-        # Gerar horários para os próximos 7 dias
-        for i in range(7):
-            data = inicio + timedelta(days=i)
-
-            # Apenas dias úteis (segunda a sexta)
-            if data.weekday() < 5:
-                # Horários comerciais: 9h-11h e 13h-17h
-                horarios_comerciais = list(range(9, 11)) + list(range(13, 17))
-                for hora in horarios_comerciais:
-                    horario_dt = data.replace(hour=hora, minute=0, second=0, microsecond=0)
-
-                    # Verificar se horário não está ocupado
-                    if await verificar_horario_disponivel(horario_dt, tecnico):
-                        horarios.append({
-                            "datetime_agendamento": horario_dt.isoformat(),
-                            "dia_semana": horario_dt.strftime("%A, %d/%m/%Y"),
-                            "hora_agendamento": horario_dt.strftime("%H:%M"),
-                            "texto": f"{horario_dt.strftime('%A, %d/%m/%Y')} às {horario_dt.strftime('%H:%M')}"
-                        })
+        # Horários comerciais: 9h-11h e 13h-17h
+        horarios_comerciais = [{"hora": hora} for hora in HORAS_COMERCIAIS]
 
-                        # Limitar a 10 horários
-                        if len(horarios) >= 10:
-                            break
+        async def pontuar(candidato: Candidato, score_dia: float) -> Optional[float]:
+            # Verificar se horário não está ocupado
+            return 0 if await verificar_horario_disponivel(candidato.horario, tecnico) else None
 
-            if len(horarios) >= 10:
-                break
+        def formatar(candidato: Candidato) -> Dict:
+            horario_dt = candidato.horario
+            return {
+                "datetime_agendamento": horario_dt.isoformat(),
+                "dia_semana": horario_dt.strftime("%A, %d/%m/%Y"),
+                "hora_agendamento": horario_dt.strftime("%H:%M"),
+                "texto": f"{horario_dt.strftime('%A, %d/%m/%Y')} às {horario_dt.strftime('%H:%M')}"
+            }
 
-        return horarios
+        # Próximos 7 dias, limitado a 10 horários
+        return await buscar_melhores_horarios(EstrategiaBusca(
+            nome="v4",
+            candidatos=candidatos_por_dia(inicio, 7, horarios_comerciais),
+            pontuar=pontuar,
+            formatar=formatar,
+            ordenar_por_score=False
+        ), 10)
 
     except Exception as e:
         logger.error(f"Erro ao gerar horários disponíveis: {e}")
@@ -1689,16 +2085,27 @@ async def verificar_horario_tecnico_disponivel(technician_id: str, date_str: str
     """
     try:
         # FILTRO DE SEGURANÇA: Apenas horários comerciais (9h-11h e 13h-17h)
-        if not ((9 <= hour <= 10) or (13 <= hour <= 16)):
-            logger.warning(f"⚠️ HORÁRIO FORA DO COMERCIAL BLOQUEADO: {hour}h (permitido: 9h-10h e 13h-16h)")
+        if not hora_comercial(hour):
+            logger.warning("⚠️ HORÁRIO FORA DO COMERCIAL BLOQUEADO: %sh (permitido: 9h-10h e 13h-16h)", hour)
             return False
 
         supabase = get_supabase_client()
 
+        # 🎯 calendar_events: mesma conferência exata da ETAPA 2 (verificar_horario_disponivel_tecnico),
+        # senão um horário ocupado só no calendário é oferecido e recusado com 409 a cada conversa
+        horario_dt = pytz.timezone('America/Sao_Paulo').localize(datetime.strptime(f"{date_str} {hour:02d}:00", '%Y-%m-%d %H:%M'))
+        response_calendar = supabase.table("calendar_events").select("*").eq(
+            "technician_id", technician_id
+        ).eq("start_time", horario_dt.isoformat()).execute()
+
+        if response_calendar.data:
+            logger.debug("❌ Técnico %s ocupado em %s às %s:00 (calendar_events) - %s eventos", technician_id, date_str, hour, len(response_calendar.data))
+            return False
+
         # 🔧 CORREÇÃO: Verificar agendamentos na tabela service_orders
         # scheduled_date é DATE e scheduled_time é TIME - consultar separadamente
         time_str = f"{hour:02d}:00"
-        logger.debug(f"🔍 Verificando service_orders: technician_id={technician_id}, date={date_str}, time={time_str}")
+        logger.debug("🔍 Verificando service_orders: technician_id=%s, date=%s, time=%s", technician_id, date_str, time_str)
 
         # 🔧 CORREÇÃO CRÍTICA: scheduled_date é DATETIME, precisa usar ::date para comparar apenas a data
         response_os = supabase.table("service_orders").select("*").eq(
@@ -1717,16 +2124,16 @@ async def verificar_horario_tecnico_disponivel(technician_id: str, date_str: str
                     conflitos_os.append(os)
 
         if conflitos_os and len(conflitos_os) > 0:
-            logger.info(f"❌ Técnico {technician_id} ocupado em {date_str} às {hour}:00 (service_orders) - {len(conflitos_os)} conflitos")
+            logger.debug("❌ Técnico %s ocupado em %s às %s:00 (service_orders) - %s conflitos", technician_id, date_str, hour, len(conflitos_os))
             for os in conflitos_os:
-                logger.debug(f"   📋 OS conflitante: {os.get('order_number', 'N/A')} - {os.get('scheduled_date', 'N/A')} {os.get('scheduled_time', 'N/A')}")
+                logger.debug("   📋 OS conflitante: %s - %s %s", os.get('order_number', 'N/A'), os.get('scheduled_date', 'N/A'), os.get('scheduled_time', 'N/A'))
             return False
 
         # Verificar agendamentos na tabela agendamentos_ai
         # data_agendada é DATETIME - usar range de horário
         start_ai = f"{date_str}T{hour:02d}:00:00"
         end_ai = f"{date_str}T{hour:02d}:59:59"
-        logger.debug(f"🔍 Verificando agendamentos_ai: technician_id={technician_id}, range={start_ai} to {end_ai}")
+        logger.debug("🔍 Verificando agendamentos_ai: technician_id=%s, range=%s to %s", technician_id, start_ai, end_ai)
 
         response_ai = supabase.table("agendamentos_ai").select("*").eq(
             "technician_id", technician_id
@@ -1737,12 +2144,12 @@ async def verificar_horario_tecnico_disponivel(technician_id: str, date_str: str
         ).execute()
 
         if response_ai.data and len(response_ai.data) > 0:
-            logger.info(f"❌ Técnico {technician_id} ocupado em {date_str} às {hour}:00 (agendamentos_ai) - {len(response_ai.data)} conflitos")
+            logger.debug("❌ Técnico %s ocupado em %s às %s:00 (agendamentos_ai) - %s conflitos", technician_id, date_str, hour, len(response_ai.data))
             for ag in response_ai.data:
-                logger.debug(f"   📅 Agendamento conflitante: {ag.get('nome', 'N/A')} - {ag.get('data_agendada', 'N/A')}")
+                logger.debug("   📅 Agendamento conflitante: %s - %s", ag.get('nome', 'N/A'), ag.get('data_agendada', 'N/A'))
             return False
 
-        logger.info(f"✅ Técnico {technician_id} disponível em {date_str} às {hour}:00")
+        logger.debug("✅ Técnico %s disponível em %s às %s:00", technician_id, date_str, hour)
         return True
 
     except Exception as e:
@@ -1764,7 +2171,7 @@ async def verificar_horario_disponivel(horario_dt: datetime, tecnico: str) -> bo
         ).ilike("technician_name", f"%{tecnico}%").execute()
 
         if response_calendar.data and len(response_calendar.data) > 0:
-            logger.info(f"⚠️ Horário {horario_dt.isoformat()} ocupado no calendário para {tecnico}")
+            logger.debug("⚠️ Horário %s ocupado no calendário para %s", horario_dt.isoformat(), tecnico)
             return False
 
         # 📋 VERIFICAR agendamentos_ai (pré-agendamentos pendentes - IMPORTANTE!)
@@ -1773,15 +2180,15 @@ async def verificar_horario_disponivel(horario_dt: datetime, tecnico: str) -> bo
         ).eq("tecnico", tecnico).in_("status", ["pendente", "confirmado"]).execute()
 
         if response_ai.data and len(response_ai.data) > 0:
-            logger.info(f"⚠️ Horário ocupado por pré-agendamento para {tecnico}")
+            logger.debug("⚠️ Horário ocupado por pré-agendamento para %s", tecnico)
             return False
 
-        logger.info(f"✅ Horário {horario_dt.isoformat()} disponível para {tecnico}")
+        logger.debug("✅ Horário %s disponível para %s", horario_dt.isoformat(), tecnico)
         return True
 
     except Exception as e:
         logger.error(f"Erro ao verificar disponibilidade: {e}")
-        return True  # Em caso de erro, assumir disponível
+        return False  # Em caso de erro, assumir ocupado (mesma regra de verificar_horario_tecnico_disponivel)
 
 # Funções de roteirização inteligente
 def calculate_distance(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
@@ -1826,14 +2233,7 @@ def determine_logistics_group_by_cep(cep: str) -> str:
 
     cep_prefix = cep.replace('-', '')[:5]
 
-    if cep_prefix in CEPS_GRUPO_A:
-        return 'A'
-    elif cep_prefix in CEPS_GRUPO_B:
-        return 'B'
-    elif cep_prefix in CEPS_GRUPO_C:
-        return 'C'
-    else:
-        return 'B'  # Padrão
+    return GRUPO_POR_PREFIXO_CEP.get(cep_prefix, 'B')  # Padrão: B
 
 def extract_cep_from_address(endereco: str) -> str:
     """
@@ -1843,6 +2243,7 @@ def extract_cep_from_address(endereco: str) -> str:
     cep_match = re.search(r'\d{5}-?\d{3}', endereco)
     return cep_match.group(0).replace('-', '') if cep_match else ""
 
+@medir_etapa("geocodificacao")
 async def geocodificar_endereco(endereco: str) -> Optional[Tuple[float, float]]:
     """
     Geocodifica um endereço usando a API do OpenStreetMap Nominatim com cache
@@ -1864,17 +2265,46 @@ async def geocodificar_endereco(endereco: str) -> Optional[Tuple[float, float]]:
             cache_time = _geocoding_cache_timestamp.get(endereco_normalizado)
             if cache_time and (now - cache_time).total_seconds() < 3600:  # 1 hora
                 logger.info(f"🎯 Geocodificação do cache: {endereco}")
+                registrar_cache("geocodificacao", True)
                 return _geocoding_cache[endereco_normalizado]
+        if _geocoding_compartilhado is not None:
+            coords = _geocoding_compartilhado.get(endereco_normalizado)
+            if coords:
+                _geocoding_cache[endereco_normalizado] = coords
+                _geocoding_cache_timestamp[endereco_normalizado] = now
+                registrar_cache("geocodificacao", True)
+                return coords
+        registrar_cache("geocodificacao", False)
 
         encoded_address = endereco.replace(' ', '+') + ',+Brasil'
         url = f"https://nominatim.openstreetmap.org/search?format=json&q={encoded_address}&limit=1&countrycodes=br"
 
-        # Cliente HTTP otimizado com timeout
-        timeout = httpx.Timeout(10.0, connect=5.0)
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.get(url, headers={
-                'User-Agent': 'FixFogoes/1.0 (contato@fixfogoes.com.br)'
-            })
+        if not disjuntor_nominatim.permitir():
+            logger.warning(f"🔌 Nominatim com disjuntor aberto - sem geocodificação para: {endereco}")
+            return None
+
+        # Cliente HTTP reaproveitado (conexão TLS já aberta)
+        async with cliente_nominatim() as client:
+            inicio_http = time.perf_counter()
+            try:
+                response = await client.get(url, headers={
+                    'User-Agent': 'FixFogoes/1.0 (contato@fixfogoes.com.br)'
+                })
+            except Exception as e:
+                duracao = time.perf_counter() - inicio_http
+                disjuntor_nominatim.registrar(duracao * 1000, erro=True, detalhe=str(e) or type(e).__name__)
+                metricas.requisicoes_http_cliente.observar(duracao, "nominatim.openstreetmap.org", "erro")
+                raise
+            except BaseException:
+                disjuntor_nominatim.liberar()  # cancelada: devolve a vaga de teste do meio aberto
+                raise
+            duracao = time.perf_counter() - inicio_http
+            # 429 (limite de uso) e 5xx contam como falha da dependência
+            disjuntor_nominatim.registrar(
+                duracao * 1000, erro=response.status_code == 429 or response.status_code >= 500,
+                detalhe=f"HTTP {response.status_code}",
+            )
+            metricas.requisicoes_http_cliente.observar(duracao, "nominatim.openstreetmap.org", str(response.status_code))
 
             if response.status_code == 200:
                 # Garantir encoding UTF-8 correto na resposta
@@ -1887,6 +2317,8 @@ async def geocodificar_endereco(endereco: str) -> Optional[Tuple[float, float]]:
                     # Salvar no cache
                     _geocoding_cache[endereco_normalizado] = coords
                     _geocoding_cache_timestamp[endereco_normalizado] = now
+                    if _geocoding_compartilhado is not None:
+                        _geocoding_compartilhado.set(endereco_normalizado, coords, 3600)
 
                     logger.info(f"🌍 Geocodificação bem-sucedida: {endereco} -> {coords}")
                     return coords
@@ -1947,6 +2379,14 @@ def determinar_periodo_ideal_por_rota(endereco: str) -> str:
         logger.error(f"❌ Erro ao determinar período ideal: {e}")
         return "qualquer"
 
+def motivo_conflito_grupos(grupo_solicitado: str, grupos_existentes) -> str:
+    """Regra: Não misturar Grupo C com A/B no mesmo dia ("" = sem conflito)"""
+    if grupo_solicitado == 'C' and ('A' in grupos_existentes or 'B' in grupos_existentes):
+        return f"Dia já tem Grupo A/B: {list(grupos_existentes)}"
+    elif grupo_solicitado in ['A', 'B'] and 'C' in grupos_existentes:
+        return f"Dia já tem Grupo C"
+    return ""
+
 async def verificar_conflito_grupos_logisticos(data_verificacao: datetime, grupo_solicitado: str, technician_id: str, supabase) -> dict:
     """
     🎯 NOVA ARQUITETURA: Verifica conflitos de grupos logísticos usando calendar_events
@@ -1955,8 +2395,9 @@ async def verificar_conflito_grupos_logisticos(data_verificacao: datetime, grupo
     try:
         data_inicio = data_verificacao.replace(hour=0, minute=0, second=0, microsecond=0)
         data_fim = data_verificacao.replace(hour=23, minute=59, second=59, microsecond=999999)
+        data_str = data_verificacao.strftime('%Y-%m-%d')
 
-        logger.info(f"🔍 Verificando conflitos de grupos para {data_verificacao.strftime('%Y-%m-%d')} - Grupo solicitado: {grupo_solicitado}")
+        logger.debug("🔍 Verificando conflitos de grupos para %s - Grupo solicitado: %s", data_str, grupo_solicitado)
 
         # 🎯 BUSCAR EVENTOS NO CALENDÁRIO (fonte única da verdade)
         response_calendar = supabase.table("calendar_events").select("*").eq(
@@ -1979,26 +2420,18 @@ async def verificar_conflito_grupos_logisticos(data_verificacao: datetime, grupo
                         })
 
         # Verificar conflitos
-        conflito = False
-        motivo = ""
+        motivo = motivo_conflito_grupos(grupo_solicitado, grupos_existentes)
+        conflito = bool(motivo)
 
         if grupos_existentes:
-            logger.info(f"📊 Grupos existentes em {data_str}: {list(grupos_existentes)}")
-
-            # Regra: Não misturar Grupo C com A/B
-            if grupo_solicitado == 'C' and ('A' in grupos_existentes or 'B' in grupos_existentes):
-                conflito = True
-                motivo = f"Dia já tem Grupo A/B: {list(grupos_existentes)}"
-            elif grupo_solicitado in ['A', 'B'] and 'C' in grupos_existentes:
-                conflito = True
-                motivo = f"Dia já tem Grupo C"
+            logger.debug("📊 Grupos existentes em %s: %s", data_str, list(grupos_existentes))
 
             if conflito:
-                logger.warning(f"🚫 CONFLITO DETECTADO em {data_str}: {motivo}")
+                logger.warning("🚫 CONFLITO DETECTADO em %s: %s", data_str, motivo)
                 for ag in agendamentos_dia:
-                    logger.info(f"   - OS {ag['os']}: {ag['endereco']} (Grupo {ag['grupo']})")
+                    logger.debug("   - %s: %s (Grupo %s)", ag['cliente'], ag['endereco'], ag['grupo'])
         else:
-            logger.info(f"✅ Nenhum agendamento encontrado em {data_str}")
+            logger.debug("✅ Nenhum agendamento encontrado em %s", data_str)
 
         return {
             "conflito": conflito,
@@ -2057,38 +2490,46 @@ def determine_logistics_group(endereco: str, coordinates: Optional[Tuple[float,
     ]
 
     if any(cidade in endereco_lower for cidade in cidades_grupo_c):
-        logger.info(f"🎯 OVERRIDE: {endereco} → GRUPO C (cidade específica)")
+        logger.debug("🎯 OVERRIDE: %s → GRUPO C (cidade específica)", endereco)
         return 'C'
 
     # Prioridade 1: Usar coordenadas se disponíveis
     if coordinates:
         grupo_coords = determine_logistics_group_by_coordinates(coordinates)
-        logger.info(f"🗺️ Coordenadas: {coordinates} → GRUPO {grupo_coords}")
+        logger.debug("🗺️ Coordenadas: %s → GRUPO %s", coordinates, grupo_coords)
         return grupo_coords
 
     # Prioridade 2: Usar CEP extraído do endereço
     cep = extract_cep_from_address(endereco)
     if cep:
         grupo_cep = determine_logistics_group_by_cep(cep)
-        logger.info(f"📮 CEP: {cep} → GRUPO {grupo_cep}")
+        logger.debug("📮 CEP: %s → GRUPO %s", cep, grupo_cep)
         return grupo_cep
 
     # Prioridade 3: Análise textual do endereço
     if any(cidade in endereco_lower for cidade in ['florianópolis', 'florianopolis']):
-        logger.info(f"🏙️ Análise textual: {endereco} → GRUPO A")
+        logger.debug("🏙️ Análise textual: %s → GRUPO A", endereco)
         return 'A'
     elif any(cidade in endereco_lower for cidade in ['são josé', 'sao jose', 'palhoça', 'palhoca', 'biguaçu', 'biguacu']):
-        logger.info(f"🌆 Análise textual: {endereco} → GRUPO B")
+        logger.debug("🌆 Análise textual: %s → GRUPO B", endereco)
         return 'B'
     else:
-        logger.info(f"🏖️ Análise textual: {endereco} → GRUPO C (padrão)")
+        logger.debug("🏖️ Análise textual: %s → GRUPO C (padrão)", endereco)
         return 'C'
 
 # Função para obter técnicos do banco de dados
 async def obter_tecnicos_do_banco() -> Dict[str, Dict[str, Any]]:
     """
     Obtém técnicos ativos do Supabase e mapeia suas especialidades
+    (cache de TECNICOS_CACHE_TTL segundos, carregado no aquecimento)
     """
+    global _technicians_cache, _cache_timestamp
+
+    if _technicians_cache and _cache_timestamp and time.time() - _cache_timestamp < TECNICOS_CACHE_TTL:
+        registrar_cache("tecnicos", True)
+        return _technicians_cache
+    registrar_cache("tecnicos", False)
+
     try:
         supabase = get_supabase_client()
         response = supabase.table("technicians").select("*").eq("is_active", True).execute()
@@ -2141,12 +2582,13 @@ async def obter_tecnicos_do_banco() -> Dict[str, Dict[str, Any]]:
                 "ativo": tecnico["is_active"]
             }
 
-        logger.info(f"📋 Técnicos carregados do banco: {list(tecnicos_config.keys())}")
+        logger.info("📋 Técnicos carregados do banco: %s", list(tecnicos_config.keys()))
 
         # 🔍 DEBUG: Log detalhado dos técnicos carregados
         for chave, tecnico in tecnicos_config.items():
-            logger.info(f"   - {chave}: ID={tecnico['id']}, Nome={tecnico['nome']}, Email={tecnico['email']}")
+            logger.debug("   - %s: ID=%s, Nome=%s, Email=%s", chave, tecnico['id'], tecnico['nome'], tecnico['email'])
 
+        _technicians_cache, _cache_timestamp = tecnicos_config, time.time()
         return tecnicos_config
 
     except Exception as e:
@@ -2277,14 +2719,44 @@ async def verificar_disponibilidade_tecnico(tecnico_key: str, data_inicio: datet
         logger.error(f"Erro ao verificar disponibilidade do técnico {tecnico_key}: {e}")
         return {"disponivel": True, "carga_trabalho": 0, "agendamentos_existentes": 0}
 
+async def ranquear_tecnicos(equipamentos: List[str], grupo_logistico: str, urgente: bool = False) -> Tuple[Dict[str, Dict[str, Any]], List[Tuple[str, float]]]:
+    """
+    Técnicos do banco e (chave, score) de todos eles, do melhor para o pior
+    """
+    tecnicos_config = await obter_tecnicos_do_banco()
+
+    # Calcular score para todos os técnicos
+    scores = {}
+    for tecnico_key in tecnicos_config.keys():
+        score = await calcular_score_tecnico(tecnico_key, equipamentos, grupo_logistico, tecnicos_config, urgente)
+        scores[tecnico_key] = score
+        logger.info(f"📊 {tecnicos_config[tecnico_key]['nome']}: {score} pontos")
+
+    # Ordenar por score (maior primeiro)
+    return tecnicos_config, sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+def montar_info_tecnico(tecnico: Dict[str, Any], score: float, equipamentos: List[str], grupo_logistico: str, alternativas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Informações do técnico no formato usado pelas ETAPAS 1 e 2"""
+    return {
+        "tecnico_id": tecnico["id"],
+        "nome": tecnico["nome"],
+        "email": tecnico["email"],
+        "telefone": tecnico["telefone"],
+        "especialidades": tecnico["especialidades"],
+        "score": score,
+        "motivo_selecao": f"Melhor match para {', '.join(equipamentos)} no grupo {grupo_logistico}",
+        "alternativas": alternativas
+    }
+
+@medir_etapa("selecao_tecnico")
 async def determinar_tecnico_otimizado(equipamentos: List[str], grupo_logistico: str, urgente: bool = False) -> Dict[str, Any]:
     """
     Determina o melhor técnico usando algoritmo de scoring inteligente
     """
     logger.info(f"🎯 Determinando técnico para equipamentos: {equipamentos}, grupo: {grupo_logistico}, urgente: {urgente}")
 
-    # Obter técnicos do banco de dados
-    tecnicos_config = await obter_tecnicos_do_banco()
+    # Obter técnicos do banco de dados e ranquear
+    tecnicos_config, tecnicos_ordenados = await ranquear_tecnicos(equipamentos, grupo_logistico, urgente)
 
     if not tecnicos_config:
         logger.error("❌ Nenhum técnico encontrado no banco de dados")
@@ -2299,175 +2771,205 @@ async def determinar_tecnico_otimizado(equipamentos: List[str], grupo_logistico:
             "alternativas": []
         }
 
-    # Calcular score para todos os técnicos
-    scores = {}
-    for tecnico_key in tecnicos_config.keys():
-        score = await calcular_score_tecnico(tecnico_key, equipamentos, grupo_logistico, tecnicos_config, urgente)
-        scores[tecnico_key] = score
-        logger.info(f"📊 {tecnicos_config[tecnico_key]['nome']}: {score} pontos")
-
-    # Ordenar por score (maior primeiro)
-    tecnicos_ordenados = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-
     # Retornar informações do melhor técnico
-    melhor_tecnico_key = tecnicos_ordenados[0][0]
-    melhor_tecnico = tecnicos_config[melhor_tecnico_key]
-    melhor_score = tecnicos_ordenados[0][1]
-
-    resultado = {
-        "tecnico_id": melhor_tecnico["id"],
-        "nome": melhor_tecnico["nome"],
-        "email": melhor_tecnico["email"],
-        "telefone": melhor_tecnico["telefone"],
-        "especialidades": melhor_tecnico["especialidades"],
-        "score": melhor_score,
-        "motivo_selecao": f"Melhor match para {', '.join(equipamentos)} no grupo {grupo_logistico}",
-        "alternativas": [
+    melhor_tecnico_key, melhor_score = tecnicos_ordenados[0]
+    resultado = montar_info_tecnico(
+        tecnicos_config[melhor_tecnico_key], melhor_score, equipamentos, grupo_logistico,
+        [
             {
                 "nome": tecnicos_config[t[0]]["nome"],
                 "score": t[1]
             } for t in tecnicos_ordenados[1:3] if len(tecnicos_ordenados) > 1  # Top alternativas
         ]
-    }
+    )
 
     logger.info(f"🏆 Técnico selecionado: {resultado['nome']} ({resultado['score']} pontos)")
     return resultado
 
+@medir_etapa("selecao_tecnico")
+async def determinar_tecnicos_qualificados(equipamentos: List[str], grupo_logistico: str, urgente: bool = False) -> List[Dict[str, Any]]:
+    """
+    👥 Técnicos qualificados para a busca em vários técnicos, do melhor score para o pior:
+    ativos, com score >= BUSCA_MULTI_TECNICO_SCORE_MINIMO do melhor, no máximo BUSCA_MULTI_TECNICO_MAX
+    """
+    tecnicos_config, tecnicos_ordenados = await ranquear_tecnicos(equipamentos, grupo_logistico, urgente)
+    if not tecnicos_ordenados or tecnicos_ordenados[0][1] <= 0:
+        return []
+
+    melhor_score = tecnicos_ordenados[0][1]
+    qualificados = [
+        (chave, score) for chave, score in tecnicos_ordenados
+        if score > 0 and score >= melhor_score * BUSCA_MULTI_TECNICO_SCORE_MINIMO
+    ][:BUSCA_MULTI_TECNICO_MAX]
+    alternativas = [{"nome": tecnicos_config[chave]["nome"], "score": score} for chave, score in qualificados[1:3]]
+
+    logger.info(f"👥 Técnicos qualificados: {[tecnicos_config[chave]['nome'] for chave, _ in qualificados]}")
+    return [
+        montar_info_tecnico(tecnicos_config[chave], score, equipamentos, grupo_logistico, alternativas)
+        for chave, score in qualificados
+    ]
+
+async def info_tecnico_por_id(technician_id: str, equipamentos: List[str], grupo_logistico: str, urgente: bool = False) -> Optional[Dict[str, Any]]:
+    """Informações de um técnico específico (técnico do horário escolhido na busca em vários técnicos)"""
+    tecnicos_config = await obter_tecnicos_do_banco()
+    for chave, tecnico in tecnicos_config.items():
+        if tecnico["id"] == technician_id:
+            score = await calcular_score_tecnico(chave, equipamentos, grupo_logistico, tecnicos_config, urgente)
+            return montar_info_tecnico(tecnico, score, equipamentos, grupo_logistico, [])
+    return None
+
 async def obter_horarios_disponiveis_otimizados(
     data_inicio: datetime,
     dias: int,
     grupo_logistico: str,
     urgente: bool,
     endereco: str = "",
-    coordenadas: Optional[Tuple[float, float]] = None
+    coordenadas: Optional[Tuple[float, float]] = None,
+    quantidade: int = 3
 ) -> List[Dict[str, Any]]:
     """
-    Obtém horários disponíveis otimizados por grupo logístico, considerando:
+    Obtém os melhores horários disponíveis otimizados por grupo logístico, considerando:
     - Conflitos de agendamentos existentes
     - Carga de trabalho por grupo logístico
     - Otimização de rotas e deslocamentos
     - Priorização por urgência
+
+    Ranking puro por score: o teto de cada horário (faixa + carga + urgência + dia da
+    semana + bonus de rota máximo) sai sem I/O, então o bonus de rota (geocodificação)
+    e o conflito de grupos só são calculados enquanto um horário ainda pode entrar no top.
     """
     try:
-        supabase = get_supabase_client()
-
-        # 1. Obter horários base (já filtra conflitos)
-        horarios_base = await obter_horarios_disponiveis(data_inicio, dias)
+        # 1. Horários livres compactos (já filtra conflitos); só os vencedores viram dict
+        horarios_base = await listar_horarios_livres(data_inicio, dias)
 
         # 2. Analisar carga de trabalho por grupo logístico nos próximos dias
         carga_por_grupo = await analisar_carga_trabalho_por_grupo(data_inicio, dias)
 
-        # 3. Aplicar otimizações inteligentes
-        horarios_otimizados = []
-
-        for horario in horarios_base:
-            # Calcular score de prioridade
-            score = 0
-            hora = int(horario['hora_inicio'].split(':')[0])
-            data_horario = datetime.strptime(horario['data'], '%Y-%m-%d')
-
+        def score_faixa(hora: int) -> float:
             # 3.1. OTIMIZAÇÃO POR GRUPO LOGÍSTICO - HORÁRIOS COMERCIAIS
-            # Filtro: Apenas horários comerciais (9h-11h e 13h-17h)
-            if not ((9 <= hora <= 10) or (13 <= hora <= 16)):
-                score -= 1000  # Penalização severa para horários fora do comercial
-                continue
-
             if grupo_logistico == 'A':
                 # Grupo A: Florianópolis - Prioridade manhã (menos trânsito)
                 if 9 <= hora <= 10:
-                    score += 15  # Manhã ideal
+                    return 15  # Manhã ideal
                 elif 14 <= hora <= 16:
-                    score += 10  # Tarde boa
-                elif 13 <= hora <= 13:
-                    score += 8   # Início tarde
-                else:
-                    score += 5   # Outros horários
-
+                    return 10  # Tarde boa
+                elif hora == 13:
+                    return 8   # Início tarde
+                return 5       # Outros horários
             elif grupo_logistico == 'B':
                 # Grupo B: Grande Florianópolis - Prioridade tarde (evita rush matinal)
                 if 13 <= hora <= 16:
-                    score += 15  # Tarde ideal
-                elif 9 <= hora <= 10:
-                    score += 12  # Manhã boa
-                else:
-                    score += 6   # Outros horários
-
-            else:  # Grupo C
-                # Grupo C: Litoral/Interior - Prioridade tarde (viagens longas)
-                if 14 <= hora <= 16:
-                    score += 15  # Tarde ideal para viagens longas
+                    return 15  # Tarde ideal
                 elif 9 <= hora <= 10:
-                    score += 10  # Manhã com tempo de deslocamento
-                elif 13 <= hora <= 13:
-                    score += 8   # Início tarde
-                else:
-                    score += 5   # Outros horários
-
+                    return 12  # Manhã boa
+                return 6       # Outros horários
+            # Grupo C: Litoral/Interior - Prioridade tarde (viagens longas)
+            if 14 <= hora <= 16:
+                return 15  # Tarde ideal para viagens longas
+            elif 9 <= hora <= 10:
+                return 10  # Manhã com tempo de deslocamento
+            elif hora == 13:
+                return 8   # Início tarde
+            return 5       # Outros horários
+
+        def score_carga(carga_dia: float) -> float:
             # 3.2. ANÁLISE DE CARGA DE TRABALHO
-            data_str = data_horario.strftime('%Y-%m-%d')
-            carga_dia = carga_por_grupo.get(data_str, {}).get(grupo_logistico, 0)
-
             if carga_dia < 30:  # Baixa carga
-                score += 10
+                return 10
             elif carga_dia < 60:  # Média carga
-                score += 5
+                return 5
             elif carga_dia < 80:  # Alta carga
-                score += 2
-            else:  # Sobrecarga
-                score -= 5
+                return 2
+            return -5  # Sobrecarga
+
+        def bonus_urgencia(hora: int) -> float:
+            # 3.5. PRIORIZAÇÃO POR URGÊNCIA - HORÁRIOS COMERCIAIS
+            if not urgente:
+                return 0
+            comercial = hora_comercial(hora)
+            if grupo_logistico in ['A', 'B'] and comercial:
+                return 25  # Urgente em horário comercial
+            elif grupo_logistico == 'C' and comercial:
+                return 20  # Urgente com tempo de deslocamento
+            return 15      # Urgente em outros horários
+
+        cal = calendario()
+
+        def bonus_dia_semana(data_horario: datetime) -> float:
+            # 3.6. BONUS POR DIA DA SEMANA (tipo do dia no calendário comercial)
+            tipo_dia = cal.tipo(data_horario)
+            if tipo_dia == UTIL:  # Segunda a sexta
+                return 5
+            elif tipo_dia == SABADO:
+                return 2
+            return 0  # Domingo e feriados = sem bonus
+
+        # 3. Candidatos: score conhecido sem I/O + teto com o bonus de rota máximo (10)
+        candidatos = []
+        for ordem, candidato in enumerate(horarios_base):
+            hora = candidato.hora
+            # Filtro: Apenas horários comerciais (9h-11h e 13h-17h)
+            if not hora_comercial(hora):
+                continue
+
+            carga_dia = carga_por_grupo.get(candidato.data_str, {}).get(grupo_logistico, 0)
+            candidato.score_base = score_faixa(hora) + score_carga(carga_dia)
+            teto = candidato.score_base + (10 if coordenadas else 0) + bonus_urgencia(hora) + bonus_dia_semana(candidato.dia)
+            candidato.ordem_dia = ordem
+            candidato.teto = (teto, -ordem)
+            candidato.dados = carga_dia
+            candidatos.append(candidato)
+        candidatos.sort(key=lambda c: c.teto, reverse=True)
 
+        async def avaliar_dia(data_horario: datetime) -> float:
             # 3.3. VERIFICAÇÃO DE CONFLITOS DE GRUPOS (REGRA CRÍTICA)
-            if grupo_logistico == 'C':
+            data_str = rotulos_dia(data_horario).iso
+            if grupo_logistico == 'C' and await verificar_conflito_grupos_no_dia(data_str, 'C'):
                 # GRUPO C: Nunca no mesmo dia que grupos A ou B
-                conflito_grupos = await verificar_conflito_grupos_no_dia(data_str, 'C')
-                if conflito_grupos:
-                    score -= 1000  # Penalização severa para eliminar da lista
-                    logger.info(f"❌ Grupo C bloqueado em {data_str} - há agendamentos A/B no mesmo dia")
+                logger.info(f"❌ Grupo C bloqueado em {data_str} - há agendamentos A/B no mesmo dia")
+                return -1000  # Penalização severa para eliminar da lista
+            return 0
 
-            # 3.4. OTIMIZAÇÃO DE ROTAS (se temos coordenadas)
-            if coordenadas and score > 0:  # Só calcular se não foi penalizado
-                # Verificar se há outros agendamentos próximos no mesmo dia
-                bonus_rota = await calcular_bonus_rota(data_str, hora, coordenadas, grupo_logistico)
-                score += bonus_rota
+        async def pontuar(candidato: Candidato, penalizacao: float) -> float:
+            score = candidato.score_base + penalizacao
 
-            # 3.5. PRIORIZAÇÃO POR URGÊNCIA - HORÁRIOS COMERCIAIS
-            if urgente and score > 0:  # Só aplicar se não foi penalizado
-                if grupo_logistico in ['A', 'B'] and ((9 <= hora <= 10) or (13 <= hora <= 16)):
-                    score += 25  # Urgente em horário comercial
-                elif grupo_logistico == 'C' and ((9 <= hora <= 10) or (13 <= hora <= 16)):
-                    score += 20  # Urgente com tempo de deslocamento
-                else:
-                    score += 15  # Urgente em outros horários
+            # 3.4. OTIMIZAÇÃO DE ROTAS (só se não foi penalizado)
+            if coordenadas and score > 0:
+                # Verificar se há outros agendamentos próximos no mesmo dia
+                score += await calcular_bonus_rota(candidato.data_str, candidato.hora, coordenadas, grupo_logistico)
 
-            # 3.6. BONUS POR DIA DA SEMANA (só se não foi penalizado)
             if score > 0:
-                dia_semana = data_horario.weekday()  # 0=segunda, 6=domingo
-                if dia_semana < 5:  # Segunda a sexta
-                    score += 5
-                elif dia_semana == 5:  # Sábado
-                    score += 2
-                # Domingo = sem bonus
-
-                # 3.7. PENALIZAÇÃO POR HORÁRIOS DE PICO - Removido (horários fora do comercial já filtrados)
-
-            horario['score_otimizacao'] = score
-            horario['grupo_logistico'] = grupo_logistico
-            horario['carga_dia'] = carga_dia
-            horarios_otimizados.append(horario)
+                score += bonus_urgencia(candidato.hora)
+            if score > 0:
+                score += bonus_dia_semana(candidato.dia)
+            return score
 
-        # 4. Filtrar horários com score negativo (bloqueados) e ordenar
-        horarios_validos = [h for h in horarios_otimizados if h['score_otimizacao'] > 0]
-        horarios_validos.sort(key=lambda x: x['score_otimizacao'], reverse=True)
+        def formatar(candidato: Candidato) -> Dict[str, Any]:
+            return {
+                **formatar_horario_livre(candidato),
+                "score_otimizacao": candidato.score,
+                "grupo_logistico": grupo_logistico,
+                "carga_dia": candidato.dados,
+            }
 
-        # 5. Garantir que sempre temos pelo menos algumas opções
-        if not horarios_validos and horarios_otimizados:
-            # Se todos foram bloqueados, pegar os com menor penalização
-            horarios_validos = sorted(horarios_otimizados, key=lambda x: x['score_otimizacao'], reverse=True)[:3]
+        melhores = await buscar_melhores_horarios(EstrategiaBusca(
+            nome="otimizados_por_grupo",
+            candidatos=candidatos,
+            avaliar_dia=avaliar_dia,
+            pontuar=pontuar,
+            formatar=formatar,
+            chave=chave_score
+        ), quantidade)
+
+        # 4. Horários com score negativo (bloqueados) só entram se não houver nenhum válido
+        horarios_validos = [h for h in melhores if h['score_otimizacao'] > 0]
+        if not horarios_validos and melhores:
+            horarios_validos = melhores
             logger.warning(f"⚠️ Todos os horários foram penalizados para grupo {grupo_logistico}, oferecendo os melhores disponíveis")
 
-        # 6. Log da otimização
+        # 5. Log da otimização
         logger.info(f"🎯 Horários otimizados para grupo {grupo_logistico}:")
-        logger.info(f"   📊 {len(horarios_validos)} opções válidas de {len(horarios_base)} disponíveis")
+        logger.info(f"   📊 {len(horarios_validos)} melhores opções de {len(horarios_base)} disponíveis")
         logger.info(f"   🏆 Melhor score: {horarios_validos[0]['score_otimizacao'] if horarios_validos else 0}")
         logger.info(f"   📈 Carga média do grupo: {sum(carga_por_grupo.get(d, {}).get(grupo_logistico, 0) for d in carga_por_grupo) / max(len(carga_por_grupo), 1):.1f}%")
 
@@ -2481,6 +2983,26 @@ async def obter_horarios_disponiveis_otimizados(
 # Função para obter horários disponíveis
 async def obter_horarios_disponiveis(data_inicio: datetime, dias: int = 5) -> List[Dict[str, Any]]:
     """Obtém horários disponíveis dos técnicos nos próximos dias"""
+    return [formatar_horario_livre(candidato) for candidato in await listar_horarios_livres(data_inicio, dias)]
+
+def formatar_horario_livre(candidato: Candidato) -> Dict[str, Any]:
+    """Dict de horário livre (formato de obter_horarios_disponiveis), montado só na apresentação"""
+    # Sistema agenda para horário específico, mas mostra faixa para o cliente (ex: 9h-10h)
+    horario_inicio = candidato.horario.isoformat()
+    rotulos = rotulos_dia(candidato.dia)
+    return {
+        "data": rotulos.iso,
+        "hora_agendamento": HORA_AGENDAMENTO[candidato.hora],  # Horário real do agendamento (ex: 09:00)
+        "hora_inicio": HORA_AGENDAMENTO[candidato.hora],       # Para exibição ao cliente (ex: 09:00)
+        "hora_fim": HORA_AGENDAMENTO[candidato.hora + 1],      # Para exibição ao cliente (ex: 10:00)
+        "datetime": horario_inicio,
+        "datetime_agendamento": horario_inicio,  # Horário exato para agendar
+        "data_formatada": rotulos.data,
+        "dia_semana": rotulos.dia_semana.split("-")[0]
+    }
+
+async def listar_horarios_livres(data_inicio: datetime, dias: int = 5) -> List[Candidato]:
+    """Horários livres nos próximos dias, como candidatos compactos (sem formatação)"""
     # 🕐 LOG DO HORÁRIO DE REFERÊNCIA PARA A PESQUISA
     agora_brasil = datetime.now(pytz.timezone('America/Sao_Paulo'))
     logger.info(f"🔍 PESQUISA DE HORÁRIOS - Referência: {agora_brasil.strftime('%d/%m/%Y %H:%M:%S (Brasília)')}")
@@ -2494,27 +3016,23 @@ async def obter_horarios_disponiveis(data_inicio: datetime, dias: int = 5) -> Li
     supabase = get_supabase_client()
     horarios_disponiveis = []
 
-    # Configuração de horários de trabalho - HORÁRIOS COMERCIAIS
-    # MANHÃ: 9h às 11h | TARDE: 13h às 17h | SEGUNDA A SÁBADO
-    HORA_INICIO_MANHA = 9   # 9h
-    HORA_FIM_MANHA = 11     # 11h (até 10:59)
-    HORA_INICIO_TARDE = 13  # 13h
-    HORA_FIM_TARDE = 17     # 17h (até 16:59)
-    INTERVALO_ALMOCO_INICIO = 11  # 11h
-    INTERVALO_ALMOCO_FIM = 13     # 13h
-
-    # Timezone do Brasil
-    tz_brasil = pytz.timezone('America/Sao_Paulo')
+    # Horários comerciais - MANHÃ: 9h às 11h | TARDE: 13h às 17h | SEGUNDA A SÁBADO
+    # (faixas de cada dia pela máscara do calendário comercial; feriados sem faixas)
+    cal = calendario()
+    margem = timedelta(minutes=30)
+    duracao_slot = timedelta(hours=2)  # Slots de 2 horas
+    duracao_os = timedelta(hours=2)    # Assumir 2 horas por OS
 
     for i in range(dias):
         data_atual = data_inicio + timedelta(days=i)
 
-        # Pular apenas domingo (trabalhar segunda a sábado)
-        if data_atual.weekday() >= 6:  # 6=domingo
+        # Pular domingo e feriados (trabalhar segunda a sábado)
+        horarios_comerciais = horas_da_mascara(cal.horas(data_atual, sabado=True))
+        if not horarios_comerciais:
             continue
 
         # Buscar agendamentos existentes para esta data
-        data_str = data_atual.strftime('%Y-%m-%d')
+        data_str = rotulos_dia(data_atual).iso
 
         try:
             # Buscar agendamentos AI (múltiplos formatos de data)
@@ -2543,92 +3061,58 @@ async def obter_horarios_disponiveis(data_inicio: datetime, dias: int = 5) -> Li
             agendamentos_ai = []
             ordens_servico = []
 
-        # Gerar slots de horários disponíveis - HORÁRIOS COMERCIAIS
-        # MANHÃ: 9h às 11h | TARDE: 13h às 17h
-        horarios_comerciais = []
-
-        # Adicionar horários da manhã (9h às 10h)
-        for hora in range(HORA_INICIO_MANHA, HORA_FIM_MANHA):
-            horarios_comerciais.append(hora)
+        # Horários ocupados do dia, convertidos uma vez (e não a cada faixa)
+        inicios_ai = []
+        for ag in agendamentos_ai:
+            if ag.get('data_agendada'):
+                try:
+                    # Suportar múltiplos formatos de data
+                    data_ag_str = ag['data_agendada']
+                    if 'T' in data_ag_str:
+                        inicios_ai.append(datetime.fromisoformat(data_ag_str.replace('Z', '+00:00')))
+                    else:
+                        inicios_ai.append(datetime.strptime(data_ag_str, '%Y-%m-%d %H:%M:%S'))
+                except Exception as e:
+                    logger.warning(f"Erro ao processar agendamento AI: {e}")
 
-        # Adicionar horários da tarde (13h às 16h)
-        for hora in range(HORA_INICIO_TARDE, HORA_FIM_TARDE):
-            horarios_comerciais.append(hora)
+        inicios_os = []
+        for os in ordens_servico:
+            if os.get('scheduled_time'):
+                try:
+                    # Converter horário da OS para datetime
+                    hora_os_str = os['scheduled_time']
+                    if ':' in hora_os_str:
+                        hora_os, min_os = map(int, hora_os_str.split(':')[:2])
+                        inicios_os.append((data_atual.replace(hour=hora_os, minute=min_os, second=0, microsecond=0), os))
+                except Exception as e:
+                    logger.warning(f"Erro ao processar OS: {e}")
 
         for hora in horarios_comerciais:
-            # FILTRO: Apenas horários comerciais (9h-11h e 13h-17h)
-            if not ((9 <= hora <= 10) or (13 <= hora <= 16)):
-                continue
-
             horario_inicio = data_atual.replace(hour=hora, minute=0, second=0, microsecond=0)
-            horario_fim = horario_inicio + timedelta(hours=2)  # Slots de 2 horas
-
-            # Verificar se há conflitos com lógica melhorada
-            conflito = False
-            motivo_conflito = ""
-
-            # Verificar agendamentos AI
-            for ag in agendamentos_ai:
-                if ag.get('data_agendada'):
-                    try:
-                        # Suportar múltiplos formatos de data
-                        data_ag_str = ag['data_agendada']
-                        if 'T' in data_ag_str:
-                            data_ag = datetime.fromisoformat(data_ag_str.replace('Z', '+00:00'))
-                        else:
-                            data_ag = datetime.strptime(data_ag_str, '%Y-%m-%d %H:%M:%S')
-
-                        # Verificar sobreposição de horários (com margem de 30min)
-                        margem = timedelta(minutes=30)
-                        if (horario_inicio - margem) <= data_ag < (horario_fim + margem):
-                            conflito = True
-                            motivo_conflito = f"Agendamento AI às {data_ag.strftime('%H:%M')}"
-                            break
-                    except Exception as e:
-                        logger.warning(f"Erro ao processar agendamento AI: {e}")
-                        continue
+            horario_fim = horario_inicio + duracao_slot
 
-            # Verificar ordens de serviço
-            if not conflito:
-                for os in ordens_servico:
-                    if os.get('scheduled_time'):
-                        try:
-                            # Converter horário da OS para datetime
-                            hora_os_str = os['scheduled_time']
-                            if ':' in hora_os_str:
-                                hora_os, min_os = map(int, hora_os_str.split(':')[:2])
-                                horario_os = data_atual.replace(hour=hora_os, minute=min_os, second=0, microsecond=0)
-
-                                # Verificar sobreposição (OS geralmente dura 1-2 horas)
-                                duracao_os = timedelta(hours=2)  # Assumir 2 horas por OS
-                                margem = timedelta(minutes=30)
-
-                                if (horario_inicio - margem) <= horario_os < (horario_fim + margem) or \
-                                   (horario_os - margem) <= horario_inicio < (horario_os + duracao_os + margem):
-                                    conflito = True
-                                    motivo_conflito = f"OS às {hora_os_str} - {os.get('client_name', 'Cliente')}"
-                                    break
-                        except Exception as e:
-                            logger.warning(f"Erro ao processar OS: {e}")
-                            continue
+            # Verificar sobreposição com agendamentos AI (margem de 30min)
+            conflito = None
+            for data_ag in inicios_ai:
+                try:
+                    if (horario_inicio - margem) <= data_ag < (horario_fim + margem):
+                        conflito = f"Agendamento AI às {data_ag.strftime('%H:%M')}"
+                        break
+                except TypeError as e:  # datas com e sem timezone
+                    logger.warning(f"Erro ao processar agendamento AI: {e}")
+
+            # Verificar ordens de serviço (OS geralmente dura 1-2 horas)
+            if conflito is None:
+                for horario_os, os in inicios_os:
+                    if (horario_inicio - margem) <= horario_os < (horario_fim + margem) or \
+                       (horario_os - margem) <= horario_inicio < (horario_os + duracao_os + margem):
+                        conflito = f"OS às {os['scheduled_time']} - {os.get('client_name', 'Cliente')}"
+                        break
 
-            if conflito:
-                logger.debug(f"⚠️ Conflito em {data_str} {hora:02d}:00 - {motivo_conflito}")
-
-            if not conflito:
-                # Sistema agenda para horário específico, mas mostra faixa para o cliente
-                hora_fim_display = hora + 1  # Faixa de 1 hora para o cliente (ex: 9h-10h)
-
-                horarios_disponiveis.append({
-                    "data": data_atual.strftime('%Y-%m-%d'),
-                    "hora_agendamento": f"{hora:02d}:00",  # Horário real do agendamento (ex: 09:00)
-                    "hora_inicio": f"{hora:02d}:00",       # Para exibição ao cliente (ex: 09:00)
-                    "hora_fim": f"{hora_fim_display:02d}:00",  # Para exibição ao cliente (ex: 10:00)
-                    "datetime": horario_inicio.isoformat(),
-                    "datetime_agendamento": horario_inicio.isoformat(),  # Horário exato para agendar
-                    "data_formatada": data_atual.strftime('%d/%m/%Y'),
-                    "dia_semana": ["Segunda", "Terça", "Quarta", "Quinta", "Sexta"][data_atual.weekday()]
-                })
+            if conflito is not None:
+                logger.debug("⚠️ Conflito em %s %02d:00 - %s", data_str, hora, conflito)
+            else:
+                horarios_disponiveis.append(Candidato(data_atual, hora))
 
     logger.info(f"🗓️ Total de horários disponíveis encontrados: {len(horarios_disponiveis)}")
     return horarios_disponiveis
@@ -2683,51 +3167,66 @@ async def analisar_carga_trabalho_por_grupo(data_inicio: datetime, dias: int) ->
         logger.error(f"Erro ao analisar carga de trabalho: {e}")
         return {}
 
-async def buscar_agendamentos_rota_sequencial(periodo_ideal: str, agora: datetime, supabase) -> List[Dict]:
+# 🗺️ Corredores da rota sequencial do Grupo C (mesmas cidades de CEPS_ROTA_SEQUENCIAL)
+CIDADES_CORREDOR_ROTA = {
+    "manha": ["Tijucas", "Itapema"],
+    "tarde": ["Balneário Camboriú", "Itajaí", "Navegantes"],
+}
+# Com sql/rota_corredor_agendamentos_ai.sql aplicada, filtra pela coluna periodo_rota (indexada,
+# preenchida por trigger); sem a migração, um único or_ de ilike com as cidades do corredor
+ROTA_CORREDOR_COLUNA = os.getenv("ROTA_CORREDOR_COLUNA", "desligado") == "ligado"
+
+async def buscar_agendamentos_rota_sequencial(periodo_ideal: str, agora: datetime, supabase) -> Dict[str, List[Dict]]:
     """
     🗺️ Busca agendamentos na mesma rota sequencial (manhã ou tarde)
+
+    Uma consulta para o corredor inteiro nos próximos 15 dias, sem repetições (por id).
+
+    Returns:
+        Dict[str, List[Dict]]: Agendamentos pendentes agrupados por data (YYYY-MM-DD)
     """
+    cidades_periodo = CIDADES_CORREDOR_ROTA.get(periodo_ideal)
+    if not cidades_periodo:
+        return {}
+
     try:
         data_inicio = agora.strftime('%Y-%m-%d')
         data_fim = (agora + timedelta(days=15)).strftime('%Y-%m-%d')
 
-        # Definir cidades do período
-        if periodo_ideal == "manha":
-            cidades_periodo = ["Tijucas", "Itapema"]
-        elif periodo_ideal == "tarde":
-            cidades_periodo = ["Balneário Camboriú", "Itajaí", "Navegantes"]
+        consulta = supabase.table("agendamentos_ai").select("*")
+        if ROTA_CORREDOR_COLUNA:
+            consulta = consulta.eq("periodo_rota", periodo_ideal)
         else:
-            cidades_periodo = []
-
-        if not cidades_periodo:
-            return []
-
-        # Buscar agendamentos das cidades do período
-        agendamentos_periodo = []
-        for cidade in cidades_periodo:
-            response = supabase.table("agendamentos_ai").select("*").ilike(
-                "endereco", f"%{cidade}%"
-            ).gte(
-                "data_agendada", data_inicio
-            ).lte(
-                "data_agendada", data_fim
-            ).eq("status", "pendente").execute()
+            consulta = consulta.or_(",".join(f"endereco.ilike.%{cidade}%" for cidade in cidades_periodo))
+        response = consulta.gte(
+            "data_agendada", data_inicio
+        ).lte(
+            "data_agendada", data_fim
+        ).eq("status", "pendente").execute()
 
-            if response.data:
-                for ag in response.data:
-                    ag['cidade_detectada'] = cidade
-                    agendamentos_periodo.extend(response.data)
+        agendamentos_por_data: Dict[str, List[Dict]] = {}
+        vistos = set()
+        for ag in response.data or []:
+            chave = ag.get("id") or id(ag)
+            if chave in vistos or not ag.get("data_agendada"):
+                continue
+            vistos.add(chave)
+            endereco_lower = (ag.get("endereco") or "").lower()
+            ag['cidade_detectada'] = ag.get("cidade_rota") or next(
+                (cidade for cidade in cidades_periodo if cidade.lower() in endereco_lower), None
+            )
+            agendamentos_por_data.setdefault(ag['data_agendada'][:10], []).append(ag)
 
-        logger.info(f"🗺️ Encontrados {len(agendamentos_periodo)} agendamentos na rota {periodo_ideal}")
-        return agendamentos_periodo
+        logger.info("🗺️ Encontrados %s agendamentos em %s datas na rota %s", len(vistos), len(agendamentos_por_data), periodo_ideal)
+        return agendamentos_por_data
 
     except Exception as e:
         logger.error(f"❌ Erro ao buscar agendamentos da rota: {e}")
-        return []
+        return {}
 
 async def estrategia_rota_manha(
     technician_id: str, technician_name: str, endereco: str,
-    agendamentos_rota: List[Dict], urgente: bool, agora: datetime, supabase
+    agendamentos_rota: Dict[str, List[Dict]], urgente: bool, agora: datetime, supabase
 ) -> List[Dict]:
     """
     🌅 ESTRATÉGIA MANHÃ: Tijucas (35km) → Itapema (55km)
@@ -2737,7 +3236,7 @@ async def estrategia_rota_manha(
     """
     logger.info("🌅 Aplicando estratégia ROTA MANHÃ (Tijucas → Itapema)")
     logger.info(f"🌅 DEBUG: Técnico ID: {technician_id}, Endereço: {endereco}")
-    logger.info(f"🌅 DEBUG: Agendamentos na rota: {len(agendamentos_rota)}")
+    logger.info(f"🌅 DEBUG: Datas com agendamentos na rota: {len(agendamentos_rota)}")
 
     # 🚫 VALIDAÇÃO: BC, Itajaí, Navegantes não podem ser agendados de manhã
     endereco_lower = endereco.lower()
@@ -2767,7 +3266,7 @@ async def estrategia_rota_manha(
 
 async def estrategia_rota_tarde(
     technician_id: str, technician_name: str, endereco: str,
-    agendamentos_rota: List[Dict], urgente: bool, agora: datetime, supabase
+    agendamentos_rota: Dict[str, List[Dict]], urgente: bool, agora: datetime, supabase
 ) -> List[Dict]:
     """
     🌇 ESTRATÉGIA TARDE: BC (75km) → Itajaí (95km) → Navegantes (105km)
@@ -2807,104 +3306,61 @@ async def estrategia_rota_flexivel(
     ]
 
     return await processar_horarios_rota_sequencial(
-        technician_id, horarios_flexiveis, [],
+        technician_id, horarios_flexiveis, {},
         "FLEXÍVEL", "", urgente, agora, supabase
     )
 
-async def processar_horarios_rota_sequencial(
-    technician_id: str, horarios_prioritarios: List[Dict], agendamentos_rota: List[Dict],
-    tipo_rota: str, endereco: str, urgente: bool, agora: datetime, supabase
-) -> List[Dict]:
-    """
-    🎯 Processa horários com otimização da rota sequencial
-    """
-    logger.info(f"🎯 DEBUG: Processando horários rota sequencial - Tipo: {tipo_rota}")
-    logger.info(f"🎯 DEBUG: Técnico ID: {technician_id}, Urgente: {urgente}")
-    logger.info(f"🎯 DEBUG: Horários prioritários: {len(horarios_prioritarios)}")
-
-    horarios_disponiveis = []
-    inicio = calcular_data_inicio_otimizada(urgente)
-    logger.info(f"🎯 DEBUG: Data início busca: {inicio.strftime('%Y-%m-%d')}")
-
-    # Agrupar agendamentos por data
-    agendamentos_por_data = {}
-    for ag in agendamentos_rota:
-        data_ag = ag['data_agendada'][:10]
-        if data_ag not in agendamentos_por_data:
-            agendamentos_por_data[data_ag] = []
-        agendamentos_por_data[data_ag].append(ag)
-
-    logger.info(f"🎯 DEBUG: Agendamentos agrupados por data: {list(agendamentos_por_data.keys())}")
-
-    # Verificar próximos 10 dias úteis
-    for dia_offset in range(10):
-        data_verificacao = inicio + timedelta(days=dia_offset)
-
-        if data_verificacao.weekday() >= 5:  # Pular fins de semana
-            continue
-
-        data_str = data_verificacao.strftime('%Y-%m-%d')
-
-        # Bonus por agrupamento na mesma rota
-        bonus_agrupamento = len(agendamentos_por_data.get(data_str, [])) * 15
-
-        for horario_info in horarios_prioritarios:
-            if len(horarios_disponiveis) >= 3:
-                break
-
-            logger.info(f"🎯 DEBUG: Verificando horário {horario_info['hora']}h em {data_str}")
-
-            # Verificar disponibilidade do técnico
-            disponivel = await verificar_horario_tecnico_disponivel(
-                technician_id, data_str, horario_info["hora"]
-            )
-
-            logger.info(f"🎯 DEBUG: Técnico {technician_id} disponível em {data_str} às {horario_info['hora']}h: {disponivel}")
-
-            if disponivel:
-                score_total = horario_info["score"] + bonus_agrupamento + (20 if urgente else 0)
-
-                # Criar horário otimizado
-                horario_dt = data_verificacao.replace(
-                    hour=horario_info["hora"], minute=0, second=0, microsecond=0
-                )
-
-                dias_semana = {
-                    'Monday': 'Segunda-feira', 'Tuesday': 'Terça-feira',
-                    'Wednesday': 'Quarta-feira', 'Thursday': 'Quinta-feira',
-                    'Friday': 'Sexta-feira'
-                }
-
-                dia_semana_pt = dias_semana.get(horario_dt.strftime('%A'), horario_dt.strftime('%A'))
-                data_formatada = f"{dia_semana_pt}, {horario_dt.strftime('%d/%m/%Y')}"
-
-                # Texto personalizado por rota
-                if bonus_agrupamento > 0:
-                    texto_rota = f"Previsão de chegada entre {horario_info['texto']} - {data_formatada} (Rota {tipo_rota} otimizada)"
-                else:
-                    texto_rota = f"Previsão de chegada entre {horario_info['texto']} - {data_formatada} (Rota {tipo_rota})"
-
-                horarios_disponiveis.append({
-                    "numero": len(horarios_disponiveis) + 1,
-                    "texto": texto_rota,
-                    "datetime_agendamento": horario_dt.isoformat(),
-                    "dia_semana": data_formatada,
-                    "hora_agendamento": f"{horario_info['hora']:02d}:00",
-                    "score_otimizacao": score_total,
-                    "grupo_logistico": "C",
-                    "tipo_rota": tipo_rota,
-                    "agendamentos_agrupados": len(agendamentos_por_data.get(data_str, []))
-                })
+async def processar_horarios_rota_sequencial(
+    technician_id: str, horarios_prioritarios: List[Dict], agendamentos_por_data: Dict[str, List[Dict]],
+    tipo_rota: str, endereco: str, urgente: bool, agora: datetime, supabase
+) -> List[Dict]:
+    """
+    🎯 Processa horários com otimização da rota sequencial
+    """
+    logger.info("🎯 DEBUG: Processando horários rota sequencial - Tipo: %s", tipo_rota)
+    logger.info("🎯 DEBUG: Técnico ID: %s, Urgente: %s", technician_id, urgente)
+    logger.info("🎯 DEBUG: Horários prioritários: %s", len(horarios_prioritarios))
 
-                logger.info(f"✅ Rota {tipo_rota}: {data_formatada} {horario_info['hora']}h (Score: {score_total}, Agrupados: {len(agendamentos_por_data.get(data_str, []))})")
+    inicio = calcular_data_inicio_otimizada(urgente)
+    bonus_urgencia = 20 if urgente else 0
+    logger.info("🎯 DEBUG: Data início busca: %s", inicio.strftime('%Y-%m-%d'))
 
-        if len(horarios_disponiveis) >= 3:
-            break
+    # Agendamentos do corredor já chegam agrupados por data (buscar_agendamentos_rota_sequencial)
+    logger.info("🎯 DEBUG: Agendamentos agrupados por data: %s", list(agendamentos_por_data.keys()))
 
-    # Ordenar por score (melhor otimização primeiro)
-    horarios_disponiveis.sort(key=lambda x: x.get("score_otimizacao", 0), reverse=True)
+    async def avaliar_dia(data_verificacao: datetime) -> float:
+        # Bonus por agrupamento na mesma rota
+        return len(agendamentos_por_data.get(data_verificacao.strftime('%Y-%m-%d'), [])) * 15
 
-    return horarios_disponiveis[:3]
+    async def pontuar(candidato: Candidato, bonus_agrupamento: float) -> Optional[float]:
+        disponivel = await verificar_horario_tecnico_disponivel(
+            technician_id, candidato.data_str, candidato.hora
+        )
+        logger.debug("🎯 DEBUG: Técnico %s disponível em %s às %sh: %s", technician_id, candidato.data_str, candidato.hora, disponivel)
+        return candidato.score_base + bonus_agrupamento + bonus_urgencia if disponivel else None
+
+    def formatar(candidato: Candidato) -> Dict:
+        agrupados = len(agendamentos_por_data.get(candidato.data_str, []))
+        # Texto personalizado por rota
+        sufixo = f" (Rota {tipo_rota} otimizada)" if candidato.score_dia > 0 else f" (Rota {tipo_rota})"
+        horario = formatar_horario(
+            candidato, sufixo=sufixo,
+            score_otimizacao=candidato.score,
+            grupo_logistico="C",
+            tipo_rota=tipo_rota,
+            agendamentos_agrupados=agrupados
+        )
+        logger.debug("✅ Rota %s: %s %sh (Score: %s, Agrupados: %s)", tipo_rota, horario["dia_semana"], candidato.hora, candidato.score, agrupados)
+        return horario
+
+    # Verificar próximos 10 dias
+    return await buscar_melhores_horarios(EstrategiaBusca(
+        nome="rota_sequencial",
+        candidatos=candidatos_por_dia(inicio, 10, horarios_prioritarios, teto_extra=bonus_urgencia),
+        avaliar_dia=avaliar_dia,
+        pontuar=pontuar,
+        formatar=formatar
+    ))
 
 async def buscar_dias_com_agendamentos_grupo_c(agora: datetime, supabase) -> List[Dict]:
     """
@@ -3005,7 +3461,7 @@ async def agrupar_com_agendamentos_existentes(
         horarios_grupo_c = [14, 15, 16, 17]
 
         for hora in horarios_grupo_c:
-            if len(horarios_otimizados) >= 3:
+            if len(horarios_otimizados) >= 3 or prazo_esgotado("agrupamento_grupo_c"):
                 break
 
             # Verificar disponibilidade do técnico
@@ -3050,7 +3506,7 @@ async def agrupar_com_agendamentos_existentes(
                 logger.info(f"✅ Agrupamento C: {data_formatada} {hora}h (Score: {score_total}, Agrupados: {len(agendamentos_dia)})")
 
     # Se não encontrou suficientes, completar com novo dia
-    if len(horarios_otimizados) < 3:
+    if len(horarios_otimizados) < 3 and not prazo_esgotado("agrupamento_grupo_c"):
         horarios_novos = await criar_novo_dia_grupo_c(technician_id, technician_name, None, urgente, agora, supabase)
         horarios_otimizados.extend(horarios_novos[:3-len(horarios_otimizados)])
 
@@ -3065,8 +3521,8 @@ async def criar_novo_dia_grupo_c(
     """
     logger.info("🆕 Criando novo dia para Grupo C")
 
-    horarios_disponiveis = []
     inicio = agora + timedelta(days=3 if not urgente else 1)  # Grupo C precisa mais tempo
+    bonus_urgencia = 15 if urgente else 0
 
     # Horários ideais para Grupo C (tarde para viagens longas)
     horarios_grupo_c = [
@@ -3075,60 +3531,36 @@ async def criar_novo_dia_grupo_c(
         {"hora": 16, "texto": "16h e 17h", "score": 15}
     ]
 
-    for dia_offset in range(10):
-        data_verificacao = inicio + timedelta(days=dia_offset)
-
-        if data_verificacao.weekday() >= 5:  # Pular fins de semana
-            continue
-
-        data_str = data_verificacao.strftime('%Y-%m-%d')
-
+    async def avaliar_dia(data_verificacao: datetime) -> Optional[float]:
         # Verificar se não há conflito com grupos A/B
-        conflito = await verificar_conflito_grupos_no_dia(data_str, 'C')
-        if conflito:
-            continue
-
-        for horario_info in horarios_grupo_c:
-            if len(horarios_disponiveis) >= 3:
-                break
-
-            disponivel = await verificar_horario_tecnico_disponivel(
-                technician_id, data_str, horario_info["hora"]
-            )
-
-            if disponivel:
-                horario_dt = data_verificacao.replace(
-                    hour=horario_info["hora"], minute=0, second=0, microsecond=0
-                )
-
-                dias_semana = {
-                    'Monday': 'Segunda-feira', 'Tuesday': 'Terça-feira',
-                    'Wednesday': 'Quarta-feira', 'Thursday': 'Quinta-feira',
-                    'Friday': 'Sexta-feira'
-                }
-
-                dia_semana_pt = dias_semana.get(horario_dt.strftime('%A'), horario_dt.strftime('%A'))
-                data_formatada = f"{dia_semana_pt}, {horario_dt.strftime('%d/%m/%Y')}"
-
-                score_total = horario_info["score"] + (15 if urgente else 0)
-
-                horarios_disponiveis.append({
-                    "numero": len(horarios_disponiveis) + 1,
-                    "texto": f"Previsão de chegada entre {horario_info['texto']} - {data_formatada} (Dia dedicado)",
-                    "datetime_agendamento": horario_dt.isoformat(),
-                    "dia_semana": data_formatada,
-                    "hora_agendamento": f"{horario_info['hora']:02d}:00",
-                    "score_otimizacao": score_total,
-                    "grupo_logistico": "C",
-                    "novo_dia_grupo_c": True
-                })
-
-                logger.info(f"✅ Novo dia C: {data_formatada} {horario_info['hora']}h (Score: {score_total})")
-
-        if len(horarios_disponiveis) >= 3:
-            break
+        if await verificar_conflito_grupos_no_dia(data_verificacao.strftime('%Y-%m-%d'), 'C'):
+            return None
+        return 0
 
-    return horarios_disponiveis
+    async def pontuar(candidato: Candidato, score_dia: float) -> Optional[float]:
+        disponivel = await verificar_horario_tecnico_disponivel(
+            technician_id, candidato.data_str, candidato.hora
+        )
+        return candidato.score_base + bonus_urgencia if disponivel else None
+
+    def formatar(candidato: Candidato) -> Dict:
+        horario = formatar_horario(
+            candidato, sufixo=" (Dia dedicado)",
+            score_otimizacao=candidato.score,
+            grupo_logistico="C",
+            novo_dia_grupo_c=True
+        )
+        logger.info(f"✅ Novo dia C: {horario['dia_semana']} {candidato.hora}h (Score: {candidato.score})")
+        return horario
+
+    return await buscar_melhores_horarios(EstrategiaBusca(
+        nome="novo_dia_grupo_c",
+        candidatos=candidatos_por_dia(inicio, 10, horarios_grupo_c, teto_extra=bonus_urgencia),
+        avaliar_dia=avaliar_dia,
+        pontuar=pontuar,
+        formatar=formatar,
+        ordenar_por_score=False
+    ))
 
 async def calcular_score_dia(data_str: str, grupo: str, supabase) -> float:
     """
@@ -3156,102 +3588,134 @@ async def calcular_score_dia(data_str: str, grupo: str, supabase) -> float:
         logger.error(f"❌ Erro ao calcular score do dia: {e}")
         return 5
 
-async def calcular_bonus_rota_inteligente(data_str: str, hora: int, coordenadas: Tuple[float, float], grupo: str, supabase) -> float:
-    """
-    🗺️ Calcula bonus por otimização de rota (agendamentos próximos)
-    """
-    try:
-        # Buscar agendamentos no mesmo dia
-        response = supabase.table("agendamentos_ai").select("*").eq(
-            "data_agendada", data_str
-        ).not_.is_("coordenadas", "null").execute()
-
-        agendamentos = response.data if response.data else []
-        bonus_total = 0
+# 🛣️ Rotas do dia para o custo de inserção (rota_insercao.py)
+ROTA_INSERCAO_ORCAMENTO_MS = float(os.getenv("ROTA_INSERCAO_ORCAMENTO_MS", "150"))
+cache_rotas = CacheRotas(
+    base=tuple(FLORIANOPOLIS_CENTER),
+    validade=int(os.getenv("ROTA_INSERCAO_VALIDADE", "120")),
+)
 
-        for ag in agendamentos:
-            if ag.get('coordenadas'):
-                try:
-                    coords_ag = ag['coordenadas']
-                    if isinstance(coords_ag, list) and len(coords_ag) == 2:
-                        distancia = calculate_distance(coordenadas, tuple(coords_ag))
+async def carregar_rotas_do_dia(data_str: str, prazo: float, supabase=None) -> Dict[Optional[str], RotaDia]:
+    """
+    🛣️ Rotas de todos os técnicos no dia (calendar_events + pré-agendamentos pendentes/confirmados)
+
+    Duas consultas por dia; a matriz de distâncias fica em cache_rotas. Endereços são
+    geocodificados em paralelo até o prazo: o que não ficar pronto fica fora da rota
+    (e a rota incompleta não vai para o cache; as geocodificações seguem e aquecem o cache).
+    """
+    rotas = cache_rotas.obter(data_str)
+    if rotas is not None:
+        return rotas
+
+    supabase = supabase or get_supabase_client()
+    eventos = supabase.table("calendar_events").select("*").gte(
+        "start_time", f"{data_str}T00:00:00"
+    ).lt("start_time", f"{data_str}T23:59:59").execute().data or []
+    pre_agendamentos = supabase.table("agendamentos_ai").select("*").gte(
+        "data_agendada", f"{data_str}T00:00:00"
+    ).lt("data_agendada", f"{data_str}T23:59:59").in_("status", ["pendente", "confirmado"]).execute().data or []
+
+    # (técnico, coordenadas ou endereço, hora local)
+    paradas = []
+    for evento in eventos:
+        if evento.get('address') and (evento.get('status') or '').lower() not in STATUS_CANCELADOS:
+            paradas.append((evento.get('technician_id'), evento['address'], hora_local(evento.get('start_time'))))
+    for ag in pre_agendamentos:
+        tecnico_id = ag.get('technician_id') or ag.get('tecnico_id')
+        coords_ag = ag.get('coordenadas')
+        if isinstance(coords_ag, list) and len(coords_ag) == 2:
+            paradas.append((tecnico_id, tuple(coords_ag), hora_local(ag.get('data_agendada'))))
+        elif ag.get('endereco'):
+            paradas.append((tecnico_id, ag['endereco'], hora_local(ag.get('data_agendada'))))
+
+    enderecos = {local for _, local, _ in paradas if isinstance(local, str)}
+    tarefas = {endereco: asyncio.ensure_future(geocodificar_endereco(endereco)) for endereco in enderecos}
+    completo = True
+    if tarefas:
+        _, pendentes = await asyncio.wait(tarefas.values(), timeout=max(0.0, prazo - time.perf_counter()))
+        completo = not pendentes
+
+    def coordenadas_da_parada(local):
+        if not isinstance(local, str):
+            return local
+        tarefa = tarefas[local]
+        return tarefa.result() if tarefa.done() and not tarefa.cancelled() and tarefa.exception() is None else None
+
+    rotas = cache_rotas.montar(
+        (tecnico_id, coords, hora)
+        for tecnico_id, local, hora in paradas
+        if (coords := coordenadas_da_parada(local))
+    )
+    if completo:
+        cache_rotas.salvar(data_str, rotas)
+    else:
+        logger.info(f"⏱️ Rotas de {data_str} incompletas no prazo: {len(pendentes)} endereços sem coordenadas")
+    return rotas
 
-                        # Bonus por proximidade
-                        if distancia <= 5:    # Muito próximo
-                            bonus_total += 10
-                        elif distancia <= 10: # Próximo
-                            bonus_total += 5
-                        elif distancia <= 15: # Razoável
-                            bonus_total += 2
-                except:
-                    continue
+async def avaliar_insercao_rota(data_str: str, coordenadas: Tuple[float, float], hora: Optional[int] = None,
+                                technician_id: Optional[str] = None, supabase=None) -> Optional[Insercao]:
+    """
+    🛣️ Melhor inserção do candidato nas rotas do dia, dentro de ROTA_INSERCAO_ORCAMENTO_MS.
+    Com technician_id, só a rota desse técnico; com hora, posição fixada pelo horário.
+    Em modo degradado (Supabase ou Nominatim com disjuntor aberto) não avalia: sem bonus de rota.
+    """
+    if "sem_bonus_rota" in modos_degradados():
+        return None
+    orcamento = ROTA_INSERCAO_ORCAMENTO_MS / 1000
+    atual = prazo_atual()
+    if atual is not None:
+        orcamento = max(0.0, min(orcamento, atual.restante()))
+    prazo = time.perf_counter() + orcamento
+    rotas = await carregar_rotas_do_dia(data_str, prazo, supabase)
+    if technician_id is not None:
+        rotas = {technician_id: rotas[technician_id]} if technician_id in rotas else {}
+    return melhor_insercao(rotas, tuple(coordenadas), hora, prazo)
 
-        return min(bonus_total, 20)  # Máximo 20 pontos de bonus
+async def calcular_bonus_rota_inteligente(data_str: str, coordenadas: Tuple[float, float], grupo: str, supabase,
+                                          technician_id: Optional[str] = None) -> float:
+    """
+    🗺️ Bonus do dia pelo custo de inserção na rota (posição mais barata no dia)
+    """
+    try:
+        insercao = await avaliar_insercao_rota(data_str, coordenadas, technician_id=technician_id, supabase=supabase)
+        if insercao is None:
+            return 0
+        logger.debug(
+            f"🛣️ Inserção em {data_str} (grupo {grupo}): +{insercao.km_extra}km / +{insercao.minutos_extra}min "
+            f"(aproveitamento {insercao.aproveitamento:.0%})"
+        )
+        return round(20 * insercao.aproveitamento, 1)  # Máximo 20 pontos de bonus
 
     except Exception as e:
         logger.error(f"❌ Erro ao calcular bonus de rota: {e}")
         return 0
 
-async def calcular_bonus_rota(data_str: str, hora: int, coordenadas: Tuple[float, float], grupo_logistico: str) -> float:
+async def calcular_bonus_rota(data_str: str, hora: int, coordenadas: Tuple[float, float], grupo_logistico: str,
+                              technician_id: Optional[str] = None) -> float:
     """
-    Calcula bonus de rota baseado em agendamentos próximos no mesmo dia
+    Bonus de rota pelo custo de inserir o horário na rota do dia (posição pelo horário)
     """
     try:
-        supabase = get_supabase_client()
-        bonus = 0.0
-
-        # 🎯 BUSCAR EVENTOS NO CALENDÁRIO (fonte única da verdade)
-        response_calendar = supabase.table("calendar_events").select("*").gte(
-            "start_time", f"{data_str}T00:00:00"
-        ).lt("start_time", f"{data_str}T23:59:59").execute()
-
-        # 📋 TAMBÉM VERIFICAR pré-agendamentos pendentes
-        response_ai = supabase.table("agendamentos_ai").select("*").gte(
-            "data_agendada", f"{data_str}T00:00:00"
-        ).lt("data_agendada", f"{data_str}T23:59:59").in_("status", ["pendente", "confirmado"]).execute()
-
-        eventos_calendario = response_calendar.data if response_calendar.data else []
-        agendamentos_ai = response_ai.data if response_ai.data else []
-
-        # Verificar proximidade com eventos confirmados no calendário
-        for evento in eventos_calendario:
-            if evento.get('address'):
-                coords_evento = await geocodificar_endereco(evento['address'])
-                if coords_evento:
-                    distancia = calculate_distance(coordenadas, coords_evento)
-
-                    # Bonus por proximidade (até 5km = bonus máximo)
-                    if distancia <= 2:
-                        bonus += 5  # Muito próximo
-                    elif distancia <= 5:
-                        bonus += 3  # Próximo
-                    elif distancia <= 10:
-                        bonus += 1  # Relativamente próximo
-
-        # Verificar proximidade com pré-agendamentos pendentes
-        for ag in agendamentos_ai:
-            if ag.get('endereco'):
-                coords_ag = await geocodificar_endereco(ag['endereco'])
-                if coords_ag:
-                    distancia = calculate_distance(coordenadas, coords_ag)
-
-                    # Bonus menor para pré-agendamentos (podem ser cancelados)
-                    if distancia <= 2:
-                        bonus += 2  # Muito próximo
-                    elif distancia <= 5:
-                        bonus += 1  # Próximo
-
-        # Bonus adicional se há concentração no mesmo grupo logístico
-        agendamentos_mesmo_grupo = sum(1 for ag in agendamentos_ai if ag.get('grupo_logistico') == grupo_logistico)
-        if agendamentos_mesmo_grupo >= 2:
-            bonus += 2  # Otimização de rota por grupo
-
-        return min(bonus, 10)  # Máximo 10 pontos de bonus
+        insercao = await avaliar_insercao_rota(data_str, coordenadas, hora, technician_id)
+        if insercao is None:
+            return 0.0
+        return round(10 * insercao.aproveitamento, 1)  # Máximo 10 pontos de bonus
 
     except Exception as e:
         logger.error(f"Erro ao calcular bonus de rota: {e}")
         return 0.0
 
+async def registrar_parada_rota(technician_id: Optional[str], horario: datetime, endereco: str) -> None:
+    """Novo agendamento entra na rota do dia em cache (atualização incremental da matriz)"""
+    data_str = dia_local(horario)
+    if cache_rotas.obter(data_str) is None:
+        return
+    coords = await geocodificar_endereco(endereco)
+    if coords:
+        cache_rotas.registrar_parada(data_str, technician_id, coords, hora_local(horario))
+    else:
+        cache_rotas.invalidar(data_str)
+
 async def verificar_conflito_grupos_no_dia(data_str: str, grupo_solicitado: str) -> bool:
     """
     Verifica se há conflito de grupos no mesmo dia.
@@ -3337,9 +3801,11 @@ def processar_escolha_horario(horario_escolhido: str, horarios_disponiveis: List
         logger.error(f"Erro ao processar escolha de horário: {e}")
         return None
 
-async def verificar_horario_ainda_disponivel(data_horario: str, tecnico_nome: str = None) -> bool:
+async def verificar_horario_ainda_disponivel(data_horario: str, tecnico_nome: str = None, technician_id: Optional[str] = None) -> bool:
     """
     Verifica se um horário específico ainda está disponível antes de confirmar
+    Com technician_id (horário da busca em vários técnicos), só conflitos desse técnico
+    e pré-agendamentos ainda sem técnico contam; sem ele, qualquer agendamento do dia.
     """
     try:
         supabase = get_supabase_client()
@@ -3359,6 +3825,13 @@ async def verificar_horario_ainda_disponivel(data_horario: str, tecnico_nome: st
 
         agendamentos_ai = response_ai.data if response_ai.data else []
         ordens_servico = response_os.data if response_os.data else []
+        if technician_id:
+            agendamentos_ai = [
+                ag for ag in agendamentos_ai
+                if technician_id in (ag.get('technician_id'), ag.get('tecnico_id'))
+                or not (ag.get('technician_id') or ag.get('tecnico_id'))
+            ]
+            ordens_servico = [os for os in ordens_servico if os.get('technician_id') == technician_id]
 
         # Verificar conflitos
         margem = timedelta(hours=1)  # Margem de 1 hora
@@ -3396,13 +3869,76 @@ async def inserir_agendamento(agendamento: Dict[str, Any]) -> Dict[str, Any]:
     logger.info(f"🚫 FUNÇÃO inserir_agendamento DESABILITADA - não criando pré-agendamento")
     return {"success": False, "error": "Função desabilitada - usar apenas ETAPA 2"}
 
+def calcular_similaridade_os(os: dict, equipamento: str, endereco: str, nome: str) -> Optional[float]:
+    """
+    Compara uma OS existente com os dados recebidos (equipamento, endereço e nome)
+    Retorna a fração de campos semelhantes ou None se não houver o que comparar
+    """
+    similaridade = 0
+    total_checks = 0
+
+    # Comparar equipamento
+    if equipamento and os.get("equipment_type"):
+        total_checks += 1
+        if equipamento.lower() in os.get("equipment_type", "").lower():
+            similaridade += 1
+
+    # Comparar endereço
+    if endereco and os.get("pickup_address"):
+        total_checks += 1
+        endereco_os = os.get("pickup_address", "").lower()
+        if any(palavra in endereco_os for palavra in endereco.lower().split() if len(palavra) > 3):
+            similaridade += 1
+
+    # Comparar nome
+    if nome and os.get("client_name"):
+        total_checks += 1
+        if nome.lower() in os.get("client_name", "").lower():
+            similaridade += 1
+
+    if total_checks == 0:
+        return None
+    return similaridade / total_checks
+
+def verificar_duplicata_janela_local(cpf: str, telefone: str, endereco: str, equipamento: str, nome: str) -> Optional[dict]:
+    """
+    ⚡ Verificação de duplicatas na janela de idempotência em memória
+    Retorna o mesmo formato de verificar_duplicata_agendamento ou None se a janela não souber responder
+    """
+    # 1. OS criadas recentemente para o mesmo CPF/telefone
+    for os, minutos_atras in janela_idempotencia.buscar("os", telefone, cpf, JANELA_OS):
+        similaridade = calcular_similaridade_os(os, equipamento, endereco, nome)
+        if similaridade is not None and similaridade > 0.6:
+            logger.warning(f"🚨 DUPLICATA DETECTADA (janela local): OS {os.get('order_number')} criada há {minutos_atras} minutos")
+            return {
+                "is_duplicate": True,
+                "duplicate_type": "exact",
+                "existing_os": os,
+                "minutes_ago": minutos_atras,
+                "similarity_score": round(similaridade * 100, 1)
+            }
+
+    # 2. Pré-agendamentos recentes para o mesmo telefone
+    if telefone:
+        recentes = janela_idempotencia.buscar("pre_agendamento", telefone, None, JANELA_PRE_AGENDAMENTO)
+        if recentes:
+            logger.warning(f"🚨 PRÉ-AGENDAMENTO RECENTE (janela local): {len(recentes)} para telefone {telefone}")
+            return {
+                "is_duplicate": True,
+                "duplicate_type": "recent_pre_scheduling",
+                "count": len(recentes),
+                "latest": recentes[0][0],
+                "minutes_ago": recentes[0][1]
+            }
+
+    return None
+
 async def verificar_duplicata_agendamento(data: dict) -> dict:
     """
     🛡️ Verificação inteligente de duplicatas de agendamento
+    Consulta primeiro a janela de idempotência em memória; o banco só é consultado quando ela não encontra nada
     """
     try:
-        supabase = get_supabase_client()
-
         # Extrair dados para verificação
         cpf = data.get("cpf", "").strip()
         telefone = data.get("telefone", "").strip()
@@ -3410,6 +3946,15 @@ async def verificar_duplicata_agendamento(data: dict) -> dict:
         equipamento = data.get("equipamento", "").strip()
         nome = data.get("nome", "").strip()
 
+        # ⚡ JANELA LOCAL: reenvios do ClienteChat respondidos sem tocar no banco
+        duplicata_local = verificar_duplicata_janela_local(cpf, telefone, endereco, equipamento, nome)
+        janela_idempotencia.contabilizar(duplicata_local is not None)
+        registrar_cache("idempotencia_janela", duplicata_local is not None)
+        if duplicata_local:
+            return duplicata_local
+
+        supabase = get_supabase_client()
+
         # Janela de tempo para verificação (últimas 4 horas - mais rigorosa)
         agora = datetime.now()
         janela_tempo = agora - timedelta(hours=4)
@@ -3430,42 +3975,26 @@ async def verificar_duplicata_agendamento(data: dict) -> dict:
             if response.data:
                 for os in response.data:
                     # Verificar similaridade dos dados
-                    similaridade = 0
-                    total_checks = 0
-
-                    # Comparar equipamento
-                    if equipamento and os.get("equipment_type"):
-                        total_checks += 1
-                        if equipamento.lower() in os.get("equipment_type", "").lower():
-                            similaridade += 1
-
-                    # Comparar endereço
-                    if endereco and os.get("pickup_address"):
-                        total_checks += 1
-                        endereco_os = os.get("pickup_address", "").lower()
-                        if any(palavra in endereco_os for palavra in endereco.lower().split() if len(palavra) > 3):
-                            similaridade += 1
-
-                    # Comparar nome
-                    if nome and os.get("client_name"):
-                        total_checks += 1
-                        if nome.lower() in os.get("client_name", "").lower():
-                            similaridade += 1
+                    similaridade = calcular_similaridade_os(os, equipamento, endereco, nome)
 
                     # Se similaridade > 60%, considerar duplicata (mais rigoroso)
-                    if total_checks > 0 and (similaridade / total_checks) > 0.6:
+                    if similaridade is not None and similaridade > 0.6:
                         tempo_criacao = datetime.fromisoformat(os.get("created_at", "").replace("Z", "+00:00"))
                         minutos_calculados = int((agora - tempo_criacao.replace(tzinfo=None)).total_seconds() / 60)
                         minutos_atras = max(0, minutos_calculados)  # Garantir que não seja negativo
 
                         logger.warning(f"🚨 DUPLICATA DETECTADA: OS {os.get('order_number')} criada há {minutos_atras} minutos")
 
+                        # Lembrar na janela local para os próximos reenvios
+                        janela_idempotencia.registrar("os", os.get("client_phone") or telefone, os.get("client_cpf_cnpj") or cpf,
+                                                      os, JANELA_OS, criado_em=time.time() - minutos_atras * 60)
+
                         return {
                             "is_duplicate": True,
                             "duplicate_type": "exact",
                             "existing_os": os,
                             "minutes_ago": minutos_atras,
-                            "similarity_score": round((similaridade / total_checks) * 100, 1)
+                            "similarity_score": round(similaridade * 100, 1)
                         }
 
         # 2. VERIFICAR DUPLICATAS EM AGENDAMENTOS_AI (pré-agendamentos) - MAIS RIGOROSO
@@ -3499,6 +4028,9 @@ async def verificar_duplicata_agendamento(data: dict) -> dict:
                     tempo_criacao = datetime.fromisoformat(agendamentos_recentes[0].get("created_at", "").replace("Z", "+00:00")).replace(tzinfo=None)
                     minutos_ago = max(0, int((agora - tempo_criacao).total_seconds() / 60))
 
+                    janela_idempotencia.registrar("pre_agendamento", telefone, None, agendamentos_recentes[0],
+                                                  JANELA_PRE_AGENDAMENTO, criado_em=time.time() - minutos_ago * 60)
+
                     return {
                         "is_duplicate": True,
                         "duplicate_type": "recent_pre_scheduling",
@@ -3637,14 +4169,16 @@ Por favor, aguarde alguns instantes e evite clicar novamente.
         logger.info(f"🔍 DEBUG: horario_escolhido='{horario_escolhido}', telefone='{telefone}'")
 
         # Verificar se há pré-agendamento recente
-        supabase = get_supabase_client()
-        tres_minutos_atras = datetime.now(pytz.UTC) - timedelta(minutes=10)
-        response_busca = supabase.table("agendamentos_ai").select("*").eq(
-            "telefone", telefone
-        ).eq("status", "pendente").gte("created_at", tres_minutos_atras.isoformat()).order("created_at", desc=True).limit(1).execute()
-
-        tem_pre_agendamento = bool(response_busca.data)
-        logger.info(f"🔍 DEBUG: Pré-agendamentos encontrados: {len(response_busca.data) if response_busca.data else 0}")
+        if "fila_saida" in modos_degradados():
+            tem_pre_agendamento = pre_agendamento_local(telefone) is not None
+        else:
+            supabase = get_supabase_client()
+            tres_minutos_atras = datetime.now(pytz.UTC) - timedelta(minutes=10)
+            response_busca = supabase.table("agendamentos_ai").select("*").eq(
+                "telefone", telefone
+            ).eq("status", "pendente").gte("created_at", tres_minutos_atras.isoformat()).order("created_at", desc=True).limit(1).execute()
+            tem_pre_agendamento = bool(response_busca.data)
+        logger.info(f"🔍 DEBUG: Pré-agendamento encontrado: {tem_pre_agendamento}")
 
         if tem_pre_agendamento:
             # ETAPA 2: CONFIRMAÇÃO
@@ -3653,14 +4187,22 @@ Por favor, aguarde alguns instantes e evite clicar novamente.
         else:
             # ETAPA 1: CONSULTA
             logger.info(f"🎯 ETAPA 1 DETECTADA: Primeira consulta - gerando opções de horário")
-            resultado_consulta = await consultar_disponibilidade_interna(data)
 
-            # Criar pré-agendamento
-            if hasattr(resultado_consulta, 'status_code') and resultado_consulta.status_code == 200:
-                logger.info("💾 ETAPA 1: Criando pré-agendamento após consulta bem-sucedida")
-                await criar_pre_agendamento_etapa1(data, telefone)
+            async def executar_etapa_1():
+                resultado = await consultar_disponibilidade_interna(data)
+
+                # Criar pré-agendamento
+                if hasattr(resultado, 'status_code') and resultado.status_code == 200:
+                    logger.info("💾 ETAPA 1: Criando pré-agendamento após consulta bem-sucedida")
+                    await criar_pre_agendamento_etapa1(data, telefone)
+
+                return resultado
 
-            return resultado_consulta
+            # 🔀 Reenvios simultâneos aguardam a mesma consulta (e o mesmo pré-agendamento)
+            resultado_consulta = await coalescedor_disponibilidade.executar(
+                gerar_chave_disponibilidade(data, "etapa1"), executar_etapa_1
+            )
+            return copiar_resposta(resultado_consulta)
 
     except Exception as e:
         logger.error(f"❌ Erro no agendamento inteligente: {e}")
@@ -3669,6 +4211,13 @@ Por favor, aguarde alguns instantes e evite clicar novamente.
             content={"success": False, "message": "Erro interno do servidor"}
         )
 
+def pre_agendamento_local(telefone: str, janela: int = 10 * 60) -> Optional[dict]:
+    """Pré-agendamento pendente mais recente na janela de idempotência (Supabase degradado)"""
+    for registro, _ in janela_idempotencia.buscar("pre_agendamento", telefone, None, janela):
+        if registro.get("status") == "pendente":
+            return registro
+    return None
+
 async def criar_pre_agendamento_etapa1(data: dict, telefone: str):
     """
     Cria pré-agendamento após ETAPA 1 bem-sucedida
@@ -3736,10 +4285,20 @@ async def criar_pre_agendamento_etapa1(data: dict, telefone: str):
         logger.info(f"   - Tipos atendimento: {tipos_atendimento}")
         logger.info(f"   - Valores: valor_os_1={pre_agendamento_data.get('valor_os_1')}, valor_os_2={pre_agendamento_data.get('valor_os_2')}, valor_os_3={pre_agendamento_data.get('valor_os_3')}")
 
+        # 🔌 Supabase degradado: o pré-agendamento fica só na janela local (a ETAPA 2 vai para a fila de saída)
+        if "fila_saida" in modos_degradados():
+            registro = {**pre_agendamento_data, "id": str(uuid.uuid4()), "created_at": datetime.now(pytz.UTC).isoformat()}
+            janela_idempotencia.registrar("pre_agendamento", telefone, None, registro, JANELA_PRE_AGENDAMENTO)
+            logger.warning(f"🔌 ETAPA 1: Supabase degradado - pré-agendamento {registro['id']} mantido só na janela local")
+            return
+
         # Inserir no banco
         response = supabase.table("agendamentos_ai").insert(pre_agendamento_data).execute()
         logger.info(f"💾 ETAPA 1: Pré-agendamento criado com ID: {response.data[0]['id']}")
 
+        # 🛡️ Registrar na janela de idempotência (reenvios não precisam consultar o banco)
+        janela_idempotencia.registrar("pre_agendamento", telefone, None, response.data[0], JANELA_PRE_AGENDAMENTO)
+
     except Exception as e:
         logger.error(f"❌ Erro ao criar pré-agendamento: {e}")
 
@@ -4035,6 +4594,7 @@ async def processar_confirmacao_final(pre_agendamento: dict, opcao_escolhida: st
         )
 
 # Função para criar OS completa (ETAPA 2)
+@medir_etapa("criacao_os")
 async def criar_os_completa(dados: dict):
     """
     Cria OS completa usando dados reais (sem placeholders)
@@ -4134,6 +4694,10 @@ async def criar_os_completa(dados: dict):
 
         logger.info(f"✅ OS criada com sucesso: {os_numero} (ID: {os_id})")
 
+        # 🛡️ Registrar na janela de idempotência (detecção de duplicata sem consultar o banco)
+        janela_idempotencia.registrar("os", os_data["client_phone"], os_data["client_cpf_cnpj"],
+                                      {**os_data, "id": os_id}, JANELA_OS)
+
         # 🎯 REGISTRAR CONVERSÃO GOOGLE ADS (se houver tracking)
         try:
             # Buscar tracking params se disponível
@@ -4201,6 +4765,12 @@ async def criar_os_completa(dados: dict):
                 response_calendar = supabase.table("calendar_events").insert(calendar_event_data).execute()
                 calendar_event_id = response_calendar.data[0]["id"]
 
+                # 📋 Atualizar o quadro de disponibilidade com a nova ocupação
+                quadro_disponibilidade.remover_horario(tecnico_id, horario_inicio.isoformat())
+                # 🛣️ E a rota do dia em cache ganha a parada (sem recarregar o dia)
+                await registrar_parada_rota(tecnico_id, horario_inicio, dados["endereco"])
+                quadro_disponibilidade.invalidar(tecnico_id)
+
                 logger.info(f"✅ Evento do calendário criado com sucesso: {calendar_event_id}")
                 logger.info(f"🕐 Horário: {horario_inicio.strftime('%d/%m/%Y %H:%M')} - {horario_fim.strftime('%H:%M')}")
                 logger.info(f"🎯 NOVA ARQUITETURA: Usando calendar_events como fonte única da verdade")
@@ -4263,37 +4833,220 @@ async def criar_os_completa(dados: dict):
             "message": str(e)
         }
 
-# Endpoint para verificar saúde da API
-@app.get("/health")
-async def health_check():
-    try:
-        # Teste rápido de conectividade com Supabase
-        supabase = get_supabase_client()
-        test_response = supabase.table("technicians").select("count", count="exact").limit(1).execute()
-        supabase_status = "connected" if test_response else "error"
+# 🩺 SAÚDE DA API: liveness sem I/O e prontidão via sonda em segundo plano
+VERSAO_API = "3.1.4-PERFORMANCE-OPTIMIZED"
+
+async def verificar_dependencias():
+    """Consulta mínima ao Supabase executada pela sonda (fora do event loop)"""
+    await asyncio.to_thread(
+        lambda: get_supabase_client().table("technicians").select("id").limit(1).execute()
+    )
+
+sonda_prontidao = SondaProntidao(
+    verificar_dependencias,
+    intervalo=int(os.getenv("HEALTH_PROBE_INTERVALO", "30")),
+    timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+)
 
+def estatisticas_pool_supabase() -> dict:
+    """Estado do cliente Supabase e do pool HTTP do PostgREST"""
+    if _supabase_client is None:
+        return {"cliente_inicializado": False}
+    info = {"cliente_inicializado": True}
+    try:
+        pool = _supabase_client.postgrest.session._transport._pool
+        info["conexoes_abertas"] = len(pool.connections)
+        info["requisicoes_aguardando"] = len(getattr(pool, "_requests", []))
+    except Exception:
+        pass
+    return info
+
+sonda_prontidao.registrar_componente("pool_supabase", estatisticas_pool_supabase)
+sonda_prontidao.registrar_componente("caches", lambda: {
+    "horarios": len(cache_horarios),
+    "tecnicos": len(_technicians_cache),
+    "geocodificacao": len(_geocoding_cache),
+    "idempotencia": len(janela_idempotencia.armazenamento) if hasattr(janela_idempotencia.armazenamento, "__len__") else None,
+    "idempotencia_estatisticas": janela_idempotencia.estatisticas,
+    "quadro_disponibilidade": quadro_disponibilidade.estatisticas,
+    "rotas": cache_rotas.resumo(),
+})
+sonda_prontidao.registrar_componente("filas", lambda: {
+    "consultas_em_andamento": coalescedor_disponibilidade.estatisticas["em_andamento"],
+    "consultas_coalescidas": coalescedor_disponibilidade.estatisticas["coalescidas"],
+    "quadro_tecnicos_pendentes": len(quadro_disponibilidade._tecnicos_pendentes),
+    "tarefas_asyncio": estado_processo()["tarefas_asyncio"],
+})
+sonda_prontidao.registrar_componente("feed_alteracoes", lambda: consumidor_alteracoes.estatisticas)
+sonda_prontidao.registrar_componente("disjuntores", lambda: {
+    **{disjuntor.nome: disjuntor.resumo() for disjuntor in disjuntores()},
+    "modos_degradados": sorted(modos_degradados()),
+    "fila_saida": fila_saida.resumo(),
+})
+sonda_prontidao.registrar_componente("leituras_supabase", leituras_supabase.resumo)
+sonda_prontidao.registrar_componente("admissao", controle_admissao.resumo)
+sonda_prontidao.registrar_componente("estado_compartilhado", lambda: {
+    "pid": os.getpid(),
+    "armazenamento": type(cache_horarios).__name__,
+    "lider": trava_lider.lider if ESTADO_COMPARTILHADO else None,
+})
+
+# 🧠 MEMÓRIA: caches globais acompanhados pelo amostrador e pelo /admin/memoria
+monitor_memoria = MonitorMemoria()
+monitor_memoria.registrar_cache("horarios", lambda: cache_horarios)
+monitor_memoria.registrar_cache("tecnicos", lambda: _technicians_cache)
+monitor_memoria.registrar_cache("geocodificacao", lambda: _geocoding_cache)
+monitor_memoria.registrar_cache("geocodificacao_timestamps", lambda: _geocoding_cache_timestamp)
+monitor_memoria.registrar_cache("idempotencia", lambda: getattr(janela_idempotencia.armazenamento, "_dados", {}))
+monitor_memoria.registrar_cache("quadro_disponibilidade", lambda: quadro_disponibilidade._entradas)
+monitor_memoria.registrar_cache("quadro_demanda", lambda: quadro_disponibilidade._demanda)
+monitor_memoria.registrar_cache("perfis", lambda: perfilador.perfis)
+
+# 📈 MÉTRICAS PROMETHEUS
+registrar_observador(lambda tabela, ms, erro: metricas.consultas_banco.observar(ms / 1000, tabela, "erro" if erro else "ok"))
+
+def coletar_metricas_estado() -> List[str]:
+    """Gauges lidos só na exportação: tamanho dos caches, filas e idade do quadro"""
+    ultima_atualizacao = quadro_disponibilidade.estatisticas["ultima_atualizacao"]
+    linhas = metricas.gauge("cache_entries", "Entradas nos caches em memória", {
+        (("cache", "horarios"),): len(cache_horarios),
+        (("cache", "tecnicos"),): len(_technicians_cache),
+        (("cache", "geocodificacao"),): len(_geocoding_cache),
+        (("cache", "idempotencia"),): len(janela_idempotencia.armazenamento) if hasattr(janela_idempotencia.armazenamento, "__len__") else None,
+    })
+    linhas += metricas.gauge("singleflight_in_flight", "Consultas de disponibilidade em andamento", {
+        (("grupo", "disponibilidade"),): coalescedor_disponibilidade.estatisticas["em_andamento"],
+    })
+    linhas += metricas.gauge("availability_board_age_seconds", "Idade da última atualização completa do quadro de disponibilidade", {
+        (): round(time.time() - ultima_atualizacao, 1) if ultima_atualizacao else None,
+    })
+    linhas += metricas.gauge("process_resident_memory_bytes", "Memória residente do processo", {
+        (): rss_bytes(),
+    })
+    linhas += metricas.gauge("readiness_probe_ok", "Resultado da última sonda de prontidão (1 = ok)", {
+        (): 1 if sonda_prontidao.pronto() else 0,
+    })
+    return linhas
+
+metricas.registro.registrar_coletor(coletar_metricas_estado)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    📈 Exposição no formato texto do Prometheus (sem consultas ao banco)
+    """
+    return Response(content=metricas.registro.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def exigir_token_admin(request: Request) -> None:
+    """Rotas /admin/* usam o mesmo token do perfilador (PERFILADOR_TOKEN, header X-Perfilador-Token)"""
+    if not perfilador.token:
+        raise HTTPException(status_code=404, detail="Rotas administrativas desativadas (defina PERFILADOR_TOKEN)")
+    if not perfilador.autorizado(request.headers.get("x-perfilador-token")):
+        raise HTTPException(status_code=403, detail="Token administrativo inválido")
+
+@app.get("/admin/perfis")
+async def listar_perfis(request: Request):
+    """
+    🔬 Perfis recentes (buffer circular), do mais novo para o mais antigo
+    """
+    exigir_token_admin(request)
+    return {"capacidade": perfilador.perfis.maxlen, "perfis": perfilador.listar()}
+
+@app.get("/admin/perfis/{perfil_id}")
+async def obter_perfil(perfil_id: str, request: Request, formato: str = "colapsado"):
+    """
+    🔬 Um perfil: formato=colapsado (flamegraph.pl/speedscope), json (atribuição por ponto de espera) ou pstats (modo cprofile)
+    """
+    exigir_token_admin(request)
+    perfil = perfilador.obter(perfil_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    if formato == "json":
         return {
-            "status": "ok",
-            "version": "3.1.4-PERFORMANCE-OPTIMIZED",
-            "timestamp": datetime.now(pytz.timezone('America/Sao_Paulo')).isoformat(),
-            "middleware": "agendamento-inteligente",
-            "railway_deploy": "python311_optimized",
-            "build_status": "WORKING",
-            "supabase_status": supabase_status,
-            "cache_status": "enabled" if _supabase_client else "initializing",
-            "performance": {
-                "timeout_keep_alive": 300,
-                "timeout_graceful_shutdown": 30,
-                "cache_enabled": True
-            }
+            **perfil.resumo(),
+            "atribuicao": perfil.atribuicao(perfilador.funcoes_atribuidas),
+            "pilhas": dict(perfil.amostras.most_common(50)),
         }
-    except Exception as e:
-        logger.error(f"❌ Health check error: {e}")
-        return {
-            "status": "degraded",
-            "version": "3.1.4-PERFORMANCE-OPTIMIZED",
-            "error": str(e)
+    if formato == "pstats":
+        if perfil.estatisticas_cprofile is None:
+            raise HTTPException(status_code=400, detail="Perfil gerado por amostragem: use formato=colapsado ou json")
+        return Response(content=perfil.estatisticas_cprofile, media_type="text/plain; charset=utf-8")
+    return Response(content=perfil.colapsado(), media_type="text/plain; charset=utf-8")
+
+@app.get("/admin/memoria")
+async def relatorio_memoria(request: Request, tipos: int = 15):
+    """
+    🧠 RSS, bytes por cache, objetos por tipo e tendência do amostrador periódico
+    """
+    exigir_token_admin(request)
+    return monitor_memoria.relatorio(tipos)
+
+@app.post("/admin/memoria/snapshot")
+async def snapshot_memoria(request: Request, top: int = 20, frames: int = 5):
+    """
+    🧠 Snapshot do tracemalloc: o primeiro liga o rastreamento, os seguintes mostram o que cresceu desde o anterior
+    """
+    exigir_token_admin(request)
+    return monitor_memoria.snapshot(top, frames)
+
+@app.delete("/admin/memoria/snapshot")
+async def parar_snapshot_memoria(request: Request):
+    """
+    🧠 Desliga o tracemalloc (tem custo em cada alocação enquanto ativo)
+    """
+    exigir_token_admin(request)
+    monitor_memoria.parar_rastreamento()
+    return {"tracemalloc": "desligado"}
+
+@app.get("/health/live")
+async def health_live():
+    """
+    💓 Liveness: responde apenas com o estado do processo (nenhuma consulta ao banco)
+    """
+    return {"status": "ok", "version": VERSAO_API, **estado_processo()}
+
+@app.get("/health/ready")
+async def health_ready():
+    """
+    🩺 Readiness: resultado da última sonda em segundo plano + estatísticas de pool, caches e filas
+    """
+    relatorio = sonda_prontidao.relatorio()
+    return JSONResponse(
+        status_code=200 if relatorio["pronto"] else 503,
+        content={"status": "ready" if relatorio["pronto"] else "not_ready", "version": VERSAO_API, **relatorio}
+    )
+
+# Endpoint para verificar saúde da API (usado pelo healthcheck do Railway)
+@app.get("/health")
+async def health_check():
+    """
+    Mantém o formato antigo, mas sem consultar o banco: o status do Supabase vem da sonda em segundo plano
+    """
+    sonda = sonda_prontidao.ultimo_resultado
+    if sonda["ok"] is None:
+        supabase_status = "unknown"
+    else:
+        supabase_status = "connected" if sonda["ok"] else "error"
+
+    return {
+        "status": "ok",
+        "version": VERSAO_API,
+        "timestamp": datetime.now(pytz.timezone('America/Sao_Paulo')).isoformat(),
+        "middleware": "agendamento-inteligente",
+        "railway_deploy": "python311_optimized",
+        "build_status": "WORKING",
+        "supabase_status": supabase_status,
+        "cache_status": "enabled" if _supabase_client else "initializing",
+        "performance": {
+            "timeout_keep_alive": 300,
+            "timeout_graceful_shutdown": 30,
+            "cache_enabled": True,
+            "idempotencia": janela_idempotencia.estatisticas,
+            "coalescencia_disponibilidade": coalescedor_disponibilidade.estatisticas,
+            "quadro_disponibilidade": quadro_disponibilidade.estatisticas,
+            "feed_alteracoes": consumidor_alteracoes.estatisticas
         }
+    }
 
 # Endpoint compatível com webhook-ai para orçamentos
 @app.post("/api/quote/estimate")
@@ -4614,7 +5367,8 @@ async def listar_agendamentos():
     try:
         supabase = get_supabase_client()
         response = supabase.table("agendamentos_ai").select("*").order("created_at", desc=True).execute()
-        return {"success": True, "data": response.data}
+        # Linhas do PostgREST já são JSON: resposta direta, sem o jsonable_encoder do FastAPI
+        return JSONResponse(content={"success": True, "data": response.data})
     except Exception as e:
         logger.error(f"Erro ao listar agendamentos: {e}")
         return JSONResponse(
@@ -4651,6 +5405,25 @@ async def consultar_disponibilidade(request: Request):
                 }
             )
 
+        # 🔀 Requisições idênticas simultâneas compartilham a mesma computação
+        resultado = await coalescedor_disponibilidade.executar(
+            gerar_chave_disponibilidade(data, "consulta"),
+            lambda: processar_consulta_disponibilidade(data)
+        )
+        return copiar_resposta(resultado)
+
+    except Exception as e:
+        logger.error(f"Erro ao consultar disponibilidade: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "message": f"Erro interno: {str(e)}"}
+        )
+
+async def processar_consulta_disponibilidade(data: dict):
+    """
+    Calcula técnico e horários para /consultar-disponibilidade
+    """
+    try:
         logger.info(f"Consultando disponibilidade: {data}")
 
         # Extrair e validar dados básicos
@@ -4927,13 +5700,205 @@ async def agendamento_inteligente_completo(request: Request):
         )
 
 # Função interna para consulta de disponibilidade
+# 📋 QUADRO DE DISPONIBILIDADE PRÉ-CALCULADO
+QUADRO_INTERVALO = int(os.getenv("QUADRO_DISPONIBILIDADE_INTERVALO", "60"))
+QUADRO_TAMANHO = int(os.getenv("QUADRO_DISPONIBILIDADE_TAMANHO", "6"))
+
+async def calcular_entrada_quadro(chave: tuple, quantidade: int) -> List[Dict]:
+    """
+    Calcula os próximos horários livres de uma chave do quadro.
+    Com o disjuntor do Supabase aberto (antes ou durante o cálculo) levanta DisjuntorAberto:
+    o quadro conta como erro e mantém a entrada anterior, servida vencida em modo degradado.
+    """
+    technician_id, grupo_logistico, tipo_atendimento, urgente = chave
+    if disjuntor_supabase.degradado:
+        raise DisjuntorAberto(disjuntor_supabase.nome)
+    horarios = await gerar_horarios_proximas_datas_disponiveis(
+        technician_id,
+        urgente,
+        tipo_atendimento,
+        quantidade=quantidade,
+        grupo_logistico=grupo_logistico
+    )
+    # A busca trata falhas de consulta como "sem horários": resultado do período degradado não substitui o anterior
+    if disjuntor_supabase.degradado:
+        raise DisjuntorAberto(disjuntor_supabase.nome)
+    return horarios
+
+async def listar_chaves_quadro() -> List[tuple]:
+    """Chaves sempre aquecidas: todos os técnicos ativos nos grupos A, B e C (em domicílio, não urgente)"""
+    tecnicos_config = await obter_tecnicos_do_banco()
+    return [
+        (tecnico["id"], grupo, "em_domicilio", False)
+        for tecnico in tecnicos_config.values()
+        for grupo in ("A", "B", "C")
+    ]
+
+quadro_disponibilidade = QuadroDisponibilidade(
+    calcular_entrada_quadro,
+    listar_chaves_quadro,
+    intervalo=QUADRO_INTERVALO,
+    tamanho=QUADRO_TAMANHO,
+    armazenamento=criar_armazenamento("quadro") if ESTADO_COMPARTILHADO else None
+)
+
+# 🔔 FEED DE ALTERAÇÕES: invalida caches quando o calendário muda fora deste processo
+STATUS_CANCELADOS = {"cancelled", "canceled", "cancelado", "cancelada", "rejected"}
+
+consumidor_alteracoes = ConsumidorAlteracoes(
+    intervalo_polling=int(os.getenv("FEED_ALTERACOES_INTERVALO", "15"))
+)
+
+def aplicar_invalidacao(evento: EventoInvalidacao) -> None:
+    """
+    Aplica um evento do feed aos caches em memória
+    """
+    cancelado = evento.operacao == "DELETE" or (evento.status or "").lower() in STATUS_CANCELADOS
+
+    # 📋 Quadro de disponibilidade: só alterações que ocupam/liberam horário de técnico
+    if evento.technician_id:
+        if evento.inicio and not cancelado:
+            quadro_disponibilidade.remover_horario(evento.technician_id, evento.inicio)
+        quadro_disponibilidade.invalidar(evento.technician_id)
+    elif evento.inicio:
+        quadro_disponibilidade.invalidar()
+
+    # 🛣️ Rotas do dia: a alteração pode mudar qualquer parada do dia
+    if evento.inicio:
+        cache_rotas.invalidar(dia_local(evento.inicio))
+
+    # 🛡️ Janela de idempotência: OS/pré-agendamento cancelado não é mais duplicata
+    if cancelado:
+        if evento.tabela == "service_orders":
+            janela_idempotencia.esquecer("os", evento.telefone, evento.cpf)
+        elif evento.tabela == "agendamentos_ai":
+            janela_idempotencia.esquecer("pre_agendamento", evento.telefone, None)
+
+consumidor_alteracoes.assinar(aplicar_invalidacao)
+
+@medir_etapa("busca_horarios")
+async def obter_horarios_do_quadro(technician_id: str, grupo_logistico: str, tipo_atendimento: str, urgente: bool) -> List[Dict]:
+    """
+    Lê os 3 melhores horários do quadro; na falta da entrada, calcula na hora e guarda no quadro
+    """
+    chave = (technician_id, grupo_logistico, tipo_atendimento, urgente)
+    degradado = "quadro_vencido" in modos_degradados()
+    horarios = quadro_disponibilidade.obter(chave, aceitar_vencida=degradado)
+    registrar_cache("quadro_disponibilidade", horarios is not None)
+
+    if horarios is None and degradado:
+        logger.warning(f"🔌 Supabase degradado e quadro sem entrada para {chave} - sem horários")
+        return []
+    if horarios is None:
+        logger.info(f"📋 Quadro sem entrada para {chave} - calculando horários na hora")
+        try:
+            horarios = await calcular_entrada_quadro(chave, QUADRO_TAMANHO)
+        except DisjuntorAberto:
+            # O disjuntor abriu durante o cálculo: a última entrada, mesmo vencida, vale mais que a busca com falhas
+            logger.warning(f"🔌 Supabase degradado durante o cálculo de {chave} - usando o quadro anterior")
+            horarios = quadro_disponibilidade.obter(chave, aceitar_vencida=True) or []
+            return horarios[:3]
+        # Busca interrompida pelo prazo não vai para o quadro (a atualização em segundo plano completa)
+        if not resultado_parcial():
+            quadro_disponibilidade.salvar(chave, horarios)
+    else:
+        logger.info(f"📋 Horários lidos do quadro de disponibilidade: {len(horarios)} para {chave}")
+
+    melhores = horarios[:3]
+    for numero, horario in enumerate(melhores, 1):
+        horario["numero"] = numero
+    return melhores
+
+# 👥 BUSCA EM VÁRIOS TÉCNICOS: todos os técnicos qualificados avaliados juntos, uma lista única
+BUSCA_MULTI_TECNICO = os.getenv("BUSCA_MULTI_TECNICO", "desligado") == "ligado"
+BUSCA_MULTI_TECNICO_MAX = int(os.getenv("BUSCA_MULTI_TECNICO_MAX", "5"))
+# Qualificado: score de habilidade de pelo menos esta fração do melhor técnico
+BUSCA_MULTI_TECNICO_SCORE_MINIMO = float(os.getenv("BUSCA_MULTI_TECNICO_SCORE_MINIMO", "0.6"))
+# Pontos somados ao score do horário pelo técnico de maior habilidade (proporcional para os demais).
+# Referência: no score do horário, 1 ponto = 1 dia mais próximo; manhã vale 5 pontos a mais que a tarde
+BUSCA_MULTI_TECNICO_PESO_HABILIDADE = float(os.getenv("BUSCA_MULTI_TECNICO_PESO_HABILIDADE", "10"))
+# Maior janela de gerar_horarios_proximas_datas_disponiveis (coleta: 10 dias)
+DIAS_RETRATO_MULTI_TECNICO = 10
+
+@medir_etapa("busca_horarios")
+async def obter_horarios_multi_tecnico(tecnicos: List[Dict[str, Any]], grupo_logistico: str, tipo_atendimento: str, urgente: bool, quantidade: int = 3) -> List[Dict]:
+    """
+    👥 Melhores horários entre vários técnicos qualificados
+
+    Cada técnico vem do quadro de disponibilidade; os que faltam no quadro são calculados em
+    paralelo contra um único retrato do calendário (3 consultas para todos). A lista final
+    ordena por score do horário + peso da habilidade do técnico, sem repetir o mesmo horário,
+    e cada horário leva o técnico que vai atendê-lo (usado na ETAPA 2).
+    """
+    horarios_por_tecnico: Dict[str, List[Dict]] = {}
+    faltando = []
+    degradado = "quadro_vencido" in modos_degradados()
+    for tecnico in tecnicos:
+        chave = (tecnico["tecnico_id"], grupo_logistico, tipo_atendimento, urgente)
+        horarios = quadro_disponibilidade.obter(chave, aceitar_vencida=degradado)
+        registrar_cache("quadro_disponibilidade", horarios is not None)
+        if horarios is None:
+            faltando.append(chave)
+        else:
+            horarios_por_tecnico[tecnico["tecnico_id"]] = horarios
+
+    if faltando and degradado:
+        logger.warning(f"🔌 Supabase degradado: {len(faltando)} técnicos sem entrada no quadro ficam de fora")
+    elif faltando:
+        inicio = calcular_data_inicio_otimizada(urgente).date()
+        retrato = RetratoCalendario.carregar(
+            get_supabase_client(), [chave[0] for chave in faltando],
+            inicio, inicio + timedelta(days=DIAS_RETRATO_MULTI_TECNICO - 1), determine_logistics_group
+        )
+        calculados = await asyncio.gather(*(
+            gerar_horarios_proximas_datas_disponiveis(
+                chave[0], urgente, tipo_atendimento,
+                quantidade=QUADRO_TAMANHO, grupo_logistico=grupo_logistico, retrato=retrato
+            )
+            for chave in faltando
+        ))
+        parcial = resultado_parcial()
+        for chave, horarios in zip(faltando, calculados):
+            if not parcial:
+                quadro_disponibilidade.salvar(chave, horarios)
+            horarios_por_tecnico[chave[0]] = [dict(horario) for horario in horarios]
+        logger.info(f"👥 {len(faltando)} técnicos calculados em paralelo com um retrato do calendário")
+
+    # Score combinado: horário + habilidade (empates: horário mais cedo, depois técnico de maior score)
+    melhor_habilidade = max(tecnico["score"] for tecnico in tecnicos) or 1
+    combinados = []
+    for tecnico in tecnicos:
+        bonus_habilidade = BUSCA_MULTI_TECNICO_PESO_HABILIDADE * tecnico["score"] / melhor_habilidade
+        for horario in horarios_por_tecnico.get(tecnico["tecnico_id"], []):
+            horario.update(
+                tecnico_id=tecnico["tecnico_id"],
+                tecnico_nome=tecnico["nome"],
+                score_tecnico=tecnico["score"],
+                score_combinado=round(horario.get("score_otimizacao", 0) + bonus_habilidade, 2)
+            )
+            combinados.append(horario)
+    combinados.sort(key=lambda h: (-h["score_combinado"], h.get("datetime_agendamento", "")))
+
+    melhores, vistos = [], set()
+    for horario in combinados:
+        if horario.get("datetime_agendamento") in vistos:
+            continue
+        vistos.add(horario.get("datetime_agendamento"))
+        horario["numero"] = len(melhores) + 1
+        melhores.append(horario)
+        if len(melhores) == quantidade:
+            break
+
+    logger.info(f"👥 Horários de {len(horarios_por_tecnico)} técnicos: {[(h['tecnico_nome'], h['datetime_agendamento']) for h in melhores]}")
+    return melhores
+
 async def consultar_disponibilidade_interna(data: dict):
     try:
         # 🕐 VERIFICAR HORÁRIO REAL ANTES DA CONSULTA
         logger.info("🔍 ═══════════════════════════════════════════════════════════")
         logger.info("🔍 INICIANDO CONSULTA DE DISPONIBILIDADE")
         info_horario = verificar_horario_real_sistema()
-        logger.info(f"🔍 Horário de referência: {info_horario['brasil']['formatted']}")
+        logger.info("🔍 Horário de referência: %s", info_horario['brasil']['formatted'])
         logger.info("🔍 ═══════════════════════════════════════════════════════════")
 
         # Extrair dados básicos e filtrar placeholders
@@ -4968,7 +5933,7 @@ async def consultar_disponibilidade_interna(data: dict):
 
         # ETAPA 1: Validação flexível - dados podem estar vazios (placeholders filtrados)
         # Na ETAPA 1, geramos horários genéricos. Dados reais virão na ETAPA 2.
-        logger.info(f"🔍 ETAPA 1 - Dados após filtro: nome='{nome}', endereco='{endereco}', telefone='{telefone}', equipamentos={len(equipamentos)}")
+        logger.info("🔍 ETAPA 1 - Dados após filtro: nome='%s', endereco='%s', telefone='%s', equipamentos=%s", nome, endereco, telefone, len(equipamentos))
 
         # Se todos os dados estão vazios (placeholders filtrados), usar dados padrão para gerar horários
         if not nome and not endereco and not telefone and not equipamentos:
@@ -5000,34 +5965,49 @@ async def consultar_disponibilidade_interna(data: dict):
 
         # Extrair tipo de atendimento
         tipo_atendimento = data.get("tipo_atendimento_1", "em_domicilio")
-        logger.info(f"🎯 ETAPA 1: Tipo de atendimento: {tipo_atendimento}")
+        logger.info("🎯 ETAPA 1: Tipo de atendimento: %s", tipo_atendimento)
 
         # Determinar técnico otimizado para ETAPA 1
-        logger.info(f"🎯 ETAPA 1: Iniciando determinação de técnico para equipamentos: {lista_equipamentos}")
-        logger.info(f"🎯 ETAPA 1: Grupo logístico: {grupo_logistico}, Urgente: {urgente}")
-
-        tecnico_info = await determinar_tecnico_otimizado(lista_equipamentos, grupo_logistico, urgente)
+        logger.info("🎯 ETAPA 1: Iniciando determinação de técnico para equipamentos: %s", lista_equipamentos)
+        logger.info("🎯 ETAPA 1: Grupo logístico: %s, Urgente: %s", grupo_logistico, urgente)
+
+        tecnicos_qualificados = []
+        if BUSCA_MULTI_TECNICO:
+            tecnicos_qualificados = await determinar_tecnicos_qualificados(lista_equipamentos, grupo_logistico, urgente)
+        if tecnicos_qualificados:
+            tecnico_info = tecnicos_qualificados[0]
+        else:
+            tecnico_info = await determinar_tecnico_otimizado(lista_equipamentos, grupo_logistico, urgente)
         tecnico = f"{tecnico_info['nome']} ({tecnico_info['email']})"
 
-        logger.info(f"🏆 ETAPA 1: Técnico selecionado: {tecnico_info['nome']} (ID: {tecnico_info['tecnico_id']}, Score: {tecnico_info['score']})")
+        logger.info("🏆 ETAPA 1: Técnico selecionado: %s (ID: %s, Score: %s)", tecnico_info['nome'], tecnico_info['tecnico_id'], tecnico_info['score'])
 
         # 🎯 ETAPA 1: NOVA LÓGICA - Sempre priorizar datas mais próximas
-        logger.info(f"🎯 ETAPA 1: Gerando horários próximas datas para {tecnico_info['nome']} - Grupo {grupo_logistico}")
-
-        # Usar nova função que sempre busca as datas mais próximas
-        horarios_disponiveis = await gerar_horarios_proximas_datas_disponiveis(
-            tecnico_info['tecnico_id'],
-            urgente,
-            tipo_atendimento,
-            endereco
-        )
+        logger.info("🎯 ETAPA 1: Gerando horários próximas datas para %s - Grupo %s", tecnico_info['nome'], grupo_logistico)
+
+        if len(tecnicos_qualificados) > 1:
+            # 👥 Todos os técnicos qualificados de uma vez: o melhor horário entre eles
+            horarios_disponiveis = await obter_horarios_multi_tecnico(
+                tecnicos_qualificados,
+                grupo_logistico,
+                tipo_atendimento,
+                urgente
+            )
+        else:
+            # Usar o quadro de disponibilidade (datas mais próximas, pré-calculadas em segundo plano)
+            horarios_disponiveis = await obter_horarios_do_quadro(
+                tecnico_info['tecnico_id'],
+                grupo_logistico,
+                tipo_atendimento,
+                urgente
+            )
 
         # Ajustar grupo logístico nos horários
         for horario in horarios_disponiveis:
             horario['grupo_logistico'] = grupo_logistico
 
-        # Se não encontrou horários próximos, usar fallback da logística inteligente
-        if not horarios_disponiveis:
+        # Se não encontrou horários próximos, usar fallback da logística inteligente (se ainda houver prazo)
+        if not horarios_disponiveis and not prazo_esgotado("fallback_logistica") and "quadro_vencido" not in modos_degradados():
             logger.warning("⚠️ Nenhum horário próximo encontrado, usando logística inteligente como fallback")
 
             # Geocodificar endereço para otimização de rotas
@@ -5049,7 +6029,8 @@ async def consultar_disponibilidade_interna(data: dict):
                     "success": True,
                     "message": "⚠️ Não há horários disponíveis no momento. Nossa equipe entrará em contato para agendar.",
                     "horarios_disponiveis": [],
-                    "action": "contact_later"
+                    "action": "contact_later",
+                    "parcial": resultado_parcial()
                 }
             )
 
@@ -5080,9 +6061,9 @@ async def consultar_disponibilidade_interna(data: dict):
                 }
             }
             # Salvar no cache usando a mesma estrutura do salvar_horarios_cache
-            logger.info(f"💾 Dados do técnico preparados para ETAPA 2")
+            logger.info("💾 Dados do técnico preparados para ETAPA 2")
         except Exception as e:
-            logger.warning(f"⚠️ Erro ao preparar cache do técnico: {e}")
+            logger.warning("⚠️ Erro ao preparar cache do técnico: %s", e)
 
         # Formatar resposta para o cliente - FORMATO COMPATÍVEL COM CLIENTECHAT
         mensagem = f"✅ *Horários disponíveis para {primeiro_equipamento}:*\n\n"
@@ -5175,7 +6156,9 @@ async def consultar_disponibilidade_interna(data: dict):
                     "email": data.get("email", "")
                 },
                 "equipamentos": equipamentos,
-                "problemas": problemas
+                "problemas": problemas,
+                # ⏱️ True quando o prazo da requisição interrompeu a busca (menos opções que o normal)
+                "parcial": resultado_parcial()
             }
         )
 
@@ -5227,29 +6210,34 @@ async def processar_etapa_2_confirmacao(opcao_escolhida: str, telefone_contato:
         # Buscar dados do cache (horários e técnico) em vez de pré-agendamento
         logger.info(f"🔍 ETAPA 2: Buscando dados do cache por telefone {telefone_contato}")
 
-        # Buscar pré-agendamento para obter dados completos
-        supabase = get_supabase_client()
-        dez_minutos_atras = datetime.now(pytz.UTC) - timedelta(minutes=10)  # ✅ AUMENTAR JANELA
+        # 🔌 Supabase degradado: o pré-agendamento da ETAPA 1 está só na janela local
+        if "fila_saida" in modos_degradados():
+            pre_agendamento = pre_agendamento_local(telefone_contato)
+            encontrados = [pre_agendamento] if pre_agendamento else []
+        else:
+            # Buscar pré-agendamento para obter dados completos
+            supabase = get_supabase_client()
+            dez_minutos_atras = datetime.now(pytz.UTC) - timedelta(minutes=10)  # ✅ AUMENTAR JANELA
 
-        logger.info(f"🔍 ETAPA 2: Buscando pré-agendamento desde {dez_minutos_atras.isoformat()}")
+            logger.info(f"🔍 ETAPA 2: Buscando pré-agendamento desde {dez_minutos_atras.isoformat()}")
 
-        # Buscar sem filtro de status primeiro para debug
-        response_debug = supabase.table("agendamentos_ai").select("*").eq(
-            "telefone", telefone_contato
-        ).gte("created_at", dez_minutos_atras.isoformat()).order("created_at", desc=True).execute()
+            # Buscar sem filtro de status primeiro para debug
+            response_debug = supabase.table("agendamentos_ai").select("*").eq(
+                "telefone", telefone_contato
+            ).gte("created_at", dez_minutos_atras.isoformat()).order("created_at", desc=True).execute()
 
-        logger.info(f"🔍 ETAPA 2: Total de agendamentos encontrados (qualquer status): {len(response_debug.data) if response_debug.data else 0}")
+            logger.info(f"🔍 ETAPA 2: Total de agendamentos encontrados (qualquer status): {len(response_debug.data) if response_debug.data else 0}")
 
-        if response_debug.data:
-            for agend in response_debug.data:
-                logger.info(f"🔍 ETAPA 2: Agendamento ID={agend.get('id', 'N/A')[:8]}, Status={agend.get('status', 'N/A')}, Criado={agend.get('created_at', 'N/A')}")
+            if response_debug.data:
+                for agend in response_debug.data:
+                    logger.info(f"🔍 ETAPA 2: Agendamento ID={agend.get('id', 'N/A')[:8]}, Status={agend.get('status', 'N/A')}, Criado={agend.get('created_at', 'N/A')}")
 
-        # Agora buscar com status pendente
-        response_busca = supabase.table("agendamentos_ai").select("*").eq(
-            "telefone", telefone_contato
-        ).eq("status", "pendente").gte("created_at", dez_minutos_atras.isoformat()).order("created_at", desc=True).limit(1).execute()
+            # Agora buscar com status pendente
+            encontrados = supabase.table("agendamentos_ai").select("*").eq(
+                "telefone", telefone_contato
+            ).eq("status", "pendente").gte("created_at", dez_minutos_atras.isoformat()).order("created_at", desc=True).limit(1).execute().data
 
-        if not response_busca.data:
+        if not encontrados:
             return JSONResponse(
                 status_code=404,
                 content={
@@ -5258,7 +6246,7 @@ async def processar_etapa_2_confirmacao(opcao_escolhida: str, telefone_contato:
                 }
             )
 
-        pre_agendamento = response_busca.data[0]
+        pre_agendamento = encontrados[0]
 
         # Criar dados para buscar no cache usando a mesma estrutura da ETAPA 1
         dados_busca = {
@@ -5334,6 +6322,84 @@ async def processar_etapa_2_confirmacao(opcao_escolhida: str, telefone_contato:
         )
 
 # Função para confirmar agendamento final (ETAPA 2)
+# 📮 FILA DE SAÍDA: confirmações recebidas com o Supabase fora, reprocessadas pelo worker líder
+fila_saida = FilaSaida(intervalo=float(os.getenv("FILA_SAIDA_INTERVALO", "15")))
+
+def enfileirar_confirmacao(dados_reais: dict, horario_iso: str, tecnico_info: dict, equipamentos: List[str],
+                           conflito_so_do_tecnico: bool = False) -> JSONResponse:
+    """
+    ETAPA 2 em modo degradado: grava a confirmação na fila de saída e responde "recebido".
+    A disponibilidade do horário é conferida no reprocessamento (conflito = contato manual).
+    """
+    item = {
+        "dados": {**dados_reais, "horario_agendado": horario_iso},
+        "horario_iso": horario_iso,
+        "tecnico_id": tecnico_info.get("tecnico_id"),
+        "tecnico_nome": tecnico_info.get("nome"),
+        "conflito_so_do_tecnico": conflito_so_do_tecnico,
+    }
+    fila_saida.enfileirar("criar_os", item, chave=f"{dados_reais['telefone']}|{horario_iso}")
+    # O quadro vencido continua sendo servido: o horário prometido sai dele para não ser oferecido de novo
+    if item["tecnico_id"] not in (None, "fallback"):
+        quadro_disponibilidade.remover_horario(item["tecnico_id"], horario_iso)
+    mensagem = (
+        f"AGENDAMENTO_RECEBIDO|CLIENTE:{dados_reais['nome']}|HORARIO:{dados_reais['horario_agendado']}"
+        f"|TECNICO:{dados_reais['tecnico']}|VALOR:R$ {dados_reais['valor_os']:.2f}"
+        f"|EQUIPAMENTOS:{', '.join(equipamentos)}|QTD_EQUIPAMENTOS:{len(equipamentos)}"
+    )
+    return JSONResponse(
+        status_code=200,
+        content={
+            "success": True,
+            "message": mensagem,
+            "action": "confirmacao_pendente",
+            "dados_agendamento": dados_reais
+        }
+    )
+
+def os_criada_pela_fila(item: dict) -> Optional[dict]:
+    """
+    OS já criada por uma tentativa anterior do item (o insert pode ter sido gravado mesmo com
+    timeout na resposta). Erros na consulta sobem: o item fica para depois, nunca às cegas.
+    """
+    horario_dt = datetime.fromisoformat(converter_horario_para_iso_direto(item["horario_iso"]).replace('Z', '+00:00'))
+    resposta = get_supabase_client().table("service_orders").select("id, order_number, scheduled_date").eq(
+        "client_phone", item["dados"]["telefone"]
+    ).eq("scheduled_time", horario_dt.strftime('%H:%M')).execute()
+    data_str = horario_dt.strftime('%Y-%m-%d')
+    return next((os for os in resposta.data or [] if str(os.get("scheduled_date", "")).startswith(data_str)), None)
+
+async def processar_item_fila_saida(operacao: str, item: dict) -> str:
+    """
+    Reprocessa uma confirmação adiada: procura a OS de uma tentativa anterior, confere o
+    horário como a ETAPA 2 online (calendário do técnico + agendamentos/OS do dia) e cria a OS
+    """
+    if operacao != "criar_os":
+        raise ValueError(f"Operação desconhecida na fila de saída: {operacao}")
+    existente = os_criada_pela_fila(item)
+    if existente is not None:
+        logger.info(f"📮 OS {existente.get('order_number')} já criada por tentativa anterior - item concluído")
+        return CONCLUIDO
+
+    horario_dt = datetime.fromisoformat(item["horario_iso"])
+    tecnico_id = item.get("tecnico_id")
+    horario_livre = True
+    if horario_dt.tzinfo is not None and tecnico_id not in (None, "fallback"):
+        horario_livre = await verificar_horario_disponivel_tecnico(tecnico_id, horario_dt)
+    if not horario_livre or not await verificar_horario_ainda_disponivel(
+        item["horario_iso"], item.get("tecnico_nome") or item["dados"].get("tecnico"),
+        tecnico_id if item.get("conflito_so_do_tecnico") else None
+    ):
+        # Ocupado ou erro na consulta: com o disjuntor aberto de novo, tentar depois
+        if disjuntor_supabase.degradado:
+            raise DisjuntorAberto(disjuntor_supabase.nome)
+        logger.warning(f"📮 Horário {item['horario_iso']} ocupado enquanto o Supabase estava fora - contato manual")
+        return CONFLITO
+    os_criada = await criar_os_completa(item["dados"])
+    if not os_criada["success"]:
+        raise RuntimeError(os_criada.get("message") or "Erro ao criar OS")
+    return CONCLUIDO
+
 async def confirmar_agendamento_final(data: dict, horario_escolhido: str, request: Request = None):
     """
     NOVA ESTRATÉGIA: Busca pré-agendamento existente (com placeholders) e atualiza com dados reais
@@ -5544,6 +6610,15 @@ async def confirmar_agendamento_final(data: dict, horario_escolhido: str, reques
             logger.info(f"🎯 Processando horário ISO direto: {horario_escolhido}")
             horario_iso = horario_escolhido
 
+        # 👥 Busca em vários técnicos: o horário oferecido na ETAPA 1 já traz o técnico que vai atendê-lo
+        tecnico_horario = next(
+            (h.get('tecnico_id') for h in horarios_cache or [] if h.get('datetime_agendamento') == horario_iso), None
+        )
+        conflito_so_do_tecnico = bool(tecnico_horario)
+        if tecnico_horario and tecnico_horario != tecnico_info.get("tecnico_id"):
+            tecnico_info = await info_tecnico_por_id(tecnico_horario, lista_equipamentos, grupo_logistico, urgente) or tecnico_info
+            logger.info(f"👥 ETAPA 2: Técnico do horário escolhido: {tecnico_info['nome']}")
+
         # Converter para datetime
         try:
             horario_dt = datetime.fromisoformat(horario_iso)
@@ -5557,8 +6632,19 @@ async def confirmar_agendamento_final(data: dict, horario_escolhido: str, reques
                 content={"success": False, "message": "Formato de horário inválido"}
             )
 
-        # Verificar se horário ainda está disponível
-        if not await verificar_horario_ainda_disponivel(horario_iso, tecnico_info["nome"]):
+        # 🔌 Supabase com disjuntor aberto: a confirmação vai para a fila de saída e o horário é
+        # conferido quando ela for reprocessada
+        adiar_escrita = "fila_saida" in modos_degradados()
+
+        # Verificar se horário ainda está disponível (os horários da ETAPA 1 vêm do quadro pré-calculado,
+        # então o horário escolhido é conferido de forma exata no calendário do técnico)
+        horario_livre_tecnico = True
+        if not adiar_escrita and horario_dt.tzinfo is not None and tecnico_info.get("tecnico_id") not in (None, "fallback"):
+            horario_livre_tecnico = await verificar_horario_disponivel_tecnico(tecnico_info["tecnico_id"], horario_dt)
+
+        if not adiar_escrita and (not horario_livre_tecnico or not await verificar_horario_ainda_disponivel(
+            horario_iso, tecnico_info["nome"], tecnico_info["tecnico_id"] if conflito_so_do_tecnico else None
+        )):
             return JSONResponse(
                 status_code=409,
                 content={
@@ -5609,6 +6695,10 @@ async def confirmar_agendamento_final(data: dict, horario_escolhido: str, reques
             "valor_os": final_cost
         }
 
+        if adiar_escrita:
+            logger.warning("🔌 ETAPA 2: Supabase degradado - confirmação enviada para a fila de saída")
+            return enfileirar_confirmacao(dados_reais, horario_iso, tecnico_info, equipamentos, conflito_so_do_tecnico)
+
         # Criar OS usando a função completa do endpoint de confirmação
         logger.info("🔄 ETAPA 2: Criando Ordem de Serviço completa...")
         os_criada = await criar_os_completa(dados_reais)
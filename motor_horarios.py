@@ -0,0 +1,242 @@
+"""
+🎯 Motor único de busca de horários
+
+Os geradores de horários do middleware (próximas datas, grupos A/B, rota sequencial
+e novo dia do Grupo C, busca otimizada por grupo) usam este laço. Cada estratégia
+fornece:
+- candidatos: dia + faixa de horário, montados sem I/O, em ordem não crescente de teto
+- avaliar_dia: bloqueios do dia e score do dia (uma chamada por dia, com cache)
+- pontuar: disponibilidade do técnico + bônus; None descarta o candidato
+- formatar: o dict entregue ao ClienteChat, montado só para os vencedores
+
+Dias e faixas vêm do calendário comercial (calendario_comercial.py): fins de semana,
+feriados e faixas fora do expediente do dia ficam de fora por consulta em tabela.
+
+Candidatos são compactos (Candidato com __slots__: dia, hora, scores; nenhuma string
+formatada). Rótulos de data e de faixa vêm de tabelas calculadas uma vez por data /
+hora (rotulos_dia, TEXTO_FAIXA, HORA_AGENDAMENTO) e só são usados na apresentação.
+
+O motor mantém um heap com os k melhores e para assim que o teto do próximo
+candidato não supera o pior dos k: como os candidatos chegam em ordem de teto,
+nenhum dos restantes consegue entrar.
+
+Com um prazo de requisição aberto (prazos.py), o motor também para quando o prazo
+esgota: devolve os melhores encontrados até ali e a requisição fica marcada como parcial.
+
+Chaves e tetos são tuplas comparáveis. chave_proximidade, (-dia, score sem o score
+do dia), prioriza a data mais próxima e, no mesmo dia, o maior score (a regra de
+sempre: oferecer as datas mais próximas); como o score do dia é igual para todas as
+faixas do dia, o teto só precisa cobrir o que varia por faixa. chave_score,
+(score, -dia), é ranking puro por score e o teto cobre a pontuação inteira.
+"""
+
+import functools
+import heapq
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from calendario_comercial import calendario
+from metricas import registro
+from prazos import prazo_esgotado
+
+logger = logging.getLogger(__name__)
+
+candidatos_avaliados = registro.contador(
+    "slot_candidates_total", "Candidatos de horário processados pelo motor de busca", ("strategy", "outcome")
+)
+
+DIAS_SEMANA_PT = (
+    "Segunda-feira", "Terça-feira", "Quarta-feira", "Quinta-feira", "Sexta-feira", "Sábado", "Domingo"
+)
+
+# Rótulos por hora do dia, montados uma vez
+TEXTO_FAIXA = tuple(f"{hora}h e {hora + 1}h" for hora in range(24))
+HORA_AGENDAMENTO = tuple(f"{hora:02d}:00" for hora in range(24))
+
+
+class RotulosDia(NamedTuple):
+    iso: str          # 2026-10-20
+    data: str         # 20/10/2026
+    dia_semana: str   # Terça-feira
+    por_extenso: str  # Terça-feira, 20/10/2026
+
+
+@functools.lru_cache(maxsize=1024)
+def _rotulos_ordinal(ordinal: int) -> RotulosDia:
+    dia = date.fromordinal(ordinal)
+    data = f"{dia.day:02d}/{dia.month:02d}/{dia.year}"
+    dia_semana = DIAS_SEMANA_PT[dia.weekday()]
+    return RotulosDia(dia.isoformat(), data, dia_semana, f"{dia_semana}, {data}")
+
+
+def rotulos_dia(dia: date) -> RotulosDia:
+    """Rótulos da data (tabela por dia: cada data é formatada uma única vez por processo)"""
+    return _rotulos_ordinal(dia.toordinal())
+
+
+class Candidato:
+    """Horário candidato compacto: dia + hora + scores, sem strings formatadas"""
+
+    __slots__ = ("dia", "hora", "texto_hora", "score_base", "ordem_dia", "teto", "score", "score_dia", "dados")
+
+    def __init__(
+        self,
+        dia: datetime,
+        hora: int,
+        texto_hora: Optional[str] = None,
+        score_base: float = 0,
+        ordem_dia: int = 0,  # posição do dia na varredura (0 = mais próximo)
+        teto: Tuple = (),
+        dados: Any = None,
+    ):
+        self.dia = dia
+        self.hora = hora
+        self.texto_hora = texto_hora or TEXTO_FAIXA[hora]
+        self.score_base = score_base
+        self.ordem_dia = ordem_dia
+        self.teto = teto
+        self.score = 0
+        self.score_dia = 0
+        self.dados = dados
+
+    def __repr__(self) -> str:
+        return f"Candidato({self.data_str} {self.hora}h, score={self.score}, teto={self.teto})"
+
+    @property
+    def horario(self) -> datetime:
+        return self.dia.replace(hour=self.hora, minute=0, second=0, microsecond=0)
+
+    @property
+    def data_str(self) -> str:
+        return rotulos_dia(self.dia).iso
+
+
+def chave_proximidade(candidato: Candidato) -> Tuple:
+    return (-candidato.ordem_dia, candidato.score - candidato.score_dia)
+
+
+def chave_score(candidato: Candidato) -> Tuple:
+    return (candidato.score, -candidato.ordem_dia)
+
+
+@dataclass
+class EstrategiaBusca:
+    nome: str
+    candidatos: Iterable[Candidato]
+    pontuar: Callable[[Candidato, float], Awaitable[Optional[float]]]
+    formatar: Callable[[Candidato], Dict[str, Any]]
+    avaliar_dia: Optional[Callable[[datetime], Awaitable[Optional[float]]]] = None
+    chave: Callable[[Candidato], Tuple] = chave_proximidade
+    # Ordem de apresentação: por score (maior primeiro) ou pela própria chave
+    ordenar_por_score: bool = True
+
+
+def candidatos_por_dia(
+    inicio: datetime,
+    max_dias: int,
+    faixas: Sequence[Dict[str, Any]],
+    teto_extra: float = 0,
+    dias_uteis: bool = False,
+) -> Iterator[Candidato]:
+    """
+    Candidatos para as faixas de horário de cada dia útil, do mais próximo ao mais distante.
+    max_dias: dias corridos a partir de inicio, ou dias úteis com dias_uteis=True.
+    faixas: {"hora", "texto", "score"}; teto para chave_proximidade = (-dia, score da faixa + teto_extra),
+    com teto_extra cobrindo os bônus por faixa (urgência, por exemplo)
+    """
+    cal = calendario()
+    faixas = [
+        (faixa["hora"], faixa.get("texto"), faixa.get("score", 0))
+        for faixa in sorted(faixas, key=lambda f: f.get("score", 0), reverse=True)
+    ]
+    if dias_uteis:
+        dias = cal.dias_uteis(inicio, max_dias)
+    else:
+        dias = [dia for dia in (inicio.date() + timedelta(days=offset) for offset in range(max_dias)) if cal.dia_util(dia)]
+    data_inicio = inicio.date()
+    for ordem_dia, data in enumerate(dias):
+        dia = inicio + timedelta(days=(data - data_inicio).days)
+        mascara = cal.horas(data)
+        for hora, texto, score_base in faixas:
+            if mascara >> hora & 1:
+                yield Candidato(dia, hora, texto, score_base, ordem_dia, (-ordem_dia, score_base + teto_extra))
+
+
+def formatar_horario(candidato: Candidato, horario_dt: Optional[datetime] = None, sufixo: str = "", **extras) -> Dict[str, Any]:
+    """Dict de horário no formato da ETAPA 1 (texto, datetime_agendamento, dia_semana, hora_agendamento)"""
+    horario_dt = horario_dt or candidato.horario
+    data_formatada = rotulos_dia(horario_dt).por_extenso
+    horario = {
+        "texto": f"Previsão de chegada entre {candidato.texto_hora} - {data_formatada}{sufixo}",
+        "datetime_agendamento": horario_dt.isoformat(),
+        "dia_semana": data_formatada,
+        "hora_agendamento": HORA_AGENDAMENTO[candidato.hora],
+    }
+    horario.update(extras)
+    return horario
+
+
+async def buscar_melhores_horarios(estrategia: EstrategiaBusca, k: int = 3) -> List[Dict[str, Any]]:
+    """
+    🎯 Os k melhores horários da estratégia, com parada antecipada pelo teto
+    """
+    # Heap mínimo de (chave, -sequência, candidato): a raiz é o pior dos k
+    melhores: List[Tuple[Tuple, int, Candidato]] = []
+    dias: Dict[int, Optional[float]] = {}
+    avaliados = 0
+    parada_antecipada = False
+    sem_prazo = False
+
+    for sequencia, candidato in enumerate(estrategia.candidatos):
+        if len(melhores) >= k and candidato.teto <= melhores[0][0]:
+            parada_antecipada = True
+            break
+        # ⏱️ Cada candidato custa I/O (dia e disponibilidade): sem prazo, ficam os melhores até aqui
+        if prazo_esgotado(estrategia.nome):
+            sem_prazo = True
+            break
+
+        ordinal = candidato.dia.toordinal()
+        if ordinal not in dias:
+            dias[ordinal] = await estrategia.avaliar_dia(candidato.dia) if estrategia.avaliar_dia else 0.0
+        score_dia = dias[ordinal]
+        if score_dia is None:
+            continue
+
+        avaliados += 1
+        score = await estrategia.pontuar(candidato, score_dia)
+        if score is None:
+            continue
+        candidato.score = score
+        candidato.score_dia = score_dia
+
+        entrada = (estrategia.chave(candidato), -sequencia, candidato)
+        if len(melhores) < k:
+            heapq.heappush(melhores, entrada)
+        elif entrada[:2] > melhores[0][:2]:
+            heapq.heapreplace(melhores, entrada)
+
+    vencedores = [candidato for _, _, candidato in sorted(melhores, key=lambda e: e[:2], reverse=True)]
+    if estrategia.ordenar_por_score:
+        vencedores.sort(key=lambda c: c.score, reverse=True)
+
+    candidatos_avaliados.inc(estrategia.nome, "evaluated", valor=avaliados)
+    if parada_antecipada:
+        candidatos_avaliados.inc(estrategia.nome, "early_stop")
+    if sem_prazo:
+        candidatos_avaliados.inc(estrategia.nome, "deadline")
+        logger.warning(
+            "⏱️ Motor %s: prazo da requisição esgotado após %s candidatos - %s horários parciais",
+            estrategia.nome, avaliados, len(vencedores)
+        )
+    logger.debug(
+        "🎯 Motor %s: %s candidatos avaliados em %s dias, %s vencedores%s",
+        estrategia.nome, avaliados, len(dias), len(vencedores), " (parada antecipada)" if parada_antecipada else ""
+    )
+
+    horarios = []
+    for numero, candidato in enumerate(vencedores, 1):
+        horarios.append({"numero": numero, **estrategia.formatar(candidato)})
+    return horarios
@@ -0,0 +1,266 @@
+"""
+📊 Orçamento de consultas por requisição
+
+Envolve o cliente Supabase para contar consultas, linhas e milissegundos de cada
+requisição (via contextvar), detectar N+1 (mesma tabela consultada mais de K vezes)
+e, opcionalmente, falhar quando um orçamento configurado é excedido (útil em testes).
+
+Uso em testes:
+    with medir_consultas(max_consultas=30) as estatisticas:
+        await consultar_disponibilidade_interna(data)
+"""
+
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from disjuntores import Disjuntor, DisjuntorAberto
+from leituras_resilientes import LeiturasResilientes
+
+logger = logging.getLogger(__name__)
+
+# Mesma tabela consultada mais vezes que isso em uma requisição = suspeita de N+1
+LIMITE_CONSULTAS_POR_TABELA = int(os.getenv("QUERY_STATS_LIMITE_TABELA", "5"))
+
+
+class OrcamentoConsultasExcedido(Exception):
+    """Requisição excedeu o orçamento de consultas configurado"""
+
+
+class EstatisticasConsultas:
+    """Contadores de consultas de uma requisição"""
+
+    def __init__(self, max_consultas: Optional[int] = None, max_linhas: Optional[int] = None,
+                 max_ms: Optional[float] = None, estrito: bool = False):
+        self.consultas = 0
+        self.linhas = 0
+        self.ms = 0.0
+        self.erros = 0
+        self.por_tabela: Dict[str, int] = {}
+        self.max_consultas = max_consultas
+        self.max_linhas = max_linhas
+        self.max_ms = max_ms
+        # Estrito: a requisição que exceder o orçamento responde 500 (para falhar testes de integração)
+        self.estrito = estrito
+
+    def registrar(self, tabela: str, linhas: int, ms: float, erro: bool = False) -> None:
+        self.consultas += 1
+        self.linhas += linhas
+        self.ms += ms
+        if erro:
+            self.erros += 1
+        self.por_tabela[tabela] = self.por_tabela.get(tabela, 0) + 1
+
+        if self.por_tabela[tabela] == LIMITE_CONSULTAS_POR_TABELA + 1:
+            logger.warning(f"⚠️ Possível N+1: tabela '{tabela}' consultada mais de {LIMITE_CONSULTAS_POR_TABELA} vezes na mesma requisição")
+
+    def tabelas_n_mais_1(self) -> Dict[str, int]:
+        return {tabela: total for tabela, total in self.por_tabela.items() if total > LIMITE_CONSULTAS_POR_TABELA}
+
+    def orcamento_excedido(self) -> list:
+        excedidos = []
+        if self.max_consultas is not None and self.consultas > self.max_consultas:
+            excedidos.append(f"consultas={self.consultas}>{self.max_consultas}")
+        if self.max_linhas is not None and self.linhas > self.max_linhas:
+            excedidos.append(f"linhas={self.linhas}>{self.max_linhas}")
+        if self.max_ms is not None and self.ms > self.max_ms:
+            excedidos.append(f"ms={round(self.ms, 1)}>{self.max_ms}")
+        return excedidos
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "consultas": self.consultas,
+            "linhas": self.linhas,
+            "ms": round(self.ms, 1),
+            "erros": self.erros,
+            "por_tabela": dict(self.por_tabela),
+            "n_mais_1": self.tabelas_n_mais_1(),
+        }
+
+    def cabecalho(self) -> str:
+        """Valor compacto para o header X-Query-Stats"""
+        tabelas = ",".join(f"{tabela}:{total}" for tabela, total in sorted(self.por_tabela.items()))
+        return f"queries={self.consultas}; rows={self.linhas}; ms={round(self.ms, 1)}; tables={tabelas}"
+
+
+_estatisticas_atuais: contextvars.ContextVar[Optional[EstatisticasConsultas]] = contextvars.ContextVar(
+    "estatisticas_consultas", default=None
+)
+
+
+def _valor_env(nome: str, tipo=int):
+    valor = os.getenv(nome)
+    return tipo(valor) if valor else None
+
+
+def iniciar_requisicao() -> contextvars.Token:
+    """Começa a contagem para a requisição atual usando o orçamento do ambiente (QUERY_BUDGET_*)"""
+    estatisticas = EstatisticasConsultas(
+        max_consultas=_valor_env("QUERY_BUDGET_CONSULTAS"),
+        max_linhas=_valor_env("QUERY_BUDGET_LINHAS"),
+        max_ms=_valor_env("QUERY_BUDGET_MS", float),
+        estrito=os.getenv("QUERY_BUDGET_ESTRITO", "").lower() in ("1", "true", "sim"),
+    )
+    return _estatisticas_atuais.set(estatisticas)
+
+
+def finalizar_requisicao(token: contextvars.Token) -> Optional[EstatisticasConsultas]:
+    estatisticas = _estatisticas_atuais.get()
+    _estatisticas_atuais.reset(token)
+    return estatisticas
+
+
+def estatisticas_atuais() -> Optional[EstatisticasConsultas]:
+    return _estatisticas_atuais.get()
+
+
+@contextmanager
+def medir_consultas(max_consultas: Optional[int] = None, max_linhas: Optional[int] = None,
+                    max_ms: Optional[float] = None):
+    """
+    Mede as consultas feitas dentro do bloco e levanta OrcamentoConsultasExcedido
+    ao sair se algum limite for ultrapassado.
+    """
+    estatisticas = EstatisticasConsultas(max_consultas, max_linhas, max_ms)
+    token = _estatisticas_atuais.set(estatisticas)
+    try:
+        yield estatisticas
+    finally:
+        _estatisticas_atuais.reset(token)
+    excedidos = estatisticas.orcamento_excedido()
+    if excedidos:
+        raise OrcamentoConsultasExcedido(f"Orçamento de consultas excedido: {', '.join(excedidos)} - {estatisticas.resumo()}")
+
+
+# Funções (tabela, ms, erro) chamadas a cada consulta, com ou sem requisição em andamento
+_observadores: List[Callable[[str, float, bool], None]] = []
+
+
+def registrar_observador(observador: Callable[[str, float, bool], None]) -> None:
+    """Registra um observador global de consultas (ex.: histograma de métricas)"""
+    _observadores.append(observador)
+
+
+def _notificar_observadores(tabela: str, ms: float, erro: bool) -> None:
+    for observador in _observadores:
+        try:
+            observador(tabela, ms, erro)
+        except Exception as e:
+            logger.debug(f"Observador de consultas falhou: {e}")
+
+
+def _falha_da_dependencia(erro: Exception) -> bool:
+    """APIError = o PostgREST respondeu (consulta inválida, constraint): não conta para o disjuntor"""
+    return type(erro).__name__ != "APIError"
+
+
+# Métodos do builder que definem o tipo da consulta: só leituras recebem novas tentativas/hedge
+_LEITURAS = frozenset({"select"})
+_ESCRITAS = frozenset({"insert", "upsert", "update", "delete"})
+
+
+class _ConsultaInstrumentada:
+    """
+    Proxy de um request builder do PostgREST que mede o execute(); passa pelo disjuntor e,
+    nas leituras, pela política de novas tentativas/hedge do cliente, se houver
+    """
+
+    __slots__ = ("_builder", "_tabela", "_cliente", "_leitura")
+
+    def __init__(self, builder, tabela: str, cliente: "ClienteInstrumentado", leitura: bool = False):
+        self._builder = builder
+        self._tabela = tabela
+        self._cliente = cliente
+        self._leitura = leitura
+
+    def _chamar(self, *args, **kwargs):
+        """Uma ida ao PostgREST, registrada no disjuntor"""
+        disjuntor = self._cliente.disjuntor
+        if disjuntor is None:
+            return self._builder.execute(*args, **kwargs)
+        if not disjuntor.permitir():
+            raise DisjuntorAberto(disjuntor.nome)
+        inicio = time.perf_counter()
+        try:
+            resposta = self._builder.execute(*args, **kwargs)
+        except Exception as e:
+            disjuntor.registrar((time.perf_counter() - inicio) * 1000, erro=_falha_da_dependencia(e),
+                                detalhe=str(e) or type(e).__name__)
+            raise
+        except BaseException:
+            disjuntor.liberar()
+            raise
+        disjuntor.registrar((time.perf_counter() - inicio) * 1000)
+        return resposta
+
+    def execute(self, *args, **kwargs):
+        estatisticas = _estatisticas_atuais.get()
+        leituras = self._cliente.leituras if self._leitura else None
+        if estatisticas is None and not _observadores and self._cliente.disjuntor is None and leituras is None:
+            return self._builder.execute(*args, **kwargs)
+
+        inicio = time.perf_counter()
+        try:
+            if leituras is not None:
+                resposta = leituras.executar(self._tabela, lambda: self._chamar(*args, **kwargs))
+            else:
+                resposta = self._chamar(*args, **kwargs)
+        except Exception:
+            ms = (time.perf_counter() - inicio) * 1000
+            if estatisticas is not None:
+                estatisticas.registrar(self._tabela, 0, ms, erro=True)
+            _notificar_observadores(self._tabela, ms, True)
+            raise
+        ms = (time.perf_counter() - inicio) * 1000
+        if estatisticas is not None:
+            dados = getattr(resposta, "data", None)
+            linhas = len(dados) if isinstance(dados, list) else (1 if dados else 0)
+            estatisticas.registrar(self._tabela, linhas, ms)
+        _notificar_observadores(self._tabela, ms, False)
+        return resposta
+
+    def __getattr__(self, nome: str):
+        atributo = getattr(self._builder, nome)
+        if callable(atributo):
+            leitura = True if nome in _LEITURAS else False if nome in _ESCRITAS else self._leitura
+
+            def encadear(*args, **kwargs):
+                resultado = atributo(*args, **kwargs)
+                if hasattr(resultado, "execute"):
+                    return _ConsultaInstrumentada(resultado, self._tabela, self._cliente, leitura)
+                return resultado
+            return encadear
+        if hasattr(atributo, "execute"):
+            # Propriedades como .not_ devolvem outro builder
+            return _ConsultaInstrumentada(atributo, self._tabela, self._cliente, self._leitura)
+        return atributo
+
+
+class ClienteInstrumentado:
+    """Proxy do cliente Supabase: table()/from_()/rpc() passam a ser medidos"""
+
+    def __init__(self, cliente, disjuntor: Optional[Disjuntor] = None, leituras: Optional[LeiturasResilientes] = None):
+        self._cliente = cliente
+        self.disjuntor = disjuntor
+        self.leituras = leituras
+
+    def table(self, nome: str):
+        return _ConsultaInstrumentada(self._cliente.table(nome), nome, self)
+
+    def from_(self, nome: str):
+        return _ConsultaInstrumentada(self._cliente.from_(nome), nome, self)
+
+    def rpc(self, funcao: str, *args, **kwargs):
+        # RPC pode escrever: nunca repetida
+        return _ConsultaInstrumentada(self._cliente.rpc(funcao, *args, **kwargs), f"rpc:{funcao}", self)
+
+    def __getattr__(self, nome: str):
+        return getattr(self._cliente, nome)
+
+
+def instrumentar_cliente(cliente, disjuntor: Optional[Disjuntor] = None,
+                         leituras: Optional[LeiturasResilientes] = None) -> ClienteInstrumentado:
+    return ClienteInstrumentado(cliente, disjuntor, leituras)
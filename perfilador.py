@@ -0,0 +1,293 @@
+"""
+🔬 Perfilador sob demanda por requisição
+
+Ativado por requisição com o header `X-Perfilar: <PERFILADOR_TOKEN>` ou por
+amostragem (PERFILADOR_AMOSTRAGEM=0.01 = 1% das requisições). Dois modos:
+
+- amostragem (padrão): uma thread lê, a cada PERFILADOR_INTERVALO_MS, a cadeia de
+  corrotinas da task que executa o endpoint. Como a cadeia é lida também com a
+  task suspensa, o tempo de parede fica atribuído à linha do `await` em que ela
+  esperava (banco, to_thread, Nominatim...), e não só ao tempo de CPU.
+- cprofile (`X-Perfilar-Modo: cprofile`): cProfile determinístico durante a
+  requisição. Conta tudo que rodar na thread do event loop nesse intervalo,
+  inclusive outras requisições; um por vez.
+
+Os últimos PERFILADOR_CAPACIDADE perfis ficam em memória e são servidos em pilhas
+colapsadas (entrada do flamegraph.pl / speedscope) pelo endpoint administrativo.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import io
+import itertools
+import logging
+import os
+import pstats
+import random
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER_GATILHO = "x-perfilar"
+HEADER_MODO = "x-perfilar-modo"
+MODOS = ("amostragem", "cprofile")
+
+_DIRETORIOS_BIBLIOTECA = tuple(
+    caminho for caminho in {sysconfig.get_paths().get("stdlib"), sysconfig.get_paths().get("purelib")} if caminho
+)
+
+
+def rotulo_quadro(quadro) -> str:
+    codigo = quadro.f_code
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{quadro.f_lineno})"
+
+
+def _e_biblioteca(quadro) -> bool:
+    return quadro.f_code.co_filename.startswith(_DIRETORIOS_BIBLIOTECA)
+
+
+def pilha_tarefa(tarefa: asyncio.Task, quadro_thread=None) -> List[str]:
+    """
+    Pilha (da raiz para a folha) de uma task, seguindo cr_await de corrotina em corrotina.
+    Se a task estiver executando agora na thread do loop, completa com as funções
+    síncronas chamadas a partir da corrotina mais interna.
+    """
+    quadros = []
+    folha = None
+    aguardando = tarefa.get_coro()
+    while aguardando is not None:
+        quadro = getattr(aguardando, "cr_frame", None) or getattr(aguardando, "gi_frame", None) \
+            or getattr(aguardando, "ag_frame", None)
+        if quadro is None:
+            # Future (ou outro objeto) sem frame: é o ponto final da espera
+            folha = f"<{type(aguardando).__name__}>"
+            break
+        quadros.append(quadro)
+        aguardando = getattr(aguardando, "cr_await", None) or getattr(aguardando, "gi_yieldfrom", None) \
+            or getattr(aguardando, "ag_await", None)
+
+    if not quadros:
+        return []
+
+    sincronos = []
+    if quadro_thread is not None and folha is None:
+        pilha_thread = []
+        while quadro_thread is not None:
+            if quadro_thread is quadros[-1]:
+                sincronos = list(reversed(pilha_thread))
+                break
+            pilha_thread.append(quadro_thread)
+            quadro_thread = quadro_thread.f_back
+
+    # Quadros do framework (starlette/anyio/fastapi) entre quadros da aplicação são omitidos;
+    # depois do último quadro da aplicação ficam todos (ex.: httpx, asyncio.sleep)
+    quadros += sincronos
+    ultimo_app = max((i for i, q in enumerate(quadros) if not _e_biblioteca(q)), default=-1)
+    pilha = [
+        rotulo_quadro(q) for i, q in enumerate(quadros)
+        if i > ultimo_app or not (_e_biblioteca(q) or q.f_code.co_filename == __file__)
+    ]
+    if folha:
+        pilha.append(folha)
+    return pilha
+
+
+class PerfilRequisicao:
+    def __init__(self, identificador: str, metodo: str, caminho: str, modo: str, intervalo_ms: float):
+        self.id = identificador
+        self.metodo = metodo
+        self.caminho = caminho
+        self.rota: Optional[str] = None
+        self.modo = modo
+        self.intervalo_ms = intervalo_ms
+        self.inicio = time.time()
+        self.duracao_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.amostras: Counter = Counter()
+        self.estatisticas_cprofile: Optional[str] = None
+
+    def colapsado(self) -> str:
+        """Formato 'a;b;c N' (uma pilha por linha), pronto para flamegraph.pl"""
+        return "\n".join(f"{pilha} {total}" for pilha, total in self.amostras.most_common()) + "\n"
+
+    def atribuicao(self, funcoes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Tempo estimado por ponto de espera (linha) dentro das funções de interesse:
+        cada amostra conta para o quadro mais interno de uma dessas funções.
+        """
+        funcoes = set(funcoes)
+        total = sum(self.amostras.values())
+        pontos: Counter = Counter()
+        for pilha, quantidade in self.amostras.items():
+            for quadro in reversed(pilha.split(";")):
+                if quadro.split(" (", 1)[0] in funcoes:
+                    pontos[quadro] += quantidade
+                    break
+        return {
+            ponto: {
+                "ms": round(quantidade * self.intervalo_ms, 1),
+                "percentual": round(100 * quantidade / total, 1) if total else 0.0,
+            }
+            for ponto, quantidade in pontos.most_common()
+        }
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "metodo": self.metodo,
+            "caminho": self.caminho,
+            "rota": self.rota,
+            "modo": self.modo,
+            "inicio": self.inicio,
+            "duracao_ms": self.duracao_ms,
+            "status": self.status,
+            "amostras": sum(self.amostras.values()),
+        }
+
+
+class Perfilador:
+    """
+    🔬 Coordena os perfis ativos, a thread de amostragem e o buffer circular
+    dos perfis concluídos.
+    """
+
+    def __init__(self, token: Optional[str] = None, amostragem: Optional[float] = None,
+                 intervalo_ms: Optional[float] = None, capacidade: Optional[int] = None,
+                 funcoes_atribuidas: Iterable[str] = ()):
+        self.token = token if token is not None else os.getenv("PERFILADOR_TOKEN", "")
+        self.amostragem = amostragem if amostragem is not None else float(os.getenv("PERFILADOR_AMOSTRAGEM", "0"))
+        self.intervalo_ms = intervalo_ms if intervalo_ms is not None else float(os.getenv("PERFILADOR_INTERVALO_MS", "5"))
+        capacidade = capacidade if capacidade is not None else int(os.getenv("PERFILADOR_CAPACIDADE", "20"))
+        self.funcoes_atribuidas = tuple(funcoes_atribuidas)
+        self.perfis: Deque[PerfilRequisicao] = deque(maxlen=capacidade)
+
+        self._ativos: Dict[str, Tuple[asyncio.Task, PerfilRequisicao, int]] = {}
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._trava = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._sequencia = itertools.count(1)
+
+    def autorizado(self, token: Optional[str]) -> bool:
+        return bool(self.token) and bool(token) and hmac.compare_digest(token, self.token)
+
+    def modo_requisicao(self, headers: Dict[str, str]) -> Optional[str]:
+        """Modo de perfil da requisição, ou None para não perfilar"""
+        if self.autorizado(headers.get(HEADER_GATILHO)):
+            modo = headers.get(HEADER_MODO, "amostragem").lower()
+            return modo if modo in MODOS else "amostragem"
+        if self.amostragem > 0 and random.random() < self.amostragem:
+            return "amostragem"
+        return None
+
+    # ------------------------------------------------------------------
+    # Ciclo de um perfil
+    # ------------------------------------------------------------------
+    def iniciar(self, metodo: str, caminho: str, modo: str) -> PerfilRequisicao:
+        if modo == "cprofile" and self._cprofile is not None:
+            modo = "amostragem"
+        perfil = PerfilRequisicao(f"{int(time.time())}-{next(self._sequencia)}", metodo, caminho, modo, self.intervalo_ms)
+
+        if modo == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+            return perfil
+
+        tarefa = asyncio.current_task()
+        if tarefa is None:
+            return perfil
+        with self._trava:
+            self._ativos[perfil.id] = (tarefa, perfil, threading.get_ident())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._amostrar, name="perfilador", daemon=True)
+                self._thread.start()
+        return perfil
+
+    def finalizar(self, perfil: PerfilRequisicao, status: Optional[int], rota: Optional[str] = None) -> None:
+        perfil.duracao_ms = round((time.time() - perfil.inicio) * 1000, 1)
+        perfil.status = status
+        perfil.rota = rota
+
+        if perfil.modo == "cprofile" and self._cprofile is not None:
+            self._cprofile.disable()
+            saida = io.StringIO()
+            pstats.Stats(self._cprofile, stream=saida).sort_stats("cumulative").print_stats(40)
+            perfil.estatisticas_cprofile = saida.getvalue()
+            self._cprofile = None
+        else:
+            with self._trava:
+                self._ativos.pop(perfil.id, None)
+
+        self.perfis.append(perfil)
+        logger.info(f"🔬 Perfil {perfil.id} ({perfil.modo}) {perfil.metodo} {perfil.caminho}: "
+                    f"{perfil.duracao_ms}ms, {sum(perfil.amostras.values())} amostras")
+
+    def _amostrar(self) -> None:
+        intervalo = self.intervalo_ms / 1000
+        while True:
+            with self._trava:
+                if not self._ativos:
+                    self._thread = None
+                    return
+                ativos = list(self._ativos.values())
+            quadros = sys._current_frames()
+            for tarefa, perfil, thread_id in ativos:
+                try:
+                    pilha = pilha_tarefa(tarefa, quadros.get(thread_id))
+                except Exception as e:
+                    logger.debug(f"Falha ao amostrar perfil {perfil.id}: {e}")
+                    continue
+                if pilha:
+                    perfil.amostras[";".join(pilha)] += 1
+            del quadros
+            time.sleep(intervalo)
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    def listar(self) -> List[Dict[str, Any]]:
+        return [perfil.resumo() for perfil in reversed(self.perfis)]
+
+    def obter(self, identificador: str) -> Optional[PerfilRequisicao]:
+        return next((perfil for perfil in self.perfis if perfil.id == identificador), None)
+
+
+class MiddlewarePerfilador:
+    """
+    Middleware ASGI puro. Precisa ficar por dentro dos middlewares @app.middleware("http"):
+    cada um deles executa o restante da cadeia em outra task, e a amostragem segue
+    a task em que este middleware roda (a mesma do endpoint).
+    """
+
+    def __init__(self, app, perfilador: Perfilador):
+        self.app = app
+        self.perfilador = perfilador
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {chave.decode("latin-1").lower(): valor.decode("latin-1") for chave, valor in scope.get("headers", [])}
+        modo = self.perfilador.modo_requisicao(headers)
+        if modo is None:
+            return await self.app(scope, receive, send)
+
+        perfil = self.perfilador.iniciar(scope["method"], scope["path"], modo)
+        status = None
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                mensagem = {**mensagem, "headers": list(mensagem.get("headers", [])) + [(b"x-perfil-id", perfil.id.encode())]}
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            self.perfilador.finalizar(perfil, status, getattr(scope.get("route"), "path", None))
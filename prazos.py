@@ -0,0 +1,100 @@
+"""
+⏱️ Prazo (deadline) da requisição
+
+O webhook do ClienteChat tem timeout fixo: uma busca de horários que passa dele vira
+conversa sem resposta, quando poderia ter respondido com menos opções. O middleware HTTP
+abre um prazo por requisição (contextvar, herdado pelas tasks do asyncio.gather) e cada
+etapa da busca consulta o que resta:
+- o motor de horários para de avaliar candidatos e devolve os melhores até ali
+- fallbacks e buscas extras são pulados
+
+Quem esgotou o prazo fica registrado no próprio Prazo (parcial=True, etapas) e na
+métrica request_deadline_exhausted_total. Sem prazo aberto (tarefas em segundo plano,
+scripts), nada é interrompido.
+
+Uso em scripts e testes:
+    with prazo(0.5) as p:
+        horarios = await gerar_horarios_proximas_datas_disponiveis(tecnico_id)
+    p.parcial
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+from metricas import registro
+
+prazos_esgotados = registro.contador(
+    "request_deadline_exhausted_total", "Etapas interrompidas por fim do prazo da requisição", ("stage",)
+)
+
+
+class Prazo:
+    """Limite de tempo de uma requisição e as etapas que pararam por ele"""
+
+    __slots__ = ("inicio", "limite", "parcial", "etapas")
+
+    def __init__(self, segundos: float):
+        self.inicio = time.monotonic()
+        self.limite = self.inicio + segundos
+        self.parcial = False
+        self.etapas: List[str] = []
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+    def esgotado(self, etapa: str, reserva: float = 0.0) -> bool:
+        """True se restam menos de `reserva` segundos; a primeira parada de cada etapa é registrada"""
+        if self.restante() > reserva:
+            return False
+        self.parcial = True
+        if etapa not in self.etapas:
+            self.etapas.append(etapa)
+            prazos_esgotados.inc(etapa)
+        return True
+
+    def resumo(self) -> dict:
+        return {
+            "parcial": self.parcial,
+            "etapas_interrompidas": list(self.etapas),
+            "ms_restantes": round(self.restante() * 1000, 1),
+        }
+
+
+_prazo_atual: contextvars.ContextVar[Optional[Prazo]] = contextvars.ContextVar("prazo_requisicao", default=None)
+
+
+def iniciar_prazo(segundos: Optional[float]) -> contextvars.Token:
+    """Abre o prazo da requisição atual (None ou <= 0 = sem prazo)"""
+    return _prazo_atual.set(Prazo(segundos) if segundos and segundos > 0 else None)
+
+
+def finalizar_prazo(token: contextvars.Token) -> Optional[Prazo]:
+    atual = _prazo_atual.get()
+    _prazo_atual.reset(token)
+    return atual
+
+
+def prazo_atual() -> Optional[Prazo]:
+    return _prazo_atual.get()
+
+
+def prazo_esgotado(etapa: str, reserva: float = 0.0) -> bool:
+    """Sem prazo aberto, nunca esgota"""
+    atual = _prazo_atual.get()
+    return atual is not None and atual.esgotado(etapa, reserva)
+
+
+def resultado_parcial() -> bool:
+    atual = _prazo_atual.get()
+    return atual is not None and atual.parcial
+
+
+@contextmanager
+def prazo(segundos: float):
+    token = iniciar_prazo(segundos)
+    try:
+        yield _prazo_atual.get()
+    finally:
+        finalizar_prazo(token)
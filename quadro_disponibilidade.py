@@ -0,0 +1,309 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (technician_id, grupo_logistico, tipo_atendimento, urgente)
+ChaveQuadro = Tuple[str, str, str, bool]
+
+
+class QuadroDisponibilidade:
+    """
+    📋 Quadro de disponibilidade pré-calculado em segundo plano.
+
+    Mantém, para cada (técnico, grupo, tipo de atendimento, urgência), os
+    próximos horários livres já ordenados. A ETAPA 1 lê do quadro em memória;
+    a ETAPA 2 continua fazendo a verificação exata do horário escolhido.
+
+    Com um armazenamento compartilhado (estado_compartilhado.py) as entradas ficam
+    nele: o worker líder atualiza e todos os workers leem as mesmas entradas. Também
+    ficam nele, como conjuntos, o índice das chaves gravadas, as chaves pedidas (demanda)
+    e as invalidações: o líder atende o que os outros workers pedem e invalidam.
+    """
+
+    CONJUNTO_CHAVES = "chaves"
+    CONJUNTO_DEMANDA = "demanda"
+    CONJUNTO_INVALIDACOES = "invalidacoes"
+    TODOS = "*"
+
+    def __init__(
+        self,
+        calcular: Callable[[ChaveQuadro, int], Awaitable[List[Dict[str, Any]]]],
+        listar_chaves: Callable[[], Awaitable[Iterable[ChaveQuadro]]],
+        intervalo: int = 60,
+        validade: int = 180,
+        tamanho: int = 6,
+        janela_demanda: int = 2 * 60 * 60,
+        em_thread: bool = True,
+        armazenamento=None,
+        tolerancia_vencida: int = 30 * 60,
+        verificar_invalidacoes: float = 2.0,
+    ):
+        """
+        Args:
+            calcular: Corrotina que calcula os horários de uma chave
+            listar_chaves: Corrotina com as chaves mantidas sempre aquecidas
+            intervalo: Segundos entre atualizações completas
+            validade: Idade máxima (segundos) de uma entrada para ser servida
+            tamanho: Quantidade de horários guardados por chave
+            janela_demanda: Por quanto tempo uma chave pedida continua sendo atualizada
+            em_thread: Atualizar fora do event loop principal
+            armazenamento: get/set/delete compartilhado entre workers (None = só memória do processo)
+            tolerancia_vencida: Por quanto tempo além da validade uma entrada ainda pode ser
+                servida em modo degradado (Supabase fora, ver obter(aceitar_vencida=True))
+            verificar_invalidacoes: Com armazenamento, segundos entre consultas às invalidações
+                publicadas pelos outros workers
+        """
+        self._calcular = calcular
+        self._listar_chaves = listar_chaves
+        self.intervalo = intervalo
+        self.validade = validade
+        self.tamanho = tamanho
+        self.janela_demanda = janela_demanda
+        self.em_thread = em_thread
+        self.armazenamento = armazenamento
+        self.tolerancia_vencida = tolerancia_vencida
+        self.verificar_invalidacoes = verificar_invalidacoes
+
+        self._entradas: Dict[ChaveQuadro, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._demanda: Dict[ChaveQuadro, float] = {}
+        # Última publicação de cada chave na demanda compartilhada (evita uma escrita por leitura)
+        self._demanda_publicada: Dict[ChaveQuadro, float] = {}
+        self._tecnicos_pendentes: set = set()
+        self._evento: Optional[asyncio.Event] = None
+        self._tarefa: Optional[asyncio.Task] = None
+        self.estatisticas = {
+            "hits": 0,
+            "misses": 0,
+            "atualizacoes": 0,
+            "erros": 0,
+            "vencidas_servidas": 0,
+            "ultima_atualizacao": None,
+            "duracao_ultima_ms": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _chave_texto(chave: ChaveQuadro) -> str:
+        return json.dumps(list(chave))
+
+    def _ler(self, chave: ChaveQuadro) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        if self.armazenamento is None:
+            return self._entradas.get(chave)
+        return self.armazenamento.get(self._chave_texto(chave))
+
+    def _gravar(self, chave: ChaveQuadro, entrada: Tuple[float, List[Dict[str, Any]]]) -> None:
+        if self.armazenamento is None:
+            self._entradas[chave] = entrada
+            return
+        texto = self._chave_texto(chave)
+        self.armazenamento.set(texto, entrada, self.validade + self.tolerancia_vencida)
+        # Índice das chaves: remover_horario precisa alcançar entradas gravadas por outros workers
+        self.armazenamento.adicionar(self.CONJUNTO_CHAVES, texto, self.validade + self.tolerancia_vencida)
+
+    def _chaves_gravadas(self) -> List[ChaveQuadro]:
+        if self.armazenamento is None:
+            return list(self._entradas)
+        return [tuple(json.loads(texto)) for texto in self.armazenamento.membros(self.CONJUNTO_CHAVES)]
+
+    def _registrar_demanda(self, chave: ChaveQuadro) -> None:
+        agora = time.time()
+        self._demanda[chave] = agora
+        if self.armazenamento is None or agora - self._demanda_publicada.get(chave, 0) < self.intervalo:
+            return
+        self._demanda_publicada[chave] = agora
+        self.armazenamento.adicionar(self.CONJUNTO_DEMANDA, self._chave_texto(chave), self.janela_demanda)
+
+    def obter(self, chave: ChaveQuadro, aceitar_vencida: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        Horários da chave (cópias) ou None se ausente/expirada.
+        aceitar_vencida: serve a última entrada mesmo expirada (até tolerancia_vencida);
+        usado com o Supabase fora do ar, quando recalcular não é possível.
+        """
+        self._registrar_demanda(chave)
+        entrada = self._ler(chave)
+        idade = time.time() - entrada[0] if entrada is not None else None
+        if entrada is None or idade > self.validade + (self.tolerancia_vencida if aceitar_vencida else 0):
+            self.estatisticas["misses"] += 1
+            return None
+        if idade > self.validade:
+            self.estatisticas["vencidas_servidas"] += 1
+        self.estatisticas["hits"] += 1
+        return [dict(horario) for horario in entrada[1]]
+
+    def salvar(self, chave: ChaveQuadro, horarios: List[Dict[str, Any]]) -> None:
+        self._gravar(chave, (time.time(), [dict(horario) for horario in horarios[:self.tamanho]]))
+
+    def limpar(self) -> None:
+        """Descarta todas as entradas (próximas leituras calculam na hora)"""
+        self._entradas.clear()
+        self._demanda_publicada.clear()
+        if self.armazenamento is not None:
+            self.armazenamento.clear()
+
+    # ------------------------------------------------------------------
+    # Escritas no calendário
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _instante(valor: Optional[str]) -> Optional[float]:
+        try:
+            return datetime.fromisoformat(valor.replace("Z", "+00:00")).timestamp()
+        except Exception:
+            return None
+
+    def remover_horario(self, technician_id: str, datetime_agendamento: str) -> None:
+        """Retira imediatamente um horário recém-ocupado de todas as chaves do técnico"""
+        # Comparar instantes: o mesmo horário pode vir em fusos diferentes (-03:00 / +00:00)
+        alvo = self._instante(datetime_agendamento)
+        for chave in self._chaves_gravadas():
+            if chave[0] != technician_id:
+                continue
+            entrada = self._ler(chave)
+            if entrada is None:
+                continue
+            momento, horarios = entrada
+            restantes = [
+                h for h in horarios
+                if h.get("datetime_agendamento") != datetime_agendamento
+                and (alvo is None or self._instante(h.get("datetime_agendamento")) != alvo)
+            ]
+            if len(restantes) != len(horarios):
+                self._gravar(chave, (momento, restantes))
+
+    def invalidar(self, technician_id: Optional[str] = None) -> None:
+        """
+        Agenda a atualização das chaves de um técnico (ou de todas).
+        Chamado após gravações em calendar_events/service_orders/agendamentos_ai;
+        com armazenamento, publicada para o líder (que pode estar em outro worker).
+        """
+        self._tecnicos_pendentes.add(technician_id)
+        if self.armazenamento is not None:
+            self.armazenamento.adicionar(
+                self.CONJUNTO_INVALIDACOES, technician_id or self.TODOS, max(self.intervalo, self.validade)
+            )
+        if self._evento is not None:
+            self._evento.set()
+
+    def _retirar_pendentes(self) -> set:
+        pendentes, self._tecnicos_pendentes = self._tecnicos_pendentes, set()
+        if self.armazenamento is not None:
+            pendentes |= {None if t == self.TODOS else t for t in self.armazenamento.retirar(self.CONJUNTO_INVALIDACOES)}
+        return pendentes
+
+    async def _aguardar(self) -> None:
+        """Até o próximo intervalo, uma invalidação local ou uma publicada por outro worker"""
+        if self.armazenamento is None:
+            try:
+                await asyncio.wait_for(self._evento.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            return
+        limite = time.monotonic() + self.intervalo
+        while time.monotonic() < limite:
+            try:
+                await asyncio.wait_for(
+                    self._evento.wait(), timeout=min(self.verificar_invalidacoes, limite - time.monotonic())
+                )
+                return
+            except asyncio.TimeoutError:
+                pass
+            if self.armazenamento.membros(self.CONJUNTO_INVALIDACOES):
+                return
+
+    # ------------------------------------------------------------------
+    # Atualização
+    # ------------------------------------------------------------------
+    async def _chaves_ativas(self) -> List[ChaveQuadro]:
+        agora = time.time()
+        for chave, ultimo_uso in list(self._demanda.items()):
+            if agora - ultimo_uso > self.janela_demanda:
+                del self._demanda[chave]
+        demanda = list(self._demanda)
+        if self.armazenamento is not None:
+            demanda += [tuple(json.loads(texto)) for texto in self.armazenamento.membros(self.CONJUNTO_DEMANDA)]
+        chaves = list(await self._listar_chaves())
+        for chave in demanda:
+            if chave not in chaves:
+                chaves.append(chave)
+        return chaves
+
+    async def _calcular_isolado(self, chave: ChaveQuadro) -> List[Dict[str, Any]]:
+        """
+        Executa o cálculo em uma thread com event loop próprio: as consultas ao
+        Supabase são síncronas e não podem travar as requisições em andamento.
+        """
+        if not self.em_thread:
+            return await self._calcular(chave, self.tamanho)
+        return await asyncio.to_thread(lambda: asyncio.run(self._calcular(chave, self.tamanho)))
+
+    async def atualizar(self, technician_ids: Optional[set] = None) -> int:
+        """
+        Recalcula as chaves ativas (opcionalmente só as de alguns técnicos).
+
+        Returns:
+            int: Quantidade de chaves atualizadas
+        """
+        inicio = time.perf_counter()
+        atualizadas = 0
+        for chave in await self._chaves_ativas():
+            if technician_ids is not None and chave[0] not in technician_ids:
+                continue
+            try:
+                self.salvar(chave, await self._calcular_isolado(chave))
+                atualizadas += 1
+            except Exception as e:
+                self.estatisticas["erros"] += 1
+                logger.error(f"❌ Erro ao atualizar quadro de disponibilidade {chave}: {e}")
+
+        self.estatisticas["atualizacoes"] += 1
+        self.estatisticas["ultima_atualizacao"] = time.time()
+        self.estatisticas["duracao_ultima_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        logger.info(f"📋 Quadro de disponibilidade atualizado: {atualizadas} chaves em {self.estatisticas['duracao_ultima_ms']}ms")
+        return atualizadas
+
+    async def executar(self, atualizar_ao_iniciar: bool = True) -> None:
+        """Laço em segundo plano: atualiza a cada intervalo ou quando houver invalidação"""
+        self._evento = asyncio.Event()
+        ultima_completa = 0.0
+        primeira = True
+        while True:
+            try:
+                pendentes = self._retirar_pendentes()
+                if primeira and not atualizar_ao_iniciar:
+                    # Quadro recém-calculado (aquecimento): só as invalidações já pendentes
+                    ultima_completa = time.time()
+                    if pendentes:
+                        await self.atualizar(None if None in pendentes else pendentes)
+                elif pendentes and None not in pendentes and time.time() - ultima_completa < self.intervalo:
+                    await self.atualizar(pendentes)
+                else:
+                    await self.atualizar()
+                    ultima_completa = time.time()
+                primeira = False
+                await self._aguardar()
+                self._evento.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro no laço do quadro de disponibilidade: {e}")
+                await asyncio.sleep(self.intervalo)
+
+    def iniciar(self, atualizar_ao_iniciar: bool = True) -> asyncio.Task:
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self.executar(atualizar_ao_iniciar))
+        return self._tarefa
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
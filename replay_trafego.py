@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+🔁 REPLAY DE TRÁFEGO CAPTURADO (teste de carga)
+Reproduz um JSONL gravado por captura_trafego.py contra o middleware em processo
+(Supabase em memória, sem rede) ou contra uma URL HTTP, com concorrência e
+aceleração configuráveis. Mede vazão, percentis de latência e taxa de erros.
+
+As requisições de uma mesma conversa (mesmo telefone) são enviadas em ordem,
+respeitando o intervalo original dividido pela aceleração; conversas diferentes
+correm em paralelo, limitadas por --concorrencia.
+
+Uso:
+    python replay_trafego.py captura.jsonl --alvo local --concorrencia 8 --velocidade 10
+    python replay_trafego.py captura.jsonl --alvo http://localhost:8000 --velocidade 0 --repeticoes 3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from captura_trafego import Anonimizador, CAMPOS_TELEFONE
+from metricas import percentil
+
+
+def carregar_captura(caminho: str, rotas: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    registros = []
+    with open(caminho, encoding="utf-8") as arquivo:
+        for numero, linha in enumerate(arquivo, 1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Linha {numero} ignorada: {e}", file=sys.stderr)
+                continue
+            if rotas and registro.get("path") not in rotas:
+                continue
+            registros.append(registro)
+    registros.sort(key=lambda r: r.get("ts", 0))
+    return registros
+
+
+def chave_conversa(registro: Dict[str, Any]) -> str:
+    """Telefone da requisição (ETAPA 1 e ETAPA 2 do mesmo cliente ficam na mesma fila)"""
+    corpo = registro.get("json")
+    if isinstance(corpo, dict):
+        for campo in CAMPOS_TELEFONE:
+            if corpo.get(campo):
+                return str(corpo[campo])
+    return f"avulsa-{id(registro)}"
+
+
+def montar_plano(registros: List[Dict[str, Any]], repeticoes: int) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Agrupa as requisições por conversa com o deslocamento (s) desde o início da captura.
+    Cada repetição ganha novos pseudônimos, para não cair na proteção anti-duplicata.
+    """
+    if not registros:
+        return {}
+    inicio = registros[0].get("ts", 0)
+    duracao = max(registros[-1].get("ts", 0) - inicio, 1.0)
+    conversas: Dict[str, List[Dict[str, Any]]] = {}
+
+    for repeticao in range(repeticoes):
+        anonimizador = Anonimizador(sal=f"replay-{repeticao}") if repeticao else None
+        for registro in registros:
+            corpo = registro.get("json")
+            if anonimizador is not None and corpo is not None:
+                corpo = anonimizador.anonimizar(corpo)
+            item = {
+                **registro,
+                "json": corpo,
+                "deslocamento": repeticao * duracao + registro.get("ts", inicio) - inicio,
+            }
+            conversas.setdefault(f"{repeticao}:{chave_conversa(item)}", []).append(item)
+    return conversas
+
+
+class Replay:
+    def __init__(self, cliente: httpx.AsyncClient, concorrencia: int, velocidade: float):
+        self.cliente = cliente
+        self.semaforo = asyncio.Semaphore(concorrencia)
+        self.velocidade = velocidade
+        self.resultados: List[Dict[str, Any]] = []
+        self._inicio = 0.0
+
+    async def enviar(self, item: Dict[str, Any]) -> None:
+        headers = dict(item.get("headers") or {})
+        conteudo = item.get("body")
+        if item.get("json") is not None:
+            conteudo = json.dumps(item["json"], ensure_ascii=False)
+            headers["content-type"] = "application/json"
+
+        async with self.semaforo:
+            inicio = time.perf_counter()
+            resultado = {"path": item["path"], "status_original": item.get("status"), "status": None, "erro": None}
+            try:
+                resposta = await self.cliente.request(
+                    item.get("method", "POST"),
+                    item["path"] + (f"?{item['query']}" if item.get("query") else ""),
+                    content=conteudo.encode("utf-8") if conteudo else None,
+                    headers=headers
+                )
+                resultado["status"] = resposta.status_code
+            except Exception as e:
+                resultado["erro"] = f"{type(e).__name__}: {e}"
+            resultado["latencia_ms"] = (time.perf_counter() - inicio) * 1000
+            self.resultados.append(resultado)
+
+    async def executar_conversa(self, itens: List[Dict[str, Any]]) -> None:
+        for item in itens:
+            if self.velocidade > 0:
+                espera = self._inicio + item["deslocamento"] / self.velocidade - time.perf_counter()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+            await self.enviar(item)
+
+    async def executar(self, conversas: Dict[str, List[Dict[str, Any]]]) -> float:
+        self._inicio = time.perf_counter()
+        await asyncio.gather(*(self.executar_conversa(itens) for itens in conversas.values()))
+        return time.perf_counter() - self._inicio
+
+
+def resumir(resultados: List[Dict[str, Any]], duracao: float) -> Dict[str, Any]:
+    def estatisticas(lista: List[Dict[str, Any]]) -> Dict[str, Any]:
+        latencias = [r["latencia_ms"] for r in lista]
+        erros = [r for r in lista if r["erro"] or (r["status"] or 0) >= 500]
+        return {
+            "requisicoes": len(lista),
+            "p50_ms": round(percentil(latencias, 50), 1),
+            "p95_ms": round(percentil(latencias, 95), 1),
+            "p99_ms": round(percentil(latencias, 99), 1),
+            "taxa_erros": round(len(erros) / len(lista), 4) if lista else 0.0,
+            "status_divergente": sum(
+                1 for r in lista if r["status_original"] is not None and r["status"] != r["status_original"]
+            ),
+        }
+
+    por_rota: Dict[str, List[Dict[str, Any]]] = {}
+    for resultado in resultados:
+        por_rota.setdefault(resultado["path"], []).append(resultado)
+
+    return {
+        "duracao_s": round(duracao, 2),
+        "vazao_rps": round(len(resultados) / duracao, 2) if duracao else 0.0,
+        **estatisticas(resultados),
+        "por_rota": {rota: estatisticas(lista) for rota, lista in sorted(por_rota.items())},
+        "erros_exemplo": sorted({r["erro"] for r in resultados if r["erro"]})[:5],
+    }
+
+
+def imprimir(resumo: Dict[str, Any], args: argparse.Namespace) -> None:
+    print(f"\n🔁 Replay contra {args.alvo} - concorrência {args.concorrencia}, "
+          f"velocidade {'máxima' if args.velocidade <= 0 else f'{args.velocidade}x'}")
+    print(f"   {resumo['requisicoes']} requisições em {resumo['duracao_s']}s = {resumo['vazao_rps']} req/s, "
+          f"p50 {resumo['p50_ms']}ms, p95 {resumo['p95_ms']}ms, p99 {resumo['p99_ms']}ms, erros {resumo['taxa_erros']:.2%}")
+    print(f"{'rota':<40} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erros':>7} {'status≠':>8}")
+    for rota, r in resumo["por_rota"].items():
+        print(f"{rota:<40} {r['requisicoes']:>5} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['taxa_erros']:>7.2%} {r['status_divergente']:>8}")
+    for erro in resumo["erros_exemplo"]:
+        print(f"   ❌ {erro}")
+
+
+async def executar(args: argparse.Namespace) -> Dict[str, Any]:
+    rotas = [r.strip() for r in args.rotas.split(",")] if args.rotas else None
+    conversas = montar_plano(carregar_captura(args.arquivo, rotas), args.repeticoes)
+    if not conversas:
+        raise SystemExit("❌ Nenhuma requisição para reproduzir")
+
+    async with AsyncExitStack() as pilha:
+        if args.alvo == "local":
+            # Import tardio: o modo HTTP não precisa carregar o middleware
+            from benchmark_agendamento import preparar_ambiente_offline
+            import middleware
+
+            preparar_ambiente_offline(args.tecnicos, args.dias, args.ocupacao, args.latencia_ms)
+            logging.getLogger().setLevel(args.log.upper())
+            logging.getLogger("middleware").setLevel(args.log.upper())
+            await pilha.enter_async_context(middleware.app.router.lifespan_context(middleware.app))
+            transporte = httpx.ASGITransport(app=middleware.app)
+            cliente = httpx.AsyncClient(transport=transporte, base_url="http://replay", timeout=args.timeout)
+        else:
+            limites = httpx.Limits(max_connections=args.concorrencia, max_keepalive_connections=args.concorrencia)
+            cliente = httpx.AsyncClient(base_url=args.alvo, timeout=args.timeout, limits=limites)
+        await pilha.enter_async_context(cliente)
+
+        replay = Replay(cliente, args.concorrencia, args.velocidade)
+        duracao = await replay.executar(conversas)
+    return resumir(replay.resultados, duracao)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay de tráfego capturado do ClienteChat")
+    parser.add_argument("arquivo", help="JSONL gerado com CAPTURA_TRAFEGO_ARQUIVO")
+    parser.add_argument("--alvo", default="local", help="'local' (em processo, Supabase em memória) ou URL base")
+    parser.add_argument("--concorrencia", type=int, default=4, help="Requisições simultâneas no máximo")
+    parser.add_argument("--velocidade", type=float, default=1.0, help="Aceleração do tempo original (0 = sem pausas)")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Quantas vezes reproduzir a captura")
+    parser.add_argument("--rotas", help="Apenas estas rotas (separadas por vírgula)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--tecnicos", type=int, default=3, help="(local) técnicos semeados")
+    parser.add_argument("--dias", type=int, default=14, help="(local) dias úteis de agenda")
+    parser.add_argument("--ocupacao", type=float, default=0.5, help="(local) fração de horários ocupados")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="(local) latência simulada por consulta")
+    parser.add_argument("--log", default="WARNING", help="(local) nível de log do middleware")
+    parser.add_argument("--json", help="Salvar o resumo neste arquivo")
+    args = parser.parse_args()
+
+    resumo = asyncio.run(executar(args))
+    imprimir(resumo, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump({"parametros": vars(args), "resumo": resumo}, arquivo, indent=2, ensure_ascii=False)
+        print(f"💾 Resumo salvo em {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+⚡ Serialização JSON das respostas da API
+
+RespostaJSON substitui o JSONResponse do Starlette (classe padrão do app e das
+respostas montadas nos endpoints). Com o orjson instalado a serialização é feita
+em código nativo; sem ele (ou com JSON_SERIALIZADOR=padrao) usa o json da
+biblioteca padrão com os mesmos parâmetros do Starlette.
+
+Saída igual byte a byte à do JSONResponse para o que a API devolve: UTF-8 sem
+escapes (ensure_ascii=False), separadores compactos, chaves não-str convertidas
+como no json. Tipos que o FastAPI converte com jsonable_encoder (datetime/date/time
+via isoformat(), Decimal para int ou float, set, UUID, Enum) recebem a mesma
+conversão aqui, também nos JSONResponse(content=...) montados à mão.
+
+Diferenças conhecidas do orjson: floats fora de [1e-4, 1e16) saem com expoente
+compacto (1e16 em vez de 1e+16, JSON equivalente) e NaN/Infinity viram null em vez
+de erro 500. Inteiros acima de 64 bits caem para o json padrão.
+"""
+
+import json
+import logging
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SERIALIZADOR = os.getenv("JSON_SERIALIZADOR", "orjson" if orjson is not None else "padrao")
+if SERIALIZADOR == "orjson" and orjson is None:
+    logger.warning("⚠️ JSON_SERIALIZADOR=orjson sem o pacote orjson instalado: usando o json padrão")
+    SERIALIZADOR = "padrao"
+
+# Datetimes passam pelo converter() para sair com isoformat(), como no jsonable_encoder
+OPCOES_ORJSON = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson is not None else 0
+
+
+def converter(valor: Any) -> Any:
+    """Tipos fora do JSON nativo, convertidos como o jsonable_encoder do FastAPI"""
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return int(valor) if valor.as_tuple().exponent >= 0 else float(valor)
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    if isinstance(valor, UUID):
+        return str(valor)
+    if isinstance(valor, Enum):
+        return valor.value
+    if hasattr(valor, "model_dump"):
+        return valor.model_dump(mode="json")
+    raise TypeError(f"Objeto do tipo {type(valor).__name__} não é serializável em JSON")
+
+
+def serializar_padrao(conteudo: Any) -> bytes:
+    """Mesmos parâmetros do JSONResponse.render do Starlette"""
+    return json.dumps(
+        conteudo,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=converter,
+    ).encode("utf-8")
+
+
+def serializar(conteudo: Any) -> bytes:
+    if SERIALIZADOR == "orjson":
+        try:
+            return orjson.dumps(conteudo, default=converter, option=OPCOES_ORJSON)
+        except orjson.JSONEncodeError:
+            # Inteiro acima de 64 bits, por exemplo: o json padrão resolve (ou levanta o erro de sempre)
+            pass
+    return serializar_padrao(conteudo)
+
+
+class RespostaJSON(JSONResponse):
+    """⚡ JSONResponse com serialização rápida (orjson) e fallback para o json padrão"""
+
+    def render(self, content: Any) -> bytes:
+        return serializar(content)
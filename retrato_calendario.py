@@ -0,0 +1,133 @@
+"""
+📸 Retrato do calendário de vários técnicos
+
+Carrega de uma vez, para uma janela de dias e um conjunto de técnicos, o que a busca
+de horários consulta a cada candidato:
+- calendar_events (ocupação exata do horário e grupos logísticos do dia)
+- agendamentos_ai pendentes/confirmados (pré-agendamentos)
+- service_orders da janela (regra do Grupo C em dias consecutivos)
+
+São 3 consultas por retrato, em vez de 2 a 3 por candidato e por técnico. As buscas
+de vários técnicos rodam em paralelo contra o mesmo retrato, sem I/O.
+
+As verificações devolvem None quando o dia está fora da janela carregada: quem chama
+volta para a consulta direta ao Supabase.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_PRE_AGENDAMENTO_ATIVO = ["pendente", "confirmado"]
+
+
+def instante(valor: Any) -> Optional[datetime]:
+    """Texto ISO do banco como datetime com fuso (sem fuso = UTC, como no timestamptz)"""
+    if not valor:
+        return None
+    try:
+        dt = valor if isinstance(valor, datetime) else datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class RetratoCalendario:
+    """
+    📸 Ocupação dos técnicos entre duas datas, carregada uma vez e consultada em memória
+    """
+
+    def __init__(self, tecnico_ids: Iterable[str], inicio: date, fim: date, classificar_grupo: Callable[[str], str]):
+        self.tecnico_ids = set(tecnico_ids)
+        self.inicio = inicio
+        self.fim = fim
+        self.classificar_grupo = classificar_grupo
+        self.consultas = 0
+        # técnico -> instantes ocupados no calendário / em pré-agendamentos
+        self._eventos: Dict[str, Set[datetime]] = defaultdict(set)
+        self._pre_agendamentos: Dict[str, Set[datetime]] = defaultdict(set)
+        # técnico -> eventos (instante, endereço) para os grupos do dia
+        self._enderecos: Dict[str, List[Tuple[datetime, str]]] = defaultdict(list)
+        # (técnico, AAAA-MM-DD) -> OS com endereço do Grupo C
+        self._grupo_c: Set[Tuple[str, str]] = set()
+
+    @classmethod
+    def carregar(cls, supabase, tecnico_ids: Iterable[str], inicio: date, fim: date,
+                 classificar_grupo: Callable[[str], str]) -> "RetratoCalendario":
+        retrato = cls(tecnico_ids, inicio, fim, classificar_grupo)
+        ids = sorted(retrato.tecnico_ids)
+        # Margem de um dia para cada lado: fusos e a regra do dia anterior (Grupo C)
+        janela_inicio = datetime.combine(inicio - timedelta(days=1), time.min, timezone.utc).isoformat()
+        janela_fim = datetime.combine(fim + timedelta(days=2), time.min, timezone.utc).isoformat()
+
+        eventos = supabase.table("calendar_events").select("*").in_(
+            "technician_id", ids
+        ).gte("start_time", janela_inicio).lt("start_time", janela_fim).execute().data or []
+        for evento in eventos:
+            inicio_evento = instante(evento.get("start_time"))
+            if inicio_evento is None:
+                continue
+            tecnico_id = evento.get("technician_id")
+            retrato._eventos[tecnico_id].add(inicio_evento)
+            if evento.get("address"):
+                retrato._enderecos[tecnico_id].append((inicio_evento, evento["address"]))
+
+        pre_agendamentos = supabase.table("agendamentos_ai").select("*").gte(
+            "data_agendada", janela_inicio
+        ).lt("data_agendada", janela_fim).in_("status", STATUS_PRE_AGENDAMENTO_ATIVO).execute().data or []
+        for ag in pre_agendamentos:
+            data_ag = instante(ag.get("data_agendada"))
+            if data_ag is None:
+                continue
+            for campo in ("technician_id", "tecnico_id"):
+                if ag.get(campo) in retrato.tecnico_ids:
+                    retrato._pre_agendamentos[ag[campo]].add(data_ag)
+
+        ordens = supabase.table("service_orders").select("*").in_(
+            "technician_id", ids
+        ).gte("scheduled_date", (inicio - timedelta(days=2)).isoformat()).lt(
+            "scheduled_date", (fim + timedelta(days=2)).isoformat()
+        ).execute().data or []
+        for os in ordens:
+            endereco = os.get("pickup_address", "")
+            if endereco and classificar_grupo(endereco) == "C":
+                retrato._grupo_c.add((os.get("technician_id"), str(os.get("scheduled_date", ""))[:10]))
+
+        retrato.consultas = 3
+        logger.info(
+            f"📸 Retrato do calendário: {len(ids)} técnicos, {inicio.isoformat()} a {fim.isoformat()}, "
+            f"{len(eventos)} eventos, {len(pre_agendamentos)} pré-agendamentos, {len(ordens)} OS"
+        )
+        return retrato
+
+    def cobre(self, tecnico_id: str, dia: date) -> bool:
+        dia = dia.date() if isinstance(dia, datetime) else dia
+        return tecnico_id in self.tecnico_ids and self.inicio <= dia <= self.fim
+
+    def horario_livre(self, tecnico_id: str, horario_dt: datetime) -> Optional[bool]:
+        """Mesma regra de verificar_horario_disponivel_tecnico (início exato do horário)"""
+        if not self.cobre(tecnico_id, horario_dt):
+            return None
+        horario = instante(horario_dt)
+        return horario not in self._eventos.get(tecnico_id, ()) and horario not in self._pre_agendamentos.get(tecnico_id, ())
+
+    def grupos_do_dia(self, tecnico_id: str, dia: datetime) -> Optional[Set[str]]:
+        """Grupos logísticos já agendados no dia (regra de verificar_conflito_grupos_logisticos)"""
+        if not self.cobre(tecnico_id, dia):
+            return None
+        inicio_dia = instante(dia.replace(hour=0, minute=0, second=0, microsecond=0))
+        fim_dia = instante(dia.replace(hour=23, minute=59, second=59, microsecond=999999))
+        return {
+            self.classificar_grupo(endereco)
+            for inicio_evento, endereco in self._enderecos.get(tecnico_id, ())
+            if inicio_dia <= inicio_evento <= fim_dia
+        }
+
+    def grupo_c_dia_anterior(self, tecnico_id: str, dia: datetime) -> Optional[bool]:
+        """Regra de verificar_grupo_c_consecutivo: OS do Grupo C no dia anterior"""
+        if not self.cobre(tecnico_id, dia):
+            return None
+        return (tecnico_id, (dia - timedelta(days=1)).strftime('%Y-%m-%d')) in self._grupo_c
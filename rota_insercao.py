@@ -0,0 +1,212 @@
+"""
+🛣️ Custo de inserção na rota do dia do técnico
+
+Para cada técnico e dia, a rota é base → paradas em ordem de horário → base, com a
+matriz de distâncias entre todos os pontos calculada uma vez. O custo de um candidato
+é o desvio que ele causa na rota: d(anterior, candidato) + d(candidato, próxima) -
+d(anterior, próxima), em km de estrada e em minutos.
+
+- Com a hora do candidato, a posição é a imposta pelo horário (entre a última parada
+  antes e a primeira depois).
+- Sem hora (score do dia), vale a posição de menor custo.
+- Uma nova parada entra na rota e na matriz em O(n), sem recalcular o resto.
+
+O aproveitamento (0 a 1) compara o desvio com a ida e volta da base só para o
+candidato: 1 = no caminho de uma rota já existente (corredor Tijucas → Itapema → BC →
+Itajaí → Navegantes com paradas antes e depois), 0 = dia vazio ou fora de mão.
+"""
+
+import bisect
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import pytz
+
+from retrato_calendario import instante
+
+logger = logging.getLogger(__name__)
+
+Ponto = Tuple[float, float]  # (lon, lat), como em calculate_distance
+
+FUSO_BRASIL = pytz.timezone('America/Sao_Paulo')
+
+# Distância em linha reta → estrada (BR-101 e vias urbanas da Grande Florianópolis)
+FATOR_ESTRADA = 1.3
+VELOCIDADE_MEDIA_KMH = 45.0
+
+# Parada sem horário conhecido vai para o fim do dia
+HORA_DESCONHECIDA = 24.0
+
+
+def distancia_km(a: Ponto, b: Ponto) -> float:
+    """Haversine × FATOR_ESTRADA"""
+    lon1, lat1 = a
+    lon2, lat2 = b
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    h = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2
+    return 2 * 6371 * math.asin(min(1.0, math.sqrt(h))) * FATOR_ESTRADA
+
+
+def minutos(km: float) -> float:
+    return km / VELOCIDADE_MEDIA_KMH * 60
+
+
+def hora_local(valor) -> Optional[float]:
+    """Hora local (decimal) de um timestamp do banco"""
+    dt = instante(valor)
+    if dt is None:
+        return None
+    local = dt.astimezone(FUSO_BRASIL)
+    return local.hour + local.minute / 60
+
+
+def dia_local(valor) -> Optional[str]:
+    """AAAA-MM-DD local de um timestamp do banco"""
+    dt = instante(valor)
+    return dt.astimezone(FUSO_BRASIL).strftime('%Y-%m-%d') if dt else None
+
+
+class Insercao(NamedTuple):
+    posicao: int           # índice da parada anterior na rota (0 = base)
+    km_extra: float
+    minutos_extra: float
+    km_sozinho: float      # ida e volta da base só para o candidato
+    tecnico_id: Optional[str] = None
+
+    @property
+    def aproveitamento(self) -> float:
+        if self.km_sozinho <= 0:
+            return 1.0
+        return max(0.0, min(1.0, 1 - self.km_extra / self.km_sozinho))
+
+
+class RotaDia:
+    """
+    🛣️ Rota de um técnico em um dia, com a matriz de distâncias entre os pontos
+    """
+
+    __slots__ = ("pontos", "horas", "matriz")
+
+    def __init__(self, base: Ponto, paradas: Iterable[Tuple[Ponto, Optional[float]]] = ()):
+        self.pontos: List[Ponto] = [base]
+        self.horas: List[float] = [-1.0]  # base antes de qualquer horário
+        self.matriz: List[List[float]] = [[0.0]]
+        for ponto, hora in paradas:
+            self.adicionar(ponto, hora)
+
+    def __len__(self) -> int:
+        return len(self.pontos) - 1
+
+    def adicionar(self, ponto: Ponto, hora: Optional[float]) -> int:
+        """Insere a parada na posição do horário; calcula só a linha/coluna nova da matriz"""
+        hora = HORA_DESCONHECIDA if hora is None else hora
+        indice = bisect.bisect_right(self.horas, hora)
+        distancias = [distancia_km(ponto, outro) for outro in self.pontos]
+        for linha, distancia in zip(self.matriz, distancias):
+            linha.insert(indice, distancia)
+        distancias.insert(indice, 0.0)
+        self.matriz.insert(indice, distancias)
+        self.pontos.insert(indice, ponto)
+        self.horas.insert(indice, hora)
+        return indice
+
+    def custo_insercao(self, ponto: Ponto, hora: Optional[float] = None,
+                       prazo: Optional[float] = None) -> Insercao:
+        """
+        Desvio de incluir o candidato na rota.
+        hora: fixa a posição pelo horário; None = posição mais barata.
+        prazo: time.perf_counter() limite; passado o prazo, fica a melhor posição já vista.
+        """
+        distancias = [distancia_km(ponto, outro) for outro in self.pontos]
+        ultimo = len(self.pontos) - 1
+        if hora is not None:
+            anterior = bisect.bisect_right(self.horas, hora) - 1
+            posicoes: Iterable[int] = (anterior,)
+        else:
+            posicoes = range(ultimo + 1)
+
+        melhor_posicao, melhor_km = 0, math.inf
+        for posicao in posicoes:
+            proxima = posicao + 1 if posicao < ultimo else 0  # depois da última parada, volta à base
+            km = distancias[posicao] + distancias[proxima] - self.matriz[posicao][proxima]
+            if km < melhor_km:
+                melhor_posicao, melhor_km = posicao, km
+            if prazo is not None and time.perf_counter() > prazo:
+                break
+        melhor_km = max(0.0, melhor_km)
+        return Insercao(melhor_posicao, round(melhor_km, 2), round(minutos(melhor_km), 1), round(2 * distancias[0], 2))
+
+
+def melhor_insercao(rotas: Dict[Optional[str], RotaDia], ponto: Ponto, hora: Optional[float] = None,
+                    prazo: Optional[float] = None) -> Optional[Insercao]:
+    """Inserção de maior aproveitamento entre as rotas dos técnicos do dia"""
+    melhor = None
+    for tecnico_id, rota in rotas.items():
+        if not len(rota):
+            continue
+        insercao = rota.custo_insercao(ponto, hora, prazo)._replace(tecnico_id=tecnico_id)
+        if melhor is None or insercao.aproveitamento > melhor.aproveitamento:
+            melhor = insercao
+        if prazo is not None and time.perf_counter() > prazo:
+            break
+    return melhor
+
+
+class CacheRotas:
+    """
+    🗃️ Rotas por dia (e por técnico dentro do dia), com validade e limite de dias guardados
+    """
+
+    def __init__(self, base: Ponto, validade: int = 120, tamanho: int = 64):
+        self.base = base
+        self.validade = validade
+        self.tamanho = tamanho
+        self._dias: "OrderedDict[str, Tuple[float, Dict[Optional[str], RotaDia]]]" = OrderedDict()
+        self.estatisticas = {"hits": 0, "misses": 0, "paradas_incrementais": 0, "invalidacoes": 0}
+
+    def obter(self, data_str: str) -> Optional[Dict[Optional[str], RotaDia]]:
+        entrada = self._dias.get(data_str)
+        if entrada is None or time.monotonic() - entrada[0] > self.validade:
+            self.estatisticas["misses"] += 1
+            return None
+        self._dias.move_to_end(data_str)
+        self.estatisticas["hits"] += 1
+        return entrada[1]
+
+    def salvar(self, data_str: str, rotas: Dict[Optional[str], RotaDia]) -> None:
+        self._dias[data_str] = (time.monotonic(), rotas)
+        self._dias.move_to_end(data_str)
+        while len(self._dias) > self.tamanho:
+            self._dias.popitem(last=False)
+
+    def montar(self, paradas: Iterable[Tuple[Optional[str], Ponto, Optional[float]]]) -> Dict[Optional[str], RotaDia]:
+        rotas: Dict[Optional[str], RotaDia] = {}
+        for tecnico_id, ponto, hora in paradas:
+            rotas.setdefault(tecnico_id, RotaDia(self.base)).adicionar(ponto, hora)
+        return rotas
+
+    def registrar_parada(self, data_str: str, tecnico_id: Optional[str], ponto: Ponto, hora: Optional[float]) -> bool:
+        """Novo agendamento: entra na rota do dia em cache (dia fora do cache é carregado depois)"""
+        entrada = self._dias.get(data_str)
+        if entrada is None:
+            return False
+        entrada[1].setdefault(tecnico_id, RotaDia(self.base)).adicionar(ponto, hora)
+        self.estatisticas["paradas_incrementais"] += 1
+        return True
+
+    def invalidar(self, data_str: Optional[str] = None) -> None:
+        if data_str is None:
+            self._dias.clear()
+        else:
+            self._dias.pop(data_str, None)
+        self.estatisticas["invalidacoes"] += 1
+
+    def limpar(self) -> None:
+        self._dias.clear()
+
+    def resumo(self) -> Dict:
+        return {**self.estatisticas, "dias": len(self._dias)}
@@ -0,0 +1,139 @@
+"""
+🩺 Saúde do processo para o balanceador e o Railway
+
+Sondas de health frequentes consultavam o Supabase a cada chamada: com o banco lento, a
+sonda demorava junto e o balanceador tirava do ar um worker que estava atendendo.
+- /health/live responde só com o estado do próprio processo (pid, uptime, tasks), sem I/O
+- /health/ready lê o último resultado da SondaProntidao, que verifica as dependências em
+  segundo plano a cada HEALTH_PROBE_INTERVALO segundos e exige o aquecimento concluído
+
+Assim nenhuma sonda HTTP chega ao Supabase; o tráfego no banco é uma consulta por intervalo.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+INICIO_PROCESSO = time.time()
+
+
+def estado_processo() -> Dict[str, Any]:
+    """Informações de liveness obtidas apenas do próprio processo (sem I/O)"""
+    try:
+        tarefas = len(asyncio.all_tasks())
+    except RuntimeError:
+        tarefas = None
+    return {
+        "pid": os.getpid(),
+        "uptime_segundos": round(time.time() - INICIO_PROCESSO, 1),
+        "tarefas_asyncio": tarefas,
+    }
+
+
+class SondaProntidao:
+    """
+    🩺 Sonda de prontidão executada em segundo plano.
+
+    A verificação de dependências (Supabase) roda a cada `intervalo` segundos;
+    /health/ready apenas lê o último resultado, sem gerar tráfego no banco.
+    """
+
+    def __init__(self, verificar: Callable[[], Awaitable[Any]], intervalo: int = 30, timeout: float = 5.0):
+        """
+        Args:
+            verificar: Corrotina que testa as dependências (exceção = falha)
+            intervalo: Segundos entre verificações
+            timeout: Tempo máximo de cada verificação
+        """
+        self._verificar = verificar
+        self.intervalo = intervalo
+        self.timeout = timeout
+        self._componentes: Dict[str, Callable[[], Any]] = {}
+        self._tarefa: Optional[asyncio.Task] = None
+        self.aquecimento: Dict[str, Any] = {"concluido": False, "duracao_ms": None, "fases": {}}
+        self.ultimo_resultado: Dict[str, Any] = {
+            "ok": None,
+            "verificado_em": None,
+            "latencia_ms": None,
+            "falhas_consecutivas": 0,
+            "ultimo_erro": None,
+            "ultimo_erro_em": None,
+        }
+
+    def registrar_componente(self, nome: str, estatisticas: Callable[[], Any]) -> None:
+        """Registra uma função que devolve estatísticas (cache, fila, pool...) para o relatório"""
+        self._componentes[nome] = estatisticas
+
+    async def verificar_agora(self) -> bool:
+        inicio = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._verificar(), timeout=self.timeout)
+            self.ultimo_resultado["ok"] = True
+            self.ultimo_resultado["falhas_consecutivas"] = 0
+        except Exception as e:
+            erro = str(e) or type(e).__name__
+            self.ultimo_resultado["ok"] = False
+            self.ultimo_resultado["falhas_consecutivas"] += 1
+            self.ultimo_resultado["ultimo_erro"] = erro
+            self.ultimo_resultado["ultimo_erro_em"] = time.time()
+            logger.warning(f"⚠️ Sonda de prontidão falhou: {erro}")
+        self.ultimo_resultado["verificado_em"] = time.time()
+        self.ultimo_resultado["latencia_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        return self.ultimo_resultado["ok"]
+
+    async def _executar(self) -> None:
+        while True:
+            await self.verificar_agora()
+            await asyncio.sleep(self.intervalo)
+
+    def iniciar(self) -> asyncio.Task:
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.create_task(self._executar())
+        return self._tarefa
+
+    async def parar(self) -> None:
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    def marcar_aquecido(self, fases: Dict[str, Any], duracao_ms: float) -> None:
+        """Chamado pelo lifespan ao fim do aquecimento; antes disso a API não está pronta"""
+        self.aquecimento = {"concluido": True, "duracao_ms": duracao_ms, "fases": fases}
+
+    def pronto(self) -> bool:
+        """Pronto = aquecimento concluído e última verificação ok e recente (até 3 intervalos)"""
+        verificado_em = self.ultimo_resultado["verificado_em"]
+        return bool(
+            self.aquecimento["concluido"]
+            and self.ultimo_resultado["ok"]
+            and verificado_em is not None
+            and time.time() - verificado_em <= self.intervalo * 3
+        )
+
+    def relatorio(self) -> Dict[str, Any]:
+        componentes = {}
+        for nome, estatisticas in self._componentes.items():
+            try:
+                componentes[nome] = estatisticas()
+            except Exception as e:
+                componentes[nome] = {"erro": str(e)}
+
+        verificado_em = self.ultimo_resultado["verificado_em"]
+        return {
+            "pronto": self.pronto(),
+            "sonda": {
+                **self.ultimo_resultado,
+                "idade_segundos": round(time.time() - verificado_em, 1) if verificado_em else None,
+                "intervalo_segundos": self.intervalo,
+            },
+            "aquecimento": self.aquecimento,
+            "componentes": componentes,
+        }
@@ -0,0 +1,51 @@
+-- Feed de alterações para invalidação de caches do middleware (feed_alteracoes.py, modo "postgres")
+-- Publica cada INSERT/UPDATE/DELETE de calendar_events, service_orders e agendamentos_ai
+-- no canal NOTIFY 'agendamento_alteracoes' com o mesmo formato usado pelo Supabase Realtime.
+-- Apenas as colunas usadas na invalidação são enviadas (o payload do NOTIFY é limitado a 8000 bytes).
+
+CREATE OR REPLACE FUNCTION notify_agendamento_alteracoes()
+RETURNS TRIGGER AS $$
+DECLARE
+  linha JSONB;
+  dados JSONB;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    linha := to_jsonb(OLD);
+  ELSE
+    linha := to_jsonb(NEW);
+  END IF;
+
+  SELECT jsonb_object_agg(key, value) INTO dados
+  FROM jsonb_each(linha)
+  WHERE key IN (
+    'id', 'technician_id', 'tecnico_id', 'status',
+    'start_time', 'scheduled_date', 'data_agendada',
+    'client_phone', 'telefone', 'client_cpf_cnpj', 'cpf'
+  );
+
+  PERFORM pg_notify(
+    'agendamento_alteracoes',
+    jsonb_build_object('table', TG_TABLE_NAME, 'type', TG_OP, 'record', dados)::text
+  );
+
+  IF TG_OP = 'DELETE' THEN
+    RETURN OLD;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_calendar_events ON calendar_events;
+CREATE TRIGGER trg_notify_calendar_events
+  AFTER INSERT OR UPDATE OR DELETE ON calendar_events
+  FOR EACH ROW EXECUTE FUNCTION notify_agendamento_alteracoes();
+
+DROP TRIGGER IF EXISTS trg_notify_service_orders ON service_orders;
+CREATE TRIGGER trg_notify_service_orders
+  AFTER INSERT OR UPDATE OR DELETE ON service_orders
+  FOR EACH ROW EXECUTE FUNCTION notify_agendamento_alteracoes();
+
+DROP TRIGGER IF EXISTS trg_notify_agendamentos_ai ON agendamentos_ai;
+CREATE TRIGGER trg_notify_agendamentos_ai
+  AFTER INSERT OR UPDATE OR DELETE ON agendamentos_ai
+  FOR EACH ROW EXECUTE FUNCTION notify_agendamento_alteracoes();
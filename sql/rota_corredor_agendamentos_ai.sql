@@ -0,0 +1,48 @@
+-- Corredor da rota sequencial do Grupo C em agendamentos_ai (buscar_agendamentos_rota_sequencial)
+-- Grava cidade e período (manha/tarde) da rota em colunas próprias, preenchidas por trigger a partir
+-- do endereço: prefixo do CEP (mesmo mapa de CEPS_ROTA_SEQUENCIAL) e, na falta dele, o nome da cidade.
+-- Depois de aplicar, ligar ROTA_CORREDOR_COLUNA=ligado no middleware.
+
+ALTER TABLE agendamentos_ai
+  ADD COLUMN IF NOT EXISTS cidade_rota TEXT,
+  ADD COLUMN IF NOT EXISTS periodo_rota TEXT;
+
+CREATE OR REPLACE FUNCTION classificar_rota_agendamento()
+RETURNS TRIGGER AS $$
+DECLARE
+  prefixo_cep TEXT := substring(coalesce(NEW.endereco, '') FROM '(\d{5})-?\d{3}');
+  endereco_normalizado TEXT := translate(lower(coalesce(NEW.endereco, '')), 'áàâãéêíóôõúç', 'aaaaeeiooouc');
+BEGIN
+  NEW.cidade_rota := CASE
+    WHEN prefixo_cep = '88200' THEN 'Tijucas'
+    WHEN prefixo_cep = '88220' THEN 'Itapema'
+    WHEN prefixo_cep IN ('88330', '88337', '88339') THEN 'Balneário Camboriú'
+    WHEN prefixo_cep IN ('88300', '88301', '88302', '88303', '88304', '88306', '88307') THEN 'Itajaí'
+    WHEN prefixo_cep = '88370' THEN 'Navegantes'
+    WHEN endereco_normalizado LIKE '%tijucas%' THEN 'Tijucas'
+    WHEN endereco_normalizado LIKE '%itapema%' THEN 'Itapema'
+    WHEN endereco_normalizado LIKE '%balneario camboriu%' THEN 'Balneário Camboriú'
+    WHEN endereco_normalizado LIKE '%itajai%' THEN 'Itajaí'
+    WHEN endereco_normalizado LIKE '%navegantes%' THEN 'Navegantes'
+    ELSE NULL
+  END;
+  NEW.periodo_rota := CASE
+    WHEN NEW.cidade_rota IN ('Tijucas', 'Itapema') THEN 'manha'
+    WHEN NEW.cidade_rota IS NOT NULL THEN 'tarde'
+    ELSE NULL
+  END;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_classificar_rota_agendamento ON agendamentos_ai;
+CREATE TRIGGER trg_classificar_rota_agendamento
+  BEFORE INSERT OR UPDATE OF endereco ON agendamentos_ai
+  FOR EACH ROW EXECUTE FUNCTION classificar_rota_agendamento();
+
+-- Linhas existentes (o UPDATE OF endereco dispara o trigger)
+UPDATE agendamentos_ai SET endereco = endereco WHERE periodo_rota IS NULL AND endereco IS NOT NULL;
+
+-- Consulta do corredor: periodo_rota + status + janela de data_agendada
+CREATE INDEX IF NOT EXISTS idx_agendamentos_ai_corredor_rota
+  ON agendamentos_ai (periodo_rota, status, data_agendada);
@@ -5,6 +5,9 @@ import time
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
+from leituras_resilientes import LeiturasResilientes, espera_com_jitter
+from orcamento_consultas import instrumentar_cliente
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,8 +26,9 @@ supabase = None
 
 # Número máximo de tentativas de conexão
 MAX_RETRIES = 3
-# Tempo de espera entre tentativas (em segundos)
-RETRY_DELAY = 2
+# Espera base entre tentativas (em segundos): dobra a cada tentativa, com jitter, até RETRY_DELAY_MAX
+RETRY_DELAY = 0.5
+RETRY_DELAY_MAX = 4
 
 def get_supabase_client():
     """
@@ -70,14 +74,16 @@ def get_supabase_client():
     for attempt in range(1, MAX_RETRIES + 1):
         try:
             logger.info(f"Tentativa {attempt} de {MAX_RETRIES} para conectar ao Supabase")
-            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+            # Leituras (select) com novas tentativas em falhas passageiras; escritas não se repetem
+            supabase = instrumentar_cliente(create_client(SUPABASE_URL, SUPABASE_KEY), leituras=LeiturasResilientes())
             logger.info("Conexão com Supabase estabelecida com sucesso")
             return supabase
         except Exception as e:
             logger.error(f"Erro ao conectar com Supabase (tentativa {attempt}): {str(e)}")
             if attempt < MAX_RETRIES:
-                logger.info(f"Aguardando {RETRY_DELAY} segundos antes de tentar novamente...")
-                time.sleep(RETRY_DELAY)
+                espera = espera_com_jitter(attempt - 1, RETRY_DELAY, RETRY_DELAY_MAX)
+                logger.info(f"Aguardando {espera:.2f} segundos antes de tentar novamente...")
+                time.sleep(espera)
             else:
                 logger.error("Número máximo de tentativas excedido. Não foi possível conectar ao Supabase.")
                 raise
@@ -0,0 +1,472 @@
+"""
+🧪 Supabase em memória para benchmarks e testes offline
+
+Implementa o subconjunto do query builder do PostgREST usado pelo middleware
+(select/insert/update/upsert/delete, eq, neq, gt, gte, lt, lte, like, ilike,
+is_, in_, or_, not_, order, limit, range, single) sobre listas de dicionários.
+
+Timestamps são comparados como instantes (texto ISO sem fuso = UTC, como o
+Postgres faz com timestamptz), de modo que os filtros por data se comportam
+como no Supabase real.
+
+Uso:
+    cliente = ClienteSupabaseMemoria(latencia_ms=5)
+    popular_calendario(cliente, tecnicos=4, dias=14, ocupacao=0.6)
+    middleware._supabase_client = instrumentar_cliente(cliente)
+"""
+
+import copy
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+_PADRAO_DATA = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _instante(valor: Any) -> Any:
+    """Converte textos ISO em datetime com fuso (sem fuso = UTC); demais valores passam direto"""
+    if isinstance(valor, datetime):
+        return valor if valor.tzinfo else valor.replace(tzinfo=timezone.utc)
+    if isinstance(valor, str) and _PADRAO_DATA.match(valor):
+        try:
+            dt = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+        except ValueError:
+            return valor
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return valor
+
+
+def _comparar(valor: Any, operador: str, alvo: Any) -> bool:
+    if operador == "is":
+        if isinstance(alvo, str):
+            alvo = {"null": None, "true": True, "false": False}.get(alvo.lower(), alvo)
+        return valor is alvo or valor == alvo
+    if operador == "in":
+        return any(_comparar(valor, "eq", item) for item in alvo)
+    if operador in ("like", "ilike"):
+        if valor is None:
+            return False
+        padrao = "^" + re.escape(str(alvo)).replace("%", ".*").replace("_", ".") + "$"
+        return re.match(padrao, str(valor), re.IGNORECASE if operador == "ilike" else 0) is not None
+    if valor is None:
+        return False
+
+    a, b = _instante(valor), _instante(alvo)
+    if type(a) is not type(b):
+        # PostgREST recebe o filtro como texto: converter para o tipo da coluna quando possível
+        if isinstance(valor, bool):
+            a, b = str(valor).lower(), str(alvo).lower()
+        elif isinstance(valor, (int, float)):
+            try:
+                b = float(alvo)
+            except (TypeError, ValueError):
+                a, b = str(valor), str(alvo)
+        else:
+            a, b = str(valor), str(alvo)
+    try:
+        if operador == "eq":
+            return a == b
+        if operador == "neq":
+            return a != b
+        if operador == "gt":
+            return a > b
+        if operador == "gte":
+            return a >= b
+        if operador == "lt":
+            return a < b
+        if operador == "lte":
+            return a <= b
+    except TypeError:
+        return False
+    raise ValueError(f"Operador não suportado: {operador}")
+
+
+def _dividir_condicoes(expressao: str) -> List[str]:
+    """Divide 'a.eq.1,b.in.(2,3)' nas vírgulas de primeiro nível"""
+    partes, nivel, atual = [], 0, ""
+    for caractere in expressao:
+        if caractere == "(":
+            nivel += 1
+        elif caractere == ")":
+            nivel -= 1
+        if caractere == "," and nivel == 0:
+            partes.append(atual)
+            atual = ""
+        else:
+            atual += caractere
+    if atual:
+        partes.append(atual)
+    return partes
+
+
+def _condicao_textual(condicao: str) -> Callable[[Dict[str, Any]], bool]:
+    """Converte 'coluna.operador.valor' (sintaxe do or_ do PostgREST) em predicado"""
+    coluna, operador, valor = condicao.strip().split(".", 2)
+    negar = False
+    if operador == "not":
+        negar = True
+        operador, valor = valor.split(".", 1)
+    if operador == "in":
+        valor = [item.strip().strip('"') for item in valor.strip("()").split(",")]
+
+    def predicado(linha: Dict[str, Any]) -> bool:
+        resultado = _comparar(linha.get(coluna), operador, valor)
+        return not resultado if negar else resultado
+    return predicado
+
+
+class RespostaMemoria:
+    """Mesmo formato da APIResponse do postgrest (data + count)"""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class ConsultaMemoria:
+    """Request builder encadeável equivalente ao do postgrest-py"""
+
+    def __init__(self, cliente: "ClienteSupabaseMemoria", tabela: str):
+        self._cliente = cliente
+        self._tabela = tabela
+        self._operacao = "select"
+        self._colunas: Optional[List[str]] = None
+        self._payload: Any = None
+        self._filtros: List[Callable[[Dict[str, Any]], bool]] = []
+        self._ordem: List[tuple] = []
+        self._limite: Optional[int] = None
+        self._deslocamento = 0
+        self._negar = False
+        self._unico = False
+        self._contar = False
+
+    # --- operações -----------------------------------------------------
+    def select(self, colunas: str = "*", count: Optional[str] = None) -> "ConsultaMemoria":
+        colunas = colunas.strip()
+        if colunas != "*":
+            # Relações embutidas (ex.: clients(name)) são ignoradas
+            self._colunas = [c.strip() for c in _dividir_condicoes(colunas) if "(" not in c]
+        self._contar = count is not None
+        return self
+
+    def insert(self, dados: Any, **kwargs) -> "ConsultaMemoria":
+        self._operacao, self._payload = "insert", dados
+        return self
+
+    def upsert(self, dados: Any, **kwargs) -> "ConsultaMemoria":
+        self._operacao, self._payload = "upsert", dados
+        return self
+
+    def update(self, dados: Dict[str, Any], **kwargs) -> "ConsultaMemoria":
+        self._operacao, self._payload = "update", dados
+        return self
+
+    def delete(self, **kwargs) -> "ConsultaMemoria":
+        self._operacao = "delete"
+        return self
+
+    # --- filtros -------------------------------------------------------
+    def _filtrar(self, coluna: str, operador: str, valor: Any) -> "ConsultaMemoria":
+        negar, self._negar = self._negar, False
+
+        def predicado(linha: Dict[str, Any]) -> bool:
+            resultado = _comparar(linha.get(coluna), operador, valor)
+            return not resultado if negar else resultado
+        self._filtros.append(predicado)
+        return self
+
+    @property
+    def not_(self) -> "ConsultaMemoria":
+        self._negar = True
+        return self
+
+    def eq(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "eq", valor)
+
+    def neq(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "neq", valor)
+
+    def gt(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "gt", valor)
+
+    def gte(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "gte", valor)
+
+    def lt(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "lt", valor)
+
+    def lte(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "lte", valor)
+
+    def like(self, coluna: str, padrao: str) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "like", padrao)
+
+    def ilike(self, coluna: str, padrao: str) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "ilike", padrao)
+
+    def is_(self, coluna: str, valor: Any) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "is", valor)
+
+    def in_(self, coluna: str, valores: List[Any]) -> "ConsultaMemoria":
+        return self._filtrar(coluna, "in", list(valores))
+
+    def or_(self, expressao: str, **kwargs) -> "ConsultaMemoria":
+        negar, self._negar = self._negar, False
+        condicoes = [_condicao_textual(c) for c in _dividir_condicoes(expressao)]
+
+        def predicado(linha: Dict[str, Any]) -> bool:
+            resultado = any(condicao(linha) for condicao in condicoes)
+            return not resultado if negar else resultado
+        self._filtros.append(predicado)
+        return self
+
+    # --- modificadores -------------------------------------------------
+    def order(self, coluna: str, desc: bool = False, **kwargs) -> "ConsultaMemoria":
+        self._ordem.append((coluna, desc))
+        return self
+
+    def limit(self, quantidade: int, **kwargs) -> "ConsultaMemoria":
+        self._limite = quantidade
+        return self
+
+    def range(self, inicio: int, fim: int) -> "ConsultaMemoria":
+        self._deslocamento, self._limite = inicio, fim - inicio + 1
+        return self
+
+    def single(self) -> "ConsultaMemoria":
+        self._unico = True
+        return self
+
+    maybe_single = single
+
+    # --- execução ------------------------------------------------------
+    def _projetar(self, linha: Dict[str, Any]) -> Dict[str, Any]:
+        if self._colunas is None:
+            return copy.deepcopy(linha)
+        return {coluna: copy.deepcopy(linha.get(coluna)) for coluna in self._colunas}
+
+    def execute(self) -> RespostaMemoria:
+        self._cliente._registrar_consulta(self._tabela, self._operacao)
+        with self._cliente._lock:
+            linhas = self._cliente.tabelas.setdefault(self._tabela, [])
+
+            if self._operacao in ("insert", "upsert"):
+                registros = self._payload if isinstance(self._payload, list) else [self._payload]
+                inseridos = []
+                for registro in registros:
+                    novo = self._cliente._completar(dict(registro))
+                    existente = next((l for l in linhas if l.get("id") == novo["id"]), None)
+                    if existente is not None and self._operacao == "upsert":
+                        existente.update(novo)
+                        inseridos.append(copy.deepcopy(existente))
+                    else:
+                        linhas.append(novo)
+                        inseridos.append(copy.deepcopy(novo))
+                return RespostaMemoria(inseridos)
+
+            selecionadas = [linha for linha in linhas if all(f(linha) for f in self._filtros)]
+
+            if self._operacao == "update":
+                agora = datetime.now(timezone.utc).isoformat()
+                for linha in selecionadas:
+                    linha.update(copy.deepcopy(self._payload))
+                    if "updated_at" in linha:
+                        linha["updated_at"] = agora
+                return RespostaMemoria([copy.deepcopy(linha) for linha in selecionadas])
+
+            if self._operacao == "delete":
+                self._cliente.tabelas[self._tabela] = [linha for linha in linhas if linha not in selecionadas]
+                return RespostaMemoria([copy.deepcopy(linha) for linha in selecionadas])
+
+            for coluna, desc in reversed(self._ordem):
+                selecionadas.sort(
+                    key=lambda linha: (linha.get(coluna) is None, _instante(linha.get(coluna)) if linha.get(coluna) is not None else 0),
+                    reverse=desc
+                )
+            total = len(selecionadas)
+            fim = None if self._limite is None else self._deslocamento + self._limite
+            dados = [self._projetar(linha) for linha in selecionadas[self._deslocamento:fim]]
+
+        if self._unico:
+            return RespostaMemoria(dados[0] if dados else None, total if self._contar else None)
+        return RespostaMemoria(dados, total if self._contar else None)
+
+
+class ClienteSupabaseMemoria:
+    """
+    Cliente com a mesma interface usada do supabase-py (table/from_).
+
+    Args:
+        latencia_ms: Atraso síncrono por consulta, simulando a ida e volta ao PostgREST
+    """
+
+    def __init__(self, latencia_ms: float = 0.0):
+        self.latencia_ms = latencia_ms
+        self.tabelas: Dict[str, List[Dict[str, Any]]] = {}
+        self.consultas = 0
+        self.consultas_por_tabela: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def table(self, nome: str) -> ConsultaMemoria:
+        return ConsultaMemoria(self, nome)
+
+    from_ = table
+
+    def rpc(self, funcao: str, *args, **kwargs):
+        raise NotImplementedError(f"RPC '{funcao}' não disponível no Supabase em memória")
+
+    def _registrar_consulta(self, tabela: str, operacao: str) -> None:
+        with self._lock:
+            self.consultas += 1
+            self.consultas_por_tabela[tabela] = self.consultas_por_tabela.get(tabela, 0) + 1
+        if self.latencia_ms:
+            # O cliente real é síncrono: a latência também bloqueia quem chamou
+            time.sleep(self.latencia_ms / 1000)
+
+    @staticmethod
+    def _completar(registro: Dict[str, Any]) -> Dict[str, Any]:
+        agora = datetime.now(timezone.utc).isoformat()
+        registro.setdefault("id", str(uuid.uuid4()))
+        registro.setdefault("created_at", agora)
+        registro.setdefault("updated_at", agora)
+        return registro
+
+    def zerar_contadores(self) -> None:
+        with self._lock:
+            self.consultas = 0
+            self.consultas_por_tabela = {}
+
+
+# ----------------------------------------------------------------------
+# Dados de exemplo
+# ----------------------------------------------------------------------
+HORAS_COMERCIAIS = (9, 10, 13, 14, 15, 16)
+
+ENDERECOS_EXEMPLO = {
+    "A": ["Rua Felipe Schmidt, 100, Centro, Florianópolis, SC", "Rua Lauro Linhares, 850, Trindade, Florianópolis, SC"],
+    "B": ["Rua Koesa, 430, Kobrasol, São José, SC", "Rua Caetano Silveira de Matos, 1200, Centro, Palhoça, SC"],
+    "C": ["Avenida Brasil, 1500, Centro, Balneário Camboriú, SC", "Rua Hercílio Luz, 300, Centro, Itajaí, SC"],
+}
+
+TECNICOS_EXEMPLO = [
+    {"name": "Paulo Cesar Betoni", "specialties": ["fogao", "gas"]},
+    {"name": "Marcelo Silva", "specialties": ["coifa"]},
+]
+
+
+def popular_calendario(cliente: ClienteSupabaseMemoria, tecnicos: int = 3, dias: int = 14,
+                       ocupacao: float = 0.5, seed: int = 42, inicio: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Cria técnicos, clientes, OS, eventos de calendário e histórico com distribuição reproduzível.
+
+    Args:
+        tecnicos: Quantidade de técnicos ativos
+        dias: Dias úteis a partir de amanhã com agenda preenchida
+        ocupacao: Fração (0-1) dos horários comerciais já ocupados
+        seed: Semente do gerador aleatório
+        inicio: Data base (padrão: hoje)
+
+    Returns:
+        Resumo do que foi criado (ids dos técnicos, totais e uma OS/cliente de exemplo)
+    """
+    aleatorio = random.Random(seed)
+    base = (inicio or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    criado_em = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+
+    lista_tecnicos = []
+    for indice in range(tecnicos):
+        modelo = TECNICOS_EXEMPLO[indice] if indice < len(TECNICOS_EXEMPLO) else {"name": f"Tecnico Geral {indice + 1}", "specialties": ["geral"]}
+        lista_tecnicos.append({
+            "id": str(uuid.UUID(int=aleatorio.getrandbits(128))),
+            "name": modelo["name"],
+            "email": f"tecnico{indice + 1}@fixfogoes.com.br",
+            "phone": f"4899{indice:07d}",
+            "specialties": modelo["specialties"],
+            "is_active": True,
+            "created_at": criado_em,
+        })
+    cliente.tabelas["technicians"] = lista_tecnicos
+
+    clientes, ordens, eventos, servicos, progresso = [], [], [], [], []
+    numero = 0
+    dia = base
+    dias_preenchidos = 0
+    while dias_preenchidos < dias:
+        dia += timedelta(days=1)
+        if dia.weekday() >= 5:
+            continue
+        dias_preenchidos += 1
+        for tecnico in lista_tecnicos:
+            for hora in HORAS_COMERCIAIS:
+                if aleatorio.random() >= ocupacao:
+                    continue
+                numero += 1
+                grupo = aleatorio.choice("AABBC")
+                endereco = aleatorio.choice(ENDERECOS_EXEMPLO[grupo])
+                inicio_evento = dia.replace(hour=hora)
+                nome_cliente = f"Cliente Exemplo {numero}"
+                telefone = f"48988{numero:06d}"
+                cliente_id = str(uuid.UUID(int=aleatorio.getrandbits(128)))
+                os_id = str(uuid.UUID(int=aleatorio.getrandbits(128)))
+                servico_id = str(uuid.UUID(int=aleatorio.getrandbits(128)))
+                order_number = f"#{numero:03d}"
+                equipamento = aleatorio.choice(["Fogão", "Cooktop", "Forno", "Coifa"])
+
+                clientes.append({
+                    "id": cliente_id, "name": nome_cliente, "phone": telefone,
+                    "cpf_cnpj": f"{numero:011d}", "email": f"cliente{numero}@exemplo.com",
+                    "address": endereco, "created_at": criado_em,
+                })
+                ordens.append({
+                    "id": os_id, "order_number": order_number, "client_id": cliente_id,
+                    "client_name": nome_cliente, "client_phone": telefone, "client_cpf_cnpj": f"{numero:011d}",
+                    "technician_id": tecnico["id"], "technician_name": tecnico["name"],
+                    "scheduled_date": inicio_evento.isoformat(), "scheduled_time": f"{hora:02d}:00",
+                    "status": "scheduled", "equipment_type": equipamento, "description": "Não acende",
+                    "pickup_address": endereco, "service_attendance_type": "em_domicilio",
+                    "created_at": criado_em, "updated_at": criado_em,
+                })
+                eventos.append({
+                    "id": str(uuid.UUID(int=aleatorio.getrandbits(128))), "technician_id": tecnico["id"],
+                    "technician_name": tecnico["name"], "client_name": nome_cliente, "client_phone": telefone,
+                    "address": endereco, "equipment_type": equipamento, "service_order_id": os_id,
+                    "start_time": inicio_evento.isoformat(), "end_time": (inicio_evento + timedelta(hours=1)).isoformat(),
+                    "status": "confirmed", "event_type": "service",
+                    "created_at": criado_em, "updated_at": criado_em,
+                })
+                servicos.append({
+                    "id": servico_id, "service_order_id": os_id, "order_number": order_number,
+                    "client_id": cliente_id, "client_name": nome_cliente,
+                    "technician_id": tecnico["id"], "technician_name": tecnico["name"],
+                    "scheduled_start_time": inicio_evento.isoformat(),
+                    "scheduled_end_time": (inicio_evento + timedelta(hours=1)).isoformat(),
+                    "address": endereco, "description": "Não acende", "status": "scheduled",
+                    "created_at": criado_em,
+                })
+                progresso.append({
+                    "id": str(uuid.UUID(int=aleatorio.getrandbits(128))), "service_order_id": servico_id,
+                    "status": "scheduled", "description": "Agendamento confirmado",
+                    "technician_name": tecnico["name"], "created_at": criado_em,
+                })
+
+    cliente.tabelas.update({
+        "clients": clientes,
+        "service_orders": ordens,
+        "calendar_events": eventos,
+        "scheduled_services": servicos,
+        "service_order_progress": progresso,
+        "agendamentos_ai": [],
+    })
+    for tabela in ("google_ads_tracking_sessions", "google_ads_conversions"):
+        cliente.tabelas.setdefault(tabela, [])
+
+    return {
+        "tecnicos": [tecnico["id"] for tecnico in lista_tecnicos],
+        "eventos": len(eventos),
+        "ordens": len(ordens),
+        "exemplo_os": ordens[0] if ordens else None,
+    }